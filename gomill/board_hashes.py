@@ -0,0 +1,217 @@
+"""Zobrist hashing of Go positions.
+
+Position hashes are 64-bit integers. They depend only on the board size and
+the stones on the board (not on whose turn it is, or on any ko restriction).
+
+The hash values are reproducible: the Zobrist keys are generated from a fixed
+seed, so the same position always has the same hash, in any process.
+
+Symmetric hashes are the same for all eight rotations and reflections of a
+position.
+
+"""
+
+import random
+
+from gomill import boards
+
+#: Number of board symmetries (rotations and reflections)
+NUMBER_OF_SYMMETRIES = 8
+
+def transform_point(row, col, size, symmetry):
+    """Apply one of the board symmetries to a point.
+
+    row, col -- coordinates
+    size     -- board size
+    symmetry -- int in range(NUMBER_OF_SYMMETRIES); 0 is the identity
+
+    Returns a pair (row, col).
+
+    """
+    m = size - 1
+    if symmetry & 4:
+        row, col = col, row
+    if symmetry & 2:
+        row = m - row
+    if symmetry & 1:
+        col = m - col
+    return row, col
+
+
+class _Keys(object):
+    """Zobrist keys for one board size.
+
+    Public attributes:
+      base  -- key for the board size (the hash of the empty board)
+      black -- list of keys, indexed by symmetry, then by point index
+      white -- list of keys, indexed by symmetry, then by point index
+
+    The point index is row * size + col.
+
+    black[s][i] is the key for the point which index i is mapped to by
+    symmetry s.
+
+    """
+    def __init__(self, size):
+        rng = random.Random(size)
+        self.base = rng.getrandbits(64)
+        black = [rng.getrandbits(64) for _ in xrange(size * size)]
+        white = [rng.getrandbits(64) for _ in xrange(size * size)]
+        self.black = []
+        self.white = []
+        for symmetry in xrange(NUMBER_OF_SYMMETRIES):
+            b = []
+            w = []
+            for row in xrange(size):
+                for col in xrange(size):
+                    r, c = transform_point(row, col, size, symmetry)
+                    b.append(black[r * size + c])
+                    w.append(white[r * size + c])
+            self.black.append(b)
+            self.white.append(w)
+
+_keys_by_size = {}
+
+def _get_keys(size):
+    try:
+        return _keys_by_size[size]
+    except KeyError:
+        keys = _keys_by_size[size] = _Keys(size)
+        return keys
+
+
+def get_symmetry_hashes(board):
+    """Calculate a position's hashes under each of the board symmetries.
+
+    board -- boards.Board
+
+    Returns a list of NUMBER_OF_SYMMETRIES ints. The first is the plain
+    (non-symmetric) hash of the position.
+
+    """
+    size = board.side
+    keys = _get_keys(size)
+    hashes = [keys.base] * NUMBER_OF_SYMMETRIES
+    symmetries = range(NUMBER_OF_SYMMETRIES)
+    i = 0
+    for row in board.board:
+        for colour in row:
+            if colour is not None:
+                if colour == 'b':
+                    table = keys.black
+                else:
+                    table = keys.white
+                for s in symmetries:
+                    hashes[s] ^= table[s][i]
+            i += 1
+    return hashes
+
+def position_hash(board, symmetric=False):
+    """Calculate the hash of a position.
+
+    board     -- boards.Board
+    symmetric -- bool
+
+    Returns a 64-bit int.
+
+    If 'symmetric' is true, returns the smallest of the hashes of the position
+    under the board symmetries.
+
+    """
+    if not symmetric:
+        keys = _get_keys(board.side)
+        h = keys.base
+        black = keys.black[0]
+        white = keys.white[0]
+        i = 0
+        for row in board.board:
+            for colour in row:
+                if colour == 'b':
+                    h ^= black[i]
+                elif colour == 'w':
+                    h ^= white[i]
+                i += 1
+        return h
+    return min(get_symmetry_hashes(board))
+
+
+def game_position_hashes(size, setup, moves, symmetric=False):
+    """Replay a game, calculating the hash of each position.
+
+    size      -- board size
+    setup     -- pair (colours, points)
+    moves     -- pair (colours, points)
+    symmetric -- bool
+
+    'setup' and 'moves' are in the compact form returned by
+    sgf_moves.get_compact_setup_and_moves().
+
+    Returns an iterator of pairs (move number, hash), where move number is the
+    number of moves (including passes) played to reach the position.
+
+    The empty board isn't reported. Passes aren't reported (because the
+    position doesn't change). If the same position appears more than once, only
+    the first occurrence is reported.
+
+    Stops at the first move which is played on an occupied point.
+
+    See position_hash() for the meaning of 'symmetric'.
+
+    """
+    board = boards.Board(size)
+    keys = _get_keys(size)
+    if symmetric:
+        symmetries = range(NUMBER_OF_SYMMETRIES)
+    else:
+        symmetries = [0]
+    seen = set()
+    setup_colours, setup_points = setup
+    if setup_points:
+        black = []
+        white = []
+        for colour, point in zip(setup_colours, setup_points):
+            if colour == 98: # ord('b')
+                black.append(divmod(point, size))
+            else:
+                white.append(divmod(point, size))
+        board.apply_setup(black, white, [])
+    hashes = get_symmetry_hashes(board)
+    if not board.is_empty():
+        h = min([hashes[s] for s in symmetries])
+        seen.add(h)
+        yield 0, h
+    rows = board.board
+    move_number = 0
+    for colour, point in zip(*moves):
+        move_number += 1
+        if point < 0:
+            continue
+        row, col = divmod(point, size)
+        colour = chr(colour)
+        opponent_neighbours = [
+            (r, c) for (r, c) in ((row-1, col), (row+1, col),
+                                  (row, col-1), (row, col+1))
+            if 0 <= r < size and 0 <= c < size and
+            rows[r][c] not in (None, colour)]
+        try:
+            board.play(row, col, colour)
+        except ValueError:
+            break
+        if (rows[row][col] != colour or
+            [1 for (r, c) in opponent_neighbours if rows[r][c] is None]):
+            # There was a capture
+            hashes = get_symmetry_hashes(board)
+        else:
+            if colour == 'b':
+                table = keys.black
+            else:
+                table = keys.white
+            for s in symmetries:
+                hashes[s] ^= table[s][point]
+        if board.is_empty():
+            continue
+        h = min([hashes[s] for s in symmetries])
+        if h in seen:
+            continue
+        seen.add(h)
+        yield move_number, h
@@ -125,6 +125,10 @@ class Cem_tuner(Competition):
     The game ids are like 'g0#1r3', where 0 is the generation number, 1 is the
     candidate number and 3 is the round number.
 
+    In asynchronous mode, candidate numbers count up through the whole run
+    (rather than restarting for each generation), and the generation number
+    in a candidate's code is the one it was sampled in.
+
     """
     def __init__(self, competition_code, **kwargs):
         Competition.__init__(self, competition_code, **kwargs)
@@ -145,6 +149,7 @@ class Cem_tuner(Competition):
         Setting('number_of_generations', interpret_positive_int),
         Setting('elite_proportion', interpret_float),
         Setting('step_size', interpret_float),
+        Setting('asynchronous', interpret_bool, default=False),
         ])
 
     special_settings = [
@@ -248,34 +253,76 @@ class Cem_tuner(Competition):
     # These are all reset for each new generation.
     #
     #   seen_successful_game -- bool (per-run state)
+    #
+    # In asynchronous mode, the state attributes are instead:
+    #  *generation        -- number of distribution updates made so far
+    #  *distribution      -- current Distribution
+    #  *next_candidate_number -- int
+    #  *sample_parameters -- map candidate number -> optimiser_params
+    #  *candidate_generations -- map candidate number -> generation number
+    #  *wins              -- map candidate number -> number of games won
+    #  *completed         -- list of tuples
+    #                        (wins, candidate number, generation number,
+    #                         optimiser_params)
+    #                        for candidates which have finished their
+    #                        batches since the last update
+    #   candidates        -- map candidate number -> Player
+    #  *scheduler         -- Group_scheduler (group codes are candidate numbers)
+    #
+    # The maps contain only candidates which are still playing their batches.
 
     def set_clean_status(self):
         self.generation = 0
         self.distribution = self.initial_distribution
-        self.reset_for_new_generation()
+        if self.asynchronous:
+            self.next_candidate_number = 0
+            self.sample_parameters = {}
+            self.candidate_generations = {}
+            self.wins = {}
+            self.completed = []
+            self.candidates = {}
+            self.scheduler = competition_schedulers.Group_scheduler()
+        else:
+            self.reset_for_new_generation()
 
     def _set_scheduler_groups(self):
+        if self.asynchronous:
+            candidate_numbers = sorted(self.sample_parameters)
+        else:
+            candidate_numbers = xrange(self.samples_per_generation)
         self.scheduler.set_groups(
-            (i, self.batch_size) for i in xrange(self.samples_per_generation)
-            )
+            (i, self.batch_size) for i in candidate_numbers)
 
     # Can bump this to prevent people loading incompatible .status files.
     status_format_version = 0
 
     def get_status(self):
-        return {
+        result = {
             'generation'         : self.generation,
             'distribution'       : self.distribution.parameters,
             'sample_parameters'  : self.sample_parameters,
             'wins'               : self.wins,
             'scheduler'          : self.scheduler,
             }
+        if self.asynchronous:
+            result['asynchronous'] = True
+            result['next_candidate_number'] = self.next_candidate_number
+            result['candidate_generations'] = self.candidate_generations
+            result['completed'] = self.completed
+        return result
 
     def set_status(self, status):
+        if status.get('asynchronous', False) != self.asynchronous:
+            raise CompetitionError(
+                "status file is inconsistent with control file")
         self.generation = status['generation']
         self.distribution = Distribution(status['distribution'])
         self.sample_parameters = status['sample_parameters']
         self.wins = status['wins']
+        if self.asynchronous:
+            self.next_candidate_number = status['next_candidate_number']
+            self.candidate_generations = status['candidate_generations']
+            self.completed = status['completed']
         self.prepare_candidates()
         self.scheduler = status['scheduler']
         # Might as well notice if they changed the batch_size
@@ -351,11 +398,17 @@ class Cem_tuner(Competition):
 
         This is run for each new generation, and when reloading state.
 
-        Requires generation and sample_parameters to be already set.
+        Requires generation and sample_parameters to be already set (and
+        candidate_generations, in asynchronous mode).
 
         Initialises self.candidates.
 
         """
+        if self.asynchronous:
+            self.candidates = {}
+            for candidate_number in self.sample_parameters:
+                self._prepare_async_candidate(candidate_number)
+            return
         self.candidates = []
         for candidate_number, optimiser_params in \
                 enumerate(self.sample_parameters):
@@ -365,6 +418,70 @@ class Cem_tuner(Competition):
             self.candidates.append(
                 self.make_candidate(candidate_code, engine_parameters))
 
+    def _prepare_async_candidate(self, candidate_number):
+        candidate_code = self.make_candidate_code(
+            self.candidate_generations[candidate_number], candidate_number)
+        engine_parameters = self.transform_parameters(
+            self.sample_parameters[candidate_number])
+        self.candidates[candidate_number] = self.make_candidate(
+            candidate_code, engine_parameters)
+
+    def _start_async_candidate(self):
+        """Sample a new candidate from the current distribution (async mode).
+
+        Returns False if no more candidates are needed.
+
+        """
+        if (self.next_candidate_number >=
+            self.samples_per_generation * self.number_of_generations):
+            return False
+        candidate_number = self.next_candidate_number
+        self.next_candidate_number += 1
+        self.sample_parameters[candidate_number] = \
+            self.distribution.get_sample()
+        self.candidate_generations[candidate_number] = self.generation
+        self.wins[candidate_number] = 0
+        self._prepare_async_candidate(candidate_number)
+        self._set_scheduler_groups()
+        return True
+
+    def _finish_async_candidate(self, candidate_number):
+        """Process a candidate's completed batch (async mode).
+
+        Updates the distribution if enough candidates have completed.
+
+        """
+        self.completed.append((self.wins.pop(candidate_number),
+                               candidate_number,
+                               self.candidate_generations.pop(candidate_number),
+                               self.sample_parameters.pop(candidate_number)))
+        del self.candidates[candidate_number]
+        self._set_scheduler_groups()
+        if len(self.completed) < self.samples_per_generation:
+            return
+        results = sorted(self.completed, reverse=True)
+        elite_count = max(1,
+            int(self.elite_proportion * len(results) + 0.5))
+        self.log_history("Generation %s" % self.generation)
+        self.log_history("Distribution\n%s" %
+                         self.format_distribution(self.distribution))
+        self.log_history(self._format_results(
+            [(wins, self.make_candidate_code(generation, candidate_number),
+              opt_parameters)
+             for (wins, candidate_number, generation, opt_parameters)
+             in results],
+            elite_count))
+        self.log_history("")
+        self.distribution = update_distribution(
+            self.distribution,
+            [opt_parameters
+             for (_, _, _, opt_parameters) in results[:elite_count]],
+            self.step_size)
+        self.completed = []
+        self.generation += 1
+        if self.generation != self.number_of_generations:
+            self.log_event("\nstarting generation %d" % self.generation)
+
     def finish_generation(self):
         """Process a generation's results and calculate the new distribution.
 
@@ -408,10 +525,15 @@ class Cem_tuner(Competition):
             return self.candidate_colour
 
     def get_game(self):
-        if self.scheduler.nothing_issued_yet():
+        if self.scheduler.nothing_issued_yet() and not self.asynchronous:
             self.log_event("\nstarting generation %d" % self.generation)
 
         candidate_number, round_id = self.scheduler.issue()
+        if candidate_number is None and self.asynchronous:
+            # All games for the current candidates have been issued; start
+            # another candidate rather than waiting for them to finish.
+            if self._start_async_candidate():
+                candidate_number, round_id = self.scheduler.issue()
         if candidate_number is None:
             return NoGameAvailable
 
@@ -453,6 +575,11 @@ class Cem_tuner(Competition):
         elif gr.winning_player is None:
             self.wins[candidate_number] += 0.5
 
+        if self.asynchronous:
+            if self.scheduler.is_group_fixed(candidate_number):
+                self._finish_async_candidate(candidate_number)
+            return
+
         if self.scheduler.all_fixed():
             self.finish_generation()
             self.generation += 1
@@ -487,13 +614,27 @@ class Cem_tuner(Competition):
         ordered_samples -- list of pairs (wins, candidate number)
         elite_count     -- number of samples to mark as elite
 
+        """
+        return self._format_results(
+            [(wins, self.make_candidate_code(self.generation, candidate_number),
+              self.sample_parameters[candidate_number])
+             for (wins, candidate_number) in ordered_samples],
+            elite_count)
+
+    def _format_results(self, ordered_results, elite_count):
+        """Pretty-print a list of candidate results.
+
+        ordered_results -- list of tuples
+                           (wins, candidate code, optimiser_params)
+        elite_count     -- number of samples to mark as elite
+
         """
         result = []
-        for i, (wins, candidate_number) in enumerate(ordered_samples):
-            opt_parameters = self.sample_parameters[candidate_number]
+        for i, (wins, candidate_code, opt_parameters) in \
+                enumerate(ordered_results):
             result.append(
                 "%s%s %s %3d" %
-                (self.make_candidate_code(self.generation, candidate_number),
+                (candidate_code,
                  "*" if i < elite_count else " ",
                  self.format_optimiser_parameters(opt_parameters),
                  wins))
@@ -511,7 +652,14 @@ class Cem_tuner(Competition):
     def write_screen_report(self, out):
         print >>out, "generation %d" % self.generation
         print >>out
-        print >>out, "wins from current samples:\n%s" % self.wins
+        if self.asynchronous:
+            print >>out, "candidates completed for this generation: %d/%d" % (
+                len(self.completed), self.samples_per_generation)
+            print >>out, "wins from candidates in progress:\n%s" % (
+                ", ".join("%s: %s" % (self.candidates[i].code, self.wins[i])
+                          for i in sorted(self.wins)))
+        else:
+            print >>out, "wins from current samples:\n%s" % self.wins
         print >>out
         if self.generation == self.number_of_generations:
             print >>out, "final distribution:"
@@ -159,6 +159,15 @@ class Group_scheduler(object):
         """Note that a game's result has been reliably stored."""
         self.allocators[group_code].fix(game_number)
 
+    def is_group_fixed(self, group_code):
+        """Check whether all of a group's games have been fixed.
+
+        Returns False for a group with no limit.
+
+        """
+        limit = self.limits[group_code]
+        return limit is not None and self.allocators[group_code].fixed >= limit
+
     def rollback(self):
         """Make issued-but-not-fixed tokens available again."""
         for allocator in self.allocators.itervalues():
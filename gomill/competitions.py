@@ -51,6 +51,15 @@ _player_settings = [
             defaultmaker=list),
     Setting('discard_stderr', interpret_bool, default=False),
     Setting('sgf_player_name_from_gtp', interpret_bool, default=True),
+    Setting('threads', interpret_positive_int, default=1),
+    Setting('memory', allow_none(interpret_positive_int), default=None),
+    Setting('memory_limit', allow_none(interpret_positive_int), default=None),
+    Setting('cpu_time_limit', allow_none(interpret_positive_int),
+            default=None),
+    Setting('open_files_limit', allow_none(interpret_positive_int),
+            default=None),
+    Setting('process_limit', allow_none(interpret_positive_int),
+            default=None),
     ]
 
 class Player_config(Quiet_config):
@@ -255,6 +264,12 @@ class Competition(object):
         player.allow_claim = config['allow_claim']
         player.discard_stderr = config['discard_stderr']
         player.sgf_player_name_from_gtp = config['sgf_player_name_from_gtp']
+        player.threads = config['threads']
+        player.memory = config['memory']
+        player.memory_limit = config['memory_limit']
+        player.cpu_time_limit = config['cpu_time_limit']
+        player.open_files_limit = config['open_files_limit']
+        player.process_limit = config['process_limit']
 
         player.startup_gtp_commands = []
         try:
@@ -426,6 +441,19 @@ class Competition(object):
         """
         raise NotImplementedError
 
+    def get_matchup_id(self, game_data):
+        """Say which matchup a game belongs to.
+
+        game_data -- the game_data attribute of a Game_job from get_game()
+
+        Returns a matchup id, or None if the competition doesn't organise its
+        games into matchups.
+
+        This is used to classify games in the ringmaster's metrics.
+
+        """
+        return None
+
     def get_tournament_results(self):
         """Return a Tournament_results object for this competition.
 
@@ -441,6 +469,32 @@ class Competition(object):
         """
         raise NotImplementedError
 
+    def get_database_tournament_results(self, database):
+        """Return a Tournament_results object which reads from a database.
+
+        database -- result_databases.Result_database
+
+        Returns a result_databases.Database_tournament_results object.
+
+        Unlike get_tournament_results(), this doesn't need the competition
+        status to be set.
+
+        Expect this to be implemented for tournaments but not tuning events.
+
+        """
+        raise NotImplementedError
+
+    def get_recorded_results(self):
+        """Return all game results held in the competition status.
+
+        Returns a list of pairs (matchup id or None, gtp_games.Game_result)
+
+        This is used to bring a results database up to date. Competitions
+        which don't keep individual game results return an empty list.
+
+        """
+        return []
+
 
 ## Helper functions for settings
 
@@ -0,0 +1,193 @@
+"""Restrict processes to particular CPUs.
+
+This uses the Linux sched_setaffinity() system call (via ctypes). On other
+systems, is_supported() returns False.
+
+CPUs are identified by the kernel's CPU numbers.
+
+"""
+
+from __future__ import with_statement
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import sys
+
+# Size of the cpu_set_t we pass to the kernel (in bits)
+_CPU_SETSIZE = 1024
+
+_libc = None
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.sched_setaffinity
+        libc.sched_getaffinity
+        _libc = libc
+    return _libc
+
+def is_supported():
+    """Check whether this system supports setting CPU affinity."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        _get_libc()
+    except (EnvironmentError, AttributeError):
+        return False
+    return True
+
+def _make_cpu_set_type():
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    return ctypes.c_ulong * (_CPU_SETSIZE // bits), bits
+
+def _raise_errno():
+    e = ctypes.get_errno()
+    raise OSError(e, os.strerror(e))
+
+def get_affinity(pid=0):
+    """Return the CPUs a process may run on.
+
+    pid -- process id (0 means the calling process)
+
+    Returns a sorted list of CPU numbers.
+
+    Raises OSError if the system call fails.
+
+    """
+    cpu_set_type, bits = _make_cpu_set_type()
+    mask = cpu_set_type()
+    if _get_libc().sched_getaffinity(
+            pid, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        _raise_errno()
+    return [cpu for cpu in xrange(_CPU_SETSIZE)
+            if mask[cpu // bits] & (1 << (cpu % bits))]
+
+def set_affinity(cpus, pid=0):
+    """Restrict a process to the specified CPUs.
+
+    cpus -- nonempty sequence of CPU numbers
+    pid  -- process id (0 means the calling process)
+
+    Subprocesses started afterwards inherit the restriction.
+
+    Raises OSError if the system call fails (for example, EINVAL if none of
+    the CPUs is available).
+
+    """
+    cpu_set_type, bits = _make_cpu_set_type()
+    mask = cpu_set_type()
+    for cpu in cpus:
+        if not 0 <= cpu < _CPU_SETSIZE:
+            raise OSError(errno.EINVAL, "CPU number out of range: %s" % cpu)
+        mask[cpu // bits] |= 1 << (cpu % bits)
+    if _get_libc().sched_setaffinity(
+            pid, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        _raise_errno()
+
+
+def _read_int(pathname):
+    with open(pathname) as f:
+        return int(f.read().strip())
+
+def parse_cpu_list(s):
+    """Interpret a CPU list in the kernel's format (eg '0-3,8,10-11').
+
+    Returns a sorted list of ints.
+
+    Raises ValueError if the string isn't well-formed.
+
+    """
+    result = set()
+    for item in s.strip().split(","):
+        if not item:
+            continue
+        if "-" in item:
+            first, last = item.split("-", 1)
+            result.update(xrange(int(first), int(last) + 1))
+        else:
+            result.add(int(item))
+    return sorted(result)
+
+def get_cpu_topology(sysfs_root="/sys/devices/system"):
+    """Describe where each CPU is located.
+
+    Returns a map CPU number -> tuple (node, package, core)
+
+    The information comes from sysfs. Values which aren't available are given
+    as 0 (so if the system has no NUMA information, all CPUs are reported as
+    being in node 0).
+
+    """
+    nodes = {}
+    node_dir = os.path.join(sysfs_root, "node")
+    try:
+        node_names = os.listdir(node_dir)
+    except EnvironmentError:
+        node_names = []
+    for name in node_names:
+        if not (name.startswith("node") and name[4:].isdigit()):
+            continue
+        try:
+            with open(os.path.join(node_dir, name, "cpulist")) as f:
+                for cpu in parse_cpu_list(f.read()):
+                    nodes[cpu] = int(name[4:])
+        except (EnvironmentError, ValueError):
+            pass
+    result = {}
+    cpu_dir = os.path.join(sysfs_root, "cpu")
+    try:
+        cpu_names = os.listdir(cpu_dir)
+    except EnvironmentError:
+        cpu_names = []
+    for name in cpu_names:
+        if not (name.startswith("cpu") and name[3:].isdigit()):
+            continue
+        cpu = int(name[3:])
+        topology_dir = os.path.join(cpu_dir, name, "topology")
+        try:
+            package = _read_int(
+                os.path.join(topology_dir, "physical_package_id"))
+            core = _read_int(os.path.join(topology_dir, "core_id"))
+        except (EnvironmentError, ValueError):
+            package = core = 0
+        result[cpu] = (nodes.get(cpu, 0), package, core)
+    return result
+
+def allocate_cpu_slots(cpus, cpus_per_slot, topology=None):
+    """Divide CPUs into disjoint slots.
+
+    cpus          -- list of CPU numbers available for use
+    cpus_per_slot -- positive int
+    topology      -- map as returned by get_cpu_topology() (optional)
+
+    Returns a list of slots, each a sorted list of cpus_per_slot CPU numbers.
+    Returns as many slots as will fit.
+
+    If topology is given, CPUs which share a core are put in the same slot
+    where possible, and slots don't span NUMA nodes unless a slot needs more
+    CPUs than any single node has available.
+
+    """
+    if not cpus:
+        return []
+    if topology is None:
+        topology = {}
+    def location(cpu):
+        return topology.get(cpu, (0, 0, 0)) + (cpu,)
+    by_node = {}
+    for cpu in cpus:
+        by_node.setdefault(location(cpu)[0], []).append(cpu)
+    if max(len(l) for l in by_node.values()) < cpus_per_slot:
+        groups = [cpus]
+    else:
+        groups = [by_node[node] for node in sorted(by_node)]
+    slots = []
+    for group in groups:
+        group = sorted(group, key=location)
+        for i in xrange(0, len(group) - cpus_per_slot + 1, cpus_per_slot):
+            slots.append(sorted(group[i:i+cpus_per_slot]))
+    return slots
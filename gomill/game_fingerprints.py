@@ -0,0 +1,335 @@
+"""Detect duplicate games.
+
+A game's fingerprint identifies its board size, setup stones and sequence of
+moves, ignoring rotations and reflections of the board, and swapping of the
+colours. That is, two games which are the same apart from their orientation
+(or apart from which colour played which moves) have the same fingerprint.
+
+Fingerprints are 8-bit strings (40 hex digits).
+
+"""
+
+from array import array
+import hashlib
+import sqlite3
+
+from gomill import board_hashes
+from gomill import sgf_grammar
+from gomill import sgf_moves
+
+_swap_colours_table = "".join(
+    {'b' : 'w', 'w' : 'b'}.get(chr(i), chr(i)) for i in xrange(256))
+
+_point_tables = {}
+
+def _get_point_tables(size):
+    """Return the symmetry tables for a board size.
+
+    Returns a list of arrays, one for each symmetry, mapping encoded points to
+    encoded points.
+
+    Each array has an extra final element -1, so the encoded pass value maps
+    to itself.
+
+    """
+    try:
+        return _point_tables[size]
+    except KeyError:
+        pass
+    tables = []
+    for symmetry in xrange(board_hashes.NUMBER_OF_SYMMETRIES):
+        table = array('h')
+        for row in xrange(size):
+            for col in xrange(size):
+                r, c = board_hashes.transform_point(row, col, size, symmetry)
+                table.append(r * size + c)
+        table.append(-1)
+        tables.append(table)
+    _point_tables[size] = tables
+    return tables
+
+def fingerprint(size, setup, moves):
+    """Calculate a game's fingerprint.
+
+    size  -- board size
+    setup -- pair (colours, points)
+    moves -- pair (colours, points)
+
+    'setup' and 'moves' are in the compact form returned by
+    sgf_moves.get_compact_setup_and_moves().
+
+    Returns an 8-bit string.
+
+    The order of the setup stones doesn't affect the result.
+
+    """
+    setup_colours, setup_points = setup
+    move_colours, move_points = moves
+    setup_colours = str(setup_colours)
+    move_colours = str(move_colours)
+    digests = []
+    for table in _get_point_tables(size):
+        setup_stones = sorted(
+            (table[p], c) for (p, c) in zip(setup_points, setup_colours))
+        points = array('h', [table[p] for p in move_points])
+        for swap in (False, True):
+            if swap:
+                setup_s = "".join(
+                    c.translate(_swap_colours_table) for (_, c) in setup_stones)
+                colours_s = move_colours.translate(_swap_colours_table)
+            else:
+                setup_s = "".join(c for (_, c) in setup_stones)
+                colours_s = move_colours
+            h = hashlib.sha1("%d:%d:%d:" % (size, len(setup_stones),
+                                            len(points)))
+            h.update(setup_s)
+            h.update(array('h', [p for (p, _) in setup_stones]).tostring())
+            h.update(colours_s)
+            h.update(points.tostring())
+            digests.append(h.digest())
+    return min(digests).encode("hex")
+
+def fingerprint_from_moves(size, setup_stones, moves):
+    """Calculate a game's fingerprint from gomill-style move lists.
+
+    size         -- board size
+    setup_stones -- list of pairs (colour, (row, col))
+    moves        -- list of pairs (colour, move)
+                    moves are (row, col), or None for a pass
+
+    Returns an 8-bit string, as for fingerprint().
+
+    """
+    def compact(l):
+        colours = bytearray()
+        points = array('h')
+        for colour, move in l:
+            colours.append(colour)
+            if move is None:
+                points.append(-1)
+            else:
+                row, col = move
+                points.append(row * size + col)
+        return colours, points
+    return fingerprint(size, compact(setup_stones), compact(moves))
+
+def fingerprint_coarse_game(coarse_game):
+    """Calculate the fingerprint of a game from the SGF parser output.
+
+    coarse_game -- sgf_grammar.Coarse_game_tree
+
+    Returns an 8-bit string, as for fingerprint().
+
+    Uses the game's leftmost variation.
+
+    Raises ValueError if the game's moves can't be extracted; see
+    sgf_moves.get_compact_setup_and_moves().
+
+    """
+    return fingerprint(*sgf_moves.get_compact_setup_and_moves(coarse_game))
+
+
+def iter_collection_fingerprints(s):
+    """Calculate the fingerprints of the games in an SGF collection.
+
+    s -- 8-bit string
+
+    Returns an iterator of tuples (game number, start, end, fingerprint)
+
+    'start' and 'end' are as for sgf_grammar.iter_sgf_collection(). The
+    fingerprint is None for a game whose moves couldn't be extracted.
+
+    Raises ValueError (when it reaches the problem) if there is an error
+    parsing the collection.
+
+    """
+    for game_number, (start, end, coarse_game) in enumerate(
+            sgf_grammar.iter_sgf_collection(s)):
+        try:
+            fp = fingerprint_coarse_game(coarse_game)
+        except ValueError:
+            fp = None
+        yield game_number, start, end, fp
+
+class Duplicate_finder(object):
+    """Find duplicate games in a stream of SGF files.
+
+    Call add_file() (or add_fingerprint()) for each file or game in turn, and
+    close() when finished.
+
+    The games themselves aren't kept. For each distinct game, the finder keeps
+    its fingerprint (in binary form) and a compact encoding of its location.
+    Up to max_in_memory of these are held in a dict; beyond that, they're
+    moved to a temporary SQLite database on disk. So memory use is bounded
+    (apart from a list of the pathnames seen, and the 'duplicates' and
+    'errors' lists), and arbitrarily large collections can be processed.
+
+    Public attributes (treat as read-only):
+      game_count      -- int (number of games seen)
+      duplicate_count -- int (number of games which duplicated an earlier one)
+      duplicates      -- list of pairs (location, location of original)
+      errors          -- list of pairs (location, error message)
+
+    A location is a pair (pathname, game number). Game numbers must be None
+    or less than 2**32.
+
+    If 'record_duplicates' is false, the duplicates list isn't maintained.
+
+    """
+    # Number of distinct fingerprints to hold in memory before moving them to
+    # the database (each takes roughly 150 bytes).
+    max_in_memory = 500000
+
+    def __init__(self, record_duplicates=True):
+        self.record_duplicates = record_duplicates
+        # Map binary fingerprint -> encoded location
+        self._first_seen = {}
+        # Temporary database for fingerprints moved out of _first_seen, or
+        # None if nothing has been moved yet
+        self._db = None
+        self._pathnames = []
+        self._pathname_numbers = {}
+        self.game_count = 0
+        self.duplicate_count = 0
+        self.duplicates = []
+        self.errors = []
+
+    def close(self):
+        """Release the temporary database, if there is one.
+
+        The public attributes can still be used after calling this.
+
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        self._first_seen = {}
+
+    def _encode_location(self, location):
+        pathname, game_number = location
+        try:
+            pathname_number = self._pathname_numbers[pathname]
+        except KeyError:
+            pathname_number = len(self._pathnames)
+            self._pathnames.append(pathname)
+            self._pathname_numbers[pathname] = pathname_number
+        if game_number is None:
+            game_number = -1
+        return (pathname_number << 32) | (game_number + 1)
+
+    def _decode_location(self, code):
+        game_number = (code & 0xffffffff) - 1
+        if game_number == -1:
+            game_number = None
+        return self._pathnames[code >> 32], game_number
+
+    def _move_to_database(self):
+        """Move the fingerprints held in memory to the database."""
+        if self._db is None:
+            # An empty filename gives a temporary on-disk database, which is
+            # deleted when it's closed.
+            self._db = sqlite3.connect("")
+            self._db.execute("CREATE TABLE fingerprints ("
+                             " digest BLOB PRIMARY KEY,"
+                             " location INTEGER NOT NULL)")
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO fingerprints VALUES (?, ?)",
+                ((buffer(digest), code)
+                 for (digest, code) in self._first_seen.iteritems()))
+        self._first_seen = {}
+
+    def _find(self, digest):
+        """Return the encoded location for a binary fingerprint, or None."""
+        code = self._first_seen.get(digest)
+        if code is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT location FROM fingerprints WHERE digest = ?",
+                (buffer(digest),)).fetchone()
+            if row is not None:
+                code = row[0]
+        return code
+
+    def add_fingerprint(self, fp, location):
+        """Record a game's fingerprint.
+
+        Returns the location of the earlier game with the same fingerprint, or
+        None if this game isn't a duplicate.
+
+        """
+        self.game_count += 1
+        digest = fp.decode("hex")
+        code = self._find(digest)
+        if code is None:
+            self._first_seen[digest] = self._encode_location(location)
+            if len(self._first_seen) >= self.max_in_memory:
+                self._move_to_database()
+            return None
+        original = self._decode_location(code)
+        self.duplicate_count += 1
+        if self.record_duplicates:
+            self.duplicates.append((location, original))
+        return original
+
+    def add_file(self, pathname, s=None, write_unique=None):
+        """Process the games in an SGF file.
+
+        pathname     -- string
+        s            -- 8-bit string (default: read the file)
+        write_unique -- function taking an 8-bit string (optional)
+
+        If 'write_unique' is specified, it's called with the SGF data for each
+        game which isn't a duplicate (including games whose moves can't be
+        extracted).
+
+        Problems reading or parsing the file are recorded in 'errors'.
+
+        """
+        if s is None:
+            try:
+                f = open(pathname, "rb")
+                try:
+                    s = f.read()
+                finally:
+                    f.close()
+            except EnvironmentError, e:
+                self.errors.append(((pathname, None), str(e)))
+                return
+        try:
+            for game_number, start, end, fp in iter_collection_fingerprints(s):
+                location = (pathname, game_number)
+                if fp is None:
+                    self.errors.append((location, "can't extract moves"))
+                    is_duplicate = False
+                else:
+                    is_duplicate = (
+                        self.add_fingerprint(fp, location) is not None)
+                if write_unique is not None and not is_duplicate:
+                    write_unique(s[start:end])
+        except ValueError, e:
+            self.errors.append(((pathname, None), str(e)))
+
+
+def write_deduplicated_collection(pathnames, output_pathname):
+    """Write an SGF collection containing one copy of each distinct game.
+
+    pathnames       -- list of pathnames of SGF files
+    output_pathname -- pathname of the collection to write
+
+    Keeps the first occurrence of each game (in the order of 'pathnames').
+
+    Returns the Duplicate_finder used.
+
+    """
+    finder = Duplicate_finder(record_duplicates=False)
+    f = open(output_pathname, "wb")
+    try:
+        def write_unique(s):
+            f.write(s)
+            f.write("\n")
+        for pathname in pathnames:
+            finder.add_file(pathname, write_unique=write_unique)
+    finally:
+        f.close()
+        finder.close()
+    return finder
@@ -1,11 +1,16 @@
 """Connection between GTP games and the job manager."""
 
 import datetime
+import hashlib
 import os
+import signal
 
+from gomill import game_fingerprints
 from gomill import gtp_controller
 from gomill import gtp_games
 from gomill import job_manager
+from gomill import live_sgf
+from gomill import sgf
 from gomill import utils
 from gomill.gtp_controller import BadGtpResponse, GtpChannelError
 
@@ -25,6 +30,13 @@ class Player(object):
       cwd                  -- working directory to change to (default None)
       environ              -- maplike of environment variables (default None)
       sgf_player_name_from_gtp -- Use gtp player name in sgf files (default True)
+      threads              -- number of threads the engine uses (default 1)
+      memory               -- memory the engine needs, in megabytes
+                              (default None, meaning unspecified)
+      memory_limit         -- int (megabytes) or None
+      cpu_time_limit       -- int (seconds) or None
+      open_files_limit     -- int or None
+      process_limit        -- int or None
 
     See gtp_controllers.Gtp_controller for an explanation of gtp_aliases.
 
@@ -36,6 +48,9 @@ class Player(object):
     environment variables; use 'environ' to add variables or replace particular
     values.
 
+    The ..._limit attributes are resource limits applied to the engine
+    subprocess (see get_resource_limits()). None means no limit.
+
     Players are suitable for pickling.
 
     """
@@ -48,6 +63,12 @@ class Player(object):
         self.cwd = None
         self.environ = None
         self.sgf_player_name_from_gtp = True
+        self.threads = 1
+        self.memory = None
+        self.memory_limit = None
+        self.cpu_time_limit = None
+        self.open_files_limit = None
+        self.process_limit = None
 
     def make_environ(self):
         """Return environment variables to use with the player's subprocess.
@@ -60,6 +81,47 @@ class Player(object):
             environ.update(self.environ)
         return environ
 
+    def get_resource_limits(self):
+        """Return the resource limits to apply to the player's subprocess.
+
+        Returns a list of pairs (resource name, int), suitable for use with a
+        Subprocess_gtp_channel.
+
+        memory_limit limits the engine's address space (RLIMIT_AS), which may
+        be larger than the memory it actually uses. process_limit is applied
+        using RLIMIT_NPROC, which counts all processes belonging to the user.
+
+        """
+        result = []
+        if self.memory_limit is not None:
+            result.append(('RLIMIT_AS', self.memory_limit * 1024 * 1024))
+        if self.cpu_time_limit is not None:
+            result.append(('RLIMIT_CPU', self.cpu_time_limit))
+        if self.open_files_limit is not None:
+            result.append(('RLIMIT_NOFILE', self.open_files_limit))
+        if self.process_limit is not None:
+            result.append(('RLIMIT_NPROC', self.process_limit))
+        return result
+
+    def describe_resource_limits(self):
+        """Return a short description of the player's resource limits.
+
+        Returns a string, or None if the player has no resource limits.
+
+        """
+        limits = []
+        if self.memory_limit is not None:
+            limits.append("memory %dMB" % self.memory_limit)
+        if self.cpu_time_limit is not None:
+            limits.append("CPU time %ds" % self.cpu_time_limit)
+        if self.open_files_limit is not None:
+            limits.append("open files %d" % self.open_files_limit)
+        if self.process_limit is not None:
+            limits.append("processes %d" % self.process_limit)
+        if not limits:
+            return None
+        return ", ".join(limits)
+
     def copy(self, code):
         """Return an independent clone of the Player."""
         result = Player()
@@ -72,6 +134,12 @@ class Player(object):
         result.gtp_aliases = dict(self.gtp_aliases)
         result.startup_gtp_commands = list(self.startup_gtp_commands)
         result.cwd = self.cwd
+        result.threads = self.threads
+        result.memory = self.memory
+        result.memory_limit = self.memory_limit
+        result.cpu_time_limit = self.cpu_time_limit
+        result.open_files_limit = self.open_files_limit
+        result.process_limit = self.process_limit
         if self.environ is None:
             result.environ = None
         else:
@@ -88,10 +156,20 @@ class Game_job_result(object):
       warnings              -- list of strings
       log_entries           -- list of strings
       engine_descriptions   -- map player code -> Engine_description
+      sgf_string            -- 8-bit string or None
+      move_times            -- map player code -> list of floats, or None
+
+    sgf_string is the game's SGF record if the Game_job's return_sgf was set
+    (otherwise it's None).
+
+    move_times gives the wall-clock time (in seconds) each player took to
+    generate each of its moves.
 
     Game_job_results are suitable for pickling.
 
     """
+    sgf_string = None
+    move_times = None
 
 class Game_job(object):
     """A game to be played in a worker process.
@@ -123,6 +201,8 @@ class Game_job(object):
       sgf_game_name       -- string to show as SGF Game Name (default game_id)
       sgf_event           -- string to show as SGF EVent
       sgf_note            -- multiline string to put into SGF root comment
+      live_sgf            -- bool (default False)
+      return_sgf          -- bool (default False)
       gtp_log_pathname    -- pathname to use for the GTP log
       stderr_pathname     -- pathname to send players' stderr to
 
@@ -143,6 +223,16 @@ class Game_job(object):
     for any void games (games which were aborted due to unhandled errors) which
     have at least one move. The leaf directory will be created if necessary.
 
+    If return_sgf is True, the SGF record isn't written to sgf_dirname;
+    instead it's returned in the job result (records for void games are still
+    written to void_sgf_dirname).
+
+    If live_sgf is True (and sgf_dirname and sgf_filename are set), the SGF
+    record is written while the game is played, to a file in sgf_dirname with
+    '.partial' appended to sgf_filename (see the live_sgf module). When the
+    game is over the record is completed and renamed to its normal location
+    (or removed, for void games which aren't to be recorded).
+
     If gtp_log_pathname is set, all GTP messages to and from both players will
     be logged (this doesn't append; any existing file will be overwritten).
 
@@ -164,6 +254,8 @@ class Game_job(object):
         self.sgf_game_name = None
         self.sgf_event = None
         self.sgf_note = None
+        self.live_sgf = False
+        self.return_sgf = False
         self.use_internal_scorer = True
         self.internal_scorer_handicap_compensation = 'no'
         self.game_data = None
@@ -184,6 +276,8 @@ class Game_job(object):
         """
         self._worker_id = worker_id
         self._files_to_close = []
+        self._live_record = None
+        self._sgf_string = None
         try:
             return self._run()
         finally:
@@ -215,9 +309,13 @@ class Game_job(object):
         env['GOMILL_GAME_ID'] = self.game_id
         if self._worker_id is not None:
             env['GOMILL_SLOT'] = str(self._worker_id)
+        kwargs = {}
+        resource_limits = player.get_resource_limits()
+        if resource_limits:
+            kwargs['resource_limits'] = resource_limits
         game_controller.set_player_subprocess(
             colour, player.cmd_args,
-            env=env, cwd=player.cwd, stderr=stderr)
+            env=env, cwd=player.cwd, stderr=stderr, **kwargs)
         controller = game_controller.get_controller(colour)
         controller.set_gtp_aliases(player.gtp_aliases)
         if gtp_log_file is not None:
@@ -246,6 +344,7 @@ class Game_job(object):
         else:
             gtp_log_file = None
 
+        started = False
         try:
             self._start_player(game_controller, game,
                                'b', self.player_b, gtp_log_file)
@@ -257,15 +356,28 @@ class Game_job(object):
                     game.set_handicap(self.handicap, self.handicap_is_free)
                 except ValueError:
                     raise BadGtpResponse("invalid handicap")
+            if (self.live_sgf and not self.return_sgf and
+                self.sgf_dirname is not None and
+                self.sgf_filename is not None):
+                self._start_live_record(game_controller, game)
+            started = True
             game.run()
         except (GtpChannelError, BadGtpResponse), e:
             game_controller.close_players()
-            msg = "aborting game due to error:\n%s" % e
-            self._record_void_game(game_controller, game, msg)
-            late_error_messages = game_controller.describe_late_errors()
-            if late_error_messages is not None:
-                msg += "\nalso:\n" + late_error_messages
-            raise job_manager.JobFailed(msg)
+            forfeit = None
+            if started and isinstance(e, GtpChannelError):
+                forfeit = self._check_resource_limit_forfeit(game_controller)
+            if forfeit is None:
+                msg = "aborting game due to error:\n%s" % e
+                limit_messages = self._describe_limited_exits(game_controller)
+                if limit_messages:
+                    msg += "\n" + limit_messages
+                self._record_void_game(game_controller, game, msg)
+                late_error_messages = game_controller.describe_late_errors()
+                if late_error_messages is not None:
+                    msg += "\nalso:\n" + late_error_messages
+                raise job_manager.JobFailed(msg)
+            game.record_forfeit_after_error(*forfeit)
         if game.result.is_forfeit:
             warnings.append(game.result.detail)
         game_controller.close_players()
@@ -276,21 +388,84 @@ class Game_job(object):
         late_error_messages = game_controller.describe_late_errors()
         if late_error_messages:
             log_entries.append(late_error_messages)
+        game.result.fingerprint = game_fingerprints.fingerprint_from_moves(
+            self.board_size,
+            [('b', point) for point in game.get_handicap_stones()],
+            [(colour, move) for (colour, move, _) in game.get_moves()])
         self._record_game(game_controller, game)
         response = Game_job_result()
         response.game_id = self.game_id
         response.game_result = game.result
         response.warnings = warnings
         response.log_entries = log_entries
+        response.sgf_string = self._sgf_string
 
         response.engine_descriptions = {
             self.player_b.code : game_controller.engine_descriptions['b'],
             self.player_w.code : game_controller.engine_descriptions['w'],
             }
         response.game_data = self.game_data
+        move_times = game.get_move_times()
+        response.move_times = {
+            self.player_b.code : move_times['b'],
+            self.player_w.code : move_times['w'],
+            }
         return response
 
-    def _make_sgf(self, game_controller, game, game_end_message=None):
+    def _get_players_and_channels(self, game_controller):
+        """Return the players whose engines were started, with their channels.
+
+        Returns a list of tuples (colour, Player, Gtp_channel)
+
+        """
+        result = []
+        for colour, player in (('b', self.player_b), ('w', self.player_w)):
+            try:
+                controller = game_controller.get_controller(colour)
+            except KeyError:
+                continue
+            result.append((colour, player, controller.channel))
+        return result
+
+    def _check_resource_limit_forfeit(self, game_controller):
+        """Check whether an engine was killed for exceeding its CPU limit.
+
+        Call this after closing the players.
+
+        Returns a pair (colour, forfeit detail), or None.
+
+        """
+        for colour, player, channel in \
+                self._get_players_and_channels(game_controller):
+            if exceeded_cpu_time_limit(player, channel):
+                return colour, ("exceeded CPU time limit (%d seconds)" %
+                                player.cpu_time_limit)
+        return None
+
+    def _describe_limited_exits(self, game_controller):
+        """Describe how engines which have resource limits exited.
+
+        Call this after closing the players.
+
+        Returns a string, or None if no engine with resource limits exited
+        abnormally.
+
+        """
+        messages = []
+        for colour, player, channel in \
+                self._get_players_and_channels(game_controller):
+            limits = player.describe_resource_limits()
+            exit_status = getattr(channel, 'exit_status', None)
+            if limits is None or not exit_status:
+                continue
+            messages.append("player %s: engine %s (resource limits: %s)" % (
+                player.code, describe_exit_status(exit_status), limits))
+        if not messages:
+            return None
+        return "\n".join(messages)
+
+    def _make_sgf(self, game_controller, game, game_end_message=None,
+                  only_last_move=False):
         """Return an Sgf_game with annotations.
 
         This adds the following to the result of Gtp_game.make_sgf:
@@ -310,11 +485,13 @@ class Game_job(object):
           any game_end_message
           describe_late_errors() output
 
+        See Game_runner.make_sgf() for only_last_move.
+
         """
         b_player = self.player_b.code
         w_player = self.player_w.code
         notes = []
-        sgf_game = game.make_sgf()
+        sgf_game = game.make_sgf(only_last_move)
         root = sgf_game.get_root()
         last_node = sgf_game.get_last_node()
         if self.sgf_game_name is not None:
@@ -360,13 +537,70 @@ class Game_job(object):
             last_node.add_comment_text(late_error_messages)
         return sgf_game
 
+    def _start_live_record(self, game_controller, game):
+        """Start writing the game's SGF record incrementally.
+
+        Writes a provisional root node, and arranges for each move to be
+        written as it's played.
+
+        """
+        pathname = os.path.join(self.sgf_dirname,
+                                self.sgf_filename + ".partial")
+        root = self._make_sgf(game_controller, game).get_root()
+        self._live_record = live_sgf.Live_sgf_record(
+            pathname, root.get_raw_property_map())
+        self._files_to_close.append(self._live_record.file)
+        presenter = root.get_presenter()
+        def record_move(colour, move, **kwargs):
+            _, _, comment = game.get_moves()[-1]
+            node = sgf.Node({}, presenter)
+            node.set_move(colour, move)
+            if comment is not None:
+                node.set("C", comment)
+            self._live_record.add_node(node.get_raw_property_map())
+        game.set_move_callback(record_move)
+
+    def _finish_live_record(self, pathname, sgf_game):
+        """Complete the live record and move it to the specified pathname.
+
+        sgf_game -- Sgf_game from _make_sgf() with only_last_move set
+
+        """
+        root = sgf_game.get_root()
+        last_node = sgf_game.get_last_node()
+        if last_node is root:
+            last_properties = None
+        else:
+            last_properties = last_node.get_raw_property_map()
+        self._live_record.finalise(root.get_raw_property_map(), last_properties)
+        os.rename(self._live_record.pathname, pathname)
+
+    def _abandon_live_record(self):
+        """Remove the live record."""
+        self._live_record.close()
+        os.remove(self._live_record.pathname)
+
     def _record_game(self, game_controller, game):
-        """Record the game in the standard sgf directory."""
+        """Record the game in the standard sgf directory.
+
+        If return_sgf is set, keeps the serialised game for the job result
+        instead.
+
+        """
+        if self.return_sgf:
+            sgf_game = self._make_sgf(game_controller, game)
+            self._sgf_string = sgf_game.serialise()
+            return
         if self.sgf_dirname is None or self.sgf_filename is None:
             return
         pathname = os.path.join(self.sgf_dirname, self.sgf_filename)
+        if self._live_record is not None:
+            sgf_game = self._make_sgf(game_controller, game,
+                                      only_last_move=True)
+            self._finish_live_record(pathname, sgf_game)
+            return
         sgf_game = self._make_sgf(game_controller, game)
-        self._write_sgf(pathname, sgf_game.serialise())
+        self._write_sgf(pathname, sgf_game)
 
     def _record_void_game(self, game_controller, game, game_end_message):
         """Record the game in the void sgf directory if it had any moves.
@@ -374,21 +608,28 @@ class Game_job(object):
         Sets sgf RE to 'Void'.
 
         """
-        if not game.get_moves():
-            return
-        if self.void_sgf_dirname is None or self.sgf_filename is None:
+        if (not game.get_moves() or
+            self.void_sgf_dirname is None or self.sgf_filename is None):
+            if self._live_record is not None:
+                self._abandon_live_record()
             return
         self._ensure_dir(self.void_sgf_dirname)
         pathname = os.path.join(self.void_sgf_dirname, self.sgf_filename)
-        sgf_game = self._make_sgf(game_controller, game, game_end_message)
+        sgf_game = self._make_sgf(game_controller, game, game_end_message,
+                                  only_last_move=(self._live_record is not None))
         sgf_game.get_root().set('RE', 'Void')
-        self._write_sgf(pathname, sgf_game.serialise())
+        if self._live_record is not None:
+            self._finish_live_record(pathname, sgf_game)
+            return
+        self._write_sgf(pathname, sgf_game)
 
-    def _write_sgf(self, pathname, sgf_string):
+    def _write_sgf(self, pathname, sgf_game):
         # For overriding in the testsuite
         f = open(pathname, "w")
-        f.write(sgf_string)
-        f.close()
+        try:
+            sgf_game.serialise_to_file(f)
+        finally:
+            f.close()
 
     def _ensure_dir(self, pathname):
         # For overriding in the testsuite
@@ -408,6 +649,36 @@ class Player_check(object):
 
     """
 
+def describe_exit_status(exit_status):
+    """Describe a subprocess's exit status (as returned by os.wait4()).
+
+    Returns a string like 'exited with status 1' or 'was killed by signal 9'.
+
+    """
+    if os.WIFSIGNALED(exit_status):
+        return "was killed by signal %d" % os.WTERMSIG(exit_status)
+    return "exited with status %d" % os.WEXITSTATUS(exit_status)
+
+def exceeded_cpu_time_limit(player, channel):
+    """Check whether an engine was killed for exceeding its CPU time limit.
+
+    player  -- Player
+    channel -- closed Subprocess_gtp_channel for the player's engine
+
+    """
+    if player.cpu_time_limit is None:
+        return False
+    exit_status = getattr(channel, 'exit_status', None)
+    if exit_status is None or not os.WIFSIGNALED(exit_status):
+        return False
+    sig = os.WTERMSIG(exit_status)
+    if sig == signal.SIGXCPU:
+        return True
+    # If the engine ignores SIGXCPU, it's killed at the hard limit
+    ru = getattr(channel, 'resource_usage', None)
+    return (sig == signal.SIGKILL and ru is not None and
+            ru.ru_utime + ru.ru_stime >= player.cpu_time_limit)
+
 def check_player(player_check, discard_stderr=False):
     """Do a test run of a GTP engine.
 
@@ -441,10 +712,14 @@ def check_player(player_check, discard_stderr=False):
     try:
         env = player.make_environ()
         env['GOMILL_GAME_ID'] = 'startup-check'
+        kwargs = {}
+        resource_limits = player.get_resource_limits()
+        if resource_limits:
+            kwargs['resource_limits'] = resource_limits
         try:
             channel = gtp_controller.Subprocess_gtp_channel(
                 player.cmd_args,
-                env=env, cwd=player.cwd, stderr=stderr)
+                env=env, cwd=player.cwd, stderr=stderr, **kwargs)
         except GtpChannelError, e:
             raise GtpChannelError(
                 "error starting subprocess for %s:\n%s" % (player.code, e))
@@ -468,3 +743,88 @@ def check_player(player_check, discard_stderr=False):
         except Exception:
             pass
 
+
+def _find_executable(player):
+    """Find the file that a player's subprocess would execute.
+
+    Returns a pathname, or None if there is no such file.
+
+    """
+    cmd = player.cmd_args[0]
+    if os.path.dirname(cmd):
+        if player.cwd is not None:
+            cmd = os.path.join(player.cwd, cmd)
+        if os.path.isfile(cmd):
+            return cmd
+        return None
+    path = player.make_environ().get('PATH', os.defpath)
+    for dirname in path.split(os.pathsep):
+        pathname = os.path.join(dirname, cmd)
+        if os.path.isfile(pathname) and os.access(pathname, os.X_OK):
+            return pathname
+    return None
+
+def _find_argument_files(player):
+    """Find files named by a player's command-line arguments.
+
+    Returns a list of pathnames of existing files (not directories), for
+    arguments after the executable which name them (taken relative to the
+    player's working directory).
+
+    """
+    result = []
+    for arg in player.cmd_args[1:]:
+        pathname = arg
+        if player.cwd is not None:
+            pathname = os.path.join(player.cwd, pathname)
+        if os.path.isfile(pathname):
+            result.append(pathname)
+    return result
+
+def get_player_check_key(player_check):
+    """Return a string identifying what a player check depends on.
+
+    player_check -- Player_check object
+
+    The key covers the player's command line, working directory, 'environ'
+    setting and PATH, startup commands and resource limits, the board size and
+    komi, and the size and modification time of the player's executable and
+    of any other files named in its command line (such as the script run by
+    an interpreter). So if a check passed, a later check with the same key can
+    be expected to pass too.
+
+    Other environment variables aren't included, so that the key doesn't
+    change with unrelated details of the ringmaster's environment.
+
+    Returns None if the player's executable can't be found (such a check
+    shouldn't be skipped).
+
+    """
+    player = player_check.player
+    executable = _find_executable(player)
+    if executable is None:
+        return None
+    files = []
+    for pathname in [executable] + _find_argument_files(player):
+        try:
+            st = os.stat(pathname)
+        except EnvironmentError:
+            return None
+        files.append((os.path.abspath(pathname), st.st_size, st.st_mtime))
+    if player.environ is None:
+        environ = {}
+    else:
+        environ = player.environ
+    key = repr((
+        player.cmd_args,
+        player.cwd,
+        sorted(environ.items()),
+        player.make_environ().get('PATH'),
+        sorted(player.gtp_aliases.items()),
+        player.startup_gtp_commands,
+        player.get_resource_limits(),
+        player_check.board_size,
+        player_check.komi,
+        files,
+        ))
+    return hashlib.sha1(key).hexdigest()
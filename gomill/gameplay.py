@@ -381,6 +381,21 @@ class Result(object):
         return cls.from_score(game_score.winner, game_score.margin,
                               game_score.get_detail())
 
+    @classmethod
+    def from_forfeit(cls, loser, detail):
+        """Instantiate for a game forfeited outside normal play.
+
+        loser  -- colour of the player who forfeits
+        detail -- string: human-readable explanation of the forfeit
+
+        """
+        result = cls()
+        result._set_winning_colour(opponent_of(loser))
+        result.sgf_result += "F"
+        result.is_forfeit = True
+        result.detail = detail
+        return result
+
     @classmethod
     def from_unscored_game(cls, game):
         """Instantiate based on a non-passed-out Game.
@@ -775,6 +790,22 @@ class Game_runner(object):
             self._do_move(game)
         self._set_result(game)
 
+    def record_forfeit_after_error(self, colour, detail):
+        """Record that a player forfeited a game which didn't complete.
+
+        colour -- player who forfeits
+        detail -- string: human-readable explanation of the forfeit
+
+        Use this after run() has propagated an exception which was the
+        player's own fault. Sets the 'result' attribute.
+
+        Raises GameRunnerStateError if run() hasn't been called.
+
+        """
+        if self._state != 3:
+            raise GameRunnerStateError
+        self.result = self.result_class.from_forfeit(colour, detail)
+
     def get_moves(self):
         """Retrieve a list of the moves played.
 
@@ -811,7 +842,7 @@ class Game_runner(object):
         """
         return self.game_score
 
-    def make_sgf(self):
+    def make_sgf(self, only_last_move=False):
         """Return an SGF description of the game.
 
         Returns an Sgf_game object with the following root node properties set:
@@ -828,6 +859,10 @@ class Game_runner(object):
         comment on the corresponding move (in the final node for comments on
         resignation, forfeits and so on).
 
+        If only_last_move is true, the main sequence contains only the last
+        move (this is for use when the earlier moves have been recorded
+        separately).
+
         """
         sgf_game = sgf.Sgf_game(self.board_size)
         root = sgf_game.get_root()
@@ -840,7 +875,11 @@ class Game_runner(object):
         sgf_game.set_date()
         if self.handicap_stones:
             root.set_setup_stones(black=self.handicap_stones, white=[])
-        for colour, move, comment in self.moves:
+        if only_last_move:
+            moves = self.moves[-1:]
+        else:
+            moves = self.moves
+        for colour, move, comment in moves:
             node = sgf_game.extend_main_sequence()
             node.set_move(colour, move)
             if comment is not None:
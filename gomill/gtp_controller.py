@@ -10,6 +10,11 @@ import re
 import signal
 import subprocess
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
 from gomill.utils import *
 from gomill.common import *
 
@@ -375,14 +380,42 @@ class Linebased_gtp_channel(Gtp_channel):
 def permit_sigpipe():
     signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
+# Extra CPU seconds allowed after the soft CPU limit, before SIGKILL
+CPU_LIMIT_GRACE = 5
+
+def set_resource_limit(name, value):
+    """Lower a resource limit for the calling process.
+
+    name  -- name of a resource module constant (eg 'RLIMIT_AS')
+    value -- int
+
+    Sets both the soft and hard limits, except that for RLIMIT_CPU the hard
+    limit is CPU_LIMIT_GRACE seconds higher (so the process is sent SIGXCPU
+    before it's killed).
+
+    Never tries to raise a limit above the current hard limit.
+
+    """
+    rlimit = getattr(resource, name)
+    soft, hard = resource.getrlimit(rlimit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    new_hard = value
+    if name == 'RLIMIT_CPU':
+        new_hard += CPU_LIMIT_GRACE
+        if hard != resource.RLIM_INFINITY:
+            new_hard = min(new_hard, hard)
+    resource.setrlimit(rlimit, (value, new_hard))
+
 class Subprocess_gtp_channel(Linebased_gtp_channel):
     """A GTP channel to a subprocess.
 
     Instantiate with
-      command -- list of strings (as for subprocess.Popen)
-      stderr  -- destination for standard error output (optional)
-      cwd     -- working directory to change to (optional)
-      env     -- new environment (optional)
+      command         -- list of strings (as for subprocess.Popen)
+      stderr          -- destination for standard error output (optional)
+      cwd             -- working directory to change to (optional)
+      env             -- new environment (optional)
+      resource_limits -- list of pairs (resource name, int) (optional)
     Instantiation will raise GtpChannelError if the process can't be started.
 
     This starts the subprocess and speaks GTP over its standard input and
@@ -394,15 +427,38 @@ class Subprocess_gtp_channel(Linebased_gtp_channel):
 
     The 'cwd' and 'env' parameters are interpreted as for subprocess.Popen.
 
+    The resource names in 'resource_limits' are names of resource module
+    constants (eg 'RLIMIT_AS'); the limits are applied to the subprocess using
+    set_resource_limit(). GtpChannelError is raised if the system doesn't
+    support resource limits.
+
     Closing the channel waits for the subprocess to exit.
 
     """
-    def __init__(self, command, stderr=None, cwd=None, env=None):
+    def __init__(self, command, stderr=None, cwd=None, env=None,
+                 resource_limits=None):
         Linebased_gtp_channel.__init__(self)
+        if resource_limits:
+            if resource is None:
+                raise GtpChannelError("resource limits are not supported")
+            for name, value in resource_limits:
+                if not hasattr(resource, name):
+                    raise GtpChannelError(
+                        "resource limit %s is not supported" % name)
+            def preexec_fn():
+                permit_sigpipe()
+                for name, value in resource_limits:
+                    try:
+                        set_resource_limit(name, value)
+                    except (ValueError, resource.error), e:
+                        # Reported by Popen in the parent process
+                        raise OSError("can't set %s: %s" % (name, e))
+        else:
+            preexec_fn = permit_sigpipe
         try:
             p = subprocess.Popen(
                 command,
-                preexec_fn=permit_sigpipe, close_fds=True,
+                preexec_fn=preexec_fn, close_fds=True,
                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
                 stderr=stderr, cwd=cwd, env=env)
         except EnvironmentError, e:
@@ -1,5 +1,7 @@
 """Run games between two GTP engines."""
 
+import time
+
 from gomill.utils import *
 from gomill.common import *
 from gomill import gameplay
@@ -16,6 +18,7 @@ class Game_result(gameplay.Result):
       winning_player -- player code or None
       losing_player  -- player code or None
       cpu_times      -- map player code -> float (representing seconds) or None
+      fingerprint    -- string or None (see game_fingerprints)
 
     Call set_players() before using these.
 
@@ -29,6 +32,7 @@ class Game_result(gameplay.Result):
     def __init__(self):
         gameplay.Result.__init__(self)
         self.game_id = None
+        self.fingerprint = None
 
     def set_players(self, players):
         """Specify the player-code map.
@@ -61,9 +65,13 @@ class Game_result(gameplay.Result):
             self.is_forfeit,
             self.game_id,
             self.cpu_times,
+            self.fingerprint,
             )
 
     def __setstate__(self, state):
+        # In gomill 0.8.3 and earlier, there was no fingerprint
+        if len(state) == 8:
+            state += (None,)
         (self.player_b,
          self.player_w,
          self.winning_colour,
@@ -72,6 +80,7 @@ class Game_result(gameplay.Result):
          self.is_forfeit,
          self.game_id,
          cpu_times,
+         self.fingerprint,
          ) = state
         # In gomill 0.7 and earlier, cpu_time could be '?'; treat this as None
         for colour, cpu_time in cpu_times.items():
@@ -187,6 +196,8 @@ class _Gtp_backend(gameplay.Backend):
         self.internal_scorer = False
         self.handicap_compensation = "no"
         self.handicap = None
+        # map colour -> list of floats (seconds taken by each genmove)
+        self.move_times = {'b' : [], 'w' : []}
 
     def start_new_game(self, board_size, komi):
         """Reset the engines' GTP game state (board size, contents, komi)."""
@@ -243,10 +254,13 @@ class _Gtp_backend(gameplay.Backend):
         else:
             genmove_command = ["genmove", colour]
             may_claim = False
+        start = time.time()
         try:
             raw_move = self.gc.send_command(colour, *genmove_command)
         except BadGtpResponse, e:
             return 'forfeit', str(e)
+        finally:
+            self.move_times[colour].append(time.time() - start)
         move_s = raw_move.lower()
         if move_s == "resign":
             return 'resign', None
@@ -511,6 +525,26 @@ class Gtp_game(object):
             self.game_controller.get_gtp_cpu_times()
         self.result.soft_update_cpu_times(cpu_times)
 
+    def record_forfeit_after_error(self, colour, detail):
+        """Record that a player forfeited a game which didn't complete.
+
+        colour -- player who forfeits
+        detail -- string: human-readable explanation of the forfeit
+
+        Use this after run() has propagated GtpChannelError, if the error was
+        the player's own fault (for example, its engine was killed for
+        exceeding a resource limit). Sets the 'result' and 'cpu_time_errors'
+        attributes.
+
+        Raises GameRunnerStateError if run() hasn't been called.
+
+        """
+        self.game_runner.record_forfeit_after_error(colour, detail)
+        self.result = self.game_runner.result
+        self.result.set_players(self.game_controller.players)
+        self.result.game_id = self.game_id
+        self.cpu_time_errors = set()
+
     def get_moves(self):
         """Retrieve a list of the moves played.
 
@@ -526,6 +560,25 @@ class Gtp_game(object):
         """
         return self.game_runner.get_moves()
 
+    def get_move_times(self):
+        """Retrieve the time taken to generate each move.
+
+        Returns a map colour -> list of floats (wall-clock seconds taken by
+        each genmove command, including any which failed).
+
+        """
+        return dict((colour, times[:])
+                    for (colour, times) in self.backend.move_times.items())
+
+    def get_handicap_stones(self):
+        """Retrieve the handicap stones placed before the game.
+
+        Returns a list of pairs (row, col), or an empty list if there was no
+        handicap.
+
+        """
+        return list(self.game_runner.handicap_stones or [])
+
     def get_final_diagnostics(self):
         return self.game_runner.get_final_diagnostics()
 
@@ -549,7 +602,7 @@ class Gtp_game(object):
         """
         return describe_scoring(self.result, self.get_game_score())
 
-    def make_sgf(self):
+    def make_sgf(self, only_last_move=False):
         """Return an SGF description of the game.
 
         Returns an Sgf_game object.
@@ -561,8 +614,10 @@ class Gtp_game(object):
         It also adds the following to the last node's comment:
           describe_scoring() output
 
+        See Game_runner.make_sgf() for only_last_move.
+
         """
-        sgf_game = self.game_runner.make_sgf()
+        sgf_game = self.game_runner.make_sgf(only_last_move)
         root = sgf_game.get_root()
         for colour, prop in (('b', 'PB'), ('w', 'PW')):
             ed = self.game_controller.engine_descriptions[colour]
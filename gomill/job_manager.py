@@ -1,8 +1,22 @@
-"""Job system supporting multiprocessing."""
+"""Job system supporting multiprocessing.
+
+Worker processes may be started while the job source has other threads
+running (eg to serve control requests). Forking copies any lock which another
+thread holds at that moment, and the copy is never released in the worker. So
+if the job source provides get_worker_start_lock(), workers are started only
+while holding that lock; the job source's other threads should hold it
+whenever they might be holding a lock the workers also use (in particular,
+while writing to the standard streams).
+
+"""
+
+from __future__ import division, with_statement
 
 import sys
+import Queue
 
 from gomill import compact_tracebacks
+from gomill import cpu_affinity
 
 multiprocessing = None
 
@@ -33,8 +47,17 @@ class Worker_finish_signal(object):
     pass
 worker_finish_signal = Worker_finish_signal()
 
-def worker_run_jobs(job_queue, response_queue, worker_id):
+class Wakeup_signal(object):
+    pass
+
+def worker_run_jobs(job_queue, response_queue, worker_id, cpus=None):
     try:
+        if cpus is not None:
+            try:
+                cpu_affinity.set_affinity(cpus)
+            except EnvironmentError, e:
+                print >>sys.stderr, \
+                    "worker %d: can't set CPU affinity: %s" % (worker_id, e)
         #pid = os.getpid()
         #sys.stderr.write("worker %d starting\n" % pid)
         while True:
@@ -60,6 +83,176 @@ def worker_run_jobs(job_queue, response_queue, worker_id):
     except KeyboardInterrupt:
         sys.exit(3)
 
+def _mean_sample(samples, index):
+    values = [sample[index] for sample in samples if sample[index] is not None]
+    if not values:
+        return None
+    return sum(values) / len(values)
+
+class Adaptive_worker_limit(object):
+    """Choose the number of workers by measuring how jobs perform.
+
+    Instantiate with
+      minimum   -- int
+      maximum   -- int
+      tolerance -- float (default 0.15)
+
+    Public attributes for reading:
+      level   -- current number of workers (starts at the minimum)
+      ceiling -- highest level which hasn't shown contention
+      history -- list of levels, including the initial one
+
+    The job source reports each completed job using note_job_completed(), and
+    calls review() after each report; review() decides when it has seen
+    enough jobs at the current level, and then changes the level by at most
+    one. The job source is responsible for passing the level to the job
+    manager (eg from get_worker_limit()).
+
+    The measurements are:
+      throughput -- units of work completed per second
+      cost       -- CPU time per unit of work, for each key
+      latency    -- wall-clock time per unit of work, for each key
+
+    (For games, the unit of work is a move and the keys are players.)
+
+    Cost and latency are compared with the first measurement made for the
+    same key at the lowest level where the key was seen; if the average
+    inflation is more than the tolerance, the level is too high. The level is
+    also too high if the throughput gained from the last increase is less than
+    half of what perfect scaling would give. In either case the level is
+    reduced, and never raised above that level again.
+
+    Otherwise, the level is increased if all the workers were busy and
+    (where the caller can tell) at least one CPU is idle.
+
+    """
+    def __init__(self, minimum, maximum, tolerance=0.15):
+        if not 1 <= minimum <= maximum:
+            raise ValueError
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.level = minimum
+        self.ceiling = maximum
+        self.history = [minimum]
+        # Map level -> throughput measured at that level
+        self._throughputs = {}
+        # Map key -> (level, cost or None, latency)
+        self._baselines = {}
+        self._start_period(None)
+
+    def _start_period(self, now):
+        self._period_start = now
+        self._period_work = 0
+        self._period_jobs = 0
+        # Map key -> list of pairs (cost or None, latency)
+        self._period_samples = {}
+
+    def jobs_needed(self):
+        """Return the number of jobs to measure at the current level."""
+        return max(4, 2 * self.level)
+
+    def note_job_completed(self, now, started, work, samples):
+        """Report a completed job.
+
+        now     -- float (time the job finished)
+        started -- float (time the job started), or None if not known
+        work    -- units of work the job carried out (number)
+        samples -- map key -> pair (cost per unit or None, latency per unit)
+
+        Only jobs which were started after the last review which returned a
+        description count towards the measurements of cost and latency (and
+        towards jobs_needed()).
+
+        """
+        if self._period_start is None:
+            self._period_start = now if started is None else started
+        self._period_work += work
+        if started is None or started < self._period_start:
+            return
+        self._period_jobs += 1
+        for key, sample in samples.iteritems():
+            self._period_samples.setdefault(key, []).append(sample)
+
+    def _inflation(self, index):
+        ratios = []
+        for key, samples in self._period_samples.iteritems():
+            value = _mean_sample(samples, index)
+            baseline = self._baselines.get(key)
+            if (value is None or baseline is None or
+                baseline[0] > self.level or not baseline[index+1]):
+                continue
+            ratios.append(value / baseline[index+1])
+        if not ratios:
+            return None
+        return sum(ratios) / len(ratios)
+
+    def _update_baselines(self):
+        for key, samples in self._period_samples.iteritems():
+            baseline = self._baselines.get(key)
+            if baseline is not None and baseline[0] <= self.level:
+                continue
+            self._baselines[key] = (self.level, _mean_sample(samples, 0),
+                                    _mean_sample(samples, 1))
+
+    def review(self, now, busy_workers, idle_cpus=None):
+        """Decide whether to change the level.
+
+        now          -- float
+        busy_workers -- number of workers which were running jobs
+        idle_cpus    -- estimated number of idle CPUs (float), or None
+
+        Returns None if there isn't enough information yet. Otherwise changes
+        'level' if necessary, starts a new measurement, and returns a string
+        describing the measurements and the decision (suitable for logging).
+
+        """
+        if self._period_jobs < self.jobs_needed():
+            return None
+        elapsed = now - self._period_start
+        if elapsed <= 0:
+            return None
+        level = self.level
+        throughput = self._period_work / elapsed
+        self._throughputs[level] = throughput
+        cost_inflation = self._inflation(0)
+        latency_inflation = self._inflation(1)
+        self._update_baselines()
+        inflations = [x for x in (cost_inflation, latency_inflation)
+                      if x is not None]
+        previous = self._throughputs.get(level - 1)
+        limit = min(self.maximum, self.ceiling)
+        if (inflations and max(inflations) > 1 + self.tolerance and
+            level > self.minimum):
+            self.ceiling = self.level = level - 1
+            decision = "contention; reducing to %d" % self.level
+        elif (previous is not None and level > self.minimum and
+              throughput < previous * (1 + 0.5 / (level - 1))):
+            self.ceiling = self.level = level - 1
+            decision = "no gain; reducing to %d" % self.level
+        elif level >= limit:
+            decision = "staying at %d (maximum)" % level
+        elif busy_workers < level:
+            decision = "staying at %d (workers not all busy)" % level
+        elif idle_cpus is not None and idle_cpus < 1:
+            decision = "staying at %d (no idle CPUs)" % level
+        else:
+            self.level = level + 1
+            decision = "increasing to %d" % self.level
+        if self.level != level:
+            self.history.append(self.level)
+        jobs = self._period_jobs
+        self._start_period(now)
+        def fmt(x):
+            if x is None:
+                return "?"
+            return "x%.2f" % x
+        return ("level %d: %d jobs, throughput %.2f/s, cost %s, "
+                "latency %s: %s" %
+                (level, jobs, throughput,
+                 fmt(cost_inflation), fmt(latency_inflation), decision))
+
+
 class Job_manager(object):
     def __init__(self):
         self.passed_exceptions = []
@@ -67,6 +260,101 @@ class Job_manager(object):
     def pass_exception(self, cls):
         self.passed_exceptions.append(cls)
 
+    def _get_wait_timeout(self, job_source):
+        """Ask the job source how long it's willing to wait idle.
+
+        Returns a float (seconds), or None to wait indefinitely.
+
+        Job sources needn't implement get_wait_timeout(); if they do, they
+        must also implement process_wait_timeout().
+
+        """
+        try:
+            fn = job_source.get_wait_timeout
+        except AttributeError:
+            return None
+        return fn()
+
+    def _get_worker_limit(self, job_source):
+        """Ask the job source how many jobs it wants to run at once.
+
+        Returns an int, or None for no preference.
+
+        Job sources needn't implement get_worker_limit().
+
+        """
+        try:
+            fn = job_source.get_worker_limit
+        except AttributeError:
+            return None
+        return fn()
+
+    def _set_wakeup_function(self, job_source, fn):
+        """Tell the job source how to interrupt a wait for responses.
+
+        fn -- function taking no arguments, or None (at the end of the run)
+
+        The function may be called from any thread; it makes the job manager
+        call get_job() again (if it has a free worker) and re-check the worker
+        limit.
+
+        Job sources needn't implement set_wakeup_function().
+
+        """
+        try:
+            set_fn = job_source.set_wakeup_function
+        except AttributeError:
+            return
+        set_fn(fn)
+
+    def _get_worker_cpus(self, job_source, worker_id):
+        """Ask the job source which CPUs a worker should run on.
+
+        job_source -- job source, or None if it isn't known yet
+
+        Returns a list of CPU numbers, or None for no restriction.
+
+        Job sources needn't implement get_worker_cpus().
+
+        """
+        if job_source is None:
+            return None
+        try:
+            fn = job_source.get_worker_cpus
+        except AttributeError:
+            return None
+        return fn(worker_id)
+
+    def _get_worker_start_lock(self, job_source):
+        """Ask the job source for a lock to hold while starting workers.
+
+        job_source -- job source, or None if it isn't known yet
+
+        Returns an object supporting the context manager protocol (eg a
+        threading.RLock), or None.
+
+        Job sources needn't implement get_worker_start_lock().
+
+        """
+        if job_source is None:
+            return None
+        try:
+            fn = job_source.get_worker_start_lock
+        except AttributeError:
+            return None
+        return fn()
+
+    def _process_wait_timeout(self, job_source):
+        try:
+            job_source.process_wait_timeout()
+        except Exception, e:
+            for cls in self.passed_exceptions:
+                if isinstance(e, cls):
+                    raise
+            raise JobSourceError(
+                "error from process_wait_timeout()\n%s" %
+                compact_tracebacks.format_traceback(skip=1))
+
 class Multiprocessing_job_manager(Job_manager):
     def __init__(self, number_of_workers):
         Job_manager.__init__(self)
@@ -77,21 +365,69 @@ class Multiprocessing_job_manager(Job_manager):
             raise ValueError
         self.number_of_workers = number_of_workers
 
-    def start_workers(self):
+    def start_workers(self, job_source=None):
+        """Start the worker processes.
+
+        If job_source is given, it's asked which CPUs each worker should run
+        on (see _get_worker_cpus()).
+
+        """
         self.job_queue = multiprocessing.Queue()
         self.response_queue = multiprocessing.Queue()
         self.workers = []
-        for i in range(self.number_of_workers):
-            worker = multiprocessing.Process(
-                target=worker_run_jobs,
-                args=(self.job_queue, self.response_queue, i))
-            self.workers.append(worker)
-        for worker in self.workers:
-            worker.start()
+        self._add_workers(self.number_of_workers, job_source)
+
+    def _make_worker(self, worker_id, cpus):
+        return multiprocessing.Process(
+            target=worker_run_jobs,
+            args=(self.job_queue, self.response_queue, worker_id, cpus))
+
+    def _add_workers(self, n, job_source):
+        new_workers = []
+        for i in range(len(self.workers), len(self.workers) + n):
+            new_workers.append(
+                self._make_worker(i, self._get_worker_cpus(job_source, i)))
+        self.workers += new_workers
+        lock = self._get_worker_start_lock(job_source)
+        if lock is None:
+            for worker in new_workers:
+                worker.start()
+        else:
+            with lock:
+                for worker in new_workers:
+                    worker.start()
+
+    def _wake(self):
+        # The job source might call this after finish()
+        response_queue = self.response_queue
+        if response_queue is not None:
+            response_queue.put(Wakeup_signal())
+
+    def _update_number_of_workers(self, job_source):
+        """Apply the job source's worker limit.
+
+        Workers are started as needed, but never stopped before finish(): if
+        the limit is reduced, the extra workers are left idle.
+
+        """
+        limit = self._get_worker_limit(job_source)
+        if limit is None or not 1 <= limit < 1024:
+            return
+        self.number_of_workers = limit
+        if limit > len(self.workers):
+            self._add_workers(limit - len(self.workers), job_source)
 
     def run_jobs(self, job_source):
+        self._set_wakeup_function(job_source, self._wake)
+        try:
+            self._run_jobs(job_source)
+        finally:
+            self._set_wakeup_function(job_source, None)
+
+    def _run_jobs(self, job_source):
         active_jobs = 0
         while True:
+            self._update_number_of_workers(job_source)
             if active_jobs < self.number_of_workers:
                 try:
                     job = job_source.get_job()
@@ -110,7 +446,9 @@ class Multiprocessing_job_manager(Job_manager):
             if active_jobs == 0:
                 break
 
-            response = self.response_queue.get()
+            response = self._get_response(job_source)
+            if isinstance(response, Wakeup_signal):
+                continue
             if isinstance(response, JobError):
                 try:
                     job_source.process_error_response(
@@ -135,8 +473,18 @@ class Multiprocessing_job_manager(Job_manager):
             active_jobs -= 1
             #sys.stderr.write("MGR: received response %s\n" % repr(response))
 
+    def _get_response(self, job_source):
+        while True:
+            timeout = self._get_wait_timeout(job_source)
+            if timeout is None:
+                return self.response_queue.get()
+            try:
+                return self.response_queue.get(True, timeout)
+            except Queue.Empty:
+                self._process_wait_timeout(job_source)
+
     def finish(self):
-        for _ in range(self.number_of_workers):
+        for _ in self.workers:
             self.job_queue.put(worker_finish_signal)
         for worker in self.workers:
             worker.join()
@@ -144,7 +492,7 @@ class Multiprocessing_job_manager(Job_manager):
         self.response_queue = None
 
 class In_process_job_manager(Job_manager):
-    def start_workers(self):
+    def start_workers(self, job_source=None):
         pass
 
     def run_jobs(self, job_source):
@@ -160,6 +508,9 @@ class In_process_job_manager(Job_manager):
                     compact_tracebacks.format_traceback(skip=1))
             if job is NoJobAvailable:
                 break
+            # The job blocks us, so there's no point in waiting any longer
+            if self._get_wait_timeout(job_source) is not None:
+                self._process_wait_timeout(job_source)
             try:
                 response = job.run(None)
             except Exception, e:
@@ -205,7 +556,7 @@ def run_jobs(job_source, max_workers=None, allow_mp=True,
     if passed_exceptions:
         for cls in passed_exceptions:
             job_manager.pass_exception(cls)
-    job_manager.start_workers()
+    job_manager.start_workers(job_source)
     try:
         job_manager.run_jobs(job_source)
     except Exception:
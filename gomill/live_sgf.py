@@ -0,0 +1,125 @@
+"""Write SGF game records incrementally, while the game is being played.
+
+A live record is an ordinary SGF file which is kept valid throughout the game:
+each new node is written at the end of the file, followed by the closing
+parenthesis, and the file is flushed. So a record survives a crash of the
+process writing it, and games in progress can be read by other processes.
+
+The root node is written into a fixed-size header area at the start of the
+file, padded with whitespace. When the game is over, the root node (with the
+game result and so on) can normally be replaced without rewriting the rest of
+the file.
+
+Layout:
+  header      -- '(' and the root node, padded with spaces to header_size
+                 bytes (the final byte is a newline)
+  nodes       -- one node per line (though values may contain newlines)
+  tail        -- ')' and a newline
+
+Property values are written as raw values (see sgf.Node.get_raw()); it's up to
+the caller to make sure they're in the encoding specified by the root node's
+CA property.
+
+"""
+
+from gomill import sgf_grammar
+
+DEFAULT_HEADER_SIZE = 4096
+
+_TAIL = ")\n"
+
+class Live_sgf_record(object):
+    """An SGF file being written incrementally.
+
+    Instantiate with
+      pathname    -- pathname of the file to write
+      root        -- raw property map for the provisional root node
+      header_size -- int (default DEFAULT_HEADER_SIZE)
+
+    The file is created (or truncated) immediately. If the provisional root
+    node doesn't fit in the header area, the header area is enlarged.
+
+    Public attributes (treat as read-only):
+      pathname    -- string
+      header_size -- int
+      node_count  -- int (number of nodes added after the root)
+
+    Methods propagate EnvironmentError if there is an error writing the file.
+
+    Call finalise() or close() when finished with the record.
+
+    """
+    def __init__(self, pathname, root, header_size=DEFAULT_HEADER_SIZE):
+        self.pathname = pathname
+        header = "(" + sgf_grammar.serialise_node(root)
+        self.header_size = max(header_size, len(header) + 1)
+        self.node_count = 0
+        # file offset of the tail
+        self._end = self.header_size
+        # file offset of the most recently added node, or None
+        self._last_node_offset = None
+        self.file = open(pathname, "w+b")
+        try:
+            self.file.write(self._pad_header(header) + _TAIL)
+            self.file.flush()
+        except:
+            self.file.close()
+            raise
+
+    def _pad_header(self, header):
+        return header.ljust(self.header_size - 1) + "\n"
+
+    def add_node(self, properties):
+        """Append a node to the main sequence.
+
+        properties -- raw property map
+
+        The file is flushed after the node is written.
+
+        """
+        s = sgf_grammar.serialise_node(properties) + "\n"
+        self.file.seek(self._end)
+        self.file.write(s + _TAIL)
+        self.file.flush()
+        self._last_node_offset = self._end
+        self._end += len(s)
+        self.node_count += 1
+
+    def finalise(self, root, last_node=None):
+        """Write the final versions of the root and last nodes, and close.
+
+        root      -- raw property map
+        last_node -- raw property map, or None
+
+        If last_node is specified, it replaces the node most recently added
+        with add_node() (it's ignored if no nodes have been added).
+
+        Usually this writes only the header and the last node. If the new root
+        node doesn't fit in the header area, the whole file is rewritten.
+
+        """
+        try:
+            if last_node is not None and self._last_node_offset is not None:
+                s = sgf_grammar.serialise_node(last_node) + "\n"
+                self.file.seek(self._last_node_offset)
+                self.file.write(s + _TAIL)
+                self._end = self._last_node_offset + len(s)
+                self.file.truncate()
+            header = "(" + sgf_grammar.serialise_node(root)
+            if len(header) < self.header_size:
+                self.file.seek(0)
+                self.file.write(self._pad_header(header))
+            else:
+                self.file.seek(self.header_size)
+                body = self.file.read()
+                self.header_size = len(header) + 1
+                self.file.seek(0)
+                self.file.write(self._pad_header(header) + body)
+                self.file.truncate()
+        finally:
+            self.file.close()
+
+    def close(self):
+        """Close the file, leaving the record as it is."""
+        self.file.close()
+
@@ -4,7 +4,13 @@ from __future__ import division
 
 import operator
 import random
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
 from heapq import nlargest
+from itertools import izip
 from math import exp, log, sqrt
 
 from gomill import compact_tracebacks
@@ -18,7 +24,11 @@ from gomill.settings import *
 
 
 class Node(object):
-    """A MCTS node.
+    """A detached MCTS node.
+
+    Trees don't store Node objects (see Tree); this class is used to read
+    status files written by older versions of the tuner, which pickled the
+    tree as a graph of Nodes.
 
     Public attributes:
       children     -- list of Nodes, or None for unexpanded
@@ -57,6 +67,55 @@ class Node(object):
         return "<Node:%.2f{%s}>" % (self.value, repr(self.children))
 
 
+class Node_view(object):
+    """Read-only view of a node in a Tree.
+
+    Public attributes:
+      index        -- the node's index in the tree's arrays
+      children     -- list of Node_views, or None for unexpanded
+      wins
+      visits
+      value        -- wins / visits
+      rsqrt_visits -- 1 / sqrt(visits)
+
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def children(self):
+        first = self.tree._first_child[self.index]
+        if first < 0:
+            return None
+        return [Node_view(self.tree, i)
+                for i in xrange(first, first + self.tree.branching_factor)]
+
+    @property
+    def wins(self):
+        return self.tree._wins[self.index]
+
+    @property
+    def visits(self):
+        return self.tree._visits[self.index]
+
+    @property
+    def value(self):
+        return self.wins / self.visits
+
+    @property
+    def rsqrt_visits(self):
+        return sqrt(1/self.visits)
+
+    def __repr__(self):
+        return "<Node_view %d:%.2f>" % (self.index, self.value)
+
+
+_STATE_MAGIC = "GMTREE1\n"
+_state_header_struct = struct.Struct(">8sII")
+
 class Tree(object):
     """A tree of MCTS nodes representing N-dimensional parameter space.
 
@@ -67,12 +126,25 @@ class Tree(object):
       initial_visits   -- visit count for newly-created nodes
       initial_wins     -- win count for newly-created nodes
       exploration_coefficient -- constant for UCT formula (float)
+      virtual_loss     -- visit count added for each outstanding simulation
+                          (int, default 0)
 
     Public attributes:
-      root             -- Node
+      root             -- Node_view for the root node
       dimensions       -- number of dimensions in the parameter space
+      node_count       -- number of nodes in the tree
+
+    All persistent state is in the node arrays (see get_state() and
+    set_state()).
 
-    All changing state is in the tree of Node objects started at 'root'.
+    Virtual losses (see add_virtual_loss()) are applied to the visit counts in
+    the arrays, so that simulations see them, but they're excluded from the
+    state returned by get_state(), and from the descriptions and reports.
+
+    Nodes are identified by their index in the arrays; the root is node 0.
+    The children of an expanded node are stored contiguously, starting at the
+    index given by its entry in the first-child array (-1 for an unexpanded
+    node).
 
     References to 'optimiser_parameters' below mean a sequence of length
     'dimensions', whose values are floats in the range 0.0..1.0 representing
@@ -91,7 +163,7 @@ class Tree(object):
     def __init__(self, splits, max_depth,
                  exploration_coefficient,
                  initial_visits, initial_wins,
-                 parameter_formatter):
+                 parameter_formatter, virtual_loss=0):
         self.splits = splits
         self.dimensions = len(splits)
         self.branching_factor = reduce(operator.mul, splits)
@@ -99,9 +171,10 @@ class Tree(object):
         self.exploration_coefficient = exploration_coefficient
         self.initial_visits = initial_visits
         self.initial_wins = initial_wins
-        self._initial_value = initial_wins / initial_visits
-        self._initial_rsqrt_visits = 1/sqrt(initial_visits)
+        self.virtual_loss = virtual_loss
         self.format_parameters = parameter_formatter
+        # map node index -> number of virtual losses applied
+        self._virtual_loss_counts = {}
 
         # map child index -> coordinate vector
         # coordinate vector -- tuple length 'dimensions' with values in
@@ -117,21 +190,33 @@ class Tree(object):
             v.reverse()
             self._cube_coordinates.append(tuple(v))
 
+        # Array contents for a newly-created set of children
+        self._new_wins = array('d', [initial_wins] * self.branching_factor)
+        self._new_visits = array('d', [initial_visits] * self.branching_factor)
+        self._new_first_child = array('l', [-1] * self.branching_factor)
+
+    @property
+    def root(self):
+        return Node_view(self, 0)
+
+    @property
+    def node_count(self):
+        return len(self._visits)
+
     def new_root(self):
         """Initialise the tree with an expanded root node."""
-        self.node_count = 1 # For description only
-        self.root = Node()
-        self.root.children = None
-        self.root.wins = self.initial_wins
-        self.root.visits = self.initial_visits
-        self.root.value = self.initial_wins / self.initial_visits
-        self.root.rsqrt_visits = self._initial_rsqrt_visits
-        self.expand(self.root)
+        self._wins = array('d', [self.initial_wins])
+        self._visits = array('d', [self.initial_visits])
+        self._first_child = array('l', [-1])
+        self._virtual_loss_counts = {}
+        self.expand(0)
 
     def set_root(self, node):
-        """Use the specified node as the tree's root.
+        """Use the specified Node as the tree's root.
 
-        This is used when restoring serialised state.
+        This is used when restoring state from status files written by older
+        versions (which stored a graph of Node objects). The tree's state is
+        copied from the Nodes.
 
         Raises ValueError if the node doesn't have the expected number of
         children.
@@ -139,27 +224,142 @@ class Tree(object):
         """
         if not node.children or len(node.children) != self.branching_factor:
             raise ValueError
-        self.root = node
-        self.node_count = node.count_tree_size()
+        wins = array('d', [node.wins])
+        visits = array('d', [node.visits])
+        first_child = array('l', [-1])
+        # Breadth-first, so each node's children are contiguous
+        to_visit = deque([(0, node)])
+        while to_visit:
+            index, node = to_visit.popleft()
+            if node.children is None:
+                continue
+            if len(node.children) != self.branching_factor:
+                raise ValueError
+            first_child[index] = len(visits)
+            for child in node.children:
+                to_visit.append((len(visits), child))
+                wins.append(child.wins)
+                visits.append(child.visits)
+                first_child.append(-1)
+        self._wins = wins
+        self._visits = visits
+        self._first_child = first_child
+        self._virtual_loss_counts = {}
+
+    def get_state(self):
+        """Return the tree's state, in compact binary form.
+
+        Returns an 8-bit string, suitable for passing to set_state().
+
+        Any virtual losses are excluded.
+
+        """
+        first_child = array('i', self._first_child)
+        wins = array('d', self._wins)
+        visits = array('d', self._visits)
+        for node, count in self._virtual_loss_counts.iteritems():
+            visits[node] -= count * self.virtual_loss
+        if sys.byteorder != 'big':
+            for a in (first_child, wins, visits):
+                a.byteswap()
+        return _state_header_struct.pack(
+            _STATE_MAGIC, self.branching_factor, len(visits)) + zlib.compress(
+                first_child.tostring() + wins.tostring() + visits.tostring(),
+                1)
+
+    def set_state(self, s):
+        """Restore the tree's state from the result of get_state().
+
+        Raises ValueError if the state is malformed, or has the wrong
+        branching factor.
+
+        """
+        header_size = _state_header_struct.size
+        try:
+            magic, branching_factor, node_count = \
+                _state_header_struct.unpack(s[:header_size])
+            data = zlib.decompress(s[header_size:])
+        except (struct.error, zlib.error), e:
+            raise ValueError("bad tree state: %s" % e)
+        if magic != _STATE_MAGIC:
+            raise ValueError("bad tree state: wrong magic")
+        if branching_factor != self.branching_factor:
+            raise ValueError("bad tree state: wrong branching factor")
+        first_child = array('i')
+        wins = array('d')
+        visits = array('d')
+        if len(data) != node_count * (
+                first_child.itemsize + wins.itemsize + visits.itemsize):
+            raise ValueError("bad tree state: wrong length")
+        i = node_count * first_child.itemsize
+        j = i + node_count * wins.itemsize
+        first_child.fromstring(data[:i])
+        wins.fromstring(data[i:j])
+        visits.fromstring(data[j:])
+        if sys.byteorder != 'big':
+            for a in (first_child, wins, visits):
+                a.byteswap()
+        if node_count == 0 or first_child[0] < 0:
+            raise ValueError("bad tree state: root isn't expanded")
+        if max(first_child) + branching_factor > node_count:
+            raise ValueError("bad tree state: bad child index")
+        self._wins = wins
+        self._visits = visits
+        self._first_child = array('l', first_child)
+        self._virtual_loss_counts = {}
 
     def expand(self, node):
-        """Add children to the specified node."""
-        assert node.children is None
-        node.children = []
-        child_count = self.branching_factor
-        for _ in xrange(child_count):
-            child = Node()
-            child.children = None
-            child.wins = self.initial_wins
-            child.visits = self.initial_visits
-            child.value = self._initial_value
-            child.rsqrt_visits = self._initial_rsqrt_visits
-            node.children.append(child)
-        self.node_count += child_count
+        """Add children to the specified node (a node index)."""
+        assert self._first_child[node] < 0
+        self._first_child[node] = len(self._visits)
+        self._wins.extend(self._new_wins)
+        self._visits.extend(self._new_visits)
+        self._first_child.extend(self._new_first_child)
+
+    def _get_real_visits(self, node):
+        """Return a node's visit count, excluding virtual losses."""
+        return (self._visits[node] -
+                self._virtual_loss_counts.get(node, 0) * self.virtual_loss)
 
     def is_ripe(self, node):
-        """Say whether a node has been visted enough times to be expanded."""
-        return node.visits != self.initial_visits
+        """Say whether a node has been visted enough times to be expanded.
+
+        Virtual losses don't count.
+
+        """
+        return self._get_real_visits(node) != self.initial_visits
+
+    def add_virtual_loss(self, nodes):
+        """Apply a virtual loss to the specified nodes.
+
+        nodes -- list of node indices
+
+        This adds 'virtual_loss' visits (and no wins) to each node, so that
+        other simulations are discouraged from choosing the same path before
+        this simulation's result is known.
+
+        """
+        if not self.virtual_loss:
+            return
+        visits = self._visits
+        counts = self._virtual_loss_counts
+        for node in nodes:
+            visits[node] += self.virtual_loss
+            counts[node] = counts.get(node, 0) + 1
+
+    def remove_virtual_loss(self, nodes):
+        """Revert the effect of add_virtual_loss() for the specified nodes."""
+        if not self.virtual_loss:
+            return
+        visits = self._visits
+        counts = self._virtual_loss_counts
+        for node in nodes:
+            visits[node] -= self.virtual_loss
+            count = counts[node] - 1
+            if count:
+                counts[node] = count
+            else:
+                del counts[node]
 
     def parameters_for_path(self, choice_path):
         """Retrieve the point in parameter space given by a node.
@@ -207,6 +407,17 @@ class Tree(object):
         """Return a string describing a child's coordinates in its parent."""
         return str(self._cube_coordinates[choice]).replace(" ", "")
 
+    def _iter_children(self, node):
+        """Return an iterator of pairs (child index, node) for a node's children.
+
+        Returns an empty iterator for an unexpanded node.
+
+        """
+        first = self._first_child[node]
+        if first < 0:
+            return iter(())
+        return enumerate(xrange(first, first + self.branching_factor))
+
     def describe(self):
         """Return a text description of the current state of the tree.
 
@@ -218,13 +429,13 @@ class Tree(object):
             parameters = self.format_parameters(
                 self.parameters_for_path(choice_path))
             choice_s = self.describe_choice(choice_path[-1])
+            visits = self._get_real_visits(node)
             return "%s %s %.3f %3d" % (
-                choice_s, parameters, node.value,
-                node.visits - self.initial_visits)
+                choice_s, parameters, self._wins[node] / visits,
+                visits - self.initial_visits)
 
-        root = self.root
-        wins = root.wins - self.initial_wins
-        visits = root.visits - self.initial_visits
+        wins = self._wins[0] - self.initial_wins
+        visits = self._visits[0] - self.initial_visits
         try:
             win_rate = "%.3f" % (wins/visits)
         except ZeroDivisionError:
@@ -234,11 +445,9 @@ class Tree(object):
             "Win rate %d/%d = %s" % (wins, visits, win_rate)
             ]
 
-        for choice, node in enumerate(self.root.children):
+        for choice, node in self._iter_children(0):
             result.append("  " + describe_node(node, [choice]))
-            if node.children is None:
-                continue
-            for choice2, node2 in enumerate(node.children):
+            for choice2, node2 in self._iter_children(node):
                 result.append("    " + describe_node(node2, [choice, choice2]))
         return "\n".join(result)
 
@@ -259,24 +468,24 @@ class Tree(object):
             parameters = self.format_parameters(
                 self.parameters_for_path(choice_path))
             choice_s = " ".join(map(self.describe_choice, choice_path))
+            visits = self._get_real_visits(node)
             return "%s %-40s %.3f %3d" % (
-                choice_s, parameters, node.value,
-                node.visits - self.initial_visits)
+                choice_s, parameters, self._wins[node] / visits,
+                visits - self.initial_visits)
 
-        def most_visits((child_index, node)):
-            return node.visits
+        def most_visits((path, node)):
+            return self._get_real_visits(node)
 
-        last_generation = [([], self.root)]
+        last_generation = [([], 0)]
         for i, n in enumerate(summary_spec):
             depth = i + 1
             p("most visited at depth %s" % (depth))
 
             this_generation = []
             for path, node in last_generation:
-                if node.children is not None:
-                    this_generation += [
-                        (path + [child_index], child)
-                        for (child_index, child) in enumerate(node.children)]
+                this_generation += [
+                    (path + [child_index], child)
+                    for (child_index, child) in self._iter_children(node)]
 
             for path, node in sorted(
                 nlargest(n, this_generation, key=most_visits)):
@@ -299,31 +508,41 @@ class Simulation(object):
     """
     def __init__(self, tree):
         self.tree = tree
-        # list of Nodes
+        # list of node indices
         self.node_path = []
         # corresponding list of child indices
         self.choice_path = []
         # bool
         self.candidate_won = None
+        # bool
+        self.virtual_loss_applied = False
 
     def _choose_action(self, node):
         """Choose the best action from the specified node.
 
-        Returns a pair (child index, node)
+        Returns a pair (child index, node index)
+
+        Ties are broken by starting the search at a random child.
 
         """
-        uct_numerator = (self.tree.exploration_coefficient *
-                         sqrt(log(node.visits)))
-        def urgency((i, child)):
-            return child.value + uct_numerator * child.rsqrt_visits
-        start = random.randrange(len(node.children))
-        children = list(enumerate(node.children))
-        return max(children[start:] + children[:start], key=urgency)
+        tree = self.tree
+        first = tree._first_child[node]
+        end = first + tree.branching_factor
+        uct_numerator = (tree.exploration_coefficient *
+                         sqrt(log(tree._visits[node])))
+        urgencies = [wins/visits + uct_numerator/sqrt(visits)
+                     for (wins, visits) in izip(tree._wins[first:end],
+                                                tree._visits[first:end])]
+        start = random.randrange(len(urgencies))
+        rotated = urgencies[start:] + urgencies[:start]
+        choice = (rotated.index(max(rotated)) + start) % len(urgencies)
+        return choice, first + choice
 
     def walk(self):
         """Choose a node sequence, without expansion."""
-        node = self.tree.root
-        while node.children is not None:
+        node = 0
+        first_child = self.tree._first_child
+        while first_child[node] >= 0:
             choice, node = self._choose_action(node)
             self.node_path.append(node)
             self.choice_path.append(choice)
@@ -353,23 +572,40 @@ class Simulation(object):
         """
         return self.tree.parameters_for_path(self.choice_path)
 
+    def add_virtual_loss(self):
+        """Apply the tree's virtual loss to the simulation's node sequence.
+
+        Call this after run(), if the simulation's result won't be known
+        before the next simulation is run.
+
+        """
+        self.tree.add_virtual_loss(self.node_path)
+        self.virtual_loss_applied = True
+
+    def remove_virtual_loss(self):
+        """Revert add_virtual_loss() (does nothing if it wasn't called)."""
+        if self.virtual_loss_applied:
+            self.tree.remove_virtual_loss(self.node_path)
+            self.virtual_loss_applied = False
+
     def update_stats(self, candidate_won):
         """Update the tree's node statistics with the simulation's results.
 
         This updates visits (and wins, if appropriate) for each node in the
-        simulation's node sequence.
+        simulation's node sequence, and for the root.
+
+        Removes the simulation's virtual loss, if any.
 
         """
+        self.remove_virtual_loss()
         self.candidate_won = candidate_won
-        for node in self.node_path:
-            node.visits += 1
+        wins = self.tree._wins
+        visits = self.tree._visits
+        # The root's statistics are for description only
+        for node in [0] + self.node_path:
+            visits[node] += 1
             if candidate_won:
-                node.wins += 1
-            node.recalculate()
-        self.tree.root.visits += 1
-        if candidate_won:
-            self.tree.root.wins += 1 # For description only
-        self.tree.root.recalculate()
+                wins[node] += 1
 
     def describe_steps(self):
         """Return a text description of the simulation's node sequence."""
@@ -397,9 +633,11 @@ class Greedy_simulation(Simulation):
 
     """
     def _choose_action(self, node):
-        def wins((i, node)):
-            return node.wins
-        return max(enumerate(node.children), key=wins)
+        tree = self.tree
+        first = tree._first_child[node]
+        wins = tree._wins[first:first+tree.branching_factor]
+        choice = wins.index(max(wins))
+        return choice, first + choice
 
 
 parameter_settings = [
@@ -507,6 +745,12 @@ class LOG(Config_proxy):
 class EXPLICIT(Config_proxy):
     underlying = Explicit_scale_fn
 
+def interpret_nonnegative_int(i):
+    i = interpret_int(i)
+    if i < 0:
+        raise ValueError("must be nonnegative integer")
+    return i
+
 def interpret_candidate_colour(v):
     if v in ('r', 'random'):
         return 'random'
@@ -560,6 +804,7 @@ class Mcts_tuner(Competition):
         Setting('exploration_coefficient', interpret_float),
         Setting('initial_visits', interpret_positive_int),
         Setting('initial_wins', interpret_positive_int),
+        Setting('virtual_loss', interpret_nonnegative_int, default=0),
         ]
 
     def parameter_spec_from_config(self, parameter_config):
@@ -641,7 +886,7 @@ class Mcts_tuner(Competition):
 
     # State attributes (*: in persistent state):
     #  *scheduler               -- Simple_scheduler
-    #  *tree                    -- Tree (root node is persisted)
+    #  *tree                    -- Tree (see Tree.get_state())
     #   outstanding_simulations -- map game_number -> Simulation
     #   halt_on_next_failure    -- bool
     #  *opponent_description    -- string (or None)
@@ -658,15 +903,18 @@ class Mcts_tuner(Competition):
         # path0 is stored for consistency check
         return {
             'scheduler' : self.scheduler,
-            'tree_root' : self.tree.root,
+            'tree_data' : self.tree.get_state(),
             'opponent_description' : self.opponent_description,
             'path0' : self.scale_parameters(self.tree.parameters_for_path([0])),
             }
 
     def set_status(self, status):
-        root = status['tree_root']
         try:
-            self.tree.set_root(root)
+            if 'tree_data' in status:
+                self.tree.set_state(status['tree_data'])
+            else:
+                # status from an older version, containing a tree of Nodes
+                self.tree.set_root(status['tree_root'])
         except ValueError:
             raise CompetitionError(
                 "status file is inconsistent with control file")
@@ -757,6 +1005,7 @@ class Mcts_tuner(Competition):
 
         simulation = Simulation(self.tree)
         simulation.run()
+        simulation.add_virtual_loss()
         optimiser_parameters = simulation.get_parameters()
         engine_parameters = self.scale_parameters(optimiser_parameters)
         candidate = self.make_candidate("#%d" % game_number, engine_parameters)
@@ -809,7 +1058,8 @@ class Mcts_tuner(Competition):
         stop_competition = False
         retry_game = False
         game_number = job.game_data
-        del self.outstanding_simulations[game_number]
+        simulation = self.outstanding_simulations.pop(game_number)
+        simulation.remove_virtual_loss()
         self.scheduler.fix(game_number)
         if self.halt_on_next_failure:
             stop_competition = True
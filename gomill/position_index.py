@@ -0,0 +1,357 @@
+"""Index SGF games by the positions they reach.
+
+An index file maps position hashes (see board_hashes) to the games, and move
+numbers, where the position appeared. Lookups use a binary search on the file,
+so they don't need to read the whole index.
+
+Index file format (all integers big-endian):
+  header  -- magic string, flags (uint32), record count (uint64), offset of
+             the pathname table (uint64)
+  records -- sorted fixed-size records: hash (uint64), file number (uint32),
+             game number within the file (uint32), move number (uint16)
+  pathname table -- pickled list of pathnames, indexed by file number
+
+"""
+
+import cPickle as pickle
+import heapq
+import os
+import struct
+import tempfile
+
+from gomill import board_hashes
+from gomill import job_manager
+from gomill import sgf_grammar
+from gomill import sgf_moves
+
+MAGIC = "GMPOSIX1"
+FLAG_SYMMETRIC = 1
+
+_header_struct = struct.Struct(">8sIQQ")
+_record_struct = struct.Struct(">QIIH")
+_RECORD_SIZE = _record_struct.size
+_MAX_MOVE_NUMBER = 0xffff
+
+
+def _read_file(pathname):
+    f = open(pathname, "rb")
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def _iter_packed_records(packed):
+    """Iterate over the records in a string of packed records."""
+    for i in xrange(0, len(packed), _RECORD_SIZE):
+        yield packed[i:i+_RECORD_SIZE]
+
+def _iter_run_file(f):
+    """Iterate over the records in a file of packed records."""
+    f.seek(0)
+    chunk_size = _RECORD_SIZE * 4096
+    while True:
+        s = f.read(chunk_size)
+        if not s:
+            break
+        for i in xrange(0, len(s), _RECORD_SIZE):
+            yield s[i:i+_RECORD_SIZE]
+
+def _write_records(f, records):
+    """Write packed records from an iterable to a file."""
+    buf = []
+    for record in records:
+        buf.append(record)
+        if len(buf) == 4096:
+            f.write("".join(buf))
+            buf = []
+    f.write("".join(buf))
+
+def make_index_records(file_number, s, symmetric):
+    """Calculate index records for the games in an SGF collection.
+
+    file_number -- int
+    s           -- 8-bit string containing SGF data
+    symmetric   -- bool (see board_hashes.position_hash())
+
+    Returns a pair (records, error message or None)
+
+    'records' is a list of packed index records (8-bit strings).
+
+    If some of the games can't be parsed or replayed, returns records for the
+    others, and an error message describing the first problem.
+
+    """
+    pack = _record_struct.pack
+    records = []
+    error = None
+    try:
+        for game_number, (_, _, coarse_game) in enumerate(
+                sgf_grammar.iter_sgf_collection(s)):
+            try:
+                size, setup, moves = \
+                    sgf_moves.get_compact_setup_and_moves(coarse_game)
+                hashes = board_hashes.game_position_hashes(
+                    size, setup, moves, symmetric)
+                for move_number, h in hashes:
+                    if move_number > _MAX_MOVE_NUMBER:
+                        break
+                    records.append(
+                        pack(h, file_number, game_number, move_number))
+            except ValueError, e:
+                if error is None:
+                    error = "game %d: %s" % (game_number, e)
+    except ValueError, e:
+        if error is None:
+            error = str(e)
+    return records, error
+
+
+class _Indexing_job(object):
+    """Job for indexing a single SGF file (see job_manager)."""
+    def __init__(self, file_number, pathname, symmetric):
+        self.file_number = file_number
+        self.pathname = pathname
+        self.symmetric = symmetric
+
+    def __repr__(self):
+        return "<indexing %s>" % self.pathname
+
+    def run(self, worker_id):
+        try:
+            s = _read_file(self.pathname)
+        except EnvironmentError, e:
+            return self.file_number, "", str(e)
+        records, error = make_index_records(self.file_number, s,
+                                            self.symmetric)
+        # Sorting here means the sorting is done in parallel; the job source
+        # only has to merge.
+        records.sort()
+        return self.file_number, "".join(records), error
+
+class _Indexing_job_source(object):
+    """Job source for build_position_index().
+
+    Each response holds one file's records, sorted and packed into a single
+    string (a 'run'). Runs are kept in memory until they amount to
+    run_buffer_size bytes, then merged into a temporary file in temp_dir. So
+    the memory needed doesn't depend on the size of the archive.
+
+    Call iter_records() to get all the records in order, and close() to
+    remove the temporary files.
+
+    """
+    run_buffer_size = 64 * 1024 * 1024
+
+    def __init__(self, pathnames, symmetric, temp_dir):
+        self.pathnames = pathnames
+        self.symmetric = symmetric
+        self.temp_dir = temp_dir
+        self.next_file_number = 0
+        self.record_count = 0
+        self.errors = {}
+        self._buffered_runs = []
+        self._buffered_size = 0
+        self._run_files = []
+
+    def get_job(self):
+        if self.next_file_number >= len(self.pathnames):
+            return job_manager.NoJobAvailable
+        file_number = self.next_file_number
+        self.next_file_number += 1
+        return _Indexing_job(
+            file_number, self.pathnames[file_number], self.symmetric)
+
+    def process_response(self, response):
+        file_number, packed, error = response
+        if packed:
+            self._buffered_runs.append(packed)
+            self._buffered_size += len(packed)
+            self.record_count += len(packed) // _RECORD_SIZE
+            if self._buffered_size >= self.run_buffer_size:
+                self._spill()
+        if error is not None:
+            self.errors[file_number] = error
+
+    def process_error_response(self, job, message):
+        self.errors[job.file_number] = "internal error:\n%s" % message
+
+    def _spill(self):
+        """Merge the buffered runs into a new temporary file."""
+        f = tempfile.TemporaryFile(dir=self.temp_dir)
+        self._run_files.append(f)
+        _write_records(f, heapq.merge(
+            *[_iter_packed_records(packed) for packed in self._buffered_runs]))
+        self._buffered_runs = []
+        self._buffered_size = 0
+
+    def iter_records(self):
+        """Iterate over all the records received, in sorted order."""
+        return heapq.merge(
+            *([_iter_run_file(f) for f in self._run_files] +
+              [_iter_packed_records(packed)
+               for packed in self._buffered_runs]))
+
+    def close(self):
+        """Remove the temporary files."""
+        for f in self._run_files:
+            f.close()
+        self._run_files = []
+
+
+def build_position_index(pathnames, index_pathname, symmetric=True,
+                         max_workers=None, allow_mp=True):
+    """Build a position index for a set of SGF files.
+
+    pathnames      -- list of pathnames of SGF files
+    index_pathname -- pathname of the index file to write
+    symmetric      -- bool (default True)
+    max_workers    -- number of processes to use (default: one per CPU)
+    allow_mp       -- bool (default True)
+
+    If 'symmetric' is true, the index finds positions regardless of the
+    board's orientation (see board_hashes.position_hash()).
+
+    The files are processed in parallel using job_manager. If 'allow_mp' is
+    false (or multiprocessing isn't available), they are processed in the
+    current process.
+
+    Games are replayed using the moves from their leftmost variation, until
+    the first move on an occupied point; positions after move 65535 aren't
+    indexed.
+
+    Each file's records are sorted in the worker process, and the sorted
+    runs are merged into the index file. Temporary files in the index file's
+    directory are used to hold the runs, so the memory needed doesn't grow
+    with the size of the archive.
+
+    The index file is replaced atomically.
+
+    Returns a list of pairs (pathname, error message), for files which
+    couldn't be read or contained SGF data which couldn't be parsed or
+    replayed. Any games from such a file which could be handled are still
+    indexed.
+
+    """
+    pathnames = [os.path.abspath(pathname) for pathname in pathnames]
+    job_source = _Indexing_job_source(
+        pathnames, symmetric,
+        os.path.dirname(os.path.abspath(index_pathname)))
+    try:
+        job_manager.run_jobs(job_source, max_workers=max_workers,
+                             allow_mp=allow_mp)
+        flags = 0
+        if symmetric:
+            flags |= FLAG_SYMMETRIC
+        record_count = job_source.record_count
+        pathname_table_offset = (_header_struct.size +
+                                 record_count * _RECORD_SIZE)
+        tmp_pathname = index_pathname + ".new"
+        f = open(tmp_pathname, "wb")
+        try:
+            f.write(_header_struct.pack(
+                MAGIC, flags, record_count, pathname_table_offset))
+            _write_records(f, job_source.iter_records())
+            pickle.dump(pathnames, f, protocol=-1)
+        finally:
+            f.close()
+    finally:
+        job_source.close()
+    os.rename(tmp_pathname, index_pathname)
+    return [(pathnames[file_number], error)
+            for (file_number, error) in sorted(job_source.errors.items())]
+
+
+class Position_index(object):
+    """Read access to a position index file.
+
+    Instantiate with the pathname of an index file written by
+    build_position_index().
+
+    Raises EnvironmentError if the file can't be read, or ValueError if it
+    isn't a valid index file.
+
+    Public attributes (treat as read-only):
+      symmetric    -- bool
+      record_count -- int
+
+    Call close() when finished with the index.
+
+    """
+    def __init__(self, pathname):
+        self.file = open(pathname, "rb")
+        try:
+            header = self.file.read(_header_struct.size)
+            if len(header) != _header_struct.size:
+                raise ValueError("truncated index file")
+            magic, flags, self.record_count, self._pathname_table_offset = \
+                _header_struct.unpack(header)
+            if magic != MAGIC:
+                raise ValueError("not a position index file")
+        except:
+            self.file.close()
+            raise
+        self.symmetric = bool(flags & FLAG_SYMMETRIC)
+        self._pathnames = None
+
+    def close(self):
+        """Close the index file."""
+        self.file.close()
+
+    def _get_pathnames(self):
+        if self._pathnames is None:
+            self.file.seek(self._pathname_table_offset)
+            self._pathnames = pickle.load(self.file)
+        return self._pathnames
+
+    def _read_record(self, i):
+        self.file.seek(_header_struct.size + i * _RECORD_SIZE)
+        return _record_struct.unpack(self.file.read(_RECORD_SIZE))
+
+    def find_hash(self, h):
+        """Find the games which reached the position with the specified hash.
+
+        h -- 64-bit int (from board_hashes.position_hash())
+
+        Returns a list of tuples (pathname, game number, move number)
+
+        'game number' is the game's index in its file's SGF collection. 'move
+        number' is the number of moves (including passes) played to reach
+        the position for the first time in that game.
+
+        """
+        lo = 0
+        hi = self.record_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._read_record(mid)[0] < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = []
+        pathnames = None
+        i = lo
+        while i < self.record_count:
+            record_hash, file_number, game_number, move_number = \
+                self._read_record(i)
+            if record_hash != h:
+                break
+            if pathnames is None:
+                pathnames = self._get_pathnames()
+            result.append((pathnames[file_number], game_number, move_number))
+            i += 1
+        return result
+
+    def find_position(self, board):
+        """Find the games which reached the specified position.
+
+        board -- boards.Board
+
+        Returns a list of tuples (pathname, game number, move number), as for
+        find_hash().
+
+        If the index is symmetric, finds games which reached any rotation or
+        reflection of the position.
+
+        """
+        return self.find_hash(
+            board_hashes.position_hash(board, self.symmetric))
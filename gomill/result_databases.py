@@ -0,0 +1,314 @@
+"""Store competition game results in an SQLite database.
+
+The database has a single table recording, for each game result, the game id,
+matchup id, players, winner, SGF result, forfeit flag, result detail, CPU
+times, fingerprint, and the times the game started and finished. It is
+indexed by matchup and by player, so results can be found and summarised
+without loading the whole competition state.
+
+Results are recorded by game id: recording a result for a game id which is
+already present replaces the old result.
+
+"""
+
+from __future__ import division
+
+import sqlite3
+
+from gomill import gtp_games
+from gomill import tournament_results
+
+# Exception raised for errors from the database
+DatabaseError = sqlite3.Error
+
+_schema = """\
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    matchup_id TEXT,
+    player_b TEXT NOT NULL,
+    player_w TEXT NOT NULL,
+    winning_colour TEXT,
+    winning_player TEXT,
+    sgf_result TEXT NOT NULL,
+    is_forfeit INTEGER NOT NULL,
+    detail TEXT,
+    cpu_time_b REAL,
+    cpu_time_w REAL,
+    fingerprint TEXT,
+    start_time REAL,
+    end_time REAL
+);
+CREATE INDEX IF NOT EXISTS games_matchup_id ON games (matchup_id);
+CREATE INDEX IF NOT EXISTS games_player_b ON games (player_b);
+CREATE INDEX IF NOT EXISTS games_player_w ON games (player_w);
+"""
+
+_result_columns = ("game_id, player_b, player_w, winning_colour, sgf_result, "
+                   "detail, is_forfeit, cpu_time_b, cpu_time_w, fingerprint")
+
+def _make_row(game_result, matchup_id, start_time, end_time):
+    return (
+        game_result.game_id,
+        matchup_id,
+        game_result.player_b,
+        game_result.player_w,
+        game_result.winning_colour,
+        game_result.winning_player,
+        game_result.sgf_result,
+        int(game_result.is_forfeit),
+        game_result.detail,
+        game_result.cpu_times.get(game_result.player_b),
+        game_result.cpu_times.get(game_result.player_w),
+        game_result.fingerprint,
+        start_time,
+        end_time,
+        )
+
+def _make_game_result(row):
+    (game_id, player_b, player_w, winning_colour, sgf_result, detail,
+     is_forfeit, cpu_time_b, cpu_time_w, fingerprint) = row
+    # Use the same route as unpickling, so that the derived attributes are
+    # set consistently.
+    result = gtp_games.Game_result.__new__(gtp_games.Game_result)
+    result.__setstate__((
+        player_b, player_w, winning_colour, sgf_result, detail,
+        bool(is_forfeit), game_id,
+        {player_b : cpu_time_b, player_w : cpu_time_w},
+        fingerprint))
+    return result
+
+
+class Result_database(object):
+    """Database of game results.
+
+    Instantiate with the pathname of the database (it's created if it doesn't
+    already exist).
+
+    Call close() when finished with the database.
+
+    Methods propagate DatabaseError if there is an error from SQLite.
+
+    """
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self.connection = sqlite3.connect(pathname)
+        self.connection.text_factory = str
+        self.connection.executescript(_schema)
+        self.connection.commit()
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
+
+    def record_result(self, game_result, matchup_id=None,
+                      start_time=None, end_time=None):
+        """Record a game result.
+
+        game_result -- gtp_games.Game_result (with game_id set)
+        matchup_id  -- string or None
+        start_time  -- float (seconds since the epoch) or None
+        end_time    -- float (seconds since the epoch) or None
+
+        Replaces any existing result with the same game id.
+
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO games VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _make_row(game_result, matchup_id, start_time, end_time))
+        self.connection.commit()
+
+    def add_missing_results(self, results):
+        """Record any of the specified results which aren't already present.
+
+        results -- list of pairs (matchup id or None, gtp_games.Game_result)
+
+        This is used to bring the database up to date with a competition's
+        state. Existing results are left alone.
+
+        """
+        cursor = self.connection.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO games VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (_make_row(game_result, matchup_id, None, None)
+             for (matchup_id, game_result) in results))
+        self.connection.commit()
+
+    @staticmethod
+    def _make_conditions(matchup_id, player, is_forfeit):
+        conditions = []
+        parameters = []
+        if matchup_id is not None:
+            conditions.append("matchup_id = ?")
+            parameters.append(matchup_id)
+        if player is not None:
+            conditions.append("(player_b = ? OR player_w = ?)")
+            parameters += [player, player]
+        if is_forfeit is not None:
+            conditions.append("is_forfeit = ?")
+            parameters.append(int(is_forfeit))
+        if conditions:
+            return " WHERE " + " AND ".join(conditions), parameters
+        return "", parameters
+
+    def count_games(self, matchup_id=None, player=None, is_forfeit=None):
+        """Return the number of game results in the database.
+
+        The parameters restrict the count in the same way as for
+        find_results().
+
+        """
+        where, parameters = self._make_conditions(
+            matchup_id, player, is_forfeit)
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM games" + where, parameters).fetchone()[0]
+
+    def find_results(self, matchup_id=None, player=None, is_forfeit=None):
+        """Find game results in the database.
+
+        matchup_id -- matchup id (optional)
+        player     -- player code (optional)
+        is_forfeit -- bool (optional)
+
+        Returns an iterator over gtp_games.Game_results, in the order they
+        were recorded.
+
+        Each parameter which isn't None restricts the result: to games from
+        the specified matchup, to games played by the specified player (with
+        either colour), or to games which were (or weren't) lost by forfeit.
+
+        The results are read from the database as the iterator is consumed.
+
+        """
+        where, parameters = self._make_conditions(
+            matchup_id, player, is_forfeit)
+        cursor = self.connection.execute(
+            "SELECT %s FROM games%s ORDER BY rowid" % (_result_columns, where),
+            parameters)
+        for row in cursor:
+            yield _make_game_result(row)
+
+    def get_matchup_stats(self, matchup_id, player_1, player_2):
+        """Return statistics for the specified matchup.
+
+        Returns a tournament_results.Matchup_stats object, with the colour
+        breakdown and time statistics calculated.
+
+        The statistics are calculated using SQL aggregates, without loading
+        the individual results.
+
+        """
+        ms = _Database_matchup_stats(self, matchup_id, player_1, player_2)
+        ms.calculate_colour_breakdown()
+        ms.calculate_time_stats()
+        return ms
+
+
+class _Database_matchup_stats(tournament_results.Matchup_stats):
+    """Matchup_stats variant calculated by the result database."""
+    def __init__(self, database, matchup_id, player_1, player_2):
+        self._connection = database.connection
+        self._matchup_id = matchup_id
+        self.player_1 = player_1
+        self.player_2 = player_2
+        (self.total, jigos, self.unknown, self.wins_1, self.wins_2,
+         self.forfeits_1, self.forfeits_2, fingerprinted, distinct) = \
+            self._query(
+                "COUNT(*)",
+                "SUM(sgf_result = '0')",
+                "SUM(winning_colour IS NULL AND sgf_result != '0')",
+                "SUM(winning_player = :p1)",
+                "SUM(winning_player = :p2)",
+                "SUM(winning_player = :p2 AND is_forfeit)",
+                "SUM(winning_player = :p1 AND is_forfeit)",
+                "COUNT(fingerprint)",
+                "COUNT(DISTINCT fingerprint)")
+        js = self._jigo_score = 0.5 * jigos
+        self.wins_1 += js
+        self.wins_2 += js
+        self.duplicates = fingerprinted - distinct
+
+    def _query(self, *expressions):
+        row = self._connection.execute(
+            "SELECT %s FROM games WHERE matchup_id = :m" %
+            ", ".join(expressions),
+            {'m' : self._matchup_id,
+             'p1' : self.player_1, 'p2' : self.player_2}).fetchone()
+        # SUM() gives NULL if there are no rows
+        return [0 if value is None else value for value in row]
+
+    def calculate_colour_breakdown(self):
+        js = self._jigo_score
+        (self.played_1b, self.played_1w, self.played_2b, self.played_y2) = \
+            self._query(
+                "SUM(player_b = :p1)",
+                "SUM(player_w = :p1)",
+                "SUM(player_b = :p2)",
+                "SUM(player_w = :p2)")
+        if self.played_1w == 0 and self.played_2b == 0:
+            self.alternating = False
+            self.colour_1 = 'b'
+            self.colour_2 = 'w'
+        elif self.played_1b == 0 and self.played_y2 == 0:
+            self.alternating = False
+            self.colour_1 = 'w'
+            self.colour_2 = 'b'
+        else:
+            self.alternating = True
+            (wins_b, wins_w, wins_1b, wins_1w, wins_2b, wins_2w) = \
+                self._query(
+                    "SUM(winning_colour = 'b')",
+                    "SUM(winning_colour = 'w')",
+                    "SUM(winning_player = :p1 AND winning_colour = 'b')",
+                    "SUM(winning_player = :p1 AND winning_colour = 'w')",
+                    "SUM(winning_player = :p2 AND winning_colour = 'b')",
+                    "SUM(winning_player = :p2 AND winning_colour = 'w')")
+            self.wins_b = wins_b + js
+            self.wins_w = wins_w + js
+            self.wins_1b = wins_1b + js
+            self.wins_1w = wins_1w + js
+            self.wins_2b = wins_2b + js
+            self.wins_2w = wins_2w + js
+
+    def calculate_time_stats(self):
+        # AVG() ignores NULLs, and gives NULL if there are no known times.
+        self.average_time_1, self.average_time_2 = self._connection.execute(
+            "SELECT "
+            "AVG(CASE WHEN player_b = :p1 THEN cpu_time_b ELSE cpu_time_w END),"
+            "AVG(CASE WHEN player_b = :p2 THEN cpu_time_b ELSE cpu_time_w END) "
+            "FROM games WHERE matchup_id = :m",
+            {'m' : self._matchup_id,
+             'p1' : self.player_1, 'p2' : self.player_2}).fetchone()
+
+
+class Database_tournament_results(tournament_results.Tournament_results):
+    """Tournament_results variant which reads from a Result_database.
+
+    Instantiate with
+      matchup_list -- list of Matchup_descriptions
+      database     -- Result_database
+
+    This provides the same interface as Tournament_results, and also:
+      find_results() -- as for Result_database.find_results()
+      close()        -- closes the database
+
+    """
+    def __init__(self, matchup_list, database):
+        tournament_results.Tournament_results.__init__(
+            self, matchup_list, None)
+        self.database = database
+
+    def get_matchup_results(self, matchup_id):
+        return list(self.database.find_results(matchup_id))
+
+    def get_matchup_stats(self, matchup_id):
+        matchup = self.matchups[matchup_id]
+        return self.database.get_matchup_stats(
+            matchup_id, matchup.player_1, matchup.player_2)
+
+    def find_results(self, matchup_id=None, player=None, is_forfeit=None):
+        return self.database.find_results(matchup_id, player, is_forfeit)
+
+    def close(self):
+        self.database.close()
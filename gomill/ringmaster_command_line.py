@@ -1,5 +1,7 @@
 """Command-line interface to the ringmaster."""
 
+from __future__ import with_statement
+
 import os
 import sys
 from optparse import OptionParser
@@ -13,6 +15,10 @@ from gomill.ringmasters import (
 # indicate a successful exit.
 
 def do_run(ringmaster, options):
+    if options.parallel == "auto":
+        ringmaster.set_automatic_worker_count()
+    elif options.parallel is not None:
+        ringmaster.set_parallel_worker_count(options.parallel)
     if not options.quiet:
         print "running startup checks on all players"
     if not ringmaster.check_players(discard_stderr=True, quiet=options.quiet):
@@ -26,26 +32,61 @@ def do_run(ringmaster, options):
         ringmaster.load_status()
     else:
         ringmaster.set_clean_status()
-    if options.parallel is not None:
-        ringmaster.set_parallel_worker_count(options.parallel)
     ringmaster.run(options.max_games)
     ringmaster.report()
 
 def do_stop(ringmaster, options):
-    ringmaster.write_command("stop")
+    if ringmaster.send_control_request("stop") is None:
+        ringmaster.write_command("stop")
 
 def do_show(ringmaster, options):
+    output = ringmaster.send_control_request("status")
+    if output is not None:
+        sys.stdout.write(output)
+        return
     if not ringmaster.status_file_exists():
         raise RingmasterError("no status file")
+    if ringmaster.print_summary_report():
+        return
     ringmaster.load_status()
     ringmaster.print_status_report()
 
 def do_report(ringmaster, options):
+    output = ringmaster.send_control_request("report")
+    if output is not None:
+        try:
+            with open(ringmaster.report_pathname, "w") as f:
+                f.write(output)
+        except EnvironmentError, e:
+            raise RingmasterError("error writing report file:\n%s" % e)
+        return
     if not ringmaster.status_file_exists():
         raise RingmasterError("no status file")
     ringmaster.load_status()
     ringmaster.report()
 
+def _send_to_running_ringmaster(ringmaster, request):
+    output = ringmaster.send_control_request(request)
+    if output is None:
+        raise RingmasterError("competition is not running")
+    sys.stdout.write(output)
+
+def do_workers(ringmaster, options):
+    _send_to_running_ringmaster(
+        ringmaster, "workers %s" % options.command_argument)
+
+def do_max_games(ringmaster, options):
+    _send_to_running_ringmaster(
+        ringmaster, "max-games %s" % options.command_argument)
+
+def do_watch(ringmaster, options):
+    events = ringmaster.watch_events()
+    if events is None:
+        raise RingmasterError("competition is not running")
+    for event in events:
+        print event
+        sys.stdout.flush()
+
 def do_reset(ringmaster, options):
     ringmaster.delete_state_and_output()
 
@@ -64,31 +105,48 @@ _actions = {
     "reset" : do_reset,
     "check" : do_check,
     "debugstatus" : do_debugstatus,
+    "workers" : do_workers,
+    "max-games" : do_max_games,
+    "watch" : do_watch,
     }
 
+# Commands which take an argument
+_commands_with_argument = ("workers", "max-games")
+
 
 def run(argv, ringmaster_class):
     usage = ("%prog [options] <control file> [command]\n\n"
-             "commands: run (default), stop, show, report, reset, check")
+             "commands: run (default), stop, show, report, reset, check\n"
+             "while running: watch, workers <n>, max-games <n>|none")
     parser = OptionParser(usage=usage, prog="ringmaster",
                           version=ringmaster_class.public_version)
     parser.add_option("--max-games", "-g", type="int",
                       help="maximum number of games to play in this run")
-    parser.add_option("--parallel", "-j", type="int",
-                      help="number of worker processes")
+    parser.add_option("--parallel", "-j",
+                      help="number of worker processes (or 'auto')")
     parser.add_option("--quiet", "-q", action="store_true",
                       help="be silent except for warnings and errors")
     parser.add_option("--log-gtp", action="store_true",
                       help="write GTP logs")
     (options, args) = parser.parse_args(argv)
+    if options.parallel is not None and options.parallel != "auto":
+        try:
+            options.parallel = int(options.parallel)
+        except ValueError:
+            parser.error("option --parallel: invalid value: '%s'" %
+                         options.parallel)
     if len(args) == 0:
         parser.error("no control file specified")
-    if len(args) > 2:
-        parser.error("too many arguments")
     if len(args) == 1:
         command = "run"
     else:
         command = args[1]
+    if command in _commands_with_argument:
+        if len(args) != 3:
+            parser.error("%s command requires one argument" % command)
+        options.command_argument = args[2]
+    elif len(args) > 2:
+        parser.error("too many arguments")
     try:
         action = _actions[command]
     except KeyError:
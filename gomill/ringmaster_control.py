@@ -0,0 +1,290 @@
+"""Control socket for a running ringmaster.
+
+While a competition is running, the ringmaster listens on a Unix-domain stream
+socket. Each connection carries a single request: one line of text made up of
+a command and its arguments, separated by spaces.
+
+The first line of the response is either 'ok' or 'error: <message>'. For most
+commands, the rest of the response is the command's output, and the server
+closes the connection when it has been sent.
+
+For the 'watch' command, the server instead sends one line for each event
+(see Control_server.broadcast()), until the run finishes or the client
+disconnects.
+
+"""
+
+from __future__ import with_statement
+
+import errno
+import os
+import socket
+import threading
+import Queue
+
+# Maximum length of a request line
+MAX_REQUEST_LENGTH = 1024
+
+# Seconds to wait for a client to send its request
+REQUEST_TIMEOUT = 10.0
+
+
+class ControlCommandError(StandardError):
+    """Error reported by a control command handler.
+
+    The message is sent to the client.
+
+    """
+
+def _read_line(f):
+    """Read a line from a socket file object.
+
+    Returns the line without its terminating newline.
+
+    Raises ValueError if the line is too long or the connection is closed
+    first.
+
+    """
+    line = f.readline(MAX_REQUEST_LENGTH + 1)
+    if not line.endswith("\n"):
+        if len(line) > MAX_REQUEST_LENGTH:
+            raise ValueError("line too long")
+        raise ValueError("connection closed before end of line")
+    return line[:-1]
+
+
+class Control_server(object):
+    """Serve a ringmaster's control socket.
+
+    Instantiate with
+      pathname -- pathname for the socket
+      handler  -- function (command, args) -> string
+
+    The handler is called (from a server thread) with the command name and a
+    list of argument strings. It should return the command's output (which may
+    be empty), or raise ControlCommandError.
+
+    The 'watch' command is handled by the server itself.
+
+    The server uses daemon threads, so it never prevents the process from
+    exiting.
+
+    Public attributes (treat as read-only):
+      pathname -- string
+
+    """
+    def __init__(self, pathname, handler):
+        self.pathname = pathname
+        self.handler = handler
+        self._listener = None
+        self._closing = False
+        # list of Queues, one per watching client
+        self._watchers = []
+        self._watchers_lock = threading.Lock()
+
+    def start(self):
+        """Create the socket and start serving it.
+
+        Removes any existing file at the socket pathname (a socket left by a
+        previous run; the caller is responsible for making sure no other
+        server is using it).
+
+        Propagates EnvironmentError if the socket can't be created.
+
+        """
+        try:
+            os.remove(self.pathname)
+        except EnvironmentError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(self.pathname)
+            listener.listen(5)
+        except:
+            listener.close()
+            raise
+        self._listener = listener
+        self._start_thread(self._serve)
+
+    @staticmethod
+    def _start_thread(fn, *args):
+        thread = threading.Thread(target=fn, args=args)
+        thread.setDaemon(True)
+        thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except EnvironmentError:
+                if self._closing:
+                    return
+                continue
+            if self._closing:
+                sock.close()
+                return
+            self._start_thread(self._handle_connection, sock)
+
+    def _handle_connection(self, sock):
+        try:
+            try:
+                sock.settimeout(REQUEST_TIMEOUT)
+                f = sock.makefile("rb", 0)
+                try:
+                    words = _read_line(f).split()
+                except ValueError, e:
+                    sock.sendall("error: bad request: %s\n" % e)
+                    return
+                sock.settimeout(None)
+                if not words:
+                    sock.sendall("error: empty request\n")
+                    return
+                command, args = words[0], words[1:]
+                if command == "watch" and not args:
+                    self._watch(sock)
+                    return
+                try:
+                    output = self.handler(command, args)
+                except ControlCommandError, e:
+                    sock.sendall("error: %s\n" % e)
+                    return
+                if output and not output.endswith("\n"):
+                    output += "\n"
+                sock.sendall("ok\n" + output)
+            finally:
+                sock.close()
+        except EnvironmentError:
+            # The client went away
+            pass
+
+    def _watch(self, sock):
+        queue = Queue.Queue()
+        with self._watchers_lock:
+            if self._closing:
+                return
+            self._watchers.append(queue)
+        try:
+            sock.sendall("ok\n")
+            while True:
+                event = queue.get()
+                if event is None:
+                    return
+                sock.sendall(event + "\n")
+        finally:
+            with self._watchers_lock:
+                self._watchers.remove(queue)
+
+    def broadcast(self, event):
+        """Send an event to all watching clients.
+
+        event -- string (newlines are replaced by spaces)
+
+        This doesn't block: each client has its own queue of events to send.
+
+        """
+        event = event.replace("\n", " ")
+        with self._watchers_lock:
+            for queue in self._watchers:
+                queue.put(event)
+
+    def close(self):
+        """Stop serving the socket, and remove it.
+
+        Watching clients are disconnected once they have been sent any queued
+        events.
+
+        """
+        if self._listener is None or self._closing:
+            return
+        self._closing = True
+        with self._watchers_lock:
+            for queue in self._watchers:
+                queue.put(None)
+        # Wake the accepting thread
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.pathname)
+        except EnvironmentError:
+            pass
+        sock.close()
+        self._listener.close()
+        try:
+            os.remove(self.pathname)
+        except EnvironmentError:
+            pass
+
+
+def _connect(pathname, request):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(pathname)
+        sock.sendall(request + "\n")
+    except:
+        sock.close()
+        raise
+    return sock
+
+def _read_status_line(f):
+    try:
+        line = _read_line(f)
+    except ValueError, e:
+        raise ControlCommandError("bad response from server: %s" % e)
+    if line == "ok":
+        return
+    if line.startswith("error: "):
+        raise ControlCommandError(line[7:])
+    raise ControlCommandError("bad response from server: %r" % line)
+
+def send_request(pathname, request):
+    """Send a request to a control socket and wait for the response.
+
+    pathname -- socket pathname
+    request  -- string (a single line, without newline)
+
+    Returns the command's output.
+
+    Raises ControlCommandError if the server reports an error.
+
+    Propagates EnvironmentError (eg socket.error) if the socket can't be
+    contacted; in particular, errno is ENOENT or ECONNREFUSED if no server is
+    running.
+
+    """
+    sock = _connect(pathname, request)
+    try:
+        f = sock.makefile("rb")
+        _read_status_line(f)
+        return f.read()
+    finally:
+        sock.close()
+
+def watch(pathname):
+    """Watch a running ringmaster's events.
+
+    pathname -- socket pathname
+
+    Returns an iterator over event strings (without newlines). The iterator
+    finishes when the server closes the connection.
+
+    Raises ControlCommandError or EnvironmentError as for send_request().
+
+    """
+    sock = _connect(pathname, "watch")
+    f = sock.makefile("rb")
+    try:
+        _read_status_line(f)
+    except:
+        sock.close()
+        raise
+    return _iter_events(sock, f)
+
+def _iter_events(sock, f):
+    try:
+        while True:
+            line = f.readline()
+            if not line.endswith("\n"):
+                break
+            yield line[:-1]
+    finally:
+        sock.close()
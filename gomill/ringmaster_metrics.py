@@ -0,0 +1,266 @@
+"""Statistics about a running competition, for monitoring systems.
+
+The statistics are rendered in the Prometheus text exposition format (version
+0.0.4), so a file written by the ringmaster can be collected by (for example)
+node_exporter's textfile collector.
+
+Every sample has a 'competition' label. Samples about games have a 'matchup'
+label if the competition has matchups, and samples about players have a
+'player' label.
+
+"""
+
+import time
+
+# Upper bounds for the histogram buckets (seconds)
+MOVE_TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                     60.0)
+GAME_DURATION_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0,
+                         1800.0, 3600.0)
+STATUS_WRITE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+def _escape_label_value(s):
+    return (str(s).replace("\\", "\\\\").replace("\"", "\\\"")
+            .replace("\n", "\\n"))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, _escape_label_value(value))
+        for (name, value) in labels)
+
+def _format_value(f):
+    if isinstance(f, (int, long)):
+        return str(f)
+    return repr(float(f))
+
+
+class _Metric(object):
+    """A metric family: a set of samples with the same name."""
+    def __init__(self, name, metric_type, help_text):
+        self.name = name
+        self.metric_type = metric_type
+        self.help_text = help_text
+        # map label tuple -> value
+        self.values = {}
+
+    def add(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, labels, value):
+        self.values[labels] = value
+
+    def render_samples(self):
+        return ["%s%s %s" % (self.name, _format_labels(labels),
+                             _format_value(value))
+                for (labels, value) in sorted(self.values.items())]
+
+    def render(self):
+        return (["# HELP %s %s" % (self.name, self.help_text),
+                 "# TYPE %s %s" % (self.name, self.metric_type)] +
+                self.render_samples())
+
+class _Histogram(_Metric):
+    """A histogram metric family.
+
+    values maps label tuple -> (bucket counts, sum, count)
+
+    """
+    def __init__(self, name, help_text, buckets):
+        _Metric.__init__(self, name, 'histogram', help_text)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        try:
+            counts, total, n = self.values[labels]
+        except KeyError:
+            counts, total, n = [0] * len(self.buckets), 0.0, 0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[labels] = (counts, total + value, n + 1)
+
+    def render_samples(self):
+        result = []
+        for labels, (counts, total, n) in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                result.append("%s_bucket%s %d" % (
+                    self.name,
+                    _format_labels(labels + (('le', repr(bound)),)),
+                    count))
+            result.append("%s_bucket%s %d" % (
+                self.name, _format_labels(labels + (('le', "+Inf"),)), n))
+            result.append("%s_sum%s %s" % (
+                self.name, _format_labels(labels), _format_value(total)))
+            result.append("%s_count%s %d" % (
+                self.name, _format_labels(labels), n))
+        return result
+
+
+class Ringmaster_metrics(object):
+    """Collect statistics about a competition run.
+
+    Instantiate with
+      competition_code -- string (used for the 'competition' label)
+      time_fn          -- function returning the current time in seconds
+                          (default time.time)
+
+    The ringmaster calls the note_...() methods as things happen, and
+    set_worker_state() before rendering.
+
+    Counters start from zero in each run.
+
+    """
+    def __init__(self, competition_code, time_fn=time.time):
+        self.competition_code = competition_code
+        self.time_fn = time_fn
+        self.run_start_time = time_fn()
+        self.games_completed_this_run = 0
+        # map game_id -> start time
+        self._start_times = {}
+        self._metrics = []
+        def metric(name, metric_type, help_text):
+            m = _Metric(name, metric_type, help_text)
+            self._metrics.append(m)
+            return m
+        def histogram(name, help_text, buckets):
+            m = _Histogram(name, help_text, buckets)
+            self._metrics.append(m)
+            return m
+        self.run_start = metric(
+            'gomill_run_start_time_seconds', 'gauge',
+            "Time the current run started (seconds since the epoch).")
+        self.games_started = metric(
+            'gomill_games_started_total', 'counter',
+            "Games started in this run.")
+        self.games_completed = metric(
+            'gomill_games_completed_total', 'counter',
+            "Games completed in this run.")
+        self.games_void = metric(
+            'gomill_games_void_total', 'counter',
+            "Void games (games abandoned due to an error) in this run.")
+        self.games_per_second = metric(
+            'gomill_games_per_second', 'gauge',
+            "Games completed per second, averaged over this run.")
+        self.games_in_progress = metric(
+            'gomill_games_in_progress', 'gauge',
+            "Games currently being played.")
+        self.games_awaiting_replay = metric(
+            'gomill_games_awaiting_replay', 'gauge',
+            "Games waiting to be replayed after an error.")
+        self.workers = metric(
+            'gomill_workers', 'gauge',
+            "Number of games which may be played at once.")
+        self.worker_busy_seconds = metric(
+            'gomill_worker_busy_seconds_total', 'counter',
+            "Wall-clock time spent playing games (completed or void).")
+        self.game_duration = histogram(
+            'gomill_game_duration_seconds',
+            "Wall-clock duration of completed games.",
+            GAME_DURATION_BUCKETS)
+        self.move_time = histogram(
+            'gomill_move_time_seconds',
+            "Time taken by each genmove command.",
+            MOVE_TIME_BUCKETS)
+        self.cpu_seconds = metric(
+            'gomill_player_cpu_seconds_total', 'counter',
+            "CPU time used by players in completed games.")
+        self.cpu_games = metric(
+            'gomill_player_cpu_games_total', 'counter',
+            "Completed games for which the player's CPU time is known.")
+        self.status_write_time = histogram(
+            'gomill_status_write_seconds',
+            "Time taken to write the state file.",
+            STATUS_WRITE_BUCKETS)
+        self.run_start.set(self._labels(), self.run_start_time)
+
+    def _labels(self, *extra):
+        result = (('competition', self.competition_code),)
+        for name, value in extra:
+            if value is not None:
+                result += ((name, value),)
+        return result
+
+    def _finish(self, game_id):
+        start = self._start_times.pop(game_id, None)
+        if start is None:
+            return None
+        duration = max(0.0, self.time_fn() - start)
+        self.worker_busy_seconds.add(self._labels(), duration)
+        return duration
+
+    def note_game_started(self, game_id, matchup_id):
+        """Record that a game has been started.
+
+        matchup_id -- string or None
+
+        """
+        self._start_times[game_id] = self.time_fn()
+        self.games_started.add(self._labels(('matchup', matchup_id)))
+
+    def note_game_completed(self, game_id, matchup_id, game_result,
+                            move_times, classify_player):
+        """Record that a game has been completed.
+
+        game_result     -- gtp_games.Game_result
+        move_times      -- map player code -> list of floats, or None
+        classify_player -- function player code -> player label
+
+        """
+        labels = self._labels(('matchup', matchup_id))
+        self.games_completed.add(labels)
+        self.games_completed_this_run += 1
+        duration = self._finish(game_id)
+        if duration is not None:
+            self.game_duration.observe(labels, duration)
+        for player_code, cpu_time in sorted(game_result.cpu_times.items()):
+            if cpu_time is None:
+                continue
+            player_labels = self._labels(
+                ('player', classify_player(player_code)))
+            self.cpu_seconds.add(player_labels, cpu_time)
+            self.cpu_games.add(player_labels)
+        if move_times is not None:
+            for player_code, times in sorted(move_times.items()):
+                player_labels = self._labels(
+                    ('player', classify_player(player_code)))
+                for t in times:
+                    self.move_time.observe(player_labels, t)
+
+    def note_game_void(self, game_id, matchup_id):
+        """Record that a game was abandoned due to an error."""
+        labels = self._labels(('matchup', matchup_id))
+        self.games_void.add(labels)
+        self._finish(game_id)
+
+    def note_status_written(self, seconds):
+        """Record the time taken to write the state file."""
+        self.status_write_time.observe(self._labels(), seconds)
+
+    def set_worker_state(self, games_in_progress, games_awaiting_replay,
+                         workers):
+        """Record the current numbers of games and workers.
+
+        workers -- int
+
+        """
+        self.games_in_progress.set(self._labels(), games_in_progress)
+        self.games_awaiting_replay.set(self._labels(), games_awaiting_replay)
+        self.workers.set(self._labels(), workers)
+
+    def render(self):
+        """Return the statistics in Prometheus text format.
+
+        Returns an 8-bit string (ending with a newline).
+
+        """
+        elapsed = self.time_fn() - self.run_start_time
+        if elapsed > 0:
+            self.games_per_second.set(
+                self._labels(), self.games_completed_this_run / elapsed)
+        lines = []
+        for metric in self._metrics:
+            if metric.values:
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
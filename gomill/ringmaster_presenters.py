@@ -1,10 +1,19 @@
 """Live display for ringmasters."""
 
+import errno
 import os
 import subprocess
 import sys
+import time
 from cStringIO import StringIO
 
+try:
+    import fcntl
+    import struct
+    import termios
+except ImportError:
+    fcntl = None
+
 
 class Presenter(object):
     """Abstract base class for presenters.
@@ -26,6 +35,27 @@ class Presenter(object):
     # of the display.
     shows_warnings_only = False
 
+    # Function to bring the channels up to date before a redraw, or None
+    content_function = None
+
+    def set_content_function(self, fn):
+        """Specify a function to call before each redraw.
+
+        fn -- function taking no arguments, or None
+
+        The function should bring the channels up to date (using clear() and
+        say()). Presenters which defer redraws call it only when they actually
+        redraw, so the caller doesn't prepare output which would never be
+        shown.
+
+        """
+        self.content_function = fn
+
+    def _update_content(self):
+        """Call the content function, if there is one."""
+        if self.content_function is not None:
+            self.content_function()
+
     def clear(self, channel):
         """Clear the contents of the specified channel."""
         raise NotImplementedError
@@ -45,9 +75,35 @@ class Presenter(object):
         This typically displays the full status and screen_report, and the most
         recent warnings and results.
 
+        Presenters call the content function (if any) before rendering.
+
         """
         raise NotImplementedError
 
+    def time_until_refresh(self):
+        """Say whether a deferred refresh is waiting.
+
+        Returns None if there is nothing waiting, or else the number of
+        seconds (a float, possibly 0.0) until flush() should be called.
+
+        Presenters which never defer refreshes needn't override this.
+
+        """
+        return None
+
+    def flush(self):
+        """Carry out any deferred refresh now."""
+        pass
+
+    def close(self):
+        """Release any resources the presenter holds.
+
+        This doesn't carry out a deferred refresh; call flush() first if
+        that's wanted.
+
+        """
+        pass
+
     def get_stream(self, channel):
         """Return a file-like object wired up to the specified channel.
 
@@ -140,6 +196,7 @@ class Clearing_presenter(Presenter):
             print s
 
     def refresh(self):
+        self._update_content()
         self.clear_screen()
         for box in self.box_list:
             if not box.contents:
@@ -178,3 +235,187 @@ class Clearing_presenter(Presenter):
         elif self.clear_method == "delimiter":
             print 78 * "-"
 
+
+
+def _get_terminal_size(fd):
+    """Return (rows, columns) for the terminal on fd, or None if unknown."""
+    if fcntl is None:
+        return None
+    try:
+        rows, columns = struct.unpack(
+            "hh", fcntl.ioctl(fd, termios.TIOCGWINSZ, "\0" * 4))
+    except Exception:
+        return None
+    if rows <= 0 or columns <= 0:
+        return None
+    return rows, columns
+
+class Ansi_presenter(Presenter):
+    """Full-screen presenter using ANSI cursor control.
+
+    This shows the same boxes as Clearing_presenter, but it redraws the screen
+    in place rather than clearing it: only lines whose contents have changed
+    since the last redraw are rewritten.
+
+    Instantiate with
+      max_refresh_rate -- float (maximum redraws per second; default 4.0)
+      fd               -- file descriptor to draw on (default stdout's)
+      time_fn          -- function returning the current time in seconds
+
+    refresh() redraws immediately only if the previous redraw was long enough
+    ago; otherwise the redraw is deferred, and any further changes are shown
+    by the same redraw. flush() carries out a deferred redraw immediately.
+    The content function is called only when a redraw actually happens, so at
+    most max_refresh_rate times per second.
+    Warnings are treated the same way as the other channels.
+
+    If fd is a terminal, output goes to a separate non-blocking open file
+    description for it, so a slow terminal never blocks the caller. If a
+    write would block, the rest of the frame is dropped, and the next redraw
+    repaints the whole screen.
+
+    Call close() when finished with the presenter, to close that file
+    description; anything said afterwards goes to the original fd.
+
+    """
+    shows_warnings_only = False
+
+    box_specs = Clearing_presenter.box_specs
+
+    _clear_screen_sequence = "\x1b[H\x1b[2J"
+    _clear_to_eol_sequence = "\x1b[K"
+    _clear_to_end_sequence = "\x1b[J"
+
+    def __init__(self, max_refresh_rate=4.0, fd=None, time_fn=time.time):
+        self.boxes = {}
+        self.box_list = []
+        for t in self.box_specs:
+            box = Box(*t)
+            self.boxes[box.name] = box
+            self.box_list.append(box)
+        self.min_interval = 1.0 / max_refresh_rate
+        self.time_fn = time_fn
+        if fd is None:
+            fd = sys.stdout.fileno()
+        self.original_fd = fd
+        self.fd = self._open_output(fd)
+        # cursor positioning sequences, indexed by screen line
+        self._move_sequences = []
+        # lines currently on the screen, or None if the screen is unknown
+        self._screen = None
+        self._last_redraw_time = None
+        self._refresh_pending = False
+
+    @staticmethod
+    def _open_output(fd):
+        try:
+            return os.open(os.ttyname(fd),
+                           os.O_WRONLY | os.O_NONBLOCK | os.O_NOCTTY)
+        except (EnvironmentError, AttributeError):
+            return fd
+
+    def close(self):
+        if self.fd != self.original_fd:
+            fd = self.fd
+            self.fd = self.original_fd
+            os.close(fd)
+
+    def clear(self, channel):
+        self.boxes[channel].contents = []
+
+    def say(self, channel, s):
+        self.boxes[channel].contents.append(s)
+        if channel == 'warnings':
+            self.refresh()
+
+    def refresh(self):
+        self._refresh_pending = True
+        if self.time_until_refresh() == 0.0:
+            self.flush()
+
+    def time_until_refresh(self):
+        if not self._refresh_pending:
+            return None
+        if self._last_redraw_time is None:
+            return 0.0
+        elapsed = self.time_fn() - self._last_redraw_time
+        # clamp, in case the clock has gone backwards
+        return max(0.0, min(self.min_interval, self.min_interval - elapsed))
+
+    def flush(self):
+        if not self._refresh_pending:
+            return
+        self._refresh_pending = False
+        self._last_redraw_time = self.time_fn()
+        self._update_content()
+        if not self._redraw():
+            self._screen = None
+            self._refresh_pending = True
+
+    def _move_to_line(self, i):
+        """Return the sequence to move the cursor to the start of line i."""
+        sequences = self._move_sequences
+        while len(sequences) <= i:
+            sequences.append("\x1b[%d;1H" % (len(sequences) + 1))
+        return sequences[i]
+
+    def _layout(self):
+        """Return the list of lines to display."""
+        lines = []
+        for box in self.box_list:
+            if not box.contents:
+                continue
+            if box.heading:
+                lines.append("= %s = " % box.heading)
+            lines += box.layout().split("\n")
+            if box.name != 'warnings':
+                lines.append("")
+        size = _get_terminal_size(self.fd)
+        if size is not None:
+            rows, columns = size
+            # Leave the bottom line free, and avoid wrapping, so that the
+            # screen never scrolls.
+            lines = [line[:columns-1] for line in lines[:rows-1]]
+        return lines
+
+    def _redraw(self):
+        """Bring the screen up to date.
+
+        Returns False if the output was incomplete.
+
+        """
+        lines = self._layout()
+        old_lines = self._screen
+        parts = []
+        if old_lines is None:
+            parts.append(self._clear_screen_sequence)
+            old_lines = []
+        for i, line in enumerate(lines):
+            if i < len(old_lines) and old_lines[i] == line:
+                continue
+            parts += [self._move_to_line(i), line, self._clear_to_eol_sequence]
+        if len(lines) < len(old_lines):
+            parts += [self._move_to_line(len(lines)),
+                      self._clear_to_end_sequence]
+        if not parts:
+            return True
+        # Leave the cursor below the display
+        parts.append(self._move_to_line(len(lines)))
+        self._screen = lines
+        return self._write("".join(parts))
+
+    def _write(self, s):
+        """Write s without blocking.
+
+        Returns False if not all of s could be written.
+
+        """
+        while s:
+            try:
+                n = os.write(self.fd, s)
+            except EnvironmentError, e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EIO):
+                    raise
+                return False
+            s = s[n:]
+        return True
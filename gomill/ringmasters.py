@@ -9,6 +9,10 @@ import os
 import re
 import shutil
 import sys
+import threading
+import time
+import Queue
+from cStringIO import StringIO
 
 try:
     import fcntl
@@ -16,9 +20,14 @@ except ImportError:
     fcntl = None
 
 from gomill import compact_tracebacks
+from gomill import cpu_affinity
 from gomill import game_jobs
 from gomill import job_manager
+from gomill import result_databases
+from gomill import ringmaster_control
+from gomill import ringmaster_metrics
 from gomill import ringmaster_presenters
+from gomill import sgf_archives
 from gomill import terminal_input
 from gomill.settings import *
 from gomill.competitions import (
@@ -46,6 +55,15 @@ def interpret_python(source, provided_globals, display_filename):
     exec code in result
     return result
 
+def _game_resources(player_1, player_2):
+    """Return the resources needed to play a game between two players.
+
+    Returns a pair (threads, memory in megabytes).
+
+    """
+    return (player_1.threads + player_2.threads,
+            (player_1.memory or 0) + (player_2.memory or 0))
+
 class RingmasterError(StandardError):
     """Error reported by a Ringmaster."""
 
@@ -68,6 +86,16 @@ class Ringmaster(object):
     # Can bump this to prevent people loading incompatible .status files.
     status_format_version = 0
 
+    # Can bump this to make the ringmaster ignore old .summary files.
+    summary_format_version = 0
+
+    # Minimum interval between rewrites of the metrics file (seconds)
+    metrics_interval = 10.0
+
+    # Minimum interval between rewrites of the summary file during a run
+    # (seconds)
+    summary_interval = 30.0
+
     # For --version command
     public_version = "gomill ringmaster v0.8.3"
 
@@ -82,8 +110,15 @@ class Ringmaster(object):
         Creates the Competition and initialises it from the control file.
 
         """
-        self.display_mode = 'clearing'
+        self.display_mode = None
         self.worker_count = None
+        self.automatic_worker_count = False
+        # job_manager.Adaptive_worker_limit, or None
+        self.worker_limit_controller = None
+        # Number of CPUs available, found when the controller is set up
+        self._cpu_count = None
+        # List of lists of CPU numbers, or None
+        self.worker_cpu_slots = None
         self.max_games_this_run = None
         self.presenter = None
         self.terminal_reader = None
@@ -92,22 +127,44 @@ class Ringmaster(object):
         # Map game_id -> int
         self.game_error_counts = {}
         self.write_gtp_logs = False
+        self.sgf_archive_writer = None
+        self._sgf_archive = None
+        self.control_server = None
+        # Held while handling job manager callbacks and control commands, and
+        # while starting worker processes. Threads other than the main thread
+        # must hold it while doing anything other than socket I/O.
+        self._control_lock = threading.RLock()
+        self._wakeup_function = None
 
         self.control_pathname = control_pathname
         self.base_directory, control_filename = os.path.split(control_pathname)
         self.competition_code, ext = os.path.splitext(control_filename)
-        if ext in (".log", ".status", ".cmd", ".hist",
-                   ".report", ".games", ".void", ".gtplogs"):
+        if ext in (".log", ".status", ".summary", ".cmd", ".sock", ".hist",
+                   ".report", ".checks", ".db", ".games", ".void",
+                   ".gtplogs"):
             raise RingmasterError("forbidden control file extension: %s" % ext)
         stem = os.path.join(self.base_directory, self.competition_code)
         self.log_pathname = stem + ".log"
         self.status_pathname = stem + ".status"
+        self.summary_pathname = stem + ".summary"
         self.command_pathname = stem + ".cmd"
+        self.socket_pathname = stem + ".sock"
         self.history_pathname = stem + ".hist"
         self.report_pathname = stem + ".report"
+        self.check_cache_pathname = stem + ".checks"
+        self.results_db_pathname = stem + ".db"
         self.sgf_dir_pathname = stem + ".games"
         self.void_dir_pathname = stem + ".void"
         self.gtplog_dir_pathname = stem + ".gtplogs"
+        self.metrics = ringmaster_metrics.Ringmaster_metrics(
+            self.competition_code)
+        self.metrics_pathname = None
+        self._metrics_due_time = None
+        self._summary_due_time = None
+        self._summary_is_stale = False
+        self.results_db = None
+        # Map game_id -> time the game was started
+        self._game_start_times = {}
 
         self.status_is_loaded = False
         try:
@@ -241,6 +298,9 @@ class Ringmaster(object):
         elif competition_type == "mc_tuner":
             from gomill import mcts_tuners
             return mcts_tuners.Mcts_tuner
+        elif competition_type == "spsa_tuner":
+            from gomill import spsa_tuners
+            return spsa_tuners.Spsa_tuner
         else:
             raise ValueError
 
@@ -284,6 +344,13 @@ class Ringmaster(object):
                     os.mkdir(self.sgf_dir_pathname)
             except EnvironmentError:
                 raise RingmasterError("failed to create SGF directory:\n%s" % e)
+            if self.archive_games:
+                try:
+                    self.sgf_archive_writer = sgf_archives.Sgf_archive_writer(
+                        self.sgf_dir_pathname, compress=self.compress_archive)
+                except EnvironmentError, e:
+                    raise RingmasterError(
+                        "failed to open game record archive:\n%s" % e)
 
         if self.write_gtp_logs:
             try:
@@ -303,13 +370,75 @@ class Ringmaster(object):
             self.historyfile.close()
         except EnvironmentError, e:
             raise RingmasterError("error closing history file:\n%s" % e)
+        if self.sgf_archive_writer is not None:
+            try:
+                self.sgf_archive_writer.close()
+            except EnvironmentError, e:
+                raise RingmasterError(
+                    "error closing game record archive:\n%s" % e)
+            self.sgf_archive_writer = None
 
     ringmaster_settings = [
         Setting('record_games', interpret_bool, True),
+        Setting('live_game_records', interpret_bool, False),
+        Setting('archive_games', interpret_bool, False),
+        Setting('compress_archive', interpret_bool, False),
         Setting('stderr_to_log', interpret_bool, True),
         Setting('skip_player_checks', interpret_bool, False),
+        Setting('cache_player_checks', interpret_bool, False),
+        Setting('metrics_file', allow_none(interpret_8bit_string), None),
+        Setting('results_database', interpret_bool, False),
+        Setting('cpus_per_game', allow_none(interpret_positive_int), None),
+        Setting('max_threads', allow_none(interpret_positive_int), None),
+        Setting('max_memory', allow_none(interpret_positive_int), None),
+        Setting('max_overtakes', interpret_int, 4),
+        Setting('min_workers', interpret_positive_int, 1),
+        Setting('max_workers', allow_none(interpret_positive_int), None),
         ]
 
+    def _connect_results_database(self):
+        """Return a Result_database for the results database file."""
+        return result_databases.Result_database(self.results_db_pathname)
+
+    def _open_results_database(self):
+        """Open the results database, if enabled, and bring it up to date.
+
+        Any results in the competition state which are missing from the
+        database are added.
+
+        """
+        if not self.results_database:
+            return
+        try:
+            self.results_db = self._connect_results_database()
+            self.results_db.add_missing_results(
+                self.competition.get_recorded_results())
+        except result_databases.DatabaseError, e:
+            raise RingmasterError("error opening results database:\n%s" % e)
+
+    def _close_results_database(self):
+        """Close the results database, if it's open."""
+        if self.results_db is None:
+            return
+        try:
+            self.results_db.close()
+        except result_databases.DatabaseError, e:
+            self.warn("error closing results database:\n%s" % e)
+        self.results_db = None
+
+    def _record_result(self, response):
+        """Record a game result in the results database, if it's open."""
+        start_time = self._game_start_times.pop(response.game_id, None)
+        if self.results_db is None:
+            return
+        try:
+            self.results_db.record_result(
+                response.game_result,
+                self.competition.get_matchup_id(response.game_data),
+                start_time, time.time())
+        except result_databases.DatabaseError, e:
+            self.warn("error writing to results database:\n%s" % e)
+
     def _initialise_from_control_file(self, config):
         """Interpret the parts of the control file which belong to Ringmaster.
 
@@ -322,12 +451,30 @@ class Ringmaster(object):
             raise ControlFileError(str(e))
         for name, value in to_set.items():
             setattr(self, name, value)
+        if self.max_workers is not None and self.max_workers < self.min_workers:
+            raise ControlFileError("max_workers is less than min_workers")
+        if self.max_overtakes < 0:
+            raise ControlFileError("max_overtakes is negative")
+        if self.metrics_file is not None:
+            self.metrics_pathname = os.path.join(
+                self.base_directory, os.path.expanduser(self.metrics_file))
 
     def enable_gtp_logging(self, b=True):
         self.write_gtp_logs = b
 
     def set_parallel_worker_count(self, n):
         self.worker_count = n
+        self.automatic_worker_count = False
+
+    def set_automatic_worker_count(self):
+        """Choose the number of worker processes automatically during the run.
+
+        The number starts at the min_workers setting and is kept between that
+        and max_workers.
+
+        """
+        self.worker_count = self.min_workers
+        self.automatic_worker_count = True
 
     def log(self, s):
         print >>self.logfile, s
@@ -347,23 +494,165 @@ class Ringmaster(object):
         self.historyfile.flush()
 
     _presenter_classes = {
+        'ansi'     : ringmaster_presenters.Ansi_presenter,
         'clearing' : ringmaster_presenters.Clearing_presenter,
         'quiet'    : ringmaster_presenters.Quiet_presenter,
         }
 
     def set_display_mode(self, presenter_code):
-        """Specify the presenter to use during run()."""
+        """Specify the presenter to use during run().
+
+        If this isn't called, the 'ansi' presenter is used if standard output
+        is a terminal which supports it, and otherwise the 'clearing'
+        presenter.
+
+        """
         if presenter_code not in self._presenter_classes:
             raise RingmasterError("unknown presenter type: %s" % presenter_code)
         self.display_mode = presenter_code
 
+    def _choose_display_mode(self):
+        try:
+            isatty = os.isatty(sys.stdout.fileno())
+        except Exception:
+            isatty = False
+        if isatty and os.environ.get("TERM", "dumb") != "dumb":
+            return 'ansi'
+        return 'clearing'
+
     def _initialise_presenter(self):
+        if self.display_mode is None:
+            self.display_mode = self._choose_display_mode()
         self.presenter = self._presenter_classes[self.display_mode]()
+        self.presenter.set_content_function(self._fill_display)
 
     def _initialise_terminal_reader(self):
         self.terminal_reader = terminal_input.Terminal_reader()
         self.terminal_reader.initialise()
 
+    def _start_control_server(self):
+        """Start serving the control socket.
+
+        If the socket can't be created, logs the reason and leaves
+        control_server None; the command file is used instead.
+
+        """
+        server = ringmaster_control.Control_server(
+            self.socket_pathname, self._handle_control_request)
+        try:
+            server.start()
+        except EnvironmentError, e:
+            self.log("not using control socket: %s" % e)
+            return
+        self.control_server = server
+
+    def _stop_control_server(self):
+        if self.control_server is None:
+            return
+        with self._control_lock:
+            server = self.control_server
+            self.control_server = None
+        server.close()
+
+    def _broadcast(self, event):
+        """Send an event to clients watching the control socket."""
+        if self.control_server is not None:
+            self.control_server.broadcast(event)
+
+    def _handle_control_request(self, command, args):
+        """Control socket request handler.
+
+        This is called from the control server's threads.
+
+        """
+        try:
+            fn = self._control_commands[command]
+        except KeyError:
+            raise ringmaster_control.ControlCommandError(
+                "unknown command: %s" % command)
+        with self._control_lock:
+            return fn(self, args)
+
+    def _control_stop(self, args):
+        if args:
+            raise ringmaster_control.ControlCommandError("usage: stop")
+        if not self.stopping:
+            self._halt_competition("stop command received")
+            self._update_display()
+        return ""
+
+    def _control_status(self, args):
+        if args:
+            raise ringmaster_control.ControlCommandError("usage: status")
+        f = StringIO()
+        self.competition.write_short_report(f)
+        return f.getvalue()
+
+    def _control_report(self, args):
+        if args:
+            raise ringmaster_control.ControlCommandError("usage: report")
+        f = StringIO()
+        self.competition.write_full_report(f)
+        return f.getvalue()
+
+    def _control_metrics(self, args):
+        if args:
+            raise ringmaster_control.ControlCommandError("usage: metrics")
+        return self.get_metrics()
+
+    def _control_workers(self, args):
+        try:
+            n, = map(int, args)
+        except ValueError:
+            raise ringmaster_control.ControlCommandError("usage: workers <n>")
+        if self.worker_count is None:
+            raise ringmaster_control.ControlCommandError(
+                "not running games in parallel")
+        if not 1 <= n < 1024:
+            raise ringmaster_control.ControlCommandError(
+                "worker count out of range")
+        if (self.worker_cpu_slots is not None and
+            n > len(self.worker_cpu_slots)):
+            raise ringmaster_control.ControlCommandError(
+                "not enough CPUs for %d workers (maximum %d)" %
+                (n, len(self.worker_cpu_slots)))
+        if self.worker_limit_controller is not None:
+            self._log_worker_count_history()
+            self.worker_limit_controller = None
+            self.log("automatic worker count disabled")
+        self.worker_count = n
+        self.log("worker count changed to %d" % n)
+        self._update_display()
+        self._wake_job_manager()
+        return ""
+
+    def _control_max_games(self, args):
+        try:
+            arg, = args
+            if arg == "none":
+                n = None
+            else:
+                n = int(arg)
+                if n < 0:
+                    raise ValueError
+        except ValueError:
+            raise ringmaster_control.ControlCommandError(
+                "usage: max-games <n>|none")
+        self.max_games_this_run = n
+        self.log("max-games changed to %s" % n)
+        self._update_display()
+        self._wake_job_manager()
+        return ""
+
+    _control_commands = {
+        'stop'      : _control_stop,
+        'status'    : _control_status,
+        'report'    : _control_report,
+        'metrics'   : _control_metrics,
+        'workers'   : _control_workers,
+        'max-games' : _control_max_games,
+        }
+
     def get_sgf_filename(self, game_id):
         """Return the sgf filename given a game id."""
         return "%s.sgf" % game_id
@@ -373,12 +662,41 @@ class Ringmaster(object):
         return os.path.join(self.sgf_dir_pathname,
                             self.get_sgf_filename(game_id))
 
+    def get_sgf_string(self, game_id):
+        """Return the SGF game record for a game.
+
+        Returns an 8-bit string, or None if there's no record of the game.
+
+        Looks in the game record archive (see the archive_games setting), and
+        then for an individual file. The archive's index is read the first time
+        this is called.
+
+        Raises RingmasterError if there is an error reading the record.
+
+        """
+        try:
+            if self._sgf_archive is None:
+                self._sgf_archive = sgf_archives.Sgf_archive(
+                    self.sgf_dir_pathname)
+            if self._sgf_archive.has_game(game_id):
+                return self._sgf_archive.get_sgf_string(game_id)
+            pathname = self.get_sgf_pathname(game_id)
+            if not os.path.exists(pathname):
+                return None
+            with open(pathname, "rb") as f:
+                return f.read()
+        except (EnvironmentError, ValueError), e:
+            raise RingmasterError(
+                "error reading game record for %s:\n%s" % (game_id, e))
+
 
     # State attributes (*: in persistent state):
     #  * void_game_count   -- int
     #  * comp              -- from Competition.get_status()
     #    games_in_progress -- dict game_id -> Game_job
     #    games_to_replay   -- dict game_id -> Game_job
+    #    held_jobs         -- list of Game_jobs waiting for resources
+    #    overtake_counts   -- dict game_id -> int, for held_jobs
 
     def _write_status(self, value):
         """Write the pickled contents of the persistent state file."""
@@ -389,6 +707,7 @@ class Ringmaster(object):
 
     def write_status(self):
         """Write the persistent state file."""
+        start = time.time()
         competition_status = self.competition.get_status()
         status = {
             'void_game_count' : self.void_game_count,
@@ -399,6 +718,127 @@ class Ringmaster(object):
             self._write_status((self.status_format_version, status))
         except EnvironmentError, e:
             raise RingmasterError("error writing persistent state:\n%s" % e)
+        self.metrics.note_status_written(time.time() - start)
+        self._summary_is_stale = True
+        self.write_summary()
+
+    # The summary file is a cache of the short report, so that the 'show'
+    # command doesn't have to load the whole persistent state. Its first line
+    # records which versions of the state file and control file it was made
+    # from; the summary is ignored if either has changed since.
+    #
+    # Making the short report can take a while for a large competition, so
+    # during a run the summary is rewritten at most every summary_interval
+    # seconds, and once more at the end of the run.
+
+    def _get_summary_key(self):
+        """Return a string identifying the current state and control files.
+
+        Propagates EnvironmentError.
+
+        """
+        stamps = []
+        for pathname in (self.status_pathname, self.control_pathname):
+            st = os.stat(pathname)
+            stamps.append("%d:%d:%r" % (st.st_ino, st.st_size, st.st_mtime))
+        return " ".join(stamps)
+
+    def _write_summary_file(self, contents):
+        """Write the contents of the summary file."""
+        with open(self.summary_pathname + ".new", "w") as f:
+            f.write(contents)
+        os.rename(self.summary_pathname + ".new", self.summary_pathname)
+
+    def _read_summary_file(self):
+        """Return the contents of the summary file."""
+        with open(self.summary_pathname) as f:
+            return f.read()
+
+    def write_summary(self, force=False):
+        """Write the summary file, for the current competition state.
+
+        Unless force is true, does nothing if the file was written recently.
+
+        Errors are reported as warnings: the summary file isn't essential.
+
+        """
+        now = time.time()
+        if (not force and self._summary_due_time is not None and
+            now < self._summary_due_time):
+            return
+        self._summary_due_time = now + self.summary_interval
+        self._summary_is_stale = False
+        out = StringIO()
+        self.competition.write_short_report(out)
+        try:
+            header = "gomill-summary %d %s\n" % (
+                self.summary_format_version, self._get_summary_key())
+            self._write_summary_file(header + out.getvalue())
+        except EnvironmentError, e:
+            self.warn("error writing summary file:\n%s" % e)
+
+    def print_summary_report(self):
+        """Print the competition status from the summary file.
+
+        This is a fast alternative to load_status() followed by
+        print_status_report(), for the 'show' command.
+
+        Returns False (without printing anything) if the summary file is
+        missing, or wasn't written for the current state and control files.
+
+        """
+        try:
+            contents = self._read_summary_file()
+            key = self._get_summary_key()
+        except EnvironmentError:
+            return False
+        header, sep, report = contents.partition("\n")
+        if header != "gomill-summary %d %s" % (
+            self.summary_format_version, key):
+            return False
+        self.stdout.write(report)
+        return True
+
+    def _classify_player(self, player_code):
+        """Return the label to use for a player in the metrics.
+
+        Players generated by a tuning algorithm are all labelled 'candidate',
+        to avoid having an unbounded number of labels.
+
+        """
+        if player_code in self.competition.players:
+            return player_code
+        return "candidate"
+
+    def get_metrics(self):
+        """Return the metrics for the current run in Prometheus text format."""
+        self.metrics.set_worker_state(
+            len(self.games_in_progress), len(self.games_to_replay),
+            self.worker_count or 1)
+        return self.metrics.render()
+
+    def _write_metrics(self, force=False):
+        """Rewrite the metrics file, if there is one.
+
+        Unless force is true, does nothing if the file was written recently.
+
+        """
+        if self.metrics_pathname is None:
+            return
+        now = time.time()
+        if (not force and self._metrics_due_time is not None and
+            now < self._metrics_due_time):
+            return
+        self._metrics_due_time = now + self.metrics_interval
+        # Write to a temporary file and rename it, so that readers never see a
+        # partial file.
+        temp_pathname = self.metrics_pathname + ".new"
+        try:
+            with open(temp_pathname, "w") as f:
+                f.write(self.get_metrics())
+            os.rename(temp_pathname, self.metrics_pathname)
+        except EnvironmentError, e:
+            self.warn("error writing metrics file:\n%s" % e)
 
     def _load_status(self):
         """Return the unpickled contents of the persistent state file."""
@@ -415,6 +855,8 @@ class Ringmaster(object):
             self.void_game_count = status['void_game_count']
             self.games_in_progress = {}
             self.games_to_replay = {}
+            self.held_jobs = []
+            self.overtake_counts = {}
             competition_status = status['comp']
         except pickle.UnpicklingError:
             raise RingmasterError("corrupt status file")
@@ -442,6 +884,8 @@ class Ringmaster(object):
         self.void_game_count = 0
         self.games_in_progress = {}
         self.games_to_replay = {}
+        self.held_jobs = []
+        self.overtake_counts = {}
         try:
             self.competition.set_clean_status()
         except CompetitionError, e:
@@ -475,6 +919,48 @@ class Ringmaster(object):
         except EnvironmentError, e:
             raise RingmasterError("error writing command file:\n%s" % e)
 
+    def send_control_request(self, request):
+        """Send a request to the running ringmaster's control socket.
+
+        request -- string (command and arguments, separated by spaces)
+
+        Returns the command's output, or None if the competition isn't running
+        (or the running ringmaster isn't serving a control socket).
+
+        Raises RingmasterError if the command fails.
+
+        """
+        try:
+            return ringmaster_control.send_request(
+                self.socket_pathname, request)
+        except ringmaster_control.ControlCommandError, e:
+            raise RingmasterError(str(e))
+        except EnvironmentError, e:
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise RingmasterError(
+                "error contacting running ringmaster:\n%s" % e)
+
+    def watch_events(self):
+        """Watch the running ringmaster's events.
+
+        Returns an iterator over event strings, or None if the competition
+        isn't running (or the running ringmaster isn't serving a control
+        socket).
+
+        Raises RingmasterError if the ringmaster can't be contacted.
+
+        """
+        try:
+            return ringmaster_control.watch(self.socket_pathname)
+        except ringmaster_control.ControlCommandError, e:
+            raise RingmasterError(str(e))
+        except EnvironmentError, e:
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise RingmasterError(
+                "error contacting running ringmaster:\n%s" % e)
+
     def get_tournament_results(self):
         """Provide access to the tournament's results.
 
@@ -491,6 +977,30 @@ class Ringmaster(object):
         except NotImplementedError:
             raise RingmasterError("competition is not a tournament")
 
+    def get_database_tournament_results(self):
+        """Provide access to the tournament's results via the results database.
+
+        Returns a result_databases.Database_tournament_results object. Call
+        its close() method when finished with it.
+
+        This doesn't need the competition state to be loaded.
+
+        Raises RingmasterError if there is no results database, or if the
+        competition isn't a tournament.
+
+        """
+        if not os.path.exists(self.results_db_pathname):
+            raise RingmasterError("no results database")
+        try:
+            database = self._connect_results_database()
+        except result_databases.DatabaseError, e:
+            raise RingmasterError("error opening results database:\n%s" % e)
+        try:
+            return self.competition.get_database_tournament_results(database)
+        except NotImplementedError:
+            database.close()
+            raise RingmasterError("competition is not a tournament")
+
     def report(self):
         """Write the full competition report to the report file."""
         f = open(self.report_pathname, "w")
@@ -514,15 +1024,29 @@ class Ringmaster(object):
         self.stopping = True
         self.stopping_reason = reason
         self.log("halting competition: %s" % reason)
+        self._broadcast("halt %s" % reason)
 
     def _update_display(self):
         """Redisplay the 'live' competition description.
 
+        This only asks the presenter to refresh; the description is made by
+        _fill_display() when the presenter next redraws, so a presenter which
+        limits its refresh rate also limits how often the screen report is
+        made.
+
         Does nothing in quiet mode.
 
         """
         if self.presenter.shows_warnings_only:
             return
+        self.presenter.refresh()
+
+    def _fill_display(self):
+        """Write the 'live' competition description to the presenter.
+
+        This is the presenter's content function.
+
+        """
         def p(s):
             self.say('status', s)
         self.presenter.clear('status')
@@ -532,6 +1056,8 @@ class Ringmaster(object):
             else:
                 p("waiting for workers to finish: %s" %
                   self.stopping_reason)
+        if self.worker_limit_controller is not None:
+            p("using %d workers (chosen automatically)" % self.worker_count)
         if self.games_in_progress:
             if self.worker_count is None:
                 gms = "game"
@@ -540,6 +1066,10 @@ class Ringmaster(object):
             p("%s in progress: %s" %
               (gms, " ".join(sorted(self.games_in_progress))))
         if not self.stopping:
+            if self.held_jobs:
+                p("waiting for resources to start %s %s" % (
+                  "game" if len(self.held_jobs) == 1 else "games",
+                  " ".join(job.game_id for job in self.held_jobs)))
             if self.max_games_this_run is not None:
                 p("will start at most %d more games in this run" %
                   self.max_games_this_run)
@@ -553,8 +1083,6 @@ class Ringmaster(object):
         self.competition.write_screen_report(sr)
         sr.close()
 
-        self.presenter.refresh()
-
     def _prepare_job(self, job):
         """Finish off a Game_job provided by the Competition.
 
@@ -566,6 +1094,10 @@ class Ringmaster(object):
             job.sgf_filename = self.get_sgf_filename(job.game_id)
             job.sgf_dirname = self.sgf_dir_pathname
             job.void_sgf_dirname = self.void_dir_pathname
+            job.live_sgf = self.live_game_records
+            if self.archive_games:
+                job.sgf_dirname = None
+                job.return_sgf = True
         if self.write_gtp_logs:
             job.gtp_log_pathname = os.path.join(
                     self.gtplog_dir_pathname, "%s.log" % job.game_id)
@@ -574,9 +1106,10 @@ class Ringmaster(object):
 
     def get_job(self):
         """Job supply function for the job manager."""
-        job = self._get_job()
-        self._update_display()
-        return job
+        with self._control_lock:
+            job = self._get_job()
+            self._update_display()
+            return job
 
     def _get_job(self):
         """Main implementation of get_job()."""
@@ -591,7 +1124,8 @@ class Ringmaster(object):
             return job_manager.NoJobAvailable
 
         try:
-            if os.path.exists(self.command_pathname):
+            if (self.control_server is None and
+                os.path.exists(self.command_pathname)):
                 command = open(self.command_pathname).read()
                 if command == "stop":
                     self._halt_competition("stop command received")
@@ -602,51 +1136,213 @@ class Ringmaster(object):
                     return job_manager.NoJobAvailable
         except EnvironmentError, e:
             self.warn("error reading .cmd file:\n%s" % e)
+        if self.max_games_this_run == 0:
+            self._halt_competition("max-games reached for this run")
+            return job_manager.NoJobAvailable
+
+        job = self._choose_job()
+        if job is None:
+            return job_manager.NoJobAvailable
         if self.max_games_this_run is not None:
-            if self.max_games_this_run == 0:
-                self._halt_competition("max-games reached for this run")
-                return job_manager.NoJobAvailable
             self.max_games_this_run -= 1
+        self.games_in_progress[job.game_id] = job
+        self._game_start_times[job.game_id] = time.time()
+        start_msg = "starting game %s: %s (b) vs %s (w)" % (
+            job.game_id, job.player_b.code, job.player_w.code)
+        self.log(start_msg)
+        self._broadcast("start %s %s %s" % (
+            job.game_id, job.player_b.code, job.player_w.code))
+        self.metrics.note_game_started(
+            job.game_id, self.competition.get_matchup_id(job.game_data))
 
-        if self.games_to_replay:
-            _, job = self.games_to_replay.popitem()
-        else:
+        return job
+
+    def _get_fits_function(self):
+        """Return a function which checks whether a game has room to start.
+
+        Returns a function (player, player) -> bool, or None if there's no
+        need to check (because the max_threads and max_memory settings aren't
+        in use, or because no games are in progress).
+
+        A game which needs more resources than the limits allow can still be
+        started when no other games are in progress.
+
+        """
+        if self.max_threads is None and self.max_memory is None:
+            return None
+        if not self.games_in_progress:
+            return None
+        threads_in_use = memory_in_use = 0
+        for job in self.games_in_progress.itervalues():
+            threads, memory = _game_resources(job.player_b, job.player_w)
+            threads_in_use += threads
+            memory_in_use += memory
+        def fits(player_1, player_2):
+            threads, memory = _game_resources(player_1, player_2)
+            if (self.max_threads is not None and
+                threads_in_use + threads > self.max_threads):
+                return False
+            if (self.max_memory is not None and
+                memory_in_use + memory > self.max_memory):
+                return False
+            return True
+        return fits
+
+    def _choose_job(self):
+        """Choose the next game to start.
+
+        Returns a Game_job, or None if there is no game to start now.
+
+        Games to be replayed are preferred, then games held back earlier for
+        lack of resources (oldest first), then new games from the
+        competition. A new game which doesn't fit in the free resources is
+        held back, and the next one is tried.
+
+        Each time a game starts ahead of a held game, the held game is
+        counted as overtaken. Once a held game has been overtaken
+        max_overtakes times, no later game may start before it, so a large
+        game waits only until enough of the games in progress have finished.
+        At most worker_count games are held back at once.
+
+        """
+        fits = self._get_fits_function()
+        for game_id, job in sorted(self.games_to_replay.items()):
+            if fits is None or fits(job.player_b, job.player_w):
+                return self.games_to_replay.pop(game_id)
+        for i, job in enumerate(self.held_jobs):
+            if fits is None or fits(job.player_b, job.player_w):
+                del self.held_jobs[i]
+                del self.overtake_counts[job.game_id]
+                self._note_overtaken(self.held_jobs[:i])
+                return job
+            if self.overtake_counts[job.game_id] >= self.max_overtakes:
+                return None
+        while len(self.held_jobs) < (self.worker_count or 1):
             job = self.competition.get_game()
             if job is NoGameAvailable:
-                return job_manager.NoJobAvailable
+                return None
             if job.game_id in self.games_in_progress:
                 raise RingmasterInternalError(
                     "duplicate game id: %s" % job.game_id)
             self._prepare_job(job)
-        self.games_in_progress[job.game_id] = job
-        start_msg = "starting game %s: %s (b) vs %s (w)" % (
-            job.game_id, job.player_b.code, job.player_w.code)
-        self.log(start_msg)
+            if fits is None or fits(job.player_b, job.player_w):
+                self._note_overtaken(self.held_jobs)
+                return job
+            self.held_jobs.append(job)
+            self.overtake_counts[job.game_id] = 0
+            if self.max_overtakes <= 0:
+                return None
+        return None
+
+    def _note_overtaken(self, jobs):
+        for job in jobs:
+            self.overtake_counts[job.game_id] += 1
+
+    def get_worker_limit(self):
+        """Worker limit function for the job manager."""
+        return self.worker_count
+
+    def get_worker_cpus(self, worker_id):
+        """CPU allocation function for the job manager."""
+        if self.worker_cpu_slots is None:
+            return None
+        try:
+            return self.worker_cpu_slots[worker_id]
+        except IndexError:
+            return None
 
-        return job
+    def get_worker_start_lock(self):
+        """Worker start lock function for the job manager.
+
+        Worker processes are forked while holding _control_lock, so that no
+        control server thread is part way through a command (and perhaps
+        holding a lock on the log file or the terminal) at the time.
+
+        """
+        return self._control_lock
+
+    def set_wakeup_function(self, fn):
+        """Wakeup registration function for the job manager.
+
+        This takes _control_lock, so once the job manager has cleared the
+        function no control command can still be calling it.
+
+        """
+        with self._control_lock:
+            self._wakeup_function = fn
+
+    def _wake_job_manager(self):
+        # Call with _control_lock held
+        fn = self._wakeup_function
+        if fn is not None:
+            fn()
+
+    def get_wait_timeout(self):
+        """Idle timeout function for the job manager.
+
+        Lets the presenter carry out a deferred refresh while we're waiting
+        for games to finish.
+
+        """
+        return self.presenter.time_until_refresh()
+
+    def process_wait_timeout(self):
+        """Idle timeout handler for the job manager."""
+        with self._control_lock:
+            self.presenter.flush()
 
     def process_response(self, response):
         """Job response function for the job manager."""
+        with self._control_lock:
+            self._process_response(response)
+
+    def _process_response(self, response):
         # We log before processing the result, in case there's an error from the
         # competition code.
         self.log("response from game %s" % response.game_id)
+        start_time = self._game_start_times.get(response.game_id)
+        busy_workers = len(self.games_in_progress)
         for warning in response.warnings:
             self.warn(warning)
         for log_entry in response.log_entries:
             self.log(log_entry)
+        if (response.sgf_string is not None and
+            self.sgf_archive_writer is not None):
+            try:
+                self.sgf_archive_writer.add_game(
+                    response.game_id, response.sgf_string)
+            except EnvironmentError, e:
+                self.warn("error writing game record for %s:\n%s" % (
+                    response.game_id, e))
         result_description = self.competition.process_game_result(response)
         del self.games_in_progress[response.game_id]
+        self._record_result(response)
         self.write_status()
         if result_description is None:
             result_description = response.game_result.describe()
         self.say('results', "game %s: %s" % (
             response.game_id, result_description))
+        self._broadcast("result %s %s" % (
+            response.game_id, result_description))
+        self.metrics.note_game_completed(
+            response.game_id,
+            self.competition.get_matchup_id(response.game_data),
+            response.game_result, response.move_times, self._classify_player)
+        self._write_metrics()
+        self._review_worker_count(response, start_time, busy_workers)
 
     def process_error_response(self, job, message):
         """Job error response function for the job manager."""
+        with self._control_lock:
+            self._process_error_response(job, message)
+
+    def _process_error_response(self, job, message):
         self.warn("game %s -- %s" % (
             job.game_id, message))
         self.void_game_count += 1
+        self._game_start_times.pop(job.game_id, None)
+        self.metrics.note_game_void(
+            job.game_id, self.competition.get_matchup_id(job.game_data))
         previous_error_count = self.game_error_counts.get(job.game_id, 0)
         stop_competition, retry_game = \
             self.competition.process_game_error(job, previous_error_count)
@@ -654,7 +1350,9 @@ class Ringmaster(object):
             self.games_to_replay[job.game_id] = \
                 self.games_in_progress.pop(job.game_id)
             self.game_error_counts[job.game_id] = previous_error_count + 1
+            self._broadcast("void %s (will retry)" % job.game_id)
         else:
+            self._broadcast("void %s" % job.game_id)
             del self.games_in_progress[job.game_id]
             if previous_error_count != 0:
                 del self.game_error_counts[job.game_id]
@@ -663,6 +1361,174 @@ class Ringmaster(object):
             # No need to log: _halt competition will do so
             self.say('warnings', "halting run due to void games")
             self._halt_competition("too many void games")
+        self._write_metrics()
+
+    def _review_worker_count(self, response, start_time, busy_workers):
+        """Pass a game's measurements to the worker limit controller.
+
+        response     -- Game_job_result
+        start_time   -- time the game was started (float), or None
+        busy_workers -- number of games which were in progress
+
+        Changes worker_count if the controller chooses a new level.
+
+        The unit of work is a move; the cost is the player's CPU time per move
+        and the latency is its wall-clock time per move.
+
+        Players are identified using the same labels as in the metrics, so
+        that all players generated by a tuner share one baseline.
+
+        """
+        controller = self.worker_limit_controller
+        if controller is None:
+            return
+        now = time.time()
+        moves = 0
+        # Map label -> [moves, total CPU time or None, total move time]
+        totals = {}
+        if response.move_times is not None:
+            for player_code, times in response.move_times.iteritems():
+                if not times:
+                    continue
+                moves += len(times)
+                cpu_time = response.game_result.cpu_times.get(player_code)
+                label = self._classify_player(player_code)
+                entry = totals.setdefault(label, [0, 0.0, 0.0])
+                entry[0] += len(times)
+                if cpu_time is None or entry[1] is None:
+                    entry[1] = None
+                else:
+                    entry[1] += cpu_time
+                entry[2] += sum(times)
+        samples = {}
+        for label, (label_moves, cpu_time, move_time) in totals.iteritems():
+            if cpu_time is None:
+                cost = None
+            else:
+                cost = cpu_time / label_moves
+            samples[label] = (cost, move_time / label_moves)
+        controller.note_job_completed(now, start_time, moves, samples)
+        description = controller.review(
+            now, busy_workers, self._get_idle_cpus())
+        if description is None:
+            return
+        self.log("automatic worker count: %s" % description)
+        if controller.level != self.worker_count:
+            self.worker_count = controller.level
+            self._update_display()
+
+    def _log_worker_count_history(self):
+        """Log the levels chosen by the worker limit controller."""
+        if self.worker_limit_controller is None:
+            return
+        self.log("automatic worker count history: %s" %
+                 " ".join(map(str, self.worker_limit_controller.history)))
+
+    def _count_cpus(self):
+        """Return the number of CPUs the ringmaster may use."""
+        cpu_information = self._get_cpu_information()
+        if cpu_information is not None:
+            return len(cpu_information[0])
+        try:
+            import multiprocessing
+            return multiprocessing.cpu_count()
+        except (ImportError, NotImplementedError):
+            return 1
+
+    def _get_idle_cpus(self):
+        """Estimate how many CPUs are idle, using the load average.
+
+        Returns a float (which may be negative), or None if the load average
+        isn't available.
+
+        Uses the CPU count found by _initialise_worker_limit_controller(), so
+        this doesn't need to query the system each time.
+
+        """
+        if self._cpu_count is None:
+            return None
+        try:
+            load = os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+        return self._cpu_count - load
+
+    def _initialise_worker_limit_controller(self):
+        """Set up the worker limit controller, if it's been requested.
+
+        Call this after _allocate_worker_cpus().
+
+        If max_workers isn't set, the maximum is the number of available CPUs
+        (or CPU sets, if the cpus_per_game setting is in use).
+
+        """
+        self.worker_limit_controller = None
+        if not self.automatic_worker_count:
+            return
+        self._cpu_count = self._count_cpus()
+        maximum = self.max_workers
+        if maximum is None:
+            if self.worker_cpu_slots is not None:
+                maximum = len(self.worker_cpu_slots)
+            else:
+                maximum = self._cpu_count
+        maximum = max(maximum, self.min_workers)
+        self.worker_limit_controller = job_manager.Adaptive_worker_limit(
+            self.min_workers, maximum)
+        self.worker_count = self.worker_limit_controller.level
+        self.log("choosing worker count automatically (from %d to %d)" %
+                 (self.min_workers, maximum))
+
+    def _get_cpu_information(self):
+        """Find the CPUs which the ringmaster may use.
+
+        Returns a pair (list of CPU numbers, topology map as returned by
+        cpu_affinity.get_cpu_topology()), or None if CPU affinity isn't
+        supported.
+
+        """
+        if not cpu_affinity.is_supported():
+            return None
+        try:
+            cpus = cpu_affinity.get_affinity()
+        except EnvironmentError:
+            return None
+        return cpus, cpu_affinity.get_cpu_topology()
+
+    def _allocate_worker_cpus(self):
+        """Choose the CPUs for each worker process.
+
+        Sets worker_cpu_slots, if the cpus_per_game setting is in use.
+
+        Raises RingmasterError if there aren't enough CPUs for the requested
+        number of workers.
+
+        """
+        self.worker_cpu_slots = None
+        if self.worker_count is None or self.cpus_per_game is None:
+            return
+        cpu_information = self._get_cpu_information()
+        if cpu_information is None:
+            self.warn("CPU affinity isn't supported on this system; "
+                      "ignoring cpus_per_game")
+            return
+        cpus, topology = cpu_information
+        slots = cpu_affinity.allocate_cpu_slots(
+            cpus, self.cpus_per_game, topology)
+        if self.automatic_worker_count:
+            needed = self.max_workers or self.worker_count
+            used = self.max_workers or len(slots)
+        else:
+            needed = used = self.worker_count
+        if len(slots) < needed:
+            raise RingmasterError(
+                "not enough CPUs for %d workers with cpus_per_game %d "
+                "(%d CPUs available)" %
+                (needed, self.cpus_per_game, len(cpus)))
+        self.worker_cpu_slots = slots
+        for worker_id, slot in enumerate(slots[:used]):
+            self.log("worker %d uses CPUs %s" %
+                     (worker_id, ",".join(map(str, slot))))
 
     def run(self, max_games=None):
         """Run the competition.
@@ -688,9 +1554,15 @@ class Ringmaster(object):
         self._open_files()
         self.competition.set_event_logger(self.log)
         self.competition.set_history_logger(self.log_history)
+        self._open_results_database()
 
         self._initialise_presenter()
         self._initialise_terminal_reader()
+        self._allocate_worker_cpus()
+        self._initialise_worker_limit_controller()
+        self.metrics = ringmaster_metrics.Ringmaster_metrics(
+            self.competition_code)
+        self._start_control_server()
 
         allow_mp = (self.worker_count is not None)
         self.log("run started at %s with max_games %s" % (now(), max_games))
@@ -698,12 +1570,23 @@ class Ringmaster(object):
             self.log("using %d worker processes" % self.worker_count)
         self.max_games_this_run = max_games
         self._update_display()
+        self._write_metrics(force=True)
         try:
-            job_manager.run_jobs(
-                job_source=self,
-                allow_mp=allow_mp, max_workers=self.worker_count,
-                passed_exceptions=[RingmasterError, CompetitionError,
-                                   RingmasterInternalError])
+            try:
+                job_manager.run_jobs(
+                    job_source=self,
+                    allow_mp=allow_mp, max_workers=self.worker_count,
+                    passed_exceptions=[RingmasterError, CompetitionError,
+                                       RingmasterInternalError])
+            finally:
+                self._stop_control_server()
+                self._log_worker_count_history()
+                self._close_results_database()
+                if self._summary_is_stale:
+                    self.write_summary(force=True)
+                self.presenter.flush()
+                self.presenter.close()
+                self._write_metrics(force=True)
         except KeyboardInterrupt:
             self.log("run interrupted at %s" % now())
             log_games_in_progress()
@@ -733,9 +1616,13 @@ class Ringmaster(object):
         for pathname in [
             self.log_pathname,
             self.status_pathname,
+            self.summary_pathname,
             self.command_pathname,
+            self.socket_pathname,
             self.history_pathname,
             self.report_pathname,
+            self.check_cache_pathname,
+            self.results_db_pathname,
             ]:
             if os.path.exists(pathname):
                 try:
@@ -753,6 +1640,119 @@ class Ringmaster(object):
                 except EnvironmentError, e:
                     print >>sys.stderr, e
 
+    def _read_check_cache(self):
+        """Return the set of keys from the player check cache file.
+
+        Returns an empty set if the file is missing or unreadable.
+
+        """
+        try:
+            with open(self.check_cache_pathname) as f:
+                return set(line.strip() for line in f)
+        except EnvironmentError:
+            return set()
+
+    def _write_check_cache(self, keys):
+        """Rewrite the player check cache file."""
+        try:
+            with open(self.check_cache_pathname + ".new", "w") as f:
+                for key in sorted(set(keys)):
+                    print >>f, key
+            os.rename(self.check_cache_pathname + ".new",
+                      self.check_cache_pathname)
+        except EnvironmentError, e:
+            print >>sys.stderr, "error writing player check cache:\n%s" % e
+
+    def _get_player_check_key(self, check):
+        """Return the key to use for a check in the player check cache."""
+        return game_jobs.get_player_check_key(check)
+
+    @staticmethod
+    def _run_player_checks(to_check, discard_stderr, concurrency):
+        """Run player checks, several at a time.
+
+        Returns a list of pairs (check, result), in the same order as
+        to_check. result is the list of warning messages from a successful
+        check, or a CheckFailed exception.
+
+        Once a check has failed, no further checks are started; the returned
+        list stops at the first failure.
+
+        If a check raises an exception other than CheckFailed, it's
+        propagated (once the checks already in progress have finished).
+
+        """
+        def run_check(check):
+            try:
+                return game_jobs.check_player(check, discard_stderr)
+            except game_jobs.CheckFailed, e:
+                return e
+
+        if concurrency <= 1:
+            results = []
+            for check in to_check:
+                result = run_check(check)
+                results.append((check, result))
+                if isinstance(result, game_jobs.CheckFailed):
+                    break
+            return results
+
+        pending = Queue.Queue()
+        for i, check in enumerate(to_check):
+            pending.put((i, check))
+        finished = Queue.Queue()
+        failed = threading.Event()
+        # list of pairs (index, exc_info) for unexpected exceptions
+        errors = []
+        def worker():
+            try:
+                while not failed.isSet():
+                    try:
+                        i, check = pending.get_nowait()
+                    except Queue.Empty:
+                        break
+                    try:
+                        result = run_check(check)
+                    except Exception:
+                        errors.append((i, sys.exc_info()))
+                        failed.set()
+                        break
+                    if isinstance(result, game_jobs.CheckFailed):
+                        failed.set()
+                    finished.put((i, result))
+            finally:
+                finished.put(None)
+        thread_count = min(concurrency, len(to_check))
+        for _ in xrange(thread_count):
+            thread = threading.Thread(target=worker)
+            thread.setDaemon(True)
+            thread.start()
+        results_by_index = {}
+        while thread_count:
+            # Using a timeout so that KeyboardInterrupt can get through; a
+            # check may legitimately take longer than that, so keep waiting.
+            try:
+                item = finished.get(True, 3600)
+            except Queue.Empty:
+                continue
+            if item is None:
+                thread_count -= 1
+            else:
+                i, result = item
+                results_by_index[i] = result
+        if errors:
+            i, (exc_type, exc_value, exc_traceback) = min(errors)
+            raise exc_type, exc_value, exc_traceback
+        results = []
+        for i, check in enumerate(to_check):
+            if i not in results_by_index:
+                break
+            result = results_by_index[i]
+            results.append((check, result))
+            if isinstance(result, game_jobs.CheckFailed):
+                break
+        return results
+
     def check_players(self, discard_stderr=False, quiet=False):
         """Check that the engines required for the competition will run.
 
@@ -764,6 +1764,10 @@ class Ringmaster(object):
         Skips the checks if the skip_player_checks setting is true (but always
         runs the checks if discard_stderr is false).
 
+        If discard_stderr is true, runs as many checks at once as the parallel
+        worker count, and uses the player check cache if the
+        cache_player_checks setting is true.
+
         """
         try:
             to_check = self.competition.get_player_checks()
@@ -773,18 +1777,51 @@ class Ringmaster(object):
             if not quiet:
                 print >>self.stdout, "skipping %s Player checks" % len(to_check)
             return True
-        for check in to_check:
-            if not discard_stderr:
+        if not discard_stderr:
+            # Run the checks one at a time, so that the output makes sense.
+            for check in to_check:
                 print >>self.stdout, "checking player %s" % check.player.code
-            try:
-                msgs = game_jobs.check_player(check, discard_stderr)
-            except game_jobs.CheckFailed, e:
+                try:
+                    msgs = game_jobs.check_player(check, discard_stderr)
+                except game_jobs.CheckFailed, e:
+                    print >>self.stdout, (
+                        "player %s failed startup check:\n%s" %
+                        (check.player.code, e))
+                    return False
+                for msg in msgs:
+                    print >>self.stdout, msg
+            return True
+
+        use_cache = self.cache_player_checks
+        if use_cache:
+            cached_keys = self._read_check_cache()
+            keys = {}
+            uncached = []
+            for check in to_check:
+                key = self._get_player_check_key(check)
+                keys[check] = key
+                if key is None or key not in cached_keys:
+                    uncached.append(check)
+            cached_count = len(to_check) - len(uncached)
+            if cached_count and not quiet:
+                print >>self.stdout, (
+                    "using cached results for %d player checks" % cached_count)
+        else:
+            uncached = to_check
+        results = self._run_player_checks(
+            uncached, True, self.worker_count or 1)
+        all_passed = True
+        uncached_set = set(uncached)
+        passed = set(check for check in to_check if check not in uncached_set)
+        for check, result in results:
+            if isinstance(result, game_jobs.CheckFailed):
                 print >>self.stdout, "player %s failed startup check:\n%s" % (
-                    check.player.code, e)
-                return False
+                    check.player.code, result)
+                all_passed = False
             else:
-                if not discard_stderr:
-                    for msg in msgs:
-                        print >>self.stdout, msg
-        return True
+                passed.add(check)
+        if use_cache:
+            self._write_check_cache(
+                keys[check] for check in passed if keys[check] is not None)
+        return all_passed
 
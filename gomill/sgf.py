@@ -5,6 +5,7 @@ This is intended for use with SGF FF[4]; see http://www.red-bean.com/sgf/
 """
 
 import datetime
+from cStringIO import StringIO
 
 from gomill import sgf_grammar
 from gomill import sgf_properties
@@ -22,11 +23,21 @@ class Node(object):
 
     Changing the SZ property isn't allowed.
 
+    If the presenter's value cache is enabled (see
+    sgf_properties.Presenter.enable_value_cache()), the node remembers the
+    interpreted values returned by get().
+
     """
+    # Nodes don't have a __dict__, to save memory in large game trees.
+    __slots__ = ('_property_map', '_presenter', '_value_cache')
+
     def __init__(self, property_map, presenter):
         # Map identifier (PropIdent) -> nonempty list of raw values
         self._property_map = property_map
         self._presenter = presenter
+        # None, or pair (presenter type_generation,
+        #                dict identifier -> interpreted value)
+        self._value_cache = None
 
     def get_size(self):
         """Return the board size used to interpret property values."""
@@ -70,7 +81,11 @@ class Node(object):
         single empty string.)
 
         """
-        return self._property_map[identifier]
+        values = self._property_map[identifier]
+        if values.__class__ is tuple:
+            # Values from a compact parse (see Sgf_game.from_coarse_game_tree)
+            return list(values)
+        return values
 
     def get_raw(self, identifier):
         """Return a single raw value of the specified property.
@@ -92,7 +107,8 @@ class Node(object):
         """Return the raw values of all properties as a dict.
 
         Returns a dict mapping property identifiers to lists of raw values
-        (see get_raw_list()).
+        (see get_raw_list()); for games loaded in compact form, the values
+        may be tuples rather than lists.
 
         Returns the same dict each time it's called.
 
@@ -102,9 +118,14 @@ class Node(object):
         return self._property_map
 
 
+    def _forget_value(self, identifier):
+        if self._value_cache is not None:
+            self._value_cache[1].pop(identifier, None)
+
     def _set_raw_list(self, identifier, values):
         if identifier == "SZ" and values != [str(self._presenter.size)]:
             raise ValueError("changing size is not permitted")
+        self._forget_value(identifier)
         self._property_map[identifier] = values
 
     def unset(self, identifier):
@@ -116,6 +137,7 @@ class Node(object):
         if identifier == "SZ" and self._presenter.size != 19:
             raise ValueError("changing size is not permitted")
         del self._property_map[identifier]
+        self._forget_value(identifier)
 
 
     def set_raw_list(self, identifier, values):
@@ -173,9 +195,25 @@ class Node(object):
 
         See sgf_properties.Presenter.interpret() for details.
 
+        If the value cache is enabled, repeated calls return the same object;
+        treat the returned value as read-only.
+
         """
-        return self._presenter.interpret(
-            identifier, self._property_map[identifier])
+        presenter = self._presenter
+        if not presenter.value_cache_enabled:
+            return presenter.interpret(
+                identifier, self._property_map[identifier])
+        cache = self._value_cache
+        if cache is None or cache[0] != presenter.type_generation:
+            cache = self._value_cache = (presenter.type_generation, {})
+        values = cache[1]
+        try:
+            return values[identifier]
+        except KeyError:
+            pass
+        result = presenter.interpret(identifier, self._property_map[identifier])
+        values[identifier] = result
+        return result
 
     def set(self, identifier, value):
         """Set the value of the specified property.
@@ -272,10 +310,10 @@ class Node(object):
         """
         if colour not in ('b', 'w'):
             raise ValueError
-        if 'B' in self._property_map:
-            del self._property_map['B']
-        if 'W' in self._property_map:
-            del self._property_map['W']
+        for identifier in ('B', 'W'):
+            if identifier in self._property_map:
+                del self._property_map[identifier]
+                self._forget_value(identifier)
         self.set(colour.upper(), move)
 
     def set_setup_stones(self, black, white, empty=None):
@@ -286,12 +324,10 @@ class Node(object):
         Removes any existing AB/AW/AE properties from the node.
 
         """
-        if 'AB' in self._property_map:
-            del self._property_map['AB']
-        if 'AW' in self._property_map:
-            del self._property_map['AW']
-        if 'AE' in self._property_map:
-            del self._property_map['AE']
+        for identifier in ('AB', 'AW', 'AE'):
+            if identifier in self._property_map:
+                del self._property_map[identifier]
+                self._forget_value(identifier)
         if black:
             self.set('AB', black)
         if white:
@@ -340,23 +376,42 @@ class Tree_node(Node):
       parent -- the nodes's parent Tree_node (None for the root node)
 
     """
+    # _children is _no_children for a node which has never had any children.
+    # _coarse_tree and _coarse_index are used by _Unexpanded_tree_node.
+    __slots__ = ('owner', 'parent', '_children',
+                 '_coarse_tree', '_coarse_index')
+
     def __init__(self, parent, properties):
         self.owner = parent.owner
         self.parent = parent
-        self._children = []
+        self._children = _no_children
         Node.__init__(self, properties, parent._presenter)
 
+    def _get_child_list(self):
+        # Returns the child list, making sure it's a real list (which can be
+        # modified).
+        children = self._children
+        if children is _no_children:
+            children = self._children = []
+        return children
+
     def _add_child(self, node):
-        self._children.append(node)
+        self._get_child_list().append(node)
 
     def __len__(self):
         return len(self._children)
 
     def __getitem__(self, key):
-        return self._children[key]
+        children = self._children
+        if children is _no_children:
+            children = []
+        return children[key]
 
     def index(self, child):
-        return self._children.index(child)
+        children = self._children
+        if children is _no_children:
+            children = []
+        return children.index(child)
 
     def new_child(self, index=None):
         """Create a new Tree_node and add it as this node's last child.
@@ -369,9 +424,9 @@ class Tree_node(Node):
         """
         child = Tree_node(self, {})
         if index is None:
-            self._children.append(child)
+            self._get_child_list().append(child)
         else:
-            self._children.insert(index, child)
+            self._get_child_list().insert(index, child)
         return child
 
     def delete(self):
@@ -406,9 +461,9 @@ class Tree_node(Node):
         self.parent._children.remove(self)
         self.parent = new_parent
         if index is None:
-            new_parent._children.append(self)
+            new_parent._get_child_list().append(self)
         else:
-            new_parent._children.insert(index, self)
+            new_parent._get_child_list().insert(index, self)
 
     def find(self, identifier):
         """Find the nearest ancestor-or-self containing the specified property.
@@ -441,41 +496,88 @@ class Tree_node(Node):
             raise KeyError
         return node.get(identifier)
 
+# Shared child list for nodes without children (an empty tuple, so it can't
+# be modified by accident).
+_no_children = ()
+
 class _Root_tree_node(Tree_node):
     """Variant of Tree_node used for a game root."""
+    __slots__ = ()
+
     def __init__(self, property_map, owner):
         self.owner = owner
         self.parent = None
         self._children = []
         Node.__init__(self, property_map, owner.presenter)
 
-class _Unexpanded_root_tree_node(_Root_tree_node):
-    """Variant of _Root_tree_node used with 'loaded' Sgf_games."""
-    def __init__(self, owner, coarse_tree):
-        _Root_tree_node.__init__(self, coarse_tree.sequence[0], owner)
-        self._coarse_tree = coarse_tree
+def _make_unexpanded_children(node, coarse_tree, index):
+    """Create the children of a node which came from a Coarse_game_tree.
 
-    def _expand(self):
-        sgf_grammar.make_tree(
-            self._coarse_tree, self, Tree_node, Tree_node._add_child)
-        delattr(self, '_coarse_tree')
-        self.__class__ = _Root_tree_node
+    node        -- Tree_node for coarse_tree.sequence[index]
+    coarse_tree -- sgf_grammar.Coarse_game_tree
+    index       -- int
 
-    def __len__(self):
-        self._expand()
-        return self.__len__()
+    Returns a list of _Unexpanded_tree_nodes.
 
-    def __getitem__(self, key):
-        self._expand()
-        return self.__getitem__(key)
+    """
+    if index < len(coarse_tree.sequence) - 1:
+        return [_Unexpanded_tree_node(node, coarse_tree, index+1)]
+    if not coarse_tree.children:
+        return _no_children
+    return [_Unexpanded_tree_node(node, child_tree, 0)
+            for child_tree in coarse_tree.children]
 
-    def index(self, child):
-        self._expand()
-        return self.index(child)
+class _Unexpanded_tree_node(Tree_node):
+    """Variant of Tree_node used with 'loaded' Sgf_games.
 
-    def new_child(self, index=None):
-        self._expand()
-        return self.new_child(index)
+    The node's children aren't created until they're first needed; then the
+    node becomes a plain Tree_node.
+
+    """
+    __slots__ = ()
+
+    def __init__(self, parent, coarse_tree, index):
+        self.owner = parent.owner
+        self.parent = parent
+        self._coarse_tree = coarse_tree
+        self._coarse_index = index
+        Node.__init__(self, coarse_tree.sequence[index], parent._presenter)
+
+    def __getattr__(self, name):
+        # This is called only if normal attribute lookup fails, so in
+        # particular when _children hasn't been set yet.
+        if name != '_children':
+            raise AttributeError(name)
+        self._children = _make_unexpanded_children(
+            self, self._coarse_tree, self._coarse_index)
+        del self._coarse_tree
+        del self._coarse_index
+        self.__class__ = Tree_node
+        return self._children
+
+class _Unexpanded_root_tree_node(_Root_tree_node):
+    """Variant of _Root_tree_node used with 'loaded' Sgf_games.
+
+    The root's children aren't created until they're first needed; then the
+    node becomes a plain _Root_tree_node.
+
+    """
+    __slots__ = ()
+
+    def __init__(self, owner, coarse_tree):
+        self.owner = owner
+        self.parent = None
+        self._coarse_tree = coarse_tree
+        Node.__init__(self, coarse_tree.sequence[0], owner.presenter)
+
+    def __getattr__(self, name):
+        # See _Unexpanded_tree_node.__getattr__()
+        if name != '_children':
+            raise AttributeError(name)
+        self._children = _make_unexpanded_children(self, self._coarse_tree, 0)
+        del self._coarse_tree
+        self.__class__ = _Root_tree_node
+        return self._children
 
     def _main_sequence_iter(self):
         presenter = self._presenter
@@ -567,18 +669,24 @@ class Sgf_game(object):
         return game
 
     @classmethod
-    def from_string(cls, s, override_encoding=None):
+    def from_string(cls, s, override_encoding=None, compact=False):
         """Alternative constructor: read a single Sgf_game from a string.
 
-        s -- 8-bit string
+        s       -- 8-bit string
+        compact -- bool (default False)
 
         Raises ValueError if it can't parse the string. See parse_sgf_game()
         for details.
 
         See from_coarse_game_tree for details of size and encoding handling.
 
+        If 'compact' is true, the raw property values are stored as tuples
+        (see sgf_grammar.parse_sgf_game()), which uses less memory for large
+        game records. The public interface is the same, except that the values
+        in the dicts returned by get_raw_property_map() are tuples.
+
         """
-        coarse_game = sgf_grammar.parse_sgf_game(s)
+        coarse_game = sgf_grammar.parse_sgf_game(s, compact)
         return cls.from_coarse_game_tree(coarse_game, override_encoding)
 
     def serialise(self, wrap=79):
@@ -604,21 +712,56 @@ class Sgf_game(object):
         If 'wrap' is not None, makes some effort to keep output lines no longer
         than 'wrap'.
 
+        """
+        f = StringIO()
+        self.serialise_to_file(f, wrap)
+        return f.getvalue()
+
+    def serialise_to_file(self, f, wrap=79):
+        """Serialise the SGF data, writing to a file-like object.
+
+        f    -- file-like object with a write() method
+        wrap -- int (default 79), or None
+
+        Writes the same data as serialise() would return, a piece at a time.
+
+        Errors are reported in the same way as for serialise(); if there is a
+        problem with transcoding, some of the data may already have been
+        written.
+
         """
         try:
             encoding = self.get_charset()
         except ValueError:
             raise ValueError("unsupported charset: %s" %
                              self.root.get_raw_list("CA"))
-        coarse_tree = sgf_grammar.make_coarse_game_tree(
-            self.root, lambda node:node, Node.get_raw_property_map)
-        serialised = sgf_grammar.serialise_game_tree(coarse_tree, wrap)
-        if encoding == self.root.get_encoding():
-            return serialised
+        raw_encoding = self.root.get_encoding()
+        if encoding == raw_encoding:
+            transcode = None
         else:
-            return serialised.decode(self.root.get_encoding()).encode(encoding)
+            def transcode(s):
+                return s.decode(raw_encoding).encode(encoding)
+        sgf_grammar.write_node_tree(
+            f, self.root, lambda node:node, Node.get_raw_property_map,
+            wrap, transcode)
 
 
+    def enable_value_cache(self, b=True):
+        """Make the game's nodes cache their interpreted property values.
+
+        This is off by default. It's worthwhile if the same property values
+        are read many times (for example, by tools which walk the game tree
+        repeatedly).
+
+        When it's on, Node.get() returns the same object each time it's called
+        for a given property (until the property is changed); treat the
+        returned values as read-only.
+
+        See sgf_properties.Presenter.enable_value_cache().
+
+        """
+        self.presenter.enable_value_cache(b)
+
     def get_property_presenter(self):
         """Return the property presenter.
 
@@ -0,0 +1,239 @@
+"""Archives of SGF game records.
+
+An archive is a directory holding SGF collection files, each containing many
+game records, together with an index mapping game ids to the games' locations.
+This avoids creating a separate file for each game.
+
+Collection files are named <prefix>-NNNN.sgf (or <prefix>-NNNN.sgf.gz if
+compressed). A new file is started when the current one reaches the size
+limit.
+
+In a compressed collection file, each game is a separate gzip member. So a
+single game can be read without decompressing the rest of the file, and the
+file as a whole is still a normal gzip file (of an SGF collection).
+
+The index is a text file named <prefix>.index, with one line per game:
+  game id, collection filename, byte offset, byte length
+separated by tabs. Lines are only ever appended; if a game id appears more
+than once, the last entry is used.
+
+"""
+
+import os
+import re
+import zlib
+
+from gomill import sgf
+
+DEFAULT_MAX_FILE_SIZE = 64 * 1024 * 1024
+
+# zlib wbits value for gzip format
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def _compress(s):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(s) + compressor.flush()
+
+def _decompress(s):
+    return zlib.decompress(s, _GZIP_WBITS)
+
+def _index_pathname(dirname, prefix):
+    return os.path.join(dirname, prefix + ".index")
+
+
+class Sgf_archive_writer(object):
+    """Add game records to an archive.
+
+    Instantiate with
+      dirname       -- directory pathname (the directory must exist)
+      prefix        -- filename prefix (default "games")
+      compress      -- bool (default False)
+      max_file_size -- int (default DEFAULT_MAX_FILE_SIZE)
+
+    If the archive already exists, games are added to it (continuing the
+    latest collection file, if it has the right compression and isn't full).
+
+    Each game is flushed to disk before its index entry is written, so after a
+    crash the index refers only to complete games.
+
+    Methods propagate EnvironmentError if there are problems with the files.
+
+    Call close() when finished with the archive.
+
+    """
+    def __init__(self, dirname, prefix="games", compress=False,
+                 max_file_size=DEFAULT_MAX_FILE_SIZE):
+        self.dirname = dirname
+        self.prefix = prefix
+        self.compress = compress
+        self.max_file_size = max_file_size
+        if compress:
+            self._suffix = ".sgf.gz"
+        else:
+            self._suffix = ".sgf"
+        self._file = None
+        self._file_size = None
+        self._file_number = self._find_file_number()
+        self._index_file = open(_index_pathname(dirname, prefix), "a")
+
+    def _find_file_number(self):
+        """Choose the number of the collection file to continue."""
+        filename_re = re.compile(
+            r"%s-([0-9]+)(\.sgf(?:\.gz)?)\Z" % re.escape(self.prefix))
+        last = None
+        for filename in os.listdir(self.dirname):
+            m = filename_re.match(filename)
+            if m:
+                last = max(last, (int(m.group(1)), m.group(2)))
+        if last is None:
+            return 0
+        number, suffix = last
+        if suffix != self._suffix:
+            return number + 1
+        return number
+
+    def _get_filename(self):
+        return "%s-%04d%s" % (self.prefix, self._file_number, self._suffix)
+
+    def _open_file(self):
+        self._file = open(os.path.join(self.dirname, self._get_filename()),
+                          "ab")
+        self._file_size = os.fstat(self._file.fileno()).st_size
+
+    def add_game(self, game_id, sgf_string):
+        """Add a game record to the archive.
+
+        game_id    -- string (mustn't contain tabs or newlines)
+        sgf_string -- 8-bit string containing a single SGF game
+
+        A newline is added to sgf_string if it doesn't already end with one.
+
+        """
+        if "\t" in game_id or "\n" in game_id:
+            raise ValueError("bad game id: %r" % game_id)
+        if not sgf_string.endswith("\n"):
+            sgf_string += "\n"
+        if self.compress:
+            data = _compress(sgf_string)
+        else:
+            data = sgf_string
+        if self._file is None:
+            self._open_file()
+        while self._file_size >= self.max_file_size:
+            self._file.close()
+            self._file_number += 1
+            self._open_file()
+        offset = self._file_size
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+        self._index_file.write("%s\t%s\t%d\t%d\n" % (
+            game_id, self._get_filename(), offset, len(data)))
+        self._index_file.flush()
+
+    def close(self):
+        """Close the archive's files."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._index_file.close()
+
+
+class Sgf_archive(object):
+    """Read access to an archive.
+
+    Instantiate with
+      dirname -- directory pathname
+      prefix  -- filename prefix (default "games")
+
+    The index is read at instantiation time. If it doesn't exist, the archive
+    is treated as empty. Malformed index lines (for example, a partial line
+    left by a crash) are ignored.
+
+    Propagates EnvironmentError if the index can't be read.
+
+    """
+    def __init__(self, dirname, prefix="games"):
+        self.dirname = dirname
+        self.prefix = prefix
+        self._locations = {}
+        self._game_ids = []
+        pathname = _index_pathname(dirname, prefix)
+        if not os.path.exists(pathname):
+            return
+        f = open(pathname)
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    game_id, filename, offset, length = \
+                        line.rstrip("\n").split("\t")
+                    location = (filename, int(offset), int(length))
+                except ValueError:
+                    continue
+                if game_id not in self._locations:
+                    self._game_ids.append(game_id)
+                self._locations[game_id] = location
+        finally:
+            f.close()
+
+    def get_game_ids(self):
+        """Return a list of the game ids in the archive.
+
+        The game ids are in the order they were first added.
+
+        """
+        return self._game_ids[:]
+
+    def has_game(self, game_id):
+        """Say whether the archive contains the specified game."""
+        return game_id in self._locations
+
+    def get_location(self, game_id):
+        """Find where a game is stored.
+
+        Returns a tuple (pathname, offset, length)
+
+        Raises KeyError if the game isn't in the archive.
+
+        """
+        filename, offset, length = self._locations[game_id]
+        return os.path.join(self.dirname, filename), offset, length
+
+    def get_sgf_string(self, game_id):
+        """Read a game record from the archive.
+
+        Returns an 8-bit string.
+
+        Raises KeyError if the game isn't in the archive.
+
+        Raises EnvironmentError if the collection file can't be read, or
+        ValueError if the data can't be decompressed.
+
+        """
+        pathname, offset, length = self.get_location(game_id)
+        f = open(pathname, "rb")
+        try:
+            f.seek(offset)
+            data = f.read(length)
+        finally:
+            f.close()
+        if pathname.endswith(".gz"):
+            try:
+                data = _decompress(data)
+            except zlib.error, e:
+                raise ValueError("bad compressed data: %s" % e)
+        return data
+
+    def get_sgf_game(self, game_id):
+        """Read a game from the archive.
+
+        Returns an sgf.Sgf_game.
+
+        Raises KeyError, EnvironmentError, or ValueError as for
+        get_sgf_string(); also raises ValueError if the game can't be parsed.
+
+        """
+        return sgf.Sgf_game.from_string(self.get_sgf_string(game_id))
+
@@ -70,6 +70,15 @@ def is_valid_property_value(s):
 
 _lcchars = string.ascii_lowercase
 
+# PropIdents which appear in most game records; the parser uses these
+# instances rather than making a new string for each occurrence. Other
+# PropIdents are interned.
+_common_propidents = dict(
+    (intern(s), intern(s)) for s in [
+        "B", "W", "C", "AB", "AW", "AE", "N", "PL", "MN", "BL", "WL",
+        "CA", "FF", "GM", "SZ", "KM", "HA", "AP", "RU", "RE", "PB", "PW",
+        "DT", "EV", "GN", "TR", "SQ", "CR", "MA", "LB"])
+
 def tokenise(s, start_position=0):
     """Tokenise a string containing SGF data.
 
@@ -111,7 +120,10 @@ def tokenise(s, start_position=0):
         group = m.lastgroup
         token = m.group(m.lastindex)
         if group == 'I':
-            token = token.translate(None, _lcchars)
+            ident = _common_propidents.get(token)
+            if ident is None:
+                ident = intern(token.translate(None, _lcchars))
+            token = ident
         result.append((group, token))
         i = m.end()
         if group == 'D':
@@ -141,74 +153,95 @@ class Coarse_game_tree(object):
         self.sequence = [] # must be at least one node
         self.children = [] # may be empty
 
-def _parse_sgf_game(s, start_position):
-    """Common implementation for parse_sgf_game and parse_sgf_games."""
-    tokens, end_position = tokenise(s, start_position)
-    if not tokens:
+def _parse_sgf_game(s, start_position, compact=False):
+    """Common implementation for parse_sgf_game and parse_sgf_collection.
+
+    This does the same job as walking the output of tokenise(), but works
+    directly from the regular expression matches, without building the token
+    list.
+
+    If 'compact' is true, property values are stored as tuples rather than
+    lists.
+
+    Returns a pair (Coarse_game_tree, index in 's' of the unprocessed tail),
+    or (None, None) if no start of game was found.
+
+    """
+    m = _find_start_re.search(s, start_position)
+    if not m:
         return None, None
+    match = _tokenise_re.match
+    common_propidents = _common_propidents
     stack = []
     game_tree = None
     sequence = None
     properties = None
-    index = 0
-    try:
-        while True:
-            token_type, token = tokens[index]
-            index += 1
-            if token_type == 'V':
+    # prop_values is not None while a PropIdent is waiting for its values
+    prop_ident = None
+    prop_values = None
+    i = m.start()
+    while True:
+        m = match(s, i)
+        if not m:
+            raise ValueError("unexpected end of SGF data")
+        i = m.end()
+        token_type = m.lastgroup
+        token = m.group(m.lastindex)
+        if token_type == 'V':
+            if prop_values is None:
                 raise ValueError("unexpected value")
-            if token_type == 'D':
-                if token == ';':
-                    if sequence is None:
-                        raise ValueError("unexpected node")
-                    properties = {}
-                    sequence.append(properties)
+            prop_values.append(token)
+            continue
+        if prop_values is not None:
+            if not prop_values:
+                raise ValueError("property with no values")
+            if compact:
+                prop_values = tuple(prop_values)
+            try:
+                if prop_ident in properties:
+                    properties[prop_ident] += prop_values
                 else:
-                    if sequence is not None:
-                        if not sequence:
-                            raise ValueError("empty sequence")
-                        game_tree.sequence = sequence
-                        sequence = None
-                    if token == '(':
-                        stack.append(game_tree)
-                        game_tree = Coarse_game_tree()
-                        sequence = []
-                    else:
-                        # token == ')'
-                        variation = game_tree
-                        game_tree = stack.pop()
-                        if game_tree is None:
-                            break
-                        game_tree.children.append(variation)
-                    properties = None
+                    properties[prop_ident] = prop_values
+            except TypeError:
+                raise ValueError("property value outside a node")
+            prop_values = None
+        if token_type == 'D':
+            if token == ';':
+                if sequence is None:
+                    raise ValueError("unexpected node")
+                properties = {}
+                sequence.append(properties)
             else:
-                # token_type == 'I'
-                prop_ident = token
-                prop_values = []
-                while True:
-                    token_type, token = tokens[index]
-                    if token_type != 'V':
+                if sequence is not None:
+                    if not sequence:
+                        raise ValueError("empty sequence")
+                    game_tree.sequence = sequence
+                    sequence = None
+                if token == '(':
+                    stack.append(game_tree)
+                    game_tree = Coarse_game_tree()
+                    sequence = []
+                else:
+                    # token == ')'
+                    variation = game_tree
+                    game_tree = stack.pop()
+                    if game_tree is None:
                         break
-                    index += 1
-                    prop_values.append(token)
-                if not prop_values:
-                    raise ValueError("property with no values")
-                try:
-                    if prop_ident in properties:
-                        properties[prop_ident] += prop_values
-                    else:
-                        properties[prop_ident] = prop_values
-                except TypeError:
-                    raise ValueError("property value outside a node")
-    except IndexError:
-        raise ValueError("unexpected end of SGF data")
-    assert index == len(tokens)
-    return variation, end_position
-
-def parse_sgf_game(s):
+                    game_tree.children.append(variation)
+                properties = None
+        else:
+            # token_type == 'I'
+            prop_ident = common_propidents.get(token)
+            if prop_ident is None:
+                prop_ident = intern(token.translate(None, _lcchars))
+            prop_values = []
+    return variation, i
+
+def parse_sgf_game(s, compact=False):
     """Read a single SGF game from a string, returning the parse tree.
 
-    s -- 8-bit string
+    s       -- 8-bit string
+    compact -- bool (default False)
 
     Returns a Coarse_game_tree.
 
@@ -224,23 +257,28 @@ def parse_sgf_game(s):
     whitespace between); ignores everything preceding that. Ignores everything
     following the first game.
 
+    If 'compact' is true, the property maps' values are tuples rather than
+    lists. This uses less memory, but the property maps aren't suitable for
+    code which modifies the value lists in place.
+
     """
-    game_tree, _ = _parse_sgf_game(s, 0)
+    game_tree, _ = _parse_sgf_game(s, 0, compact)
     if game_tree is None:
         raise ValueError("no SGF data found")
     return game_tree
 
-def parse_sgf_collection(s):
+def parse_sgf_collection(s, compact=False):
     """Read an SGF game collection, returning the parse trees.
 
-    s -- 8-bit string
+    s       -- 8-bit string
+    compact -- bool (default False)
 
     Returns a nonempty list of Coarse_game_trees.
 
     Raises ValueError if no games were found in the string.
 
     Raises ValueError if there is an error parsing a game. See
-    parse_sgf_game() for details.
+    parse_sgf_game() for details (including the meaning of 'compact').
 
 
     Ignores non-SGF data before the first game, between games, and after the
@@ -252,7 +290,7 @@ def parse_sgf_collection(s):
     result = []
     while True:
         try:
-            game_tree, position = _parse_sgf_game(s, position)
+            game_tree, position = _parse_sgf_game(s, position, compact)
         except ValueError, e:
             raise ValueError("error parsing game %d: %s" % (len(result), e))
         if game_tree is None:
@@ -262,6 +300,36 @@ def parse_sgf_collection(s):
         raise ValueError("no SGF data found")
     return result
 
+def iter_sgf_collection(s):
+    """Read an SGF game collection, reporting where each game was found.
+
+    s -- 8-bit string
+
+    Returns an iterator of tuples (start, end, Coarse_game_tree)
+
+    'start' and 'end' are indexes into 's': s[start:end] is the SGF data for
+    the game, which can be passed to parse_sgf_game().
+
+    Raises ValueError (when it reaches the problem) if there is an error
+    parsing a game; games before the problem are returned normally.
+
+    Finds the games in the same way as parse_sgf_collection(), but doesn't
+    complain if there are none.
+
+    """
+    position = 0
+    game_number = 0
+    while True:
+        m = _find_start_re.search(s, position)
+        if not m:
+            break
+        try:
+            game_tree, position = _parse_sgf_game(s, m.start())
+        except ValueError, e:
+            raise ValueError("error parsing game %d: %s" % (game_number, e))
+        yield m.start(), position, game_tree
+        game_number += 1
+
 
 def block_format(pieces, width=79):
     """Concatenate strings, adding newlines.
@@ -329,6 +397,107 @@ def serialise_game_tree(game_tree, wrap=79):
     else:
         return block_format(l, wrap)
 
+def serialise_node(properties):
+    """Serialise a single node.
+
+    properties -- dict PropIdent -> list of raw values
+
+    Returns an 8-bit string starting with ';', with the properties in the same
+    order as serialise_game_tree() uses, and no line breaks other than any in
+    the property values.
+
+    """
+    prop_idents = sorted(properties)
+    if "FF" in properties:
+        prop_idents.remove("FF")
+        prop_idents.insert(0, "FF")
+    l = [";"]
+    for prop_ident in prop_idents:
+        l.append(prop_ident)
+        for value in properties[prop_ident]:
+            l.append("[%s]" % value)
+    return "".join(l)
+
+class Block_writer(object):
+    """Incremental equivalent of block_format().
+
+    Instantiate with
+      f     -- file-like object with a write() method
+      width -- int, or None for no wrapping
+
+    Each call to write() passes a piece to f.write(), first writing a newline
+    if necessary to avoid lines longer than 'width'. The output written is the
+    same as block_format() would return for the same pieces.
+
+    """
+    def __init__(self, f, width=79):
+        self._write = f.write
+        self.width = width
+        self.line_length = 0
+
+    def write(self, s):
+        """Write a single (nonempty) piece."""
+        if self.width is not None:
+            if self.line_length + len(s) > self.width:
+                self._write("\n")
+                self.line_length = 0
+            self.line_length += len(s)
+        self._write(s)
+
+def write_node_tree(f, root, get_children, get_properties, wrap=79,
+                    transcode=None):
+    """Serialise a node tree as an SGF game, writing to a file-like object.
+
+    f              -- file-like object with a write() method
+    root           -- node
+    get_children   -- function taking a node, returning a sequence of nodes
+    get_properties -- function taking a node, returning a property map
+    wrap           -- int (default 79), or None
+    transcode      -- function taking and returning an 8-bit string (optional)
+
+    Writes the same output as
+      serialise_game_tree(make_coarse_game_tree(...), wrap)
+    would return, but a piece at a time, without building the intermediate
+    structures.
+
+    If 'transcode' is specified, it is applied to each raw property value
+    before it's written.
+
+    Makes no further assumptions about the node type.
+
+    """
+    writer = Block_writer(f, wrap)
+    write = writer.write
+    to_serialise = [root]
+    while to_serialise:
+        node = to_serialise.pop()
+        if node is None:
+            write(")")
+            continue
+        write("(")
+        while True:
+            write(";")
+            properties = get_properties(node)
+            prop_idents = sorted(properties)
+            # Force FF to the front (see serialise_game_tree())
+            if "FF" in properties:
+                prop_idents.remove("FF")
+                prop_idents.insert(0, "FF")
+            for prop_ident in prop_idents:
+                m = [prop_ident]
+                for value in properties[prop_ident]:
+                    if transcode is not None:
+                        value = transcode(value)
+                    m.append("[%s]" % value)
+                write("".join(m))
+            children = get_children(node)
+            if len(children) != 1:
+                break
+            node = children[0]
+        to_serialise.append(None)
+        to_serialise.extend(reversed(children))
+    write("\n")
+
 
 def make_tree(game_tree, root, node_builder, node_adder):
     """Construct a node tree from a Coarse_game_tree.
@@ -0,0 +1,322 @@
+"""Index collections of SGF files by their game-info properties.
+
+The index is an SQLite database recording, for each game found in a set of SGF
+files, where the game is (pathname, byte offset and length) and the values of
+some of its root node properties.
+
+The index is updated incrementally: a file is reread only if its modification
+time or size has changed since it was last indexed.
+
+"""
+
+import os
+import sqlite3
+
+from gomill import sgf
+from gomill import sgf_grammar
+
+# Root properties recorded in the index, with their SQL column types
+INDEXED_PROPERTIES = [
+    ('PB', 'TEXT'),
+    ('PW', 'TEXT'),
+    ('RE', 'TEXT'),
+    ('SZ', 'INTEGER'),
+    ('KM', 'REAL'),
+    ('HA', 'INTEGER'),
+    ('DT', 'TEXT'),
+    ('GN', 'TEXT'),
+    ('EV', 'TEXT'),
+    ]
+
+_indexed_identifiers = [ident for (ident, _) in INDEXED_PROPERTIES]
+
+_schema = """\
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    pathname TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    file_id INTEGER NOT NULL REFERENCES files,
+    game_number INTEGER NOT NULL,
+    byte_offset INTEGER NOT NULL,
+    byte_length INTEGER NOT NULL,
+    %s,
+    PRIMARY KEY (file_id, game_number)
+);
+CREATE INDEX IF NOT EXISTS games_PB ON games (PB);
+CREATE INDEX IF NOT EXISTS games_PW ON games (PW);
+CREATE INDEX IF NOT EXISTS games_RE ON games (RE);
+CREATE INDEX IF NOT EXISTS games_DT ON games (DT);
+""" % ",\n    ".join("%s %s" % pair for pair in INDEXED_PROPERTIES)
+
+
+def _read_file(pathname):
+    f = open(pathname, "rb")
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def get_indexed_properties(coarse_game):
+    """Extract the indexed root properties from a game's parse tree.
+
+    coarse_game -- sgf_grammar.Coarse_game_tree
+
+    Returns a dict mapping each of the INDEXED_PROPERTIES to its interpreted
+    value (see sgf.Node.get()); text values are 8-bit utf-8 strings.
+
+    Properties which are missing or can't be interpreted have value None.
+
+    """
+    result = dict.fromkeys(_indexed_identifiers)
+    try:
+        game = sgf.Sgf_game.from_coarse_game_tree(coarse_game)
+    except ValueError:
+        return result
+    root = game.get_root()
+    for identifier in _indexed_identifiers:
+        try:
+            result[identifier] = root.get(identifier)
+        except (KeyError, ValueError):
+            pass
+    if result['SZ'] is None:
+        result['SZ'] = game.get_size()
+    return result
+
+
+class Indexed_game(object):
+    """A game found in an Sgf_index.
+
+    Public attributes:
+      pathname    -- pathname of the file containing the game
+      game_number -- int (index of the game within the file's collection)
+      offset      -- int (offset of the game's SGF data in the file, in bytes)
+      length      -- int (length of the game's SGF data, in bytes)
+      properties  -- dict PropIdent -> value (see get_indexed_properties())
+
+    """
+    def __init__(self, pathname, game_number, offset, length, properties):
+        self.pathname = pathname
+        self.game_number = game_number
+        self.offset = offset
+        self.length = length
+        self.properties = properties
+
+    def __repr__(self):
+        return "<Indexed_game %s:%d>" % (self.pathname, self.game_number)
+
+    def get_sgf_string(self):
+        """Read the game's SGF data from its file.
+
+        Returns an 8-bit string.
+
+        Raises EnvironmentError if the file can't be read.
+
+        This reads only the part of the file containing the game.
+
+        """
+        f = open(self.pathname, "rb")
+        try:
+            f.seek(self.offset)
+            return f.read(self.length)
+        finally:
+            f.close()
+
+    def get_sgf_game(self):
+        """Read the game from its file.
+
+        Returns an sgf.Sgf_game.
+
+        Raises EnvironmentError if the file can't be read, or ValueError if
+        it can't be parsed (for example, because it has changed since it was
+        indexed).
+
+        """
+        return sgf.Sgf_game.from_string(self.get_sgf_string())
+
+
+class Sgf_index(object):
+    """Index of the games in a set of SGF files.
+
+    Instantiate with the pathname of the index database (it's created if it
+    doesn't already exist).
+
+    Pathnames are recorded in the index in absolute form.
+
+    Call close() when finished with the index.
+
+    """
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self.connection = sqlite3.connect(pathname)
+        self.connection.text_factory = str
+        self.connection.executescript(_schema)
+        self.connection.commit()
+
+    def close(self):
+        """Close the index database."""
+        self.connection.close()
+
+    def _index_file(self, pathname, mtime, size):
+        # Returns an error message, or None
+        self._forget_file(pathname)
+        try:
+            s = _read_file(pathname)
+        except EnvironmentError, e:
+            return str(e)
+        rows = []
+        error = None
+        try:
+            for game_number, (start, end, coarse_game) in enumerate(
+                    sgf_grammar.iter_sgf_collection(s)):
+                properties = get_indexed_properties(coarse_game)
+                rows.append(
+                    [game_number, start, end - start] +
+                    [properties[ident] for ident in _indexed_identifiers])
+        except ValueError, e:
+            error = str(e)
+        cursor = self.connection.cursor()
+        cursor.execute("INSERT INTO files (pathname, mtime, size, error) "
+                       "VALUES (?, ?, ?, ?)",
+                       (pathname, mtime, size, error))
+        file_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO games VALUES (%s)" %
+            ", ".join("?" * (4 + len(_indexed_identifiers))),
+            [[file_id] + row for row in rows])
+        return error
+
+    def update_files(self, pathnames):
+        """Bring the index up to date for the specified files.
+
+        pathnames -- iterable of pathnames of SGF files
+
+        Rereads each file whose modification time or size is different from
+        when it was last indexed, or which isn't in the index.
+
+        Files which no longer exist are removed from the index.
+
+        Returns a list of pairs (pathname, error message), for files which
+        couldn't be read or contained SGF data which couldn't be parsed. The
+        games from such a file which could be parsed are still indexed.
+
+        """
+        errors = []
+        try:
+            for pathname in pathnames:
+                pathname = os.path.abspath(pathname)
+                try:
+                    st = os.stat(pathname)
+                except EnvironmentError:
+                    self._forget_file(pathname)
+                    continue
+                row = self.connection.execute(
+                    "SELECT mtime, size FROM files WHERE pathname = ?",
+                    (pathname,)).fetchone()
+                if row == (st.st_mtime, st.st_size):
+                    continue
+                error = self._index_file(pathname, st.st_mtime, st.st_size)
+                if error is not None:
+                    errors.append((pathname, error))
+        finally:
+            self.connection.commit()
+        return errors
+
+    def _forget_file(self, pathname):
+        self.connection.execute(
+            "DELETE FROM games WHERE file_id IN "
+            "(SELECT file_id FROM files WHERE pathname = ?)", (pathname,))
+        self.connection.execute(
+            "DELETE FROM files WHERE pathname = ?", (pathname,))
+
+    def update_directory(self, dirname, suffixes=(".sgf",)):
+        """Bring the index up to date for a directory tree.
+
+        dirname  -- directory pathname
+        suffixes -- filename suffixes to consider (default ".sgf" only)
+
+        Indexes all files under 'dirname' (recursively) whose name ends with
+        one of the specified suffixes (ignoring case); see update_files().
+
+        Files under 'dirname' which no longer exist are removed from the
+        index.
+
+        Returns a list of pairs (pathname, error message), as for
+        update_files().
+
+        """
+        dirname = os.path.abspath(dirname)
+        suffixes = tuple(suffix.lower() for suffix in suffixes)
+        found = set()
+        for (dirpath, _, filenames) in os.walk(dirname):
+            for filename in filenames:
+                if filename.lower().endswith(suffixes):
+                    found.add(os.path.join(dirpath, filename))
+        prefix = os.path.join(dirname, "")
+        try:
+            for (pathname,) in self.connection.execute(
+                    "SELECT pathname FROM files").fetchall():
+                if pathname.startswith(prefix) and pathname not in found:
+                    self._forget_file(pathname)
+        finally:
+            self.connection.commit()
+        return self.update_files(sorted(found))
+
+    def count_games(self):
+        """Return the number of games in the index."""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def find_games(self, player=None, **criteria):
+        """Find games in the index.
+
+        player   -- player name (optional)
+        criteria -- property values, eg PB="GNU Go", SZ=9
+
+        Returns a list of Indexed_games, in order of pathname and game number.
+
+        The criteria keywords must be among the INDEXED_PROPERTIES; each
+        restricts the result to games whose property has exactly the specified
+        value. If 'player' is specified, only games where PB or PW has that
+        value are included.
+
+        With no criteria, returns all games in the index.
+
+        Text values should be 8-bit utf-8 strings.
+
+        """
+        conditions = []
+        parameters = []
+        for identifier, value in sorted(criteria.iteritems()):
+            if identifier not in _indexed_identifiers:
+                raise ValueError("property not indexed: %s" % identifier)
+            conditions.append("%s = ?" % identifier)
+            parameters.append(value)
+        if player is not None:
+            conditions.append("(PB = ? OR PW = ?)")
+            parameters += [player, player]
+        sql = ("SELECT pathname, game_number, byte_offset, byte_length, %s "
+               "FROM games JOIN files USING (file_id)" %
+               ", ".join(_indexed_identifiers))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY pathname, game_number"
+        result = []
+        for row in self.connection.execute(sql, parameters):
+            result.append(Indexed_game(
+                row[0], row[1], row[2], row[3],
+                dict(zip(_indexed_identifiers, row[4:]))))
+        return result
+
+    def get_errors(self):
+        """Return the problems found when the indexed files were last read.
+
+        Returns a list of pairs (pathname, error message).
+
+        """
+        return self.connection.execute(
+            "SELECT pathname, error FROM files WHERE error IS NOT NULL "
+            "ORDER BY pathname").fetchall()
@@ -1,6 +1,9 @@
 """Higher-level processing of moves and positions from SGF games."""
 
+from array import array
+
 from gomill import boards
+from gomill import sgf_grammar
 from gomill import sgf_properties
 
 
@@ -97,3 +100,122 @@ def indicate_first_player(sgf_game):
     if specify_pl:
         root.set('PL', first_player)
 
+
+
+def decode_compact_point(point, size):
+    """Convert a compact encoded point to coordinates.
+
+    point -- int, as found in the arrays from get_compact_setup_and_moves()
+    size  -- board size (int)
+
+    Returns a pair (row, col), or None for a pass.
+
+    """
+    if point < 0:
+        return None
+    return divmod(point, size)
+
+def get_compact_setup_and_moves(coarse_game):
+    """Return the initial setup and the following moves from a parse tree.
+
+    coarse_game -- sgf_grammar.Coarse_game_tree
+
+    Returns a tuple (size, setup, moves)
+
+      size  -- int
+      setup -- pair (colours, points) for the setup stones
+      moves -- pair (colours, points) for the moves
+
+    In each pair, 'colours' is a bytearray and 'points' is an array('h') of
+    the same length. Colours are represented as the characters 'b' and 'w';
+    points are encoded as row * size + col, or -1 for a pass (see
+    decode_compact_point()).
+
+    This is a faster equivalent of get_setup_and_moves() for use when
+    processing many games: it works directly from the parser output, without
+    creating an Sgf_game or any Node objects.
+
+    The setup stones are from AB and/or AW properties in the root node, black
+    stones first. The moves are from the game's 'leftmost' variation.
+
+    Raises ValueError if the SZ property or any setup or move value is
+    malformed.
+
+    Raises ValueError if there are any AB/AW/AE properties after the root
+    node, or if the root node has both setup stones and a move.
+
+    Unlike get_setup_and_moves(), this doesn't build the setup position, so:
+     - it doesn't check whether the setup position is legal
+     - AE properties in the root node are ignored
+     - a point listed more than once in AB/AW (or in both) appears more than
+       once in the setup
+
+    Doesn't check whether the moves are legal.
+
+    """
+    root = coarse_game.sequence[0]
+    try:
+        size_s = root['SZ'][0]
+    except KeyError:
+        size = 19
+    else:
+        try:
+            size = int(size_s)
+        except ValueError:
+            raise ValueError("bad SZ property: %s" % size_s)
+    if not 1 <= size <= 26:
+        raise ValueError("size out of range: %s" % size)
+    # Shared with sgf_properties.interpret_go_point()
+    table = sgf_properties._get_go_point_table(size)
+
+    setup_colours = bytearray()
+    setup_points = array('h')
+    property_maps = sgf_grammar.main_sequence_iter(coarse_game)
+    if 'AB' in root or 'AW' in root:
+        for identifier, colour in (('AB', 'b'), ('AW', 'w')):
+            values = root.get(identifier)
+            if values is None:
+                continue
+            if any(":" in s for s in values):
+                # Compressed point list; take the slow path
+                context = sgf_properties._Context(size, None)
+                points = [row * size + col for (row, col) in
+                          sgf_properties.interpret_point_list(values, context)]
+            else:
+                points = []
+                for s in values:
+                    coords = table.get(s)
+                    if coords is None:
+                        raise ValueError("bad setup point: %s" % s)
+                    row, col = coords
+                    points.append(row * size + col)
+            points.sort()
+            setup_points.extend(points)
+            setup_colours.extend(colour * len(points))
+        if 'B' in root or 'W' in root:
+            raise ValueError("mixed setup and moves in root node")
+        property_maps.next()
+
+    colours = bytearray()
+    points = array('h')
+    for properties in property_maps:
+        if 'AB' in properties or 'AW' in properties or 'AE' in properties:
+            raise ValueError("setup properties after the root node")
+        values = properties.get('B')
+        if values is not None:
+            colour = 98 # ord('b')
+        else:
+            values = properties.get('W')
+            if values is None:
+                continue
+            colour = 119 # ord('w')
+        try:
+            coords = table[values[0]]
+        except KeyError:
+            raise ValueError("bad move: %s" % values[0])
+        colours.append(colour)
+        if coords is None:
+            points.append(-1)
+        else:
+            points.append(coords[0] * size + coords[1])
+    return size, (setup_colours, setup_points), (colours, points)
@@ -42,6 +42,13 @@ def interpret_go_point(s, size):
     of gomill), where (0, 0) is the lower left.
 
     """
+    table = _get_go_point_table(size)
+    if table is not None:
+        try:
+            return table[s]
+        except (KeyError, TypeError):
+            pass
+    # Slow path (reporting the appropriate exception for bad values)
     if s == "" or (s == "tt" and size <= 19):
         return None
     # May propagate ValueError
@@ -52,6 +59,34 @@ def interpret_go_point(s, size):
         raise ValueError
     return row, col
 
+# Map board size -> dict raw value -> result of interpret_go_point()
+_go_point_tables = {}
+
+def _get_go_point_table(size):
+    """Return a dict mapping valid raw Go Point values to coordinates.
+
+    The values are as returned by interpret_go_point().
+
+    The dicts are cached, one per board size. Returns None if the size is out
+    of range.
+
+    """
+    try:
+        return _go_point_tables[size]
+    except KeyError:
+        pass
+    if not 1 <= size <= 26:
+        return None
+    table = {"" : None}
+    if size <= 19:
+        table["tt"] = None
+    for row in xrange(size):
+        row_s = chr(size - row + 96)
+        for col in xrange(size):
+            table[chr(col + 97) + row_s] = (row, col)
+    _go_point_tables[size] = table
+    return table
+
 def serialise_go_point(move, size):
     """Serialise a Go Point, Move, or Stone value.
 
@@ -590,14 +625,20 @@ class Presenter(_Context):
       encoding -- encoding for the SGF strings
 
     Public attributes (treat as read-only):
-      size     -- int
-      encoding -- string (normalised form)
+      size                -- int
+      encoding            -- string (normalised form)
+      value_cache_enabled -- bool
+      type_generation     -- int
 
     See the _property_types_by_ident table above for a list of properties
     initially known, and their types.
 
     Initially, treats unknown (private) properties as if they had type Text.
 
+    type_generation is increased whenever the presenter's property types are
+    changed, so that cached interpreted values can be discarded (see
+    enable_value_cache()).
+
     """
 
     def __init__(self, size, encoding):
@@ -608,6 +649,20 @@ class Presenter(_Context):
         _Context.__init__(self, size, encoding)
         self.property_types_by_ident = _property_types_by_ident.copy()
         self.default_property_type = _text_property_type
+        self.value_cache_enabled = False
+        self.type_generation = 0
+
+    def enable_value_cache(self, b=True):
+        """Allow sgf.Nodes using this presenter to cache interpreted values.
+
+        This is off by default.
+
+        When it's on, each node remembers the values returned by its get()
+        method, and returns the same object if the property is requested again
+        (until the property is changed).
+
+        """
+        self.value_cache_enabled = bool(b)
 
     def get_property_type(self, identifier):
         """Return the Property_type for the specified PropIdent.
@@ -620,10 +675,12 @@ class Presenter(_Context):
     def register_property(self, identifier, property_type):
         """Specify the Property_type for a PropIdent."""
         self.property_types_by_ident[identifier] = property_type
+        self.type_generation += 1
 
     def deregister_property(self, identifier):
         """Forget the type for the specified PropIdent."""
         del self.property_types_by_ident[identifier]
+        self.type_generation += 1
 
     def set_private_property_type(self, property_type):
         """Specify the Property_type to use for unknown properties.
@@ -632,6 +689,7 @@ class Presenter(_Context):
 
         """
         self.default_property_type = property_type
+        self.type_generation += 1
 
     def _get_effective_property_type(self, identifier):
         try:
@@ -651,7 +709,7 @@ class Presenter(_Context):
         if not raw_values:
             raise ValueError("no raw values")
         if property_type.uses_list:
-            if raw_values == [""]:
+            if len(raw_values) == 1 and raw_values[0] == "":
                 raw = []
             else:
                 raw = raw_values
@@ -0,0 +1,426 @@
+"""Competitions for parameter tuning using SPSA.
+
+SPSA is simultaneous perturbation stochastic approximation: each game is
+played between two candidates whose parameters are the current estimate,
+perturbed in opposite directions along a random vector, and the estimate is
+moved in the direction of the winner.
+
+"""
+
+from __future__ import division
+
+import random
+
+from gomill import compact_tracebacks
+from gomill import game_jobs
+from gomill import competitions
+from gomill import competition_schedulers
+from gomill.competitions import (
+    Competition, NoGameAvailable, CompetitionError, ControlFileError,
+    Player_config)
+from gomill.mcts_tuners import LINEAR, LOG, EXPLICIT
+from gomill.settings import *
+
+
+def clip(f):
+    """Clip a float to the range 0.0..1.0."""
+    return max(0.0, min(1.0, f))
+
+class Perturbation(object):
+    """The candidates for a single SPSA iteration.
+
+    Public attributes:
+      iteration   -- int (the game number)
+      delta       -- list of +1 or -1, one per dimension
+      c           -- perturbation size for this iteration (float)
+      plus_parameters  -- optimiser_parameters for the 'plus' candidate
+      minus_parameters -- optimiser_parameters for the 'minus' candidate
+
+    """
+    def __init__(self, iteration, theta, c):
+        self.iteration = iteration
+        self.c = c
+        self.delta = [random.choice((-1, 1)) for _ in theta]
+        self.plus_parameters = [clip(t + c*d)
+                                for (t, d) in zip(theta, self.delta)]
+        self.minus_parameters = [clip(t - c*d)
+                                 for (t, d) in zip(theta, self.delta)]
+
+
+parameter_settings = [
+    Setting('code', interpret_identifier),
+    Setting('scale', interpret_callable),
+    Setting('initial_value', interpret_float, default=0.5),
+    Setting('format', interpret_8bit_string, default=None),
+    ]
+
+class Parameter_config(Quiet_config):
+    """Parameter (ie, dimension) description for use in control files."""
+    # positional or keyword
+    positional_arguments = ('code',)
+    # keyword-only
+    keyword_arguments = tuple(setting.name for setting in parameter_settings
+                              if setting.name != 'code')
+
+class Parameter_spec(object):
+    """Internal description of a parameter spec from the configuration file.
+
+    Public attributes:
+      code          -- identifier
+      scale         -- function float(0.0..1.0) -> player parameter
+      initial_value -- float(0.0..1.0)
+      format        -- string for use with '%'
+
+    """
+
+class Spsa_tuner(Competition):
+    """A Competition for parameter tuning using SPSA.
+
+    The game ids are strings containing integers starting from zero (the
+    iteration number). The candidates for game n have codes '#n+' and '#n-'.
+
+    """
+    def __init__(self, competition_code, **kwargs):
+        Competition.__init__(self, competition_code, **kwargs)
+        self.outstanding_perturbations = {}
+        self.halt_on_next_failure = True
+
+    def control_file_globals(self):
+        result = Competition.control_file_globals(self)
+        result.update({
+            'Parameter' : Parameter_config,
+            'LINEAR'    : LINEAR,
+            'LOG'       : LOG,
+            'EXPLICIT'  : EXPLICIT,
+            })
+        return result
+
+    global_settings = (Competition.global_settings +
+                       competitions.game_settings + [
+        Setting('number_of_iterations', interpret_positive_int),
+        Setting('step_size', interpret_float),
+        Setting('perturbation_size', interpret_float),
+        Setting('stability_constant', allow_none(interpret_float),
+                default=None),
+        Setting('step_size_exponent', interpret_float, default=0.602),
+        Setting('perturbation_exponent', interpret_float, default=0.101),
+        Setting('number_of_running_games_to_show', interpret_int,
+                default=12),
+        ])
+
+    special_settings = [
+        Setting('parameters',
+                interpret_sequence_of_quiet_configs(Parameter_config)),
+        Setting('make_candidate', interpret_callable),
+        ]
+
+    def parameter_spec_from_config(self, parameter_config):
+        """Make a Parameter_spec from a Parameter_config.
+
+        Raises ControlFileError if there is an error in the configuration.
+
+        Returns a Parameter_spec with all attributes set.
+
+        """
+        arguments = parameter_config.resolve_arguments()
+        interpreted = load_settings(parameter_settings, arguments)
+        pspec = Parameter_spec()
+        for name, value in interpreted.iteritems():
+            setattr(pspec, name, value)
+        if not 0.0 <= pspec.initial_value <= 1.0:
+            raise ValueError("'initial_value': out of range (0.0 to 1.0)")
+        try:
+            scaled = pspec.scale(pspec.initial_value)
+        except Exception:
+            raise ValueError(
+                "error from scale (applied to %s)\n%s" %
+                (pspec.initial_value,
+                 compact_tracebacks.format_traceback(skip=1)))
+        if pspec.format is None:
+            pspec.format = pspec.code + ":%s"
+        try:
+            pspec.format % scaled
+        except Exception:
+            raise ControlFileError("'format': invalid format string")
+        return pspec
+
+    def initialise_from_control_file(self, config):
+        Competition.initialise_from_control_file(self, config)
+
+        competitions.validate_handicap(
+            self.handicap, self.handicap_style, self.board_size)
+
+        if not self.step_size > 0.0:
+            raise ControlFileError("step_size: must be positive")
+        if not 0.0 < self.perturbation_size <= 0.5:
+            raise ControlFileError(
+                "perturbation_size: out of range (0.0 to 0.5)")
+        if self.stability_constant is None:
+            self.stability_constant = self.number_of_iterations / 10
+        elif self.stability_constant < 0.0:
+            raise ControlFileError("stability_constant: must be nonnegative")
+
+        try:
+            specials = load_settings(self.special_settings, config)
+        except ValueError, e:
+            raise ControlFileError(str(e))
+
+        self.parameter_specs = []
+        if not specials['parameters']:
+            raise ControlFileError("parameters: empty list")
+        seen_codes = set()
+        for i, parameter_spec in enumerate(specials['parameters']):
+            try:
+                pspec = self.parameter_spec_from_config(parameter_spec)
+            except StandardError, e:
+                code = parameter_spec.get_key()
+                if code is None:
+                    code = i
+                raise ControlFileError("parameter %s: %s" % (code, e))
+            if pspec.code in seen_codes:
+                raise ControlFileError(
+                    "duplicate parameter code: %s" % pspec.code)
+            seen_codes.add(pspec.code)
+            self.parameter_specs.append(pspec)
+
+        self.candidate_maker_fn = specials['make_candidate']
+
+
+    # State attributes (*: in persistent state):
+    #  *scheduler               -- Simple_scheduler (tokens are iterations)
+    #  *theta                   -- optimiser_parameters (current estimate)
+    #  *iterations_completed    -- int
+    #  *plus_score              -- float (games won by the 'plus' candidates;
+    #                              half a point for a game with no winner)
+    #   outstanding_perturbations -- map iteration -> Perturbation
+    #   halt_on_next_failure    -- bool
+
+    def set_clean_status(self):
+        self.scheduler = competition_schedulers.Simple_scheduler()
+        self.theta = [pspec.initial_value for pspec in self.parameter_specs]
+        self.iterations_completed = 0
+        self.plus_score = 0.0
+
+    # Can bump this to prevent people loading incompatible .status files.
+    status_format_version = 0
+
+    def get_status(self):
+        return {
+            'scheduler' : self.scheduler,
+            'theta' : self.theta,
+            'parameter_codes' : [pspec.code for pspec in self.parameter_specs],
+            'iterations_completed' : self.iterations_completed,
+            'plus_score' : self.plus_score,
+            }
+
+    def set_status(self, status):
+        if status['parameter_codes'] != [pspec.code
+                                         for pspec in self.parameter_specs]:
+            raise CompetitionError(
+                "status file is inconsistent with control file")
+        self.theta = status['theta']
+        self.iterations_completed = status['iterations_completed']
+        self.plus_score = status['plus_score']
+        self.scheduler = status['scheduler']
+        self.scheduler.rollback()
+
+    def get_step_size(self, iteration):
+        """Return the step size ('a_k') for the specified iteration."""
+        return self.step_size / (
+            (self.stability_constant + iteration + 1) **
+            self.step_size_exponent)
+
+    def get_perturbation_size(self, iteration):
+        """Return the perturbation size ('c_k') for the specified iteration."""
+        return self.perturbation_size / (
+            (iteration + 1) ** self.perturbation_exponent)
+
+    def scale_parameters(self, optimiser_parameters):
+        l = []
+        for pspec, v in zip(self.parameter_specs, optimiser_parameters):
+            try:
+                l.append(pspec.scale(v))
+            except Exception:
+                raise CompetitionError(
+                    "error from scale for %s\n%s" %
+                    (pspec.code, compact_tracebacks.format_traceback(skip=1)))
+        return tuple(l)
+
+    def format_engine_parameters(self, engine_parameters):
+        l = []
+        for pspec, v in zip(self.parameter_specs, engine_parameters):
+            try:
+                s = pspec.format % v
+            except Exception:
+                s = "[%s?%s]" % (pspec.code, v)
+            l.append(s)
+        return "; ".join(l)
+
+    def format_optimiser_parameters(self, optimiser_parameters):
+        return self.format_engine_parameters(self.scale_parameters(
+            optimiser_parameters))
+
+    def make_candidate(self, player_code, engine_parameters):
+        """Make a player using the specified engine parameters.
+
+        Returns a game_jobs.Player.
+
+        """
+        try:
+            candidate_config = self.candidate_maker_fn(*engine_parameters)
+        except Exception:
+            raise CompetitionError(
+                "error from make_candidate()\n%s" %
+                compact_tracebacks.format_traceback(skip=1))
+        if not isinstance(candidate_config, Player_config):
+            raise CompetitionError(
+                "make_candidate() returned %r, not Player" %
+                candidate_config)
+        try:
+            candidate = self.game_jobs_player_from_config(
+                player_code, candidate_config)
+        except Exception, e:
+            raise CompetitionError(
+                "bad player spec from make_candidate():\n"
+                "%s\nparameters were: %s" %
+                (e, self.format_engine_parameters(engine_parameters)))
+        return candidate
+
+    def get_player_checks(self):
+        engine_parameters = self.scale_parameters(
+            [pspec.initial_value for pspec in self.parameter_specs])
+        candidate = self.make_candidate('candidate', engine_parameters)
+        check = game_jobs.Player_check()
+        check.player = candidate
+        check.board_size = self.board_size
+        check.komi = self.komi
+        return [check]
+
+    def get_game(self):
+        if self.scheduler.issued >= self.number_of_iterations:
+            return NoGameAvailable
+        iteration = self.scheduler.issue()
+
+        perturbation = Perturbation(
+            iteration, self.theta, self.get_perturbation_size(iteration))
+        plus_engine_parameters = self.scale_parameters(
+            perturbation.plus_parameters)
+        minus_engine_parameters = self.scale_parameters(
+            perturbation.minus_parameters)
+        plus_candidate = self.make_candidate(
+            "#%d+" % iteration, plus_engine_parameters)
+        minus_candidate = self.make_candidate(
+            "#%d-" % iteration, minus_engine_parameters)
+        self.outstanding_perturbations[iteration] = perturbation
+
+        job = game_jobs.Game_job()
+        job.game_id = str(iteration)
+        job.game_data = iteration
+        # Alternate colours, so neither direction is favoured
+        if iteration % 2 == 0:
+            job.player_b = plus_candidate
+            job.player_w = minus_candidate
+        else:
+            job.player_b = minus_candidate
+            job.player_w = plus_candidate
+        job.board_size = self.board_size
+        job.komi = self.komi
+        job.move_limit = self.move_limit
+        job.handicap = self.handicap
+        job.handicap_is_free = (self.handicap_style == 'free')
+        job.use_internal_scorer = (self.scorer == 'internal')
+        job.internal_scorer_handicap_compensation = \
+            self.internal_scorer_handicap_compensation
+        job.sgf_event = self.competition_code
+        job.sgf_note = ("Candidate parameters:\n+ %s\n- %s" % (
+            self.format_engine_parameters(plus_engine_parameters),
+            self.format_engine_parameters(minus_engine_parameters)))
+        return job
+
+    def update_theta(self, perturbation, result):
+        """Move the estimate according to a game's result.
+
+        result -- +1 if the plus candidate won, -1 if the minus candidate won,
+                  0 for a game with no winner
+
+        """
+        scale = (self.get_step_size(perturbation.iteration) * result /
+                 (2 * perturbation.c))
+        self.theta = [clip(t + scale * d)
+                      for (t, d) in zip(self.theta, perturbation.delta)]
+
+    def process_game_result(self, response):
+        self.halt_on_next_failure = False
+        iteration = response.game_data
+        self.scheduler.fix(iteration)
+        perturbation = self.outstanding_perturbations.pop(iteration)
+        winner = response.game_result.winning_player
+        if winner == "#%d+" % iteration:
+            result = 1
+        elif winner == "#%d-" % iteration:
+            result = -1
+        else:
+            result = 0
+        self.plus_score += (result + 1) / 2
+        self.update_theta(perturbation, result)
+        self.iterations_completed += 1
+        description = "%d %s: %s" % (
+            iteration, ("-", "=", "+")[result+1],
+            self.format_optimiser_parameters(self.theta))
+        self.log_history(description)
+        return "%s %s" % (description, response.game_result.sgf_result)
+
+    def process_game_error(self, job, previous_error_count):
+        ## If the very first game to return a response gives an error, halt.
+        ## If two games in a row give an error, halt.
+        ## Otherwise, forget about the failed game
+        stop_competition = False
+        retry_game = False
+        iteration = job.game_data
+        del self.outstanding_perturbations[iteration]
+        self.scheduler.fix(iteration)
+        if self.halt_on_next_failure:
+            stop_competition = True
+        else:
+            self.halt_on_next_failure = True
+        return stop_competition, retry_game
+
+    def write_static_description(self, out):
+        def p(s):
+            print >>out, s
+        p("SPSA tuning event: %s" % self.competition_code)
+        if self.description:
+            p(self.description)
+        p("board size: %s" % self.board_size)
+        p("komi: %s" % self.komi)
+
+    def _write_main_report(self, out):
+        print >>out, "%d/%d games played" % (
+            self.iterations_completed, self.number_of_iterations)
+        if self.iterations_completed:
+            print >>out, "plus candidates' score: %.1f/%d" % (
+                self.plus_score, self.iterations_completed)
+        print >>out
+        print >>out, "Current parameters: %s" % (
+            self.format_optimiser_parameters(self.theta))
+        print >>out
+
+    def write_screen_report(self, out):
+        self._write_main_report(out)
+        if self.outstanding_perturbations:
+            print >>out, "In progress:"
+            to_show = sorted(self.outstanding_perturbations.iteritems())\
+                      [:self.number_of_running_games_to_show]
+            for iteration, perturbation in to_show:
+                print >>out, "game %d:" % iteration
+                print >>out, "  + %s" % self.format_optimiser_parameters(
+                    perturbation.plus_parameters)
+                print >>out, "  - %s" % self.format_optimiser_parameters(
+                    perturbation.minus_parameters)
+
+    def write_short_report(self, out):
+        self.write_static_description(out)
+        self._write_main_report(out)
+
+    write_full_report = write_short_report
+
@@ -115,9 +115,14 @@ class Matchup_stats(object):
       forfeits_1  -- int (number of games)
       forfeits_2  -- int (number of games)
       unknown     -- int (number of games)
+      duplicates  -- int (number of games)
 
     scores are multiples of 0.5 (as there may be jigos).
 
+    'duplicates' is the number of games which repeat an earlier game in the
+    list (see game_fingerprints); games without a fingerprint are never
+    counted as duplicates.
+
     """
     def __init__(self, results, player_1, player_2):
         self._results = results
@@ -137,6 +142,10 @@ class Matchup_stats(object):
         self.forfeits_2 = sum(r.winning_player == player_1 and r.is_forfeit
                               for r in results)
 
+        fingerprints = [r.fingerprint for r in results
+                        if r.fingerprint is not None]
+        self.duplicates = len(fingerprints) - len(set(fingerprints))
+
     def calculate_colour_breakdown(self):
         """Calculate futher statistics, broken down by colour played.
 
@@ -304,6 +313,9 @@ def write_matchup_summary(out, matchup, ms):
     if ms.unknown > 0:
         p("unknown results: %d %s" %
           (ms.unknown, format_percent(ms.unknown, ms.total)))
+    if ms.duplicates > 0:
+        p("duplicate games: %d %s" %
+          (ms.duplicates, format_percent(ms.duplicates, ms.total)))
 
     p(matchup.describe_details())
     p("\n".join(make_matchup_stats_table(ms).render()))
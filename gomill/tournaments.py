@@ -4,6 +4,7 @@ from collections import defaultdict
 
 from gomill import game_jobs
 from gomill import competition_schedulers
+from gomill import result_databases
 from gomill import tournament_results
 from gomill import competitions
 from gomill.competitions import (
@@ -261,6 +262,10 @@ class Tournament(Competition):
             retry_game = True
         return stop_competition, retry_game
 
+    def get_matchup_id(self, game_data):
+        matchup_id, game_number = game_data
+        return matchup_id
+
     def write_matchup_report(self, out, matchup, results):
         """Write the summary block for the specified matchup to 'out'
 
@@ -317,3 +322,12 @@ class Tournament(Competition):
         return tournament_results.Tournament_results(
             self.matchup_list, self.results)
 
+    def get_database_tournament_results(self, database):
+        return result_databases.Database_tournament_results(
+            self.matchup_list, database)
+
+    def get_recorded_results(self):
+        return [(matchup_id, result)
+                for (matchup_id, results) in sorted(self.results.iteritems())
+                for result in results]
+
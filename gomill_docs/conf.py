@@ -103,6 +103,10 @@ def setup(app):
                         indextemplate='pair: %s; cross-entropy tuner setting',
                         objname="Cross-entropy tuner setting")
 
+    app.add_object_type('spsa-setting', 'spsa-setting',
+                        indextemplate='pair: %s; SPSA tuner setting',
+                        objname="SPSA tuner setting")
+
     app.add_crossref_type('setting-cls', 'setting-cls',
                           indextemplate='single: %s',
                           objname="Control file object")
@@ -119,6 +123,10 @@ def setup(app):
                           indextemplate='single: %s',
                           objname="Control file object")
 
+    app.add_crossref_type('spsa-setting-cls', 'spsa-setting-cls',
+                          indextemplate='single: %s',
+                          objname="Control file object")
+
 
 if _sphinx_is_v1x0:
     # Undo undesirable sphinx code that auto-adds 'xref' class to literals
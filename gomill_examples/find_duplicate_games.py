@@ -0,0 +1,85 @@
+"""Find duplicate games in a set of SGF files.
+
+Games are duplicates if they have the same board size, setup stones, and
+moves, allowing for rotation and reflection of the board and for the colours
+being swapped.
+
+The files are read one at a time, and the fingerprints of the games seen so
+far are moved to a temporary database on disk when there are many of them, so
+large collections can be processed in bounded memory.
+
+This demonstrates the game_fingerprints module.
+
+"""
+
+import os
+import sys
+from optparse import OptionParser
+
+from gomill import game_fingerprints
+
+
+def find_sgf_files(pathnames):
+    """Expand directory names to the SGF files they contain."""
+    result = []
+    for pathname in pathnames:
+        if not os.path.isdir(pathname):
+            result.append(pathname)
+            continue
+        for dirpath, dirnames, filenames in os.walk(pathname):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(".sgf"):
+                    result.append(os.path.join(dirpath, filename))
+    return result
+
+def format_location(location):
+    pathname, game_number = location
+    if game_number is None:
+        return pathname
+    return "%s (game %d)" % (pathname, game_number + 1)
+
+def find_duplicate_games(pathnames, output_pathname=None, quiet=False):
+    pathnames = find_sgf_files(pathnames)
+    if output_pathname is not None:
+        finder = game_fingerprints.write_deduplicated_collection(
+            pathnames, output_pathname)
+    else:
+        finder = game_fingerprints.Duplicate_finder(
+            record_duplicates=not quiet)
+        for pathname in pathnames:
+            finder.add_file(pathname)
+        finder.close()
+    for location, original in finder.duplicates:
+        print "%s duplicates %s" % (
+            format_location(location), format_location(original))
+    for location, message in finder.errors:
+        print >>sys.stderr, "%s: %s" % (format_location(location), message)
+    print "%d games, %d duplicates" % (
+        finder.game_count, finder.duplicate_count)
+
+
+_description = """\
+Report duplicate games (including rotations, reflections, and colour-swapped
+versions) in SGF files. Directories are searched for .sgf files.
+"""
+
+def main(argv):
+    parser = OptionParser(usage="%prog [options] <filename or dir>...",
+                          description=_description)
+    parser.add_option("--output", "-o", metavar="FILE",
+                      help="write an SGF collection without the duplicates "
+                      "to FILE")
+    parser.add_option("--quiet", "-q", action="store_true",
+                      help="report only the number of duplicates")
+    opts, args = parser.parse_args(argv)
+    if not args:
+        parser.error("not enough arguments")
+    try:
+        find_duplicate_games(args, opts.output, opts.quiet)
+    except Exception, e:
+        print >>sys.stderr, "find_duplicate_games:", str(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
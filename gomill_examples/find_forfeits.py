@@ -4,6 +4,7 @@ This demonstrates retrieving and processing results from a tournament.
 
 """
 
+import os
 import sys
 from optparse import OptionParser
 
@@ -25,6 +26,20 @@ def find_forfeits(ringmaster):
                 filename = ringmaster.get_sgf_filename(result.game_id)
                 show_result(matchup, result, filename)
 
+def find_forfeits_in_database(ringmaster):
+    # This uses the results database's index, so it doesn't need to load all
+    # the results.
+    tournament_results = ringmaster.get_database_tournament_results()
+    try:
+        for matchup_id in tournament_results.get_matchup_ids():
+            matchup = tournament_results.get_matchup(matchup_id)
+            for result in tournament_results.find_results(
+                    matchup_id, is_forfeit=True):
+                filename = ringmaster.get_sgf_filename(result.game_id)
+                show_result(matchup, result, filename)
+    finally:
+        tournament_results.close()
+
 
 _description = """\
 Read results of a tournament and show all forfeited games.
@@ -41,7 +56,10 @@ def main(argv):
     ctl_pathname = args[0]
     try:
         ringmaster = Ringmaster(ctl_pathname)
-        find_forfeits(ringmaster)
+        if os.path.exists(ringmaster.results_db_pathname):
+            find_forfeits_in_database(ringmaster)
+        else:
+            find_forfeits(ringmaster)
     except RingmasterError, e:
         print >>sys.stderr, "ringmaster:"
         print >>sys.stderr, e
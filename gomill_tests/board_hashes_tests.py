@@ -0,0 +1,75 @@
+"""Tests for board_hashes.py."""
+
+from gomill_tests import gomill_test_support
+
+from gomill import boards
+from gomill import board_hashes
+from gomill import sgf_grammar
+from gomill import sgf_moves
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def test_transform_point(tc):
+    images = set(board_hashes.transform_point(1, 2, 9, symmetry)
+                 for symmetry in range(board_hashes.NUMBER_OF_SYMMETRIES))
+    tc.assertEqual(images, set([(1, 2), (2, 1), (7, 2), (2, 7),
+                                (1, 6), (6, 1), (7, 6), (6, 7)]))
+    tc.assertEqual(board_hashes.transform_point(1, 2, 9, 0), (1, 2))
+
+def test_position_hash(tc):
+    b1 = boards.Board(9)
+    b1.play(2, 3, 'b')
+    b1.play(4, 4, 'w')
+    b2 = boards.Board(9)
+    b2.play(4, 4, 'w')
+    b2.play(2, 3, 'b')
+    b3 = boards.Board(9)
+    b3.play(3, 2, 'b')
+    b3.play(4, 4, 'w')
+    b4 = boards.Board(9)
+    b4.play(2, 3, 'w')
+    b4.play(4, 4, 'b')
+    h = board_hashes.position_hash
+    tc.assertEqual(h(b1), h(b2))
+    tc.assertNotEqual(h(b1), h(b3))
+    tc.assertNotEqual(h(b1), h(b4))
+    tc.assertEqual(h(b1, symmetric=True), h(b3, symmetric=True))
+    tc.assertNotEqual(h(b1, symmetric=True), h(b4, symmetric=True))
+    tc.assertNotEqual(h(boards.Board(9)), h(boards.Board(13)))
+    tc.assertEqual(h(b1), board_hashes.get_symmetry_hashes(b1)[0])
+    tc.assertTrue(0 <= h(b1) < 2**64)
+
+def test_game_position_hashes(tc):
+    def hashes(s, symmetric=False):
+        size, setup, moves = sgf_moves.get_compact_setup_and_moves(
+            sgf_grammar.parse_sgf_game(s))
+        return list(board_hashes.game_position_hashes(
+            size, setup, moves, symmetric))
+
+    # Capture, then pass, then a move on an occupied point
+    game = "(;SZ[5];B[ba];W[aa];B[ab];W[];B[cc];W[ba])"
+    result = hashes(game)
+    tc.assertEqual([move_number for (move_number, _) in result],
+                   [1, 2, 3, 5])
+    b = boards.Board(5)
+    b.play(4, 1, 'b')
+    b.play(3, 0, 'b')
+    tc.assertEqual(result[2][1], board_hashes.position_hash(b))
+    b.play(2, 2, 'b')
+    tc.assertEqual(result[3][1], board_hashes.position_hash(b))
+
+    sym_result = hashes(game, symmetric=True)
+    tc.assertEqual(sym_result[3][1],
+                   board_hashes.position_hash(b, symmetric=True))
+    tc.assertEqual(hashes("(;SZ[5];B[ab];W[aa];B[ba];W[];B[cc])", True),
+                   sym_result)
+
+    setup_result = hashes("(;SZ[5]AB[ba][ab]AW[aa];B[cc])")
+    tc.assertEqual([move_number for (move_number, _) in setup_result],
+                   [0, 1])
+    tc.assertEqual(setup_result[1][1], result[3][1])
+
+    # Repeated position is reported once
+    tc.assertEqual(len(hashes("(;SZ[5];B[aa];W[ba];B[ab];W[aa];B[ba])")), 3)
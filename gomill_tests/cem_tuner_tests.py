@@ -15,6 +15,7 @@ from gomill.competitions import (
 from gomill.gtp_controller import Engine_description
 
 from gomill_tests import gomill_test_support
+from gomill_tests import competition_test_support
 
 def make_tests(suite):
     suite.addTests(gomill_test_support.make_simple_tests(globals()))
@@ -257,3 +258,80 @@ def test_random_candidate_colour(tc):
 
     tc.assertEqual(comp.wins, [1, 0, 0, 0])
 
+
+def test_play_asynchronous(tc):
+    config = default_config()
+    config['asynchronous'] = True
+    config['number_of_generations'] = 2
+    comp = cem_tuners.Cem_tuner('cemtest')
+    comp.initialise_from_control_file(config)
+    history = []
+    comp.set_history_logger(history.append)
+    comp.set_clean_status()
+    random.seed(1003)
+
+    jobs = [comp.get_game() for _ in xrange(4)]
+    tc.assertEqual([job.game_id for job in jobs],
+                   ['g0#0r0', 'g0#0r1', 'g0#0r2', 'g0#1r0'])
+    tc.assertItemsEqual(comp.candidates.keys(), [0, 1])
+
+    def process(job, winner):
+        comp.process_game_result(
+            competition_test_support.fake_response(job, winner))
+
+    # candidate 0 wins all its games
+    for job in jobs[:3]:
+        process(job, 'w')
+    tc.assertItemsEqual(comp.candidates.keys(), [1])
+    tc.assertEqual(len(comp.completed), 1)
+    tc.assertEqual(comp.completed[0][:3], (3, 0, 0))
+
+    comp2 = cem_tuners.Cem_tuner('cemtest')
+    comp2.initialise_from_control_file(config)
+    comp2.set_status(pickle.loads(pickle.dumps(comp.get_status())))
+    tc.assertEqual(comp2.next_candidate_number, 2)
+    tc.assertEqual(comp2.get_game().game_id, 'g0#1r0')
+
+    # Play the rest of the event, with up to three games in progress; the last
+    # candidate is sampled from the updated distribution.
+    outstanding = [jobs[3]]
+    while True:
+        job = comp.get_game()
+        if job is cem_tuners.NoGameAvailable:
+            break
+        outstanding.append(job)
+        if len(outstanding) > 2:
+            process(outstanding.pop(0), 'b')
+    tc.assertEqual(comp.generation, 1)
+    tc.assertEqual(outstanding[-1].game_id, 'g1#7r2')
+    tc.assertEqual(history[0], "Generation 0")
+    tc.assertRegexpMatches(history[2], r"^g0#0\*")
+    tc.assertEqual(len(history[2].split("\n")), 4)
+    for job in outstanding:
+        process(job, 'b')
+    tc.assertEqual(comp.generation, 2)
+    tc.assertEqual(comp.candidates, {})
+    tc.assertIs(comp.get_game(), cem_tuners.NoGameAvailable)
+    competition_test_support.check_screen_report(tc, comp, """\
+generation 2
+
+candidates completed for this generation: 0/4
+wins from candidates in progress:
+
+
+final distribution:
+%s
+""" % comp.format_distribution(comp.distribution))
+
+def test_asynchronous_status_mismatch(tc):
+    comp = cem_tuners.Cem_tuner('cemtest')
+    comp.initialise_from_control_file(default_config())
+    comp.set_clean_status()
+    config = default_config()
+    config['asynchronous'] = True
+    comp2 = cem_tuners.Cem_tuner('cemtest')
+    comp2.initialise_from_control_file(config)
+    with tc.assertRaises(CompetitionError) as ar:
+        comp2.set_status(pickle.loads(pickle.dumps(comp.get_status())))
+    tc.assertEqual(str(ar.exception),
+                   "status file is inconsistent with control file")
@@ -93,6 +93,9 @@ def test_grouped(tc):
         ('my', 10),
         ])
     tc.assertFalse(sc.all_fixed())
+    tc.assertFalse(sc.is_group_fixed('mz'))
     for token in issued:
         sc.fix(*token)
     tc.assertTrue(sc.all_fixed())
+    tc.assertTrue(sc.is_group_fixed('mz'))
+    tc.assertFalse(sc.is_group_fixed('my'))
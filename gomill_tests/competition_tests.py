@@ -151,6 +151,44 @@ def test_player_startup_gtp_commands(tc):
                        [("xyzzy", ["test"]),
                         ("foo", ["bar", "baz"])])
 
+def test_player_resources(tc):
+    comp = competitions.Competition('test')
+    config = {
+        'players' : {
+            't1' : Player_config("test"),
+            't2' : Player_config("test", threads=8, memory=2048),
+            }
+        }
+    comp.initialise_from_control_file(config)
+    tc.assertEqual(comp.players['t1'].threads, 1)
+    tc.assertIsNone(comp.players['t1'].memory)
+    tc.assertEqual(comp.players['t2'].threads, 8)
+    tc.assertEqual(comp.players['t2'].memory, 2048)
+    config['players']['t3'] = Player_config("test", threads=0)
+    tc.assertRaisesRegexp(
+        ControlFileError, "player t3: 'threads': must be positive",
+        comp.initialise_from_control_file, config)
+
+def test_player_resource_limits(tc):
+    comp = competitions.Competition('test')
+    config = {
+        'players' : {
+            't1' : Player_config("test"),
+            't2' : Player_config("test", memory_limit=1024, cpu_time_limit=600,
+                                 open_files_limit=64, process_limit=10),
+            }
+        }
+    comp.initialise_from_control_file(config)
+    tc.assertEqual(comp.players['t1'].get_resource_limits(), [])
+    tc.assertEqual(comp.players['t2'].memory_limit, 1024)
+    tc.assertEqual(comp.players['t2'].cpu_time_limit, 600)
+    tc.assertEqual(comp.players['t2'].open_files_limit, 64)
+    tc.assertEqual(comp.players['t2'].process_limit, 10)
+    config['players']['t3'] = Player_config("test", cpu_time_limit=-1)
+    tc.assertRaisesRegexp(
+        ControlFileError, "player t3: 'cpu_time_limit': must be positive",
+        comp.initialise_from_control_file, config)
+
 def test_player_gtp_aliases(tc):
     comp = competitions.Competition('test')
     config = {
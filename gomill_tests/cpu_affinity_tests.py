@@ -0,0 +1,88 @@
+"""Tests for cpu_affinity.py."""
+
+from __future__ import with_statement
+
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import cpu_affinity
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+def test_parse_cpu_list(tc):
+    pcl = cpu_affinity.parse_cpu_list
+    tc.assertEqual(pcl("0"), [0])
+    tc.assertEqual(pcl("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11])
+    tc.assertEqual(pcl("5,2,2-3"), [2, 3, 5])
+    tc.assertEqual(pcl(""), [])
+    tc.assertRaises(ValueError, pcl, "x")
+    tc.assertRaises(ValueError, pcl, "1-")
+
+def test_allocate_cpu_slots(tc):
+    acs = cpu_affinity.allocate_cpu_slots
+    tc.assertEqual(acs([0, 1, 2, 3, 4], 2), [[0, 1], [2, 3]])
+    tc.assertEqual(acs([0, 1, 2], 1), [[0], [1], [2]])
+    tc.assertEqual(acs([0, 1, 2], 4), [])
+    tc.assertEqual(acs([], 1), [])
+
+def test_allocate_cpu_slots_topology(tc):
+    acs = cpu_affinity.allocate_cpu_slots
+    # Two nodes, each with two cores with two hyperthreads.
+    # CPUs n and n+4 share a core.
+    topology = {}
+    for cpu in range(8):
+        topology[cpu] = (cpu % 4 // 2, cpu % 4 // 2, cpu % 2)
+    cpus = range(8)
+    tc.assertEqual(acs(cpus, 1, topology),
+                   [[0], [4], [1], [5], [2], [6], [3], [7]])
+    tc.assertEqual(acs(cpus, 2, topology), [[0, 4], [1, 5], [2, 6], [3, 7]])
+    tc.assertEqual(acs(cpus, 3, topology), [[0, 1, 4], [2, 3, 6]])
+    tc.assertEqual(acs(cpus, 4, topology), [[0, 1, 4, 5], [2, 3, 6, 7]])
+    # Slots which don't fit in a node may span nodes
+    tc.assertEqual(acs(cpus, 5, topology), [[0, 1, 2, 4, 5]])
+    tc.assertEqual(acs([0, 1, 2, 3, 4, 6], 3, topology),
+                   [[0, 1, 4], [2, 3, 6]])
+
+def test_get_cpu_topology(tc):
+    root = tc.sandbox()
+    def write(pathname, contents):
+        pathname = os.path.join(root, pathname)
+        dirname = os.path.dirname(pathname)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(pathname, "w") as f:
+            f.write(contents)
+    write("node/node0/cpulist", "0,2\n")
+    write("node/node1/cpulist", "1,3\n")
+    write("node/possible", "0-1\n")
+    for cpu in range(4):
+        write("cpu/cpu%d/topology/physical_package_id" % cpu,
+              "%d\n" % (cpu % 2))
+        write("cpu/cpu%d/topology/core_id" % cpu, "%d\n" % (cpu // 2))
+    write("cpu/cpu4/online", "1\n")
+    write("cpu/online", "0-4\n")
+    tc.assertEqual(cpu_affinity.get_cpu_topology(root), {
+        0 : (0, 0, 0),
+        1 : (1, 1, 0),
+        2 : (0, 0, 1),
+        3 : (1, 1, 1),
+        4 : (0, 0, 0),
+        })
+    tc.assertEqual(
+        cpu_affinity.get_cpu_topology(os.path.join(root, "nonexistent")), {})
+
+def test_get_and_set_affinity(tc):
+    if not cpu_affinity.is_supported():
+        tc.skipTest("CPU affinity not supported")
+    original = cpu_affinity.get_affinity()
+    tc.assertTrue(original)
+    try:
+        cpu_affinity.set_affinity(original[:1])
+        tc.assertEqual(cpu_affinity.get_affinity(), original[:1])
+    finally:
+        cpu_affinity.set_affinity(original)
+    tc.assertEqual(cpu_affinity.get_affinity(), original)
+    tc.assertRaises(OSError, cpu_affinity.set_affinity, [])
+    tc.assertRaises(OSError, cpu_affinity.set_affinity, [5000])
@@ -0,0 +1,118 @@
+"""Tests for game_fingerprints.py."""
+
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import game_fingerprints
+from gomill import sgf_grammar
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def fingerprint(s):
+    return game_fingerprints.fingerprint_coarse_game(
+        sgf_grammar.parse_sgf_game(s))
+
+def write_file(pathname, contents):
+    f = open(pathname, "wb")
+    f.write(contents)
+    f.close()
+
+def test_fingerprint(tc):
+    fp = fingerprint("(;SZ[9];B[cc];W[gg];B[ce];W[])")
+    tc.assertEqual(len(fp), 40)
+    # Same game with different properties and comments
+    tc.assertEqual(
+        fingerprint("(;SZ[9]PB[x]C[hello];B[cc]C[a];W[gg];B[ce];W[tt])"), fp)
+    # Rotated
+    tc.assertEqual(fingerprint("(;SZ[9];B[gc];W[cg];B[ec];W[])"), fp)
+    # Reflected
+    tc.assertEqual(fingerprint("(;SZ[9];B[cg];W[gc];B[ce];W[])"), fp)
+    # Colours swapped
+    tc.assertEqual(fingerprint("(;SZ[9];W[cc];B[gg];W[ce];B[])"), fp)
+    # Different moves, order, size, or length
+    tc.assertNotEqual(fingerprint("(;SZ[9];B[cc];W[gg];B[dd];W[])"), fp)
+    tc.assertNotEqual(fingerprint("(;SZ[9];B[ce];W[gg];B[cc];W[])"), fp)
+    tc.assertNotEqual(fingerprint("(;SZ[19];B[cc];W[gg];B[ce];W[])"), fp)
+    tc.assertNotEqual(fingerprint("(;SZ[9];B[cc];W[gg];B[ce])"), fp)
+
+def test_fingerprint_setup(tc):
+    fp = fingerprint("(;SZ[9]AB[cc][gg];W[ee])")
+    tc.assertEqual(fingerprint("(;SZ[9]AB[gg][cc];W[ee])"), fp)
+    tc.assertEqual(fingerprint("(;SZ[9]AB[cg][gc];W[ee])"), fp)
+    tc.assertEqual(fingerprint("(;SZ[9]AW[cc][gg];B[ee])"), fp)
+    tc.assertNotEqual(fingerprint("(;SZ[9]AB[cc][gg];W[ef])"), fp)
+    tc.assertNotEqual(fingerprint("(;SZ[9]AB[cc]AW[gg];W[ee])"), fp)
+
+def test_fingerprint_from_moves(tc):
+    tc.assertEqual(
+        game_fingerprints.fingerprint_from_moves(
+            9, [('b', (6, 2)), ('b', (2, 6))], [('w', (4, 4)), ('b', None)]),
+        fingerprint("(;SZ[9]AB[cc][gg];W[ee];B[])"))
+
+def test_duplicate_finder(tc):
+    pathname1 = os.path.join(tc.sandbox(), "one.sgf")
+    pathname2 = os.path.join(tc.sandbox(), "two.sgf")
+    game1 = "(;SZ[9];B[cc];W[gg])"
+    game2 = "(;SZ[9];B[gg];W[cc])"
+    game3 = "(;SZ[9];B[ee];W[gg])"
+    write_file(pathname1, game1 + game3)
+    write_file(pathname2, "junk " + game2 + "(;SZ[9];B[zz])" + game1)
+
+    finder = game_fingerprints.Duplicate_finder()
+    finder.add_file(pathname1)
+    finder.add_file(pathname2)
+    finder.add_file(os.path.join(tc.sandbox(), "nonexistent.sgf"))
+    tc.assertEqual(finder.game_count, 4)
+    tc.assertEqual(finder.duplicate_count, 2)
+    tc.assertEqual(finder.duplicates, [
+        ((pathname2, 0), (pathname1, 0)),
+        ((pathname2, 2), (pathname1, 0)),
+        ])
+    tc.assertEqual(len(finder.errors), 2)
+    tc.assertEqual(finder.errors[0], ((pathname2, 1), "can't extract moves"))
+    tc.assertEqual(finder.errors[1][0],
+                   (os.path.join(tc.sandbox(), "nonexistent.sgf"), None))
+
+    output_pathname = os.path.join(tc.sandbox(), "out.sgf")
+    finder = game_fingerprints.write_deduplicated_collection(
+        [pathname1, pathname2], output_pathname)
+    tc.assertEqual(finder.duplicate_count, 2)
+    tc.assertEqual(finder.duplicates, [])
+    f = open(output_pathname)
+    tc.assertEqual(f.read(),
+                   game1 + "\n" + game3 + "\n" + "(;SZ[9];B[zz])\n")
+    f.close()
+
+def test_duplicate_finder_database(tc):
+    cls = game_fingerprints.Duplicate_finder
+    tc.addCleanup(setattr, cls, 'max_in_memory', cls.max_in_memory)
+    cls.max_in_memory = 2
+    games = ["(;SZ[9];B[%s])" % (c * 2) for c in "abcde"]
+    fps = [fingerprint(game) for game in games]
+    finder = game_fingerprints.Duplicate_finder()
+    for i, fp in enumerate(fps):
+        tc.assertIsNone(finder.add_fingerprint(fp, ("one.sgf", i)))
+    tc.assertIsNotNone(finder._db)
+    tc.assertTrue(len(finder._first_seen) < 2)
+    # Found in the database
+    tc.assertEqual(finder.add_fingerprint(fps[0], ("two.sgf", 0)),
+                   ("one.sgf", 0))
+    # Found in memory
+    tc.assertEqual(finder.add_fingerprint(fps[4], ("two.sgf", None)),
+                   ("one.sgf", 4))
+    tc.assertEqual(finder.add_fingerprint(
+        fingerprint("(;SZ[9];B[ba])"), ("two.sgf", 2)), None)
+    tc.assertEqual(finder.add_fingerprint(
+        fingerprint("(;SZ[9];B[ba])"), ("three.sgf", None)), ("two.sgf", 2))
+    tc.assertEqual(finder.game_count, 9)
+    tc.assertEqual(finder.duplicate_count, 3)
+    tc.assertEqual(finder.duplicates, [
+        (("two.sgf", 0), ("one.sgf", 0)),
+        (("two.sgf", None), ("one.sgf", 4)),
+        (("three.sgf", None), ("two.sgf", 2)),
+        ])
+    finder.close()
+    tc.assertIsNone(finder._db)
@@ -3,9 +3,13 @@
 from __future__ import with_statement
 
 import os
+import signal
+import sys
 from textwrap import dedent
 
+from gomill import game_fingerprints
 from gomill import game_jobs
+from gomill import sgf_grammar
 from gomill.job_manager import JobFailed
 
 from gomill_tests import gomill_test_support
@@ -32,9 +36,9 @@ class Test_game_job(game_jobs.Game_job):
         self._sgf_written = None
         self._mkdir_pathname = None
 
-    def _write_sgf(self, pathname, sgf_string):
+    def _write_sgf(self, pathname, sgf_game):
         self._sgf_pathname_written = pathname
-        self._sgf_written = sgf_string
+        self._sgf_written = sgf_game.serialise()
 
     def _ensure_dir(self, pathname):
         self._mkdir_pathname = pathname
@@ -127,6 +131,33 @@ def test_player_copy(tc):
     tc.assertEqual(p2.code, "clone")
     tc.assertEqual(p2.cmd_args, ['testb', 'id=one'])
     tc.assertIsNot(p1.cmd_args, p2.cmd_args)
+    p1.threads = 2
+    p1.memory = 300
+    p1.memory_limit = 512
+    p1.cpu_time_limit = 60
+    p3 = p1.copy("clone2")
+    tc.assertEqual(p3.threads, 2)
+    tc.assertEqual(p3.memory, 300)
+    tc.assertEqual(p3.memory_limit, 512)
+    tc.assertEqual(p3.cpu_time_limit, 60)
+    tc.assertIsNone(p3.open_files_limit)
+
+def test_player_resource_limits(tc):
+    player = game_jobs.Player()
+    tc.assertEqual(player.get_resource_limits(), [])
+    tc.assertIsNone(player.describe_resource_limits())
+    player.memory_limit = 512
+    player.cpu_time_limit = 60
+    player.open_files_limit = 100
+    player.process_limit = 20
+    tc.assertEqual(player.get_resource_limits(), [
+        ('RLIMIT_AS', 512 * 1024 * 1024),
+        ('RLIMIT_CPU', 60),
+        ('RLIMIT_NOFILE', 100),
+        ('RLIMIT_NPROC', 20),
+        ])
+    tc.assertEqual(player.describe_resource_limits(),
+                   "memory 512MB, CPU time 60s, open files 100, processes 20")
 
 def test_game_job(tc):
     fx = Game_job_fixture(tc)
@@ -140,10 +171,16 @@ def test_game_job(tc):
     tc.assertEqual(result.game_id, 'gameid')
     tc.assertEqual(result.game_result.game_id, 'gameid')
     tc.assertEqual(result.game_data, 'gamedata')
+    tc.assertEqual(
+        result.game_result.fingerprint,
+        game_fingerprints.fingerprint_coarse_game(
+            sgf_grammar.parse_sgf_game(fx.job._sgf_written)))
     tc.assertEqual(result.warnings, [])
     tc.assertEqual(result.log_entries, [])
     tc.assertIsNone(result.engine_descriptions['one'].get_short_description())
     tc.assertIsNone(result.engine_descriptions['two'].get_short_description())
+    tc.assertEqual(sorted(result.move_times), ['one', 'two'])
+    tc.assertEqual(len(result.move_times['one']), 10)
     channel = fx.get_channel('one')
     tc.assertIsNone(channel.requested_stderr)
     tc.assertIsNone(channel.requested_cwd)
@@ -257,6 +294,54 @@ def test_game_job_channel_error(tc):
     )
     """))
 
+def test_game_job_resource_limits(tc):
+    fx = Game_job_fixture(tc)
+    fx.job.player_b.memory_limit = 100
+    fx.job.run()
+    tc.assertEqual(fx.get_channel('one').requested_resource_limits,
+                   [('RLIMIT_AS', 100 * 1024 * 1024)])
+    tc.assertIsNone(fx.get_channel('two').requested_resource_limits)
+
+def test_game_job_cpu_time_limit_forfeit(tc):
+    def exceed_cpu_limit(channel):
+        channel.fail_command = 'genmove'
+        channel.forced_exit_status = signal.SIGXCPU
+    fx = Game_job_fixture(tc)
+    fx.job.player_w.cpu_time_limit = 30
+    fx.init_player('w', exceed_cpu_limit)
+    result = fx.job.run()
+    tc.assertEqual(result.game_result.sgf_result, "B+F")
+    tc.assertEqual(result.game_result.winning_player, 'one')
+    tc.assertEqual(result.game_result.game_id, 'gameid')
+    tc.assertEqual(
+        result.game_result.detail,
+        "forfeit by two: exceeded CPU time limit (30 seconds)")
+    tc.assertEqual(
+        result.warnings,
+        ["forfeit by two: exceeded CPU time limit (30 seconds)"])
+    tc.assertEqual(fx.job._sgf_pathname_written, '/sgf/test.games/gjtest.sgf')
+
+def test_game_job_resource_limit_void(tc):
+    # An engine with limits which dies some other way makes the game void
+    # (the mock channel reports 567 seconds CPU time for player two)
+    def killed(channel):
+        channel.fail_command = 'genmove'
+        channel.forced_exit_status = signal.SIGKILL
+    fx = Game_job_fixture(tc)
+    fx.job.player_w.cpu_time_limit = 1000
+    fx.job.player_w.memory_limit = 512
+    fx.init_player('w', killed)
+    with tc.assertRaises(JobFailed) as ar:
+        fx.job.run()
+    tc.assertEqual(str(ar.exception),
+                   "aborting game due to error:\n"
+                   "transport error sending 'genmove w' to player two:\n"
+                   "forced failure for send_command_line\n"
+                   "player two: engine was killed by signal %d "
+                   "(resource limits: memory 512MB, CPU time 1000s)"
+                   % signal.SIGKILL)
+    tc.assertEqual(fx.job._sgf_pathname_written, '/sgf/test.void/gjtest.sgf')
+
 def test_game_job_late_errors(tc):
     def fail_close(channel):
         channel.fail_close = True
@@ -318,6 +403,76 @@ def test_game_job_late_error_from_void_game(tc):
     )
     """))
 
+def test_game_job_return_sgf(tc):
+    fx = Game_job_fixture(tc)
+    fx.job.return_sgf = True
+    result = fx.job.run()
+    tc.assertIsNone(fx.job._sgf_pathname_written)
+    sgf_string = gomill_test_support.scrub_sgf(result.sgf_string)
+    fx = Game_job_fixture(tc)
+    result = fx.job.run()
+    tc.assertIsNone(result.sgf_string)
+    tc.assertMultiLineEqual(sgf_string, fx.job._get_sgf_written())
+
+def test_game_job_live_sgf(tc):
+    fx = Game_job_fixture(tc)
+    fx.job.sgf_note = "test sgf_note"
+    fx.job.run()
+    expected = fx.job._get_sgf_written()
+    fx = Game_job_fixture(tc)
+    fx.job.sgf_note = "test sgf_note"
+    fx.job.sgf_dirname = tc.sandbox()
+    fx.job.live_sgf = True
+    result = fx.job.run()
+    tc.assertEqual(result.game_result.sgf_result, "B+10.5")
+    tc.assertIsNone(fx.job._sgf_pathname_written)
+    tc.assertEqual(os.listdir(tc.sandbox()), ["gjtest.sgf"])
+    with open(os.path.join(tc.sandbox(), "gjtest.sgf")) as f:
+        s = f.read()
+    tc.assertMultiLineEqual(
+        gomill_test_support.scrub_sgf(
+            sgf_grammar.serialise_game_tree(sgf_grammar.parse_sgf_game(s))),
+        expected)
+
+def test_game_job_live_sgf_void(tc):
+    def fail_first_genmove(channel):
+        channel.fail_command = 'genmove'
+    fx = Game_job_fixture(tc)
+    fx.init_player('w', fail_first_genmove)
+    fx.job.sgf_dirname = tc.sandbox()
+    fx.job.void_sgf_dirname = tc.sandbox('void')
+    fx.job.live_sgf = True
+    tc.assertRaises(JobFailed, fx.job.run)
+    tc.assertEqual(os.listdir(tc.sandbox()), [])
+    with open(os.path.join(tc.sandbox('void'), "gjtest.sgf")) as f:
+        s = f.read()
+    # The root node is padded to fill the header area
+    header, body = s[:4096], s[4096:]
+    tc.assertEqual(header[-1], "\n")
+    tc.assertMultiLineEqual(
+        gomill_test_support.scrub_sgf(header.rstrip()),
+        "(;FF[4]AP[gomill:VER]C[Game id gameid\nDate ***\n"
+        "Black one\nWhite two]CA[UTF-8]DT[***]GM[1]GN[gameid]KM[7.5]"
+        "PB[one]PW[two]RE[Void]SZ[9]")
+    tc.assertMultiLineEqual(body, dedent("""\
+    ;B[ei]C[aborting game due to error:
+    transport error sending 'genmove w' to player two:
+    forced failure for send_command_line]
+    )
+    """))
+
+def test_game_job_live_sgf_void_no_moves(tc):
+    def fail_first_genmove(channel):
+        channel.fail_command = 'genmove'
+    fx = Game_job_fixture(tc)
+    fx.init_player('b', fail_first_genmove)
+    fx.job.sgf_dirname = tc.sandbox()
+    fx.job.void_sgf_dirname = tc.sandbox('void')
+    fx.job.live_sgf = True
+    tc.assertRaises(JobFailed, fx.job.run)
+    tc.assertEqual(os.listdir(tc.sandbox()), [])
+    tc.assertEqual(os.listdir(tc.sandbox('void')), [])
+
 def test_game_job_cwd_env(tc):
     fx = Game_job_fixture(tc)
     fx.job.player_b.cwd = "/nonexistent_directory"
@@ -396,6 +551,10 @@ def test_game_job_handicap(tc):
     result = fx.job.run()
     # area score 53, less 7.5 komi, less 3 handicap compensation
     tc.assertEqual(result.game_result.sgf_result, "B+42.5")
+    tc.assertEqual(
+        result.game_result.fingerprint,
+        game_fingerprints.fingerprint_coarse_game(
+            sgf_grammar.parse_sgf_game(fx.job._sgf_written)))
 
 def test_game_job_zero_move_game(tc):
     fx = Game_job_fixture(tc)
@@ -761,3 +920,49 @@ def test_check_player_channel_error_on_close(tc):
     tc.assertEqual(game_jobs.check_player(fx.check),
                    ["error closing test:\nforced failure for close"])
 
+def test_get_player_check_key(tc):
+    fx = Player_check_fixture(tc)
+    fx.player.cmd_args = ['/nonexistent/engine']
+    tc.assertIsNone(game_jobs.get_player_check_key(fx.check))
+    fx.player.cmd_args = [sys.executable, 'id=test']
+    key = game_jobs.get_player_check_key(fx.check)
+    tc.assertIsInstance(key, str)
+    tc.assertEqual(game_jobs.get_player_check_key(fx.check), key)
+    fx.player.cmd_args = [os.path.basename(sys.executable), 'id=test']
+    fx.player.environ = {'PATH' : os.path.dirname(sys.executable)}
+    key2 = game_jobs.get_player_check_key(fx.check)
+    tc.assertIsNotNone(key2)
+    tc.assertNotEqual(key2, key)
+    fx.check.komi = 6.5
+    key3 = game_jobs.get_player_check_key(fx.check)
+    tc.assertNotEqual(key3, key2)
+    fx.player.memory_limit = 100
+    tc.assertNotEqual(game_jobs.get_player_check_key(fx.check), key3)
+
+def test_get_player_check_key_script(tc):
+    # Files named in the command line are covered too
+    fx = Player_check_fixture(tc)
+    sandbox = tc.sandbox()
+    with open(os.path.join(sandbox, "bot.py"), "w") as f:
+        f.write("pass\n")
+    fx.player.cmd_args = [sys.executable, 'bot.py', 'id=test']
+    fx.player.cwd = sandbox
+    key = game_jobs.get_player_check_key(fx.check)
+    tc.assertIsNotNone(key)
+    with open(os.path.join(sandbox, "bot.py"), "w") as f:
+        f.write("pass # edited\n")
+    tc.assertNotEqual(game_jobs.get_player_check_key(fx.check), key)
+
+def test_get_player_check_key_environment(tc):
+    # Unrelated environment variables don't affect the key
+    fx = Player_check_fixture(tc)
+    fx.player.cmd_args = [sys.executable, 'id=test']
+    key = game_jobs.get_player_check_key(fx.check)
+    os.environ['GOMILL_TEST_UNRELATED'] = 'x'
+    try:
+        tc.assertEqual(game_jobs.get_player_check_key(fx.check), key)
+    finally:
+        del os.environ['GOMILL_TEST_UNRELATED']
+    fx.player.environ = {'GOMILL_TEST' : 'gomill'}
+    tc.assertNotEqual(game_jobs.get_player_check_key(fx.check), key)
+
@@ -755,6 +755,23 @@ def test_subprocess_channel_nonexistent_program(tc):
         gtp_controller.Subprocess_gtp_channel(["/nonexistent/program"])
     tc.assertIn("[Errno 2] No such file or directory", str(ar.exception))
 
+def test_subprocess_channel_resource_limits(tc):
+    if gtp_controller.resource is None:
+        tc.skipTest("resource limits not supported")
+    fx = gtp_engine_fixtures.State_reporter_fixture(tc)
+    channel = gtp_controller.Subprocess_gtp_channel(
+        fx.cmd, stderr=fx.devnull,
+        resource_limits=[('RLIMIT_NOFILE', 64), ('RLIMIT_CPU', 60)])
+    channel.send_command("tell", [])
+    tc.assertEqual(channel.get_response()[0], False)
+    channel.close()
+    tc.assertEqual(channel.exit_status, 0)
+    with tc.assertRaises(GtpChannelError) as ar:
+        gtp_controller.Subprocess_gtp_channel(
+            fx.cmd, resource_limits=[('RLIMIT_NONSENSE', 1)])
+    tc.assertEqual(str(ar.exception),
+                   "resource limit RLIMIT_NONSENSE is not supported")
+
 def test_subprocess_channel_with_controller(tc):
     # Also tests that leaving 'env' and 'cwd' unset works
     fx = gtp_engine_fixtures.State_reporter_fixture(tc)
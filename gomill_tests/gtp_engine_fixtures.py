@@ -310,21 +310,27 @@ class Mock_subprocess_gtp_channel(
         requested_stderr
         requested_cwd
         requested_env
+        requested_resource_limits
+        forced_exit_status -- int or None
 
     After close(), provides mocked-up exit_status and resource_usage, like a
     Subprocess_gtp_channel. The cpu time used is a function of command[0]
-    ('testb' gives user/system 546/0.2; 'testw' gives 567/0.2).
+    ('testb' gives user/system 546/0.2; 'testw' gives 567/0.2). The exit
+    status is 0 unless forced_exit_status is set.
 
     """
     engine_registry = {}
     callback_registry = {}
     channels = {}
 
-    def __init__(self, command, stderr=None, cwd=None, env=None):
+    def __init__(self, command, stderr=None, cwd=None, env=None,
+                 resource_limits=None):
         self.requested_command = command
         self.requested_stderr = stderr
         self.requested_cwd = cwd
         self.requested_env = env
+        self.requested_resource_limits = resource_limits
+        self.forced_exit_status = None
         self.id = None
         engine = None
         callbacks = []
@@ -363,13 +369,15 @@ class Mock_subprocess_gtp_channel(
             callback(self)
 
     def close(self):
-        # Nothing looks at exit_status, but we might as well make it plausible.
         try:
             gtp_controller_test_support.Testing_gtp_channel.close(self)
         except Exception:
             self.exit_status = 1
             raise
-        self.exit_status = 0
+        if self.forced_exit_status is not None:
+            self.exit_status = self.forced_exit_status
+        else:
+            self.exit_status = 0
         fake_time = sum(map(ord, self.requested_command[0]))
         self.resource_usage = Mock_resource_usage(
             ru_utime=fake_time, ru_stime=0.2)
@@ -187,6 +187,10 @@ def test_game(tc):
         ('b', 'E9'), ('w', 'G9'),
         ('b', 'pass'), ('w', 'pass'),
         ])
+    move_times = fx.game.get_move_times()
+    tc.assertEqual(len(move_times['b']), 10)
+    tc.assertEqual(len(move_times['w']), 10)
+    tc.assertTrue(all(t >= 0.0 for t in move_times['b']))
     tc.assertEqual(fx.engine_b.commands_handled, [
         ('protocol_version', []),
         ('name', []),
@@ -990,6 +994,21 @@ def test_game_result_cpu_time_pickle_compatibility(tc):
     result2 = pickle.loads(pickle.dumps(result))
     tc.assertEqual(result2.cpu_times, {'one' : 33.5, 'two' : None})
 
+def test_game_result_fingerprint_pickle_compatibility(tc):
+    fx = Gtp_game_fixture(tc)
+    fx.game.prepare()
+    fx.game.run()
+    result = fx.game.result
+    tc.assertIsNone(result.fingerprint)
+    result.fingerprint = "abc"
+    result2 = pickle.loads(pickle.dumps(result))
+    tc.assertEqual(result2.fingerprint, "abc")
+    # Results pickled by gomill 0.8.3 and earlier have no fingerprint
+    result3 = gtp_games.Game_result.__new__(gtp_games.Game_result)
+    result3.__setstate__(result.__getstate__()[:8])
+    tc.assertIsNone(result3.fingerprint)
+    tc.assertEqual(result3.sgf_result, result.sgf_result)
+
 
 def test_cautious_mode_setting(tc):
     fx = Gtp_game_fixture(tc)
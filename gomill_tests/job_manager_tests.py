@@ -0,0 +1,146 @@
+"""Tests for job_manager.py."""
+
+from gomill import job_manager
+
+from gomill_tests import gomill_test_support
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def run_period(awl, now, jobs, work, cost, latency, busy=None, idle_cpus=4):
+    """Report jobs to an Adaptive_worker_limit, then review.
+
+    Each job is reported as starting at 'now' and finishing at now+10, with
+    samples for a single key 'p'.
+
+    Returns the result of review().
+
+    """
+    for i in xrange(jobs):
+        awl.note_job_completed(now + 10, now, work, {'p' : (cost, latency)})
+    if busy is None:
+        busy = awl.level
+    return awl.review(now + 10, busy, idle_cpus)
+
+def test_adaptive_worker_limit(tc):
+    awl = job_manager.Adaptive_worker_limit(1, 4)
+    tc.assertEqual(awl.level, 1)
+    tc.assertEqual(awl.jobs_needed(), 4)
+    awl.note_job_completed(20.0, 10.0, 100, {'p' : (1.0, 1.0)})
+    tc.assertIsNone(awl.review(20.0, 1))
+    tc.assertEqual(
+        run_period(awl, 10.0, 3, 100, 1.0, 1.0),
+        "level 1: 4 jobs, throughput 40.00/s, cost ?, latency ?: "
+        "increasing to 2")
+    tc.assertEqual(awl.level, 2)
+    tc.assertEqual(
+        run_period(awl, 20.0, 4, 50, 1.05, 1.0),
+        "level 2: 4 jobs, throughput 20.00/s, cost x1.05, latency x1.00: "
+        "no gain; reducing to 1")
+    tc.assertEqual(awl.level, 1)
+    tc.assertEqual(awl.ceiling, 1)
+    tc.assertEqual(
+        run_period(awl, 30.0, 4, 100, 1.0, 1.0),
+        "level 1: 4 jobs, throughput 40.00/s, cost x1.00, latency x1.00: "
+        "staying at 1 (maximum)")
+    tc.assertEqual(awl.history, [1, 2, 1])
+
+def test_adaptive_worker_limit_contention(tc):
+    awl = job_manager.Adaptive_worker_limit(1, 8)
+    run_period(awl, 0.0, 4, 100, 1.0, 2.0)
+    tc.assertEqual(awl.level, 2)
+    run_period(awl, 10.0, 4, 200, 1.1, 2.0)
+    tc.assertEqual(awl.level, 3)
+    tc.assertEqual(
+        run_period(awl, 20.0, 6, 150, 1.3, 2.2),
+        "level 3: 6 jobs, throughput 90.00/s, cost x1.30, latency x1.10: "
+        "contention; reducing to 2")
+    tc.assertEqual(awl.level, 2)
+    tc.assertEqual(awl.ceiling, 2)
+    tc.assertEqual(awl.history, [1, 2, 3, 2])
+
+def test_adaptive_worker_limit_holds(tc):
+    awl = job_manager.Adaptive_worker_limit(2, 3)
+    tc.assertEqual(
+        run_period(awl, 0.0, 4, 100, None, 1.0, busy=1),
+        "level 2: 4 jobs, throughput 40.00/s, cost ?, latency ?: "
+        "staying at 2 (workers not all busy)")
+    tc.assertEqual(
+        run_period(awl, 10.0, 4, 100, None, 1.0, idle_cpus=0.5),
+        "level 2: 4 jobs, throughput 40.00/s, cost ?, latency x1.00: "
+        "staying at 2 (no idle CPUs)")
+    tc.assertEqual(awl.level, 2)
+    # Jobs started before the last review don't count
+    awl.note_job_completed(25.0, 5.0, 100, {'p' : (None, 5.0)})
+    tc.assertIsNone(run_period(awl, 20.0, 3, 100, None, 1.0))
+    tc.assertEqual(
+        run_period(awl, 20.0, 1, 100, None, 1.0),
+        "level 2: 4 jobs, throughput 50.00/s, cost ?, latency x1.00: "
+        "increasing to 3")
+    tc.assertEqual(awl.history, [2, 3])
+    tc.assertRaises(ValueError, job_manager.Adaptive_worker_limit, 3, 2)
+
+
+class Recording_lock(object):
+    """Context manager which records whether it's held."""
+    def __init__(self):
+        self.held = False
+    def __enter__(self):
+        self.held = True
+    def __exit__(self, *args):
+        self.held = False
+
+class Fake_worker(object):
+    def __init__(self, worker_id, cpus, lock):
+        self.worker_id = worker_id
+        self.cpus = cpus
+        self.lock = lock
+        self.started_with_lock_held = None
+    def start(self):
+        self.started_with_lock_held = self.lock.held
+
+class Testing_job_manager(job_manager.Multiprocessing_job_manager):
+    """Multiprocessing_job_manager which doesn't start real processes."""
+    def __init__(self, number_of_workers, lock):
+        job_manager.Multiprocessing_job_manager.__init__(
+            self, number_of_workers)
+        self.lock = lock
+    def _make_worker(self, worker_id, cpus):
+        return Fake_worker(worker_id, cpus, self.lock)
+
+class Locking_job_source(object):
+    def __init__(self, lock):
+        self.lock = lock
+        self.worker_limit = None
+    def get_worker_start_lock(self):
+        return self.lock
+    def get_worker_limit(self):
+        return self.worker_limit
+    def get_worker_cpus(self, worker_id):
+        return [worker_id]
+
+def test_worker_start_lock(tc):
+    job_manager._initialise_multiprocessing()
+    if job_manager.multiprocessing is None:
+        tc.skipTest("multiprocessing not available")
+    lock = Recording_lock()
+    job_source = Locking_job_source(lock)
+    jm = Testing_job_manager(2, lock)
+    jm.workers = []
+    jm._add_workers(2, job_source)
+    job_source.worker_limit = 3
+    jm._update_number_of_workers(job_source)
+    tc.assertEqual([w.worker_id for w in jm.workers], [0, 1, 2])
+    tc.assertEqual([w.cpus for w in jm.workers], [[0], [1], [2]])
+    tc.assertEqual([w.started_with_lock_held for w in jm.workers],
+                   [True, True, True])
+    tc.assertFalse(lock.held)
+    # Job sources needn't provide a lock
+    jm._add_workers(1, None)
+    tc.assertIs(jm.workers[3].started_with_lock_held, False)
+
+def test_wake_after_finish(tc):
+    jm = job_manager.Multiprocessing_job_manager(1)
+    jm.response_queue = None
+    jm._wake()
@@ -0,0 +1,74 @@
+"""Tests for live_sgf.py."""
+
+from __future__ import with_statement
+
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import live_sgf
+from gomill import sgf_grammar
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+def read(pathname):
+    with open(pathname, "rb") as f:
+        return f.read()
+
+def test_live_record(tc):
+    pathname = os.path.join(tc.sandbox(), "live.sgf")
+    record = live_sgf.Live_sgf_record(
+        pathname, {'FF' : ['4'], 'SZ' : ['9'], 'C' : ['start']},
+        header_size=40)
+    tc.assertEqual(read(pathname),
+                   "(;FF[4]C[start]SZ[9]" + " " * 19 + "\n)\n")
+    record.add_node({'B' : ['ee']})
+    record.add_node({'W' : ['ef'], 'C' : ['comment']})
+    tc.assertEqual(record.node_count, 2)
+    s = read(pathname)
+    tc.assertEqual(s[40:], ";B[ee]\n;C[comment]W[ef]\n)\n")
+    # The partial record is valid SGF
+    coarse_game = sgf_grammar.parse_sgf_game(s)
+    tc.assertEqual(len(coarse_game.sequence), 3)
+
+    record.finalise({'FF' : ['4'], 'SZ' : ['9'], 'RE' : ['B+R']},
+                    {'W' : ['ef'], 'C' : ['final']})
+    tc.assertEqual(read(pathname),
+                   "(;FF[4]RE[B+R]SZ[9]" + " " * 20 + "\n"
+                   ";B[ee]\n;C[final]W[ef]\n)\n")
+    tc.assertTrue(record.file.closed)
+
+def test_live_record_shorter_last_node(tc):
+    pathname = os.path.join(tc.sandbox(), "live.sgf")
+    record = live_sgf.Live_sgf_record(pathname, {'SZ' : ['9']},
+                                      header_size=10)
+    record.add_node({'B' : ['ee'], 'C' : ['long comment']})
+    record.finalise({'SZ' : ['9']}, {'B' : ['ee']})
+    tc.assertEqual(read(pathname), "(;SZ[9]  \n;B[ee]\n)\n")
+
+def test_live_record_no_nodes(tc):
+    pathname = os.path.join(tc.sandbox(), "live.sgf")
+    record = live_sgf.Live_sgf_record(pathname, {'SZ' : ['9']},
+                                      header_size=10)
+    record.finalise({'SZ' : ['9'], 'C' : ['x']}, {'B' : ['ee']})
+    tc.assertEqual(read(pathname), "(;C[x]SZ[9]\n)\n")
+
+def test_live_record_header_overflow(tc):
+    pathname = os.path.join(tc.sandbox(), "live.sgf")
+    record = live_sgf.Live_sgf_record(
+        pathname, {'C' : ["x" * 20]}, header_size=10)
+    tc.assertEqual(record.header_size, 26)
+    record.add_node({'B' : ['ee']})
+    record.finalise({'C' : ["y" * 30]})
+    s = read(pathname)
+    tc.assertEqual(s, "(;C[%s]\n;B[ee]\n)\n" % ("y" * 30))
+    tc.assertEqual(sgf_grammar.parse_sgf_game(s).sequence[1], {'B' : ['ee']})
+
+def test_live_record_close(tc):
+    pathname = os.path.join(tc.sandbox(), "live.sgf")
+    record = live_sgf.Live_sgf_record(pathname, {'SZ' : ['9']},
+                                      header_size=10)
+    record.add_node({'B' : ['ee']})
+    record.close()
+    tc.assertEqual(read(pathname), "(;SZ[9]  \n;B[ee]\n)\n")
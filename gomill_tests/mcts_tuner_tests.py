@@ -359,6 +359,149 @@ def test_tree(tc):
     tc.assertEqual(pfp2([7, 7]), [7, 31])
 
 
+def make_test_tree(**kwargs):
+    args = dict(
+        splits=[2, 3],
+        max_depth=5,
+        exploration_coefficient=0.5,
+        initial_visits=10,
+        initial_wins=5,
+        parameter_formatter=str,
+        )
+    args.update(kwargs)
+    return mcts_tuners.Tree(**args)
+
+def run_simulations(tree, count):
+    for i in xrange(count):
+        simulation = mcts_tuners.Simulation(tree)
+        simulation.run()
+        simulation.update_stats(candidate_won=(i % 3 == 0))
+
+def test_tree_arrays(tc):
+    tree = make_test_tree()
+    tree.new_root()
+    tc.assertEqual(tree.node_count, 7)
+    root = tree.root
+    tc.assertEqual(root.index, 0)
+    tc.assertEqual([child.index for child in root.children], range(1, 7))
+    tc.assertIs(root.children[0].children, None)
+    random.seed(1234)
+    run_simulations(tree, 200)
+    tc.assertEqual(tree.root.visits, 210)
+    tc.assertEqual(tree.root.wins, 5 + 67)
+    tc.assertEqual(sum(child.visits - 10 for child in tree.root.children), 200)
+    tc.assertEqual((tree.node_count - 1) % 6, 0)
+    def check_node(node):
+        children = node.children
+        if children is None:
+            return
+        # Expanded nodes' statistics include their children's games
+        tc.assertEqual(node.visits - 10,
+                       sum(child.visits - 10 for child in children) + 1)
+        for child in children:
+            check_node(child)
+    for child in tree.root.children:
+        check_node(child)
+
+def test_tree_state(tc):
+    tree = make_test_tree()
+    tree.new_root()
+    random.seed(1234)
+    run_simulations(tree, 200)
+    state = tree.get_state()
+    tc.assertIsInstance(state, str)
+    tree2 = make_test_tree()
+    tree2.set_state(state)
+    tc.assertEqual(tree2.node_count, tree.node_count)
+    tc.assertEqual(tree2.describe(), tree.describe())
+    tc.assertEqual(tree2.retrieve_best_parameters(),
+                   tree.retrieve_best_parameters())
+    tc.assertEqual(tree2.get_state(), state)
+    # The restored tree can be used as normal
+    run_simulations(tree2, 10)
+    tc.assertEqual(tree2.root.visits, 220)
+
+    tree3 = make_test_tree(splits=[2, 4])
+    tc.assertRaisesRegexp(ValueError, "wrong branching factor",
+                          tree3.set_state, state)
+    tc.assertRaisesRegexp(ValueError, "wrong magic",
+                          tree2.set_state, "X" + state[1:])
+    tc.assertRaises(ValueError, tree2.set_state, state[:-1])
+    tc.assertRaises(ValueError, tree2.set_state, "")
+
+def test_virtual_loss(tc):
+    tree = make_test_tree(virtual_loss=3)
+    tree.new_root()
+    random.seed(1234)
+    simulations = []
+    for i in xrange(6):
+        simulation = mcts_tuners.Simulation(tree)
+        simulation.run()
+        simulation.add_virtual_loss()
+        simulations.append(simulation)
+    # With nothing else to distinguish them, each candidate is chosen once
+    tc.assertItemsEqual([simulation.choice_path for simulation in simulations],
+                        [[0], [1], [2], [3], [4], [5]])
+    tc.assertEqual([child.visits for child in tree.root.children], [13] * 6)
+    tc.assertEqual(tree.root.visits, 10)
+    # Virtual losses don't make a node ripe
+    tc.assertFalse(tree.is_ripe(1))
+    state = tree.get_state()
+    tree2 = make_test_tree(virtual_loss=3)
+    tree2.new_root()
+    tc.assertEqual(state, tree2.get_state())
+    tc.assertNotIn("13", tree.describe())
+
+    simulations[0].update_stats(candidate_won=True)
+    tc.assertFalse(simulations[0].virtual_loss_applied)
+    simulations[1].remove_virtual_loss()
+    simulations[1].remove_virtual_loss()
+    tc.assertEqual(sorted(child.visits for child in tree.root.children),
+                   [10, 11, 13, 13, 13, 13])
+    for simulation in simulations[2:]:
+        simulation.update_stats(candidate_won=False)
+    tc.assertEqual(sorted(child.visits for child in tree.root.children),
+                   [10, 11, 11, 11, 11, 11])
+    tc.assertEqual(tree._virtual_loss_counts, {})
+
+def test_virtual_loss_default(tc):
+    tree = make_test_tree()
+    tree.new_root()
+    random.seed(1234)
+    simulation = mcts_tuners.Simulation(tree)
+    simulation.run()
+    simulation.add_virtual_loss()
+    tc.assertEqual([child.visits for child in tree.root.children], [10] * 6)
+    simulation.update_stats(candidate_won=True)
+    tc.assertEqual(sum(child.visits for child in tree.root.children), 61)
+
+def test_tree_set_root_from_nodes(tc):
+    # Status files from older versions contain a tree of Node objects
+    def make_node(wins, visits, children=None):
+        node = mcts_tuners.Node()
+        node.__setstate__((children, wins, visits))
+        return node
+    leaves = [make_node(5, 10) for _ in xrange(6)]
+    leaves[2] = make_node(7, 12)
+    expanded = make_node(6, 13, leaves)
+    children = [make_node(5, 10) for _ in xrange(6)]
+    children[4] = expanded
+    root = pickle.loads(pickle.dumps(make_node(8, 14, children), -1))
+    tree = make_test_tree()
+    tree.set_root(root)
+    tc.assertEqual(tree.node_count, 13)
+    tc.assertEqual(tree.root.visits, 14)
+    tc.assertEqual(tree.root.wins, 8)
+    tc.assertEqual([child.visits for child in tree.root.children],
+                   [10, 10, 10, 10, 13, 10])
+    tc.assertEqual(
+        [child.visits for child in tree.root.children[4].children],
+        [10, 10, 12, 10, 10, 10])
+    tc.assertEqual(tree.root.children[4].children[2].wins, 7)
+    tc.assertEqual(tree.retrieve_best_parameter_simulation().choice_path,
+                   [4, 2])
+    tc.assertRaises(ValueError, make_test_tree(splits=[3, 3]).set_root, root)
+
 def test_play(tc):
     comp = mcts_tuners.Mcts_tuner('mctstest')
     comp.initialise_from_control_file(default_config())
@@ -424,6 +567,22 @@ def test_play(tc):
     tc.assertEqual(sum(node.visits-10 for node in comp2.tree.root.children), 1)
     tc.assertEqual(sum(node.wins-5 for node in comp2.tree.root.children), 1)
 
+    # Status from an older version, with the tree as a graph of Nodes
+    def to_node(view):
+        node = mcts_tuners.Node()
+        children = view.children
+        if children is not None:
+            children = map(to_node, children)
+        node.__setstate__((children, view.wins, view.visits))
+        return node
+    old_status = comp.get_status()
+    del old_status['tree_data']
+    old_status['tree_root'] = to_node(comp.tree.root)
+    comp2b = mcts_tuners.Mcts_tuner('mctstest')
+    comp2b.initialise_from_control_file(default_config())
+    comp2b.set_status(pickle.loads(pickle.dumps(old_status)))
+    tc.assertEqual(comp2b.tree.get_state(), comp.tree.get_state())
+
     config3 = default_config()
     # changed split
     config3['parameters'][0] = Parameter_config(
@@ -455,6 +614,53 @@ def test_play(tc):
                    "status file is inconsistent with control file")
 
 
+def test_play_with_virtual_loss(tc):
+    config = default_config()
+    config['virtual_loss'] = 2
+    comp = mcts_tuners.Mcts_tuner('mctstest')
+    comp.initialise_from_control_file(config)
+    comp.set_clean_status()
+    tree = comp.tree
+    job1 = comp.get_game()
+    job2 = comp.get_game()
+    sim1 = comp.outstanding_simulations[0]
+    sim2 = comp.outstanding_simulations[1]
+    tc.assertNotEqual(sim1.choice_path, sim2.choice_path)
+    tc.assertEqual(sum(node.visits-10 for node in tree.root.children), 4)
+
+    result1 = Game_result.from_score('w', 8.5)
+    result1.set_players({'b' : 'opp', 'w' : '#0'})
+    response1 = Game_job_result()
+    response1.game_id = job1.game_id
+    response1.game_result = result1
+    response1.engine_descriptions = {
+        'opp' : Engine_description("opp engine", None, None),
+        '#0'  : Engine_description("candidate engine", None, None),
+        }
+    response1.game_data = job1.game_data
+    comp.process_game_result(response1)
+    tc.assertEqual(sum(node.visits-10 for node in tree.root.children), 3)
+    tc.assertEqual(sum(node.wins-5 for node in tree.root.children), 1)
+
+    # The status excludes the outstanding game's virtual loss
+    comp2 = mcts_tuners.Mcts_tuner('mctstest')
+    comp2.initialise_from_control_file(config)
+    comp2.set_status(pickle.loads(pickle.dumps(comp.get_status())))
+    tc.assertEqual(sum(node.visits-10 for node in comp2.tree.root.children), 1)
+
+    comp.process_game_error(job2, 0)
+    tc.assertEqual(sum(node.visits-10 for node in tree.root.children), 1)
+    tc.assertEqual(comp.outstanding_simulations, {})
+
+def test_bad_virtual_loss(tc):
+    comp = mcts_tuners.Mcts_tuner('mctstest')
+    config = default_config()
+    config['virtual_loss'] = -1
+    with tc.assertRaises(ControlFileError) as ar:
+        comp.initialise_from_control_file(config)
+    tc.assertEqual(str(ar.exception),
+                   "'virtual_loss': must be nonnegative integer")
+
 def test_random_candidate_colour(tc):
     comp = mcts_tuners.Mcts_tuner('mctstest')
     config = default_config()
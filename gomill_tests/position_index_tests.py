@@ -0,0 +1,106 @@
+"""Tests for position_index.py."""
+
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import boards
+from gomill import position_index
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def write_file(pathname, contents):
+    f = open(pathname, "wb")
+    f.write(contents)
+    f.close()
+
+def test_position_index(tc):
+    pathname1 = os.path.join(tc.sandbox(), "one.sgf")
+    pathname2 = os.path.join(tc.sandbox(), "two.sgf")
+    pathname3 = os.path.join(tc.sandbox(), "three.sgf")
+    write_file(pathname1, "(;SZ[9];B[cc];W[gg];B[ee])")
+    write_file(pathname2,
+               "(;SZ[9];B[gc];W[cg];B[gg];W[cc])"
+               "(;SZ[19];B[cc];W[gg])"
+               "(;SZ[9];B[cc];W[zz])")
+    write_file(pathname3, "(;SZ[9];W[gg];B[cc];W[ee]) (;B[")
+    index_pathname = os.path.join(tc.sandbox(), "positions.idx")
+
+    errors = position_index.build_position_index(
+        [pathname1, pathname2, pathname3, "nonexistent.sgf"],
+        index_pathname, allow_mp=False)
+    tc.assertEqual(len(errors), 3)
+    tc.assertEqual(errors[0], (pathname2, "game 2: bad move: zz"))
+    tc.assertEqual(errors[1], (pathname3, "error parsing game 1: "
+                               "unexpected end of SGF data"))
+    tc.assertEqual(errors[2][0], os.path.abspath("nonexistent.sgf"))
+
+    index = position_index.Position_index(index_pathname)
+    tc.assertIs(index.symmetric, True)
+    b = boards.Board(9)
+    b.play(6, 2, 'b')
+    b.play(2, 6, 'w')
+    tc.assertEqual(sorted(index.find_position(b)),
+                   sorted([(pathname1, 0, 2), (pathname2, 0, 2),
+                           (pathname3, 0, 2)]))
+    b.play(6, 6, 'b')
+    tc.assertEqual(index.find_position(b), [(pathname2, 0, 3)])
+    b.play(4, 4, 'b')
+    tc.assertEqual(index.find_position(b), [])
+    b = boards.Board(19)
+    b.play(16, 2, 'b')
+    tc.assertEqual(index.find_position(b), [(pathname2, 1, 1)])
+    index.close()
+
+    position_index.build_position_index(
+        [pathname1, pathname2], index_pathname, symmetric=False,
+        allow_mp=False)
+    index = position_index.Position_index(index_pathname)
+    tc.assertIs(index.symmetric, False)
+    b = boards.Board(9)
+    b.play(6, 2, 'b')
+    b.play(2, 6, 'w')
+    tc.assertEqual(index.find_position(b), [(pathname1, 0, 2)])
+    index.close()
+
+def test_position_index_merging(tc):
+    pathnames = []
+    for i in xrange(5):
+        pathname = os.path.join(tc.sandbox(), "game%d.sgf" % i)
+        point = "abdfh"[i] * 2
+        write_file(pathname,
+                   "(;SZ[9];B[%s];W[gg];B[ee];W[cc])(;SZ[9];B[ee])" % point)
+        pathnames.append(pathname)
+    index_pathname = os.path.join(tc.sandbox(), "positions.idx")
+    def build():
+        position_index.build_position_index(
+            pathnames, index_pathname, allow_mp=False)
+        f = open(index_pathname, "rb")
+        try:
+            return f.read()
+        finally:
+            f.close()
+    in_memory = build()
+    # Spill every run to a temporary file
+    cls = position_index._Indexing_job_source
+    tc.addCleanup(setattr, cls, 'run_buffer_size', cls.run_buffer_size)
+    cls.run_buffer_size = 1
+    tc.assertEqual(build(), in_memory)
+    tc.assertEqual(sorted(os.listdir(tc.sandbox())),
+                   ["game%d.sgf" % i for i in xrange(5)] + ["positions.idx"])
+    index = position_index.Position_index(index_pathname)
+    tc.assertEqual(index.record_count, 25)
+    records = [index._read_record(i) for i in xrange(index.record_count)]
+    tc.assertEqual(records, sorted(records))
+    index.close()
+
+def test_bad_index_file(tc):
+    pathname = os.path.join(tc.sandbox(), "bad.idx")
+    write_file(pathname, "not an index file at all, at all")
+    tc.assertRaisesRegexp(ValueError, "not a position index file",
+                          position_index.Position_index, pathname)
+    write_file(pathname, "short")
+    tc.assertRaisesRegexp(ValueError, "truncated index file",
+                          position_index.Position_index, pathname)
@@ -0,0 +1,146 @@
+"""Tests for result_databases.py."""
+
+from __future__ import with_statement
+
+import copy
+import os
+
+from gomill import playoffs
+from gomill import result_databases
+from gomill.competitions import Player_config
+from gomill.playoffs import Matchup_config
+
+from gomill_tests import gomill_test_support
+from gomill_tests.competition_test_support import fake_response
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def make_playoff():
+    comp = playoffs.Playoff('testcomp')
+    comp.initialise_from_control_file({
+        'players' : {
+            't1' : Player_config("test1"),
+            't2' : Player_config("test2"),
+            't3' : Player_config("test3"),
+            },
+        'board_size' : 13,
+        'komi' : 7.5,
+        'matchups' : [
+            Matchup_config('t1', 't2', alternating=True),
+            Matchup_config('t1', 't3'),
+            ],
+        })
+    comp.set_clean_status()
+    return comp
+
+def play_games(comp, winners):
+    """Play games, recording the results.
+
+    Returns a list of the Game_job_results.
+
+    """
+    responses = []
+    for winner in winners:
+        job = comp.get_game()
+        response = fake_response(job, winner)
+        if winner == 'w' and len(responses) % 3 == 0:
+            response.game_result.is_forfeit = True
+        if winner is not None:
+            response.game_result.cpu_times[job.player_b.code] = 2.5
+        response.game_result.fingerprint = "fp%d" % (len(responses) % 4)
+        comp.process_game_result(response)
+        responses.append(response)
+    return responses
+
+STAT_ATTRIBUTES = [
+    'player_1', 'player_2', 'total', 'wins_1', 'wins_2', 'forfeits_1',
+    'forfeits_2', 'unknown', 'duplicates', 'played_1b', 'played_1w',
+    'played_2b', 'played_y2', 'alternating', 'average_time_1',
+    'average_time_2']
+
+ALTERNATING_ATTRIBUTES = [
+    'wins_b', 'wins_w', 'wins_1b', 'wins_1w', 'wins_2b', 'wins_2w']
+
+def check_stats(tc, ms1, ms2):
+    """Check that two Matchup_stats objects have the same statistics."""
+    attributes = STAT_ATTRIBUTES[:]
+    if ms1.alternating:
+        attributes += ALTERNATING_ATTRIBUTES
+    else:
+        attributes += ['colour_1', 'colour_2']
+    for attribute in attributes:
+        tc.assertEqual(getattr(ms1, attribute), getattr(ms2, attribute),
+                       attribute)
+
+def test_result_database(tc):
+    comp = make_playoff()
+    responses = play_games(
+        comp, ['b', 'w', 'w', None, 'unknown', 'b', 'w', 'w', 'b', 'w'])
+
+    db = result_databases.Result_database(
+        os.path.join(tc.sandbox(), "results.db"))
+    for response in responses:
+        db.record_result(response.game_result,
+                         comp.get_matchup_id(response.game_data),
+                         1000.0, 1010.0)
+    tc.assertEqual(db.count_games(), 10)
+    tc.assertEqual(db.count_games(matchup_id='1'), 5)
+    tc.assertEqual(db.count_games(player='t2'), 5)
+    tc.assertEqual(db.count_games(is_forfeit=True), 2)
+
+    results = list(db.find_results(matchup_id='0'))
+    expected = [response.game_result for response in responses
+                if response.game_data[0] == '0']
+    tc.assertEqual([r.game_id for r in results],
+                   [r.game_id for r in expected])
+    for result, original in zip(results, expected):
+        tc.assertEqual(result.__getstate__(), original.__getstate__())
+        tc.assertEqual(result.describe(), original.describe())
+
+    forfeits = list(db.find_results(player='t3', is_forfeit=True))
+    tc.assertEqual([r.game_id for r in forfeits], ['1_4'])
+    tc.assertEqual(forfeits[0].losing_player, 't1')
+
+    tr = comp.get_tournament_results()
+    db_tr = comp.get_database_tournament_results(db)
+    tc.assertEqual(db_tr.get_matchup_ids(), ['0', '1'])
+    for matchup_id in ['0', '1']:
+        check_stats(tc, db_tr.get_matchup_stats(matchup_id),
+                    tr.get_matchup_stats(matchup_id))
+    tc.assertEqual(
+        [r.game_id for r in db_tr.get_matchup_results('1')],
+        [r.game_id for r in tr.get_matchup_results('1')])
+    db_tr.close()
+
+def test_empty_matchup_stats(tc):
+    comp = make_playoff()
+    db = result_databases.Result_database(":memory:")
+    ms = comp.get_database_tournament_results(db).get_matchup_stats('0')
+    tc.assertEqual(ms.total, 0)
+    tc.assertEqual(ms.wins_1, 0)
+    tc.assertIs(ms.alternating, False)
+    tc.assertIsNone(ms.average_time_1)
+    db.close()
+
+def test_replace_and_add_missing(tc):
+    comp = make_playoff()
+    responses = play_games(comp, ['b', 'w', 'b'])
+    db = result_databases.Result_database(":memory:")
+    result = responses[0].game_result
+    db.record_result(result, '0')
+    replacement = copy.copy(responses[1].game_result)
+    replacement.game_id = result.game_id
+    db.record_result(replacement, '0')
+    tc.assertEqual(db.count_games(), 1)
+    tc.assertEqual(
+        list(db.find_results())[0].winning_player, replacement.winning_player)
+
+    db.add_missing_results(comp.get_recorded_results())
+    tc.assertEqual(db.count_games(), 3)
+    tc.assertEqual(db.count_games(matchup_id='1'), 1)
+    # Existing results are left alone
+    tc.assertEqual(
+        list(db.find_results())[0].winning_player, replacement.winning_player)
+    db.close()
@@ -0,0 +1,84 @@
+"""Tests for ringmaster_control.py."""
+
+from __future__ import with_statement
+
+import errno
+import os
+import socket
+
+from gomill_tests import gomill_test_support
+
+from gomill import ringmaster_control
+from gomill.ringmaster_control import ControlCommandError
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def handler(command, args):
+    if command == "echo":
+        return " ".join(args)
+    if command == "empty":
+        return ""
+    raise ControlCommandError("unknown command: %s" % command)
+
+def make_server(tc):
+    pathname = os.path.join(tc.sandbox(), "test.sock")
+    server = ringmaster_control.Control_server(pathname, handler)
+    server.start()
+    tc.addCleanup(server.close)
+    return server
+
+def test_send_request(tc):
+    server = make_server(tc)
+    tc.assertEqual(
+        ringmaster_control.send_request(server.pathname, "echo a  b"),
+        "a b\n")
+    tc.assertEqual(
+        ringmaster_control.send_request(server.pathname, "empty"), "")
+    with tc.assertRaises(ControlCommandError) as ar:
+        ringmaster_control.send_request(server.pathname, "xyzzy")
+    tc.assertEqual(str(ar.exception), "unknown command: xyzzy")
+    with tc.assertRaises(ControlCommandError) as ar:
+        ringmaster_control.send_request(server.pathname, "")
+    tc.assertEqual(str(ar.exception), "empty request")
+
+def test_bad_request(tc):
+    server = make_server(tc)
+    with tc.assertRaises(ControlCommandError) as ar:
+        ringmaster_control.send_request(server.pathname, "x" * 2000)
+    tc.assertEqual(str(ar.exception), "bad request: line too long")
+
+def test_watch(tc):
+    server = make_server(tc)
+    # The watcher is registered before watch() returns
+    events = ringmaster_control.watch(server.pathname)
+    server.broadcast("start 0 p1 p2")
+    server.broadcast("result 0\nB+R")
+    tc.assertEqual(events.next(), "start 0 p1 p2")
+    tc.assertEqual(events.next(), "result 0 B+R")
+    server.close()
+    tc.assertEqual(list(events), [])
+
+def test_close(tc):
+    server = make_server(tc)
+    tc.assertTrue(os.path.exists(server.pathname))
+    server.close()
+    tc.assertFalse(os.path.exists(server.pathname))
+    with tc.assertRaises(socket.error) as ar:
+        ringmaster_control.send_request(server.pathname, "empty")
+    tc.assertEqual(ar.exception.errno, errno.ENOENT)
+
+def test_stale_socket(tc):
+    pathname = os.path.join(tc.sandbox(), "test.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(pathname)
+    sock.close()
+    with tc.assertRaises(socket.error) as ar:
+        ringmaster_control.send_request(pathname, "empty")
+    tc.assertEqual(ar.exception.errno, errno.ECONNREFUSED)
+    server = ringmaster_control.Control_server(pathname, handler)
+    server.start()
+    tc.addCleanup(server.close)
+    tc.assertEqual(
+        ringmaster_control.send_request(pathname, "echo x"), "x\n")
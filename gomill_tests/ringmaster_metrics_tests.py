@@ -0,0 +1,94 @@
+"""Tests for ringmaster_metrics.py."""
+
+from gomill_tests import gomill_test_support
+
+from gomill import gtp_games
+from gomill import ringmaster_metrics
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+class Fake_clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_result(cpu_times):
+    result = gtp_games.Game_result.from_score('b', 1.5)
+    result.set_players({'b' : 'p1', 'w' : 'p2'})
+    result.cpu_times.update(cpu_times)
+    return result
+
+def classify(player_code):
+    if player_code.startswith("#"):
+        return "candidate"
+    return player_code
+
+def get_samples(metrics):
+    return [line for line in metrics.render().split("\n")
+            if line and not line.startswith("#")]
+
+def test_games(tc):
+    clock = Fake_clock()
+    metrics = ringmaster_metrics.Ringmaster_metrics('test', time_fn=clock)
+    metrics.note_game_started('0_0', '0')
+    metrics.note_game_started('0_1', '0')
+    metrics.note_game_started('1_0', '1')
+    clock.now += 20
+    metrics.note_game_completed(
+        '0_0', '0', make_result({'p1' : 3.5}),
+        {'p1' : [0.02, 0.2], 'p2' : [0.3]}, classify)
+    metrics.note_game_void('1_0', '1')
+    metrics.note_status_written(0.002)
+    metrics.set_worker_state(1, 1, 3)
+    samples = get_samples(metrics)
+    tc.assertEqual(samples[:14], [
+        'gomill_run_start_time_seconds{competition="test"} 1000.0',
+        'gomill_games_started_total{competition="test",matchup="0"} 2',
+        'gomill_games_started_total{competition="test",matchup="1"} 1',
+        'gomill_games_completed_total{competition="test",matchup="0"} 1',
+        'gomill_games_void_total{competition="test",matchup="1"} 1',
+        'gomill_games_per_second{competition="test"} 0.05',
+        'gomill_games_in_progress{competition="test"} 1',
+        'gomill_games_awaiting_replay{competition="test"} 1',
+        'gomill_workers{competition="test"} 3',
+        'gomill_worker_busy_seconds_total{competition="test"} 40.0',
+        'gomill_game_duration_seconds_bucket'
+        '{competition="test",matchup="0",le="1.0"} 0',
+        'gomill_game_duration_seconds_bucket'
+        '{competition="test",matchup="0",le="5.0"} 0',
+        'gomill_game_duration_seconds_bucket'
+        '{competition="test",matchup="0",le="10.0"} 0',
+        'gomill_game_duration_seconds_bucket'
+        '{competition="test",matchup="0",le="30.0"} 1',
+        ])
+    tc.assertIn('gomill_move_time_seconds_bucket'
+                '{competition="test",player="p1",le="0.1"} 1', samples)
+    tc.assertIn('gomill_move_time_seconds_bucket'
+                '{competition="test",player="p1",le="0.25"} 2', samples)
+    tc.assertIn('gomill_move_time_seconds_count'
+                '{competition="test",player="p2"} 1', samples)
+    tc.assertIn('gomill_player_cpu_seconds_total'
+                '{competition="test",player="p1"} 3.5', samples)
+    tc.assertIn('gomill_player_cpu_games_total'
+                '{competition="test",player="p1"} 1', samples)
+    tc.assertFalse([s for s in samples
+                    if s.startswith('gomill_player_cpu_seconds_total')
+                    and 'p2' in s])
+    tc.assertIn('gomill_status_write_seconds_count{competition="test"} 1',
+                samples)
+
+def test_render_format(tc):
+    clock = Fake_clock()
+    metrics = ringmaster_metrics.Ringmaster_metrics('a"b\\c', time_fn=clock)
+    metrics.note_game_started('0', None)
+    s = metrics.render()
+    tc.assertTrue(s.endswith("\n"))
+    tc.assertIn(
+        "# HELP gomill_games_started_total Games started in this run.\n"
+        "# TYPE gomill_games_started_total counter\n"
+        'gomill_games_started_total{competition="a\\"b\\\\c"} 1\n', s)
+    tc.assertNotIn("gomill_games_completed_total", s)
@@ -0,0 +1,188 @@
+"""Tests for ringmaster_presenters.py."""
+
+import errno
+import fcntl
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import ringmaster_presenters
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+class Fake_clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class Pipe(object):
+    """A pipe with its read end in non-blocking mode."""
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        flags = fcntl.fcntl(self.read_fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.read_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def read(self):
+        result = []
+        while True:
+            try:
+                s = os.read(self.read_fd, 65536)
+            except OSError, e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            if not s:
+                break
+            result.append(s)
+        return "".join(result)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+def make_presenter(tc):
+    pipe = Pipe()
+    tc.addCleanup(pipe.close)
+    clock = Fake_clock()
+    presenter = ringmaster_presenters.Ansi_presenter(
+        max_refresh_rate=2.0, fd=pipe.write_fd, time_fn=clock)
+    return presenter, pipe, clock
+
+
+def test_ansi_redraw(tc):
+    presenter, pipe, clock = make_presenter(tc)
+    presenter.say('status', "status 1")
+    presenter.say('results', "game 0: b+r")
+    presenter.refresh()
+    tc.assertEqual(pipe.read(),
+                   "\x1b[H\x1b[2J"
+                   "\x1b[1;1Hstatus 1\x1b[K"
+                   "\x1b[2;1H\x1b[K"
+                   "\x1b[3;1H= Results = \x1b[K"
+                   "\x1b[4;1Hgame 0: b+r\x1b[K"
+                   "\x1b[5;1H\x1b[K"
+                   "\x1b[6;1H")
+    clock.now += 1
+    presenter.clear('status')
+    presenter.say('status', "status 2")
+    presenter.refresh()
+    tc.assertEqual(pipe.read(), "\x1b[1;1Hstatus 2\x1b[K\x1b[6;1H")
+    clock.now += 1
+    presenter.refresh()
+    tc.assertEqual(pipe.read(), "")
+    clock.now += 1
+    presenter.clear('results')
+    presenter.refresh()
+    tc.assertEqual(pipe.read(), "\x1b[3;1H\x1b[J\x1b[3;1H")
+
+def test_ansi_rate_limit(tc):
+    presenter, pipe, clock = make_presenter(tc)
+    tc.assertIsNone(presenter.time_until_refresh())
+    presenter.say('status', "status 1")
+    presenter.refresh()
+    tc.assertEqual(pipe.read(),
+                   "\x1b[H\x1b[2J\x1b[1;1Hstatus 1\x1b[K"
+                   "\x1b[2;1H\x1b[K\x1b[3;1H")
+    tc.assertIsNone(presenter.time_until_refresh())
+    clock.now += 0.1
+    presenter.clear('status')
+    presenter.say('status', "status 2")
+    presenter.refresh()
+    clock.now += 0.1
+    presenter.clear('status')
+    presenter.say('status', "status 3")
+    presenter.refresh()
+    tc.assertEqual(pipe.read(), "")
+    tc.assertAlmostEqual(presenter.time_until_refresh(), 0.3)
+    clock.now += 0.3
+    tc.assertEqual(presenter.time_until_refresh(), 0.0)
+    presenter.flush()
+    tc.assertEqual(pipe.read(), "\x1b[1;1Hstatus 3\x1b[K\x1b[3;1H")
+    tc.assertIsNone(presenter.time_until_refresh())
+    # clock going backwards
+    clock.now -= 100
+    presenter.refresh()
+    tc.assertEqual(presenter.time_until_refresh(), 0.5)
+
+def test_ansi_content_function(tc):
+    presenter, pipe, clock = make_presenter(tc)
+    calls = []
+    def fill():
+        calls.append(clock.now)
+        presenter.clear('status')
+        presenter.say('status', "status %d" % len(calls))
+    presenter.set_content_function(fill)
+    presenter.refresh()
+    tc.assertEqual(pipe.read(),
+                   "\x1b[H\x1b[2J\x1b[1;1Hstatus 1\x1b[K"
+                   "\x1b[2;1H\x1b[K\x1b[3;1H")
+    # The content function is called only when a redraw happens
+    for i in xrange(10):
+        clock.now += 0.01
+        presenter.refresh()
+    tc.assertEqual(len(calls), 1)
+    tc.assertEqual(pipe.read(), "")
+    clock.now += 0.5
+    presenter.flush()
+    tc.assertEqual(len(calls), 2)
+    tc.assertEqual(pipe.read(), "\x1b[1;1Hstatus 2\x1b[K\x1b[3;1H")
+    presenter.flush()
+    tc.assertEqual(len(calls), 2)
+
+def test_ansi_warnings(tc):
+    presenter, pipe, clock = make_presenter(tc)
+    presenter.say('warnings', "warning 1")
+    tc.assertEqual(pipe.read(),
+                   "\x1b[H\x1b[2J\x1b[1;1H= Warnings = \x1b[K"
+                   "\x1b[2;1Hwarning 1\x1b[K\x1b[3;1H")
+    presenter.say('warnings', "warning 2")
+    tc.assertEqual(pipe.read(), "")
+    clock.now += 1
+    presenter.flush()
+    tc.assertEqual(pipe.read(), "\x1b[3;1Hwarning 2\x1b[K\x1b[4;1H")
+
+def test_ansi_blocked_output(tc):
+    presenter, pipe, clock = make_presenter(tc)
+    flags = fcntl.fcntl(pipe.write_fd, fcntl.F_GETFL)
+    fcntl.fcntl(pipe.write_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    # Fill the pipe
+    while True:
+        try:
+            os.write(pipe.write_fd, "x" * 4096)
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+            break
+    presenter.say('status', "status 1")
+    presenter.refresh()
+    tc.assertEqual(presenter.time_until_refresh(), 0.5)
+    pipe.read()
+    clock.now += 1
+    presenter.flush()
+    tc.assertEqual(pipe.read(),
+                   "\x1b[H\x1b[2J\x1b[1;1Hstatus 1\x1b[K"
+                   "\x1b[2;1H\x1b[K\x1b[3;1H")
+
+def test_ansi_close(tc):
+    master_fd, slave_fd = os.openpty()
+    tc.addCleanup(os.close, master_fd)
+    tc.addCleanup(os.close, slave_fd)
+    presenter = ringmaster_presenters.Ansi_presenter(fd=slave_fd)
+    opened_fd = presenter.fd
+    tc.assertNotEqual(opened_fd, slave_fd)
+    presenter.close()
+    tc.assertEqual(presenter.fd, slave_fd)
+    tc.assertRaises(OSError, os.fstat, opened_fd)
+    os.fstat(slave_fd)
+    presenter.close()
+
+def test_ansi_close_not_a_tty(tc):
+    presenter, pipe, clock = make_presenter(tc)
+    tc.assertEqual(presenter.fd, pipe.write_fd)
+    presenter.close()
+    tc.assertEqual(presenter.fd, pipe.write_fd)
+    os.fstat(pipe.write_fd)
@@ -1,8 +1,10 @@
 """Test support code for testing Ringmasters."""
 
+import errno
 from collections import defaultdict
 from cStringIO import StringIO
 
+from gomill import result_databases
 from gomill import ringmasters
 from gomill import ringmaster_presenters
 
@@ -21,7 +23,7 @@ class Test_presenter(ringmaster_presenters.Presenter):
         self.channels[channel].append(s)
 
     def refresh(self):
-        pass
+        self._update_content()
 
     def recent_messages(self, channel):
         """Retrieve messages sent since the channel was last cleared.
@@ -55,6 +57,13 @@ class Testing_ringmaster(ringmasters.Ringmaster):
         self._control_file_contents = control_file_contents
         self._test_status = None
         self._written_status = None
+        self._written_summary = None
+        self.summary_write_count = 0
+        self.summary_key = "testkey"
+        self.check_cache = None
+        self.cpu_information = None
+        self.cpu_information_requests = 0
+        self.idle_cpus = None
         ringmasters.Ringmaster.__init__(self, '/nonexistent/ctl/test.ctl')
         self.set_stdout(StringIO())
 
@@ -70,6 +79,9 @@ class Testing_ringmaster(ringmasters.Ringmaster):
         # Don't want to close the StringIOs
         pass
 
+    def _start_control_server(self):
+        pass
+
     def _read_control_file(self):
         return self._control_file_contents
 
@@ -92,6 +104,43 @@ class Testing_ringmaster(ringmasters.Ringmaster):
     def _write_status(self, value):
         self._written_status = value
 
+    def _get_summary_key(self):
+        return self.summary_key
+
+    def _write_summary_file(self, contents):
+        self._written_summary = contents
+        self.summary_write_count += 1
+
+    def _read_summary_file(self):
+        if self._written_summary is None:
+            raise IOError(errno.ENOENT, "no summary file")
+        return self._written_summary
+
+    def _read_check_cache(self):
+        if self.check_cache is None:
+            return set()
+        return set(self.check_cache)
+
+    def _write_check_cache(self, keys):
+        self.check_cache = sorted(set(keys))
+
+    def _connect_results_database(self):
+        return result_databases.Result_database(":memory:")
+
+    def _close_results_database(self):
+        # Keep the in-memory database available for inspection
+        pass
+
+    def _get_cpu_information(self):
+        self.cpu_information_requests += 1
+        return self.cpu_information
+
+    def _get_idle_cpus(self):
+        return self.idle_cpus
+
+    def _get_player_check_key(self, check):
+        return " ".join(check.player.cmd_args)
+
     def retrieve_printed_output(self):
         return self.stdout.getvalue()
 
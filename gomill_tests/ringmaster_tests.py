@@ -2,6 +2,8 @@
 
 import os
 import re
+import threading
+from cStringIO import StringIO
 from textwrap import dedent
 
 from gomill_tests import gomill_test_support
@@ -9,6 +11,10 @@ from gomill_tests import ringmaster_test_support
 from gomill_tests import gtp_engine_fixtures
 from gomill_tests.playoff_tests import fake_response
 
+from gomill import game_jobs
+from gomill import sgf_archives
+from gomill.job_manager import NoJobAvailable
+from gomill.ringmaster_control import ControlCommandError
 from gomill.ringmasters import RingmasterError
 
 def make_tests(suite):
@@ -224,10 +230,46 @@ def test_settings(tc):
     tc.assertEqual(job.sgf_filename, '0_000.sgf')
     tc.assertEqual(job.sgf_dirname, '/nonexistent/ctl/test.games')
     tc.assertEqual(job.void_sgf_dirname, '/nonexistent/ctl/test.void')
+    tc.assertIs(job.live_sgf, False)
     tc.assertEqual(fx.ringmaster.get_sgf_filename("0_000"), "0_000.sgf")
     tc.assertEqual(fx.ringmaster.get_sgf_pathname("0_000"),
                    "/nonexistent/ctl/test.games/0_000.sgf")
 
+def test_live_game_records_setting(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "record_games = True",
+        "live_game_records = True",
+        ])
+    job = fx.get_job()
+    tc.assertIs(job.live_sgf, True)
+
+def test_archive_games_setting(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "record_games = True",
+        "archive_games = True",
+        ])
+    job = fx.get_job()
+    tc.assertIs(job.return_sgf, True)
+    tc.assertIsNone(job.sgf_dirname)
+    tc.assertEqual(job.void_sgf_dirname, '/nonexistent/ctl/test.void')
+
+def test_process_response_archive(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "record_games = True",
+        "archive_games = True",
+        ])
+    fx.ringmaster.sgf_dir_pathname = tc.sandbox()
+    fx.ringmaster.sgf_archive_writer = sgf_archives.Sgf_archive_writer(
+        tc.sandbox())
+    job = fx.get_job()
+    response = fake_response(job, 'w')
+    response.sgf_string = "(;FF[4]GM[1]SZ[9]C[test])\n"
+    fx.ringmaster.process_response(response)
+    fx.ringmaster.sgf_archive_writer.close()
+    tc.assertEqual(fx.ringmaster.get_sgf_string('0_000'),
+                   "(;FF[4]GM[1]SZ[9]C[test])\n")
+    tc.assertIsNone(fx.ringmaster.get_sgf_string('0_001'))
+
 def test_stderr_settings(tc):
     fx = Ringmaster_fixture(tc, playoff_ctl, [
         "players['p2'] = Player('testb', discard_stderr=True)",
@@ -304,6 +346,7 @@ def test_run(tc):
     tc.assertListEqual(
         fx.messages('screen_report'),
         ["p1 v p2 (3/400 games)\n"
+         "duplicate games: 2 66.67%\n"
          "board size: 9   komi: 7.5\n"
          "     wins                   avg cpu\n"
          "p1      3 100.00%   (black)  546.20\n"
@@ -402,6 +445,59 @@ def test_explicit_check_not_skipped(tc):
     exec forced to fail
     """))
 
+def test_check_players_parallel(tc):
+    fx = Ringmaster_fixture(tc, allplayall_ctl, [
+        "competitors = ['p1', 'p2', 'p3', 'p4']",
+        "players['p3'] = Player('test fail=startup')",
+        "players['p4'] = Player('test')",
+        ])
+    fx.ringmaster.set_parallel_worker_count(3)
+    tc.assertFalse(fx.ringmaster.check_players(discard_stderr=True))
+    tc.assertEqual(fx.ringmaster.retrieve_printed_output(), dedent("""\
+    player p3 failed startup check:
+    error starting subprocess for p3:
+    exec forced to fail
+    """))
+
+def test_check_players_parallel_unexpected_error(tc):
+    fx = Ringmaster_fixture(tc, allplayall_ctl, [
+        "competitors = ['p1', 'p2', 'p3', 'p4']",
+        "players['p3'] = Player('test')",
+        "players['p4'] = Player('test')",
+        ])
+    fx.ringmaster.set_parallel_worker_count(3)
+    real_check_player = game_jobs.check_player
+    def check_player(check, discard_stderr=False):
+        if check.player.code == 'p2':
+            raise ZeroDivisionError("check went wrong")
+        return real_check_player(check, discard_stderr)
+    game_jobs.check_player = check_player
+    tc.addCleanup(setattr, game_jobs, 'check_player', real_check_player)
+    tc.assertRaisesRegexp(ZeroDivisionError, "check went wrong",
+                          fx.ringmaster.check_players, discard_stderr=True)
+
+def test_check_players_cache(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "players['p2'] = Player('test fail=startup')",
+        "cache_player_checks = True",
+        ])
+    tc.assertFalse(fx.ringmaster.check_players(discard_stderr=True))
+    tc.assertEqual(fx.ringmaster.check_cache, ["testb init=p1"])
+    fx.ringmaster.check_cache = ["test fail=startup", "testb init=p1"]
+    fx.ringmaster.set_stdout(StringIO())
+    tc.assertTrue(fx.ringmaster.check_players(discard_stderr=True))
+    tc.assertEqual(fx.ringmaster.retrieve_printed_output(),
+                   "using cached results for 2 player checks\n")
+    # Explicit checks ignore the cache
+    tc.assertFalse(fx.ringmaster.check_players(discard_stderr=False))
+
+def test_check_players_cache_disabled(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    fx.ringmaster.check_cache = ["other"]
+    tc.assertTrue(fx.ringmaster.check_players(discard_stderr=True))
+    tc.assertEqual(fx.ringmaster.retrieve_printed_output(), "")
+    tc.assertEqual(fx.ringmaster.check_cache, ["other"])
+
 def test_run_fail(tc):
     fx = Ringmaster_fixture(tc, playoff_ctl, [
         "players['p2'] = Player('test fail=startup')",
@@ -475,6 +571,7 @@ def test_status_roundtrip(tc):
     tc.assertListEqual(
         fx2.messages('screen_report'),
         ["p1 v p2 (3/400 games)\n"
+         "duplicate games: 2 66.67%\n"
          "board size: 9   komi: 7.5\n"
          "     wins                   avg cpu\n"
          "p1      3 100.00%   (black)  546.20\n"
@@ -505,6 +602,7 @@ def test_status(tc):
     tc.assertListEqual(
         fx.messages('screen_report'),
         ["p1 v p2 (3/400 games)\n"
+         "duplicate games: 2 66.67%\n"
          "board size: 9   komi: 7.5\n"
          "     wins                   avg cpu\n"
          "p1      3 100.00%   (black)  546.20\n"
@@ -553,6 +651,61 @@ def test_status(tc):
         "incompatible status file",
         fx.ringmaster.load_status)
 
+def test_summary(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    fx.initialise_clean()
+    tc.assertIs(fx.ringmaster.print_summary_report(), False)
+    fx.ringmaster.run(max_games=2)
+    fx.ringmaster.print_status_report()
+    expected = fx.ringmaster.retrieve_printed_output()
+    tc.assertIn("p1 v p2 (2/400 games)", expected)
+    fx.ringmaster.set_stdout(StringIO())
+    tc.assertIs(fx.ringmaster.print_summary_report(), True)
+    tc.assertMultiLineEqual(fx.ringmaster.retrieve_printed_output(), expected)
+    # The summary is ignored if the state or control file has changed
+    fx.ringmaster.set_stdout(StringIO())
+    fx.ringmaster.summary_key = "changed"
+    tc.assertIs(fx.ringmaster.print_summary_report(), False)
+    tc.assertEqual(fx.ringmaster.retrieve_printed_output(), "")
+
+def test_summary_rate_limit(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    fx.initialise_clean()
+    fx.ringmaster.run(max_games=3)
+    # Written after the first game, and again at the end of the run
+    tc.assertEqual(fx.ringmaster.summary_write_count, 2)
+    tc.assertIn("p1 v p2 (3/400 games)", fx.ringmaster._written_summary)
+
+def test_results_database(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "results_database = True",
+        ])
+    fx.initialise_clean()
+    fx.ringmaster.run(max_games=2)
+    db = fx.ringmaster.results_db
+    tc.assertEqual(db.count_games(), 2)
+    results = list(db.find_results(matchup_id='0'))
+    tc.assertEqual([r.game_id for r in results], ['0_000', '0_001'])
+    tc.assertEqual(results[0].winning_player, 'p1')
+    tc.assertEqual(
+        db.connection.execute(
+            "SELECT COUNT(*) FROM games "
+            "WHERE start_time IS NOT NULL AND end_time >= start_time"
+            ).fetchone()[0],
+        2)
+
+def test_results_database_catches_up(tc):
+    fx1 = Ringmaster_fixture(tc, playoff_ctl)
+    fx1.initialise_clean()
+    fx1.ringmaster.run(max_games=2)
+    state = fx1.get_written_state()
+    fx2 = Ringmaster_fixture(tc, playoff_ctl, [
+        "results_database = True",
+        ])
+    fx2.initialise_with_state(state)
+    fx2.ringmaster.run(max_games=1)
+    tc.assertEqual(fx2.ringmaster.results_db.count_games(), 3)
+
 def test_no_cpu_time(tc):
     fx = Ringmaster_fixture(tc, playoff_ctl)
     def register(channel):
@@ -564,7 +717,378 @@ def test_no_cpu_time(tc):
     tc.assertListEqual(
         fx.messages('screen_report'),
         ["p1 v p2 (3/400 games)\n"
+         "duplicate games: 2 66.67%\n"
          "board size: 9   komi: 7.5\n"
          "     wins\n"
          "p1      3 100.00%   (black)\n"
          "p2      0   0.00%   (white)"])
+
+def test_control_commands(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    fx.initialise_clean()
+    handle = fx.ringmaster._handle_control_request
+    tc.assertEqual(
+        handle('status', []),
+        "playoff: test\n"
+        "gomill_tests playoff.\n"
+        "\n\n\n")
+    tc.assertRaisesRegexp(
+        ControlCommandError, "^unknown command: xyzzy$",
+        handle, 'xyzzy', [])
+    tc.assertRaisesRegexp(
+        ControlCommandError, "^not running games in parallel$",
+        handle, 'workers', ['3'])
+    fx.ringmaster.set_parallel_worker_count(2)
+    tc.assertEqual(handle('workers', ['3']), "")
+    tc.assertEqual(fx.ringmaster.get_worker_limit(), 3)
+    tc.assertRaisesRegexp(
+        ControlCommandError, "^usage: workers <n>$",
+        handle, 'workers', ['x'])
+    tc.assertRaisesRegexp(
+        ControlCommandError, "^worker count out of range$",
+        handle, 'workers', ['0'])
+    tc.assertEqual(handle('max-games', ['1']), "")
+    tc.assertEqual(fx.ringmaster.max_games_this_run, 1)
+    tc.assertEqual(handle('max-games', ['none']), "")
+    tc.assertIsNone(fx.ringmaster.max_games_this_run)
+    tc.assertRaisesRegexp(
+        ControlCommandError, "^usage: max-games <n>\|none$",
+        handle, 'max-games', ['-1'])
+    tc.assertEqual(handle('stop', []), "")
+    tc.assertIs(fx.ringmaster.get_job(), NoJobAvailable)
+    tc.assertMultiLineEqual(
+        fx.get_log(),
+        "worker count changed to 3\n"
+        "max-games changed to 1\n"
+        "max-games changed to None\n"
+        "halting competition: stop command received\n"
+        )
+
+def test_cpus_per_game(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "cpus_per_game = 2",
+        ])
+    fx.initialise_clean()
+    fx.ringmaster.cpu_information = (
+        [0, 1, 2, 3, 4], {0 : (0, 0, 0), 1 : (0, 0, 1),
+                          2 : (0, 0, 0), 3 : (0, 0, 1), 4 : (0, 0, 2)})
+    fx.ringmaster._allocate_worker_cpus()
+    tc.assertIsNone(fx.ringmaster.worker_cpu_slots)
+    fx.ringmaster.set_parallel_worker_count(2)
+    fx.ringmaster._allocate_worker_cpus()
+    tc.assertEqual(fx.ringmaster.worker_cpu_slots, [[0, 2], [1, 3]])
+    tc.assertEqual(fx.ringmaster.get_worker_cpus(1), [1, 3])
+    tc.assertIsNone(fx.ringmaster.get_worker_cpus(2))
+    tc.assertMultiLineEqual(
+        fx.get_log(),
+        "worker 0 uses CPUs 0,2\n"
+        "worker 1 uses CPUs 1,3\n")
+    handle = fx.ringmaster._handle_control_request
+    tc.assertRaisesRegexp(
+        ControlCommandError, "^not enough CPUs for 3 workers \(maximum 2\)$",
+        handle, 'workers', ['3'])
+    tc.assertEqual(handle('workers', ['1']), "")
+
+    fx.ringmaster.set_parallel_worker_count(3)
+    tc.assertRaisesRegexp(
+        RingmasterError,
+        "^not enough CPUs for 3 workers with cpus_per_game 2 "
+        "\(5 CPUs available\)$",
+        fx.ringmaster._allocate_worker_cpus)
+
+    fx.ringmaster.cpu_information = None
+    fx.ringmaster._allocate_worker_cpus()
+    tc.assertIsNone(fx.ringmaster.worker_cpu_slots)
+    tc.assertEqual(fx.messages('warnings'),
+                   ["CPU affinity isn't supported on this system; "
+                    "ignoring cpus_per_game"])
+
+def test_resource_limits(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "players['p3'] = Player('testw init=p2', threads=4, memory=1000)",
+        "matchups.append(Matchup('p1', 'p3'))",
+        "max_threads = 10",
+        "max_memory = 1500",
+        "max_overtakes = 0",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    rm.set_parallel_worker_count(4)
+    def get_job():
+        job = rm.get_job()
+        if job is NoJobAvailable:
+            return None
+        return job.game_id
+    def finish(game_id):
+        rm.process_response(fake_response(rm.games_in_progress[game_id], 'b'))
+    tc.assertEqual(get_job(), '0_000')
+    tc.assertEqual(get_job(), '1_000')
+    tc.assertEqual(get_job(), '0_001')
+    # 1_001 would exceed the memory limit, so it's held
+    tc.assertIsNone(get_job())
+    tc.assertEqual([job.game_id for job in rm.held_jobs], ['1_001'])
+    # 0_002 would fit, but it isn't allowed to overtake 1_001
+    finish('0_000')
+    tc.assertIsNone(get_job())
+    tc.assertEqual([job.game_id for job in rm.held_jobs], ['1_001'])
+    finish('1_000')
+    tc.assertEqual(get_job(), '1_001')
+    tc.assertEqual(rm.held_jobs, [])
+    tc.assertEqual(get_job(), '0_002')
+
+def test_resource_limits_overtaking(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "players['p3'] = Player('testw init=p2', threads=4, memory=1000)",
+        "matchups.append(Matchup('p1', 'p3'))",
+        "max_threads = 10",
+        "max_memory = 1500",
+        "max_overtakes = 2",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    rm.set_parallel_worker_count(4)
+    def get_job():
+        job = rm.get_job()
+        if job is NoJobAvailable:
+            return None
+        return job.game_id
+    def finish(game_id):
+        rm.process_response(fake_response(rm.games_in_progress[game_id], 'b'))
+    def held():
+        return [job.game_id for job in rm.held_jobs]
+    tc.assertEqual(get_job(), '0_000')
+    tc.assertEqual(get_job(), '1_000')
+    tc.assertEqual(get_job(), '0_001')
+    tc.assertIsNone(get_job())
+    # Up to worker_count games are held
+    tc.assertEqual(held(), ['1_001', '0_002', '1_002', '0_003'])
+    # Smaller games may overtake 1_001 twice
+    finish('0_000')
+    tc.assertEqual(get_job(), '0_002')
+    tc.assertIsNone(get_job())
+    finish('0_001')
+    tc.assertEqual(get_job(), '0_003')
+    tc.assertIsNone(get_job())
+    tc.assertEqual(rm.overtake_counts['1_001'], 2)
+    # but no more
+    finish('0_002')
+    tc.assertIsNone(get_job())
+    tc.assertIn("waiting for resources to start games 1_001 1_002 1_003",
+                fx.messages('status'))
+    finish('1_000')
+    tc.assertEqual(get_job(), '1_001')
+    tc.assertEqual(get_job(), '0_004')
+    tc.assertEqual(held(), ['1_002', '1_003'])
+
+    tc.assertRaisesRegexp(
+        RingmasterError, "max_overtakes is negative",
+        Ringmaster_fixture, tc, playoff_ctl, ["max_overtakes = -1"])
+
+def test_resource_limits_large_matchup_not_starved(tc):
+    # With small games finishing and being replaced all the time, the large
+    # matchup still gets its share of games (each large game is overtaken at
+    # most max_overtakes times).
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "players['p3'] = Player('testw init=p2', threads=8)",
+        "matchups.append(Matchup('p1', 'p3'))",
+        "max_threads = 8",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    rm.set_parallel_worker_count(4)
+    started = []
+    for i in xrange(24):
+        while True:
+            job = rm.get_job()
+            if job is NoJobAvailable:
+                break
+            started.append(job.game_id)
+        oldest = min(rm.games_in_progress)
+        rm.process_response(
+            fake_response(rm.games_in_progress[oldest], 'b'))
+    large = [game_id for game_id in started if game_id.startswith('1_')]
+    small = [game_id for game_id in started if game_id.startswith('0_')]
+    tc.assertTrue(len(large) >= 10, started)
+    tc.assertTrue(abs(len(large) - len(small)) <= 4, started)
+
+def test_resource_limits_held_job(tc):
+    fx = Ringmaster_fixture(tc, mcts_ctl, [
+        "max_threads = 4",
+        "def make_candidate(foo):",
+        "    return Player('candidate', threads=3)",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    first = rm.get_job()
+    tc.assertEqual(first.player_b.threads + first.player_w.threads, 4)
+    tc.assertIs(rm.get_job(), NoJobAvailable)
+    [held_job] = rm.held_jobs
+    held_id = held_job.game_id
+    tc.assertIn("waiting for resources to start game %s" % held_id,
+                fx.messages('status'))
+    tc.assertIs(rm.get_job(), NoJobAvailable)
+    rm.process_response(fake_response(first, 'b'))
+    tc.assertEqual(rm.get_job().game_id, held_id)
+    tc.assertEqual(rm.held_jobs, [])
+
+def test_automatic_worker_count(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "max_workers = 3",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    rm.cpu_information = ([0, 1, 2, 3], {})
+    rm.set_automatic_worker_count()
+    rm._initialise_worker_limit_controller()
+    tc.assertEqual(rm.get_worker_limit(), 1)
+    tc.assertEqual(rm._cpu_count, 4)
+    rm.idle_cpus = 2.0
+    for i in xrange(4):
+        job = rm.get_job()
+        rm._game_start_times[job.game_id] -= 10
+        response = fake_response(job, 'b')
+        response.move_times = {'p1' : [0.5] * 10, 'p2' : [0.6] * 10}
+        response.game_result.cpu_times = {'p1' : 4.0, 'p2' : None}
+        rm.process_response(response)
+    tc.assertEqual(rm.get_worker_limit(), 2)
+    # The CPUs are only counted once
+    tc.assertEqual(rm.cpu_information_requests, 1)
+    tc.assertIn("using 2 workers (chosen automatically)",
+                fx.messages('status'))
+    log = fx.get_log()
+    tc.assertIn("choosing worker count automatically (from 1 to 3)\n", log)
+    tc.assertTrue(re.search(
+        r"automatic worker count: level 1: 4 jobs, throughput [0-9.]+/s, "
+        r"cost \?, latency \?: increasing to 2\n", log))
+    handle = rm._handle_control_request
+    tc.assertEqual(handle('workers', ['3']), "")
+    tc.assertIsNone(rm.worker_limit_controller)
+    tc.assertTrue(fx.get_log().endswith(
+        "automatic worker count history: 1 2\n"
+        "automatic worker count disabled\n"
+        "worker count changed to 3\n"))
+
+def test_automatic_worker_count_tuner(tc):
+    # Tuner candidates have a new player code for each game, but share a
+    # baseline, so their CPU time per move is checked for contention.
+    fx = Ringmaster_fixture(tc, mcts_ctl, [
+        "max_workers = 2",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    rm.set_automatic_worker_count()
+    rm._initialise_worker_limit_controller()
+    rm.idle_cpus = 2.0
+    def play_games(n, cpu_time, back_date):
+        for i in xrange(n):
+            job = rm.get_job()
+            rm._game_start_times[job.game_id] -= back_date
+            response = fake_response(job, 'b')
+            response.move_times = {
+                job.player_b.code : [0.5] * 10,
+                job.player_w.code : [0.5] * 10,
+                }
+            response.game_result.cpu_times = {
+                job.player_b.code : 1.0,
+                job.player_w.code : cpu_time,
+                }
+            rm.process_response(response)
+    play_games(4, 1.0, back_date=10)
+    tc.assertEqual(rm.get_worker_limit(), 2)
+    tc.assertEqual(sorted(rm.worker_limit_controller._baselines),
+                   ['candidate', 'p1'])
+    # These games start after the level changed, so they're measured
+    play_games(4, 2.0, back_date=0)
+    tc.assertEqual(rm.get_worker_limit(), 1)
+    tc.assertIn("contention; reducing to 1", fx.get_log())
+
+def test_automatic_worker_count_bounds(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "cpus_per_game = 2",
+        "min_workers = 2",
+        ])
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    rm.cpu_information = ([0, 1, 2, 3, 4, 5, 6], {})
+    rm.set_automatic_worker_count()
+    tc.assertEqual(rm.worker_count, 2)
+    rm._allocate_worker_cpus()
+    rm._initialise_worker_limit_controller()
+    tc.assertEqual(rm.worker_limit_controller.minimum, 2)
+    tc.assertEqual(rm.worker_limit_controller.maximum, 3)
+    tc.assertEqual(rm.get_worker_cpus(2), [4, 5])
+    rm.max_workers = 4
+    tc.assertRaisesRegexp(
+        RingmasterError,
+        "^not enough CPUs for 4 workers with cpus_per_game 2 "
+        "\(7 CPUs available\)$",
+        rm._allocate_worker_cpus)
+    rm.set_parallel_worker_count(2)
+    rm._initialise_worker_limit_controller()
+    tc.assertIsNone(rm.worker_limit_controller)
+
+def test_worker_start_lock(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    tc.assertIs(fx.ringmaster.get_worker_start_lock(),
+                fx.ringmaster._control_lock)
+
+def test_wakeup_function_lock(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    fx.initialise_clean()
+    rm = fx.ringmaster
+    calls = []
+    rm.set_wakeup_function(lambda: calls.append("wake"))
+    rm.set_parallel_worker_count(2)
+    tc.assertEqual(rm._handle_control_request("max-games", ["3"]), "")
+    tc.assertEqual(calls, ["wake"])
+    # Clearing the function waits for a command in progress
+    rm._control_lock.acquire()
+    try:
+        t = threading.Thread(target=rm.set_wakeup_function, args=(None,))
+        t.start()
+        t.join(0.05)
+        tc.assertTrue(t.isAlive())
+        tc.assertIsNotNone(rm._wakeup_function)
+    finally:
+        rm._control_lock.release()
+    t.join()
+    tc.assertIsNone(rm._wakeup_function)
+    rm._handle_control_request("max-games", ["3"])
+    tc.assertEqual(calls, ["wake"])
+
+def test_automatic_worker_count_settings(tc):
+    tc.assertRaisesRegexp(
+        RingmasterError, "max_workers is less than min_workers",
+        Ringmaster_fixture, tc, playoff_ctl, [
+            "min_workers = 3",
+            "max_workers = 2",
+            ])
+
+def test_metrics(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl)
+    fx.initialise_clean()
+    fx.ringmaster.run(max_games=2)
+    metrics = fx.ringmaster.get_metrics()
+    tc.assertIn(
+        'gomill_games_started_total{competition="test",matchup="0"} 2\n',
+        metrics)
+    tc.assertIn(
+        'gomill_games_completed_total{competition="test",matchup="0"} 2\n',
+        metrics)
+    tc.assertIn(
+        'gomill_player_cpu_games_total{competition="test",player="p1"} 2\n',
+        metrics)
+    tc.assertIn(
+        'gomill_move_time_seconds_count{competition="test",player="p2"} ',
+        metrics)
+    tc.assertIn('gomill_workers{competition="test"} 1\n', metrics)
+    tc.assertEqual(
+        fx.ringmaster._handle_control_request('metrics', []).split("\n")[0],
+        metrics.split("\n")[0])
+
+def test_metrics_file_setting(tc):
+    fx = Ringmaster_fixture(tc, playoff_ctl, [
+        "metrics_file = 'test.prom'",
+        ])
+    tc.assertEqual(fx.ringmaster.metrics_pathname,
+                   "/nonexistent/ctl/test.prom")
@@ -6,12 +6,19 @@ from optparse import OptionParser
 
 test_modules = [
     'utils_tests',
+    'cpu_affinity_tests',
     'common_tests',
     'board_tests',
+    'board_hashes_tests',
     'sgf_grammar_tests',
     'sgf_properties_tests',
     'sgf_tests',
     'sgf_moves_tests',
+    'sgf_index_tests',
+    'sgf_archive_tests',
+    'position_index_tests',
+    'game_fingerprint_tests',
+    'live_sgf_tests',
     'gameplay_tests',
     'gtp_engine_tests',
     'gtp_state_tests',
@@ -20,12 +27,18 @@ test_modules = [
     'gtp_game_tests',
     'game_job_tests',
     'setting_tests',
+    'job_manager_tests',
     'competition_scheduler_tests',
     'competition_tests',
+    'result_database_tests',
     'playoff_tests',
     'allplayall_tests',
     'mcts_tuner_tests',
     'cem_tuner_tests',
+    'spsa_tuner_tests',
+    'ringmaster_presenter_tests',
+    'ringmaster_control_tests',
+    'ringmaster_metrics_tests',
     'ringmaster_tests',
     ]
 
@@ -0,0 +1,98 @@
+"""Tests for sgf_archives.py."""
+
+from __future__ import with_statement
+
+import gzip
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import sgf_archives
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+def game(n):
+    return "(;FF[4]GM[1]SZ[9]C[game %d];B[ee])" % n
+
+def test_archive(tc):
+    dirname = tc.sandbox()
+    writer = sgf_archives.Sgf_archive_writer(dirname)
+    writer.add_game("g0", game(0))
+    writer.add_game("g1", game(1) + "\n")
+    writer.close()
+    tc.assertEqual(sorted(os.listdir(dirname)),
+                   ["games-0000.sgf", "games.index"])
+    with open(os.path.join(dirname, "games-0000.sgf")) as f:
+        tc.assertEqual(f.read(), game(0) + "\n" + game(1) + "\n")
+    archive = sgf_archives.Sgf_archive(dirname)
+    tc.assertEqual(archive.get_game_ids(), ["g0", "g1"])
+    tc.assertIs(archive.has_game("g1"), True)
+    tc.assertIs(archive.has_game("g2"), False)
+    tc.assertEqual(archive.get_location("g1"),
+                   (os.path.join(dirname, "games-0000.sgf"), 34, 34))
+    tc.assertEqual(archive.get_sgf_string("g1"), game(1) + "\n")
+    tc.assertEqual(archive.get_sgf_game("g0").get_root().get("C"), "game 0")
+    tc.assertRaises(KeyError, archive.get_sgf_string, "g2")
+
+def test_bad_game_id(tc):
+    writer = sgf_archives.Sgf_archive_writer(tc.sandbox())
+    tc.assertRaisesRegexp(ValueError, "bad game id",
+                          writer.add_game, "a\tb", game(0))
+    writer.close()
+
+def test_empty_archive(tc):
+    archive = sgf_archives.Sgf_archive(tc.sandbox())
+    tc.assertEqual(archive.get_game_ids(), [])
+
+def test_compressed_archive(tc):
+    dirname = tc.sandbox()
+    writer = sgf_archives.Sgf_archive_writer(dirname, compress=True)
+    for i in range(3):
+        writer.add_game("g%d" % i, game(i))
+    writer.close()
+    archive = sgf_archives.Sgf_archive(dirname)
+    tc.assertEqual(archive.get_sgf_string("g1"), game(1) + "\n")
+    pathname = os.path.join(dirname, "games-0000.sgf.gz")
+    tc.assertEqual(archive.get_location("g2")[0], pathname)
+    # The file as a whole is an ordinary gzip file
+    f = gzip.open(pathname)
+    tc.assertEqual(f.read(), "".join(game(i) + "\n" for i in range(3)))
+    f.close()
+
+def test_rotation_and_reopening(tc):
+    dirname = tc.sandbox()
+    writer = sgf_archives.Sgf_archive_writer(dirname, max_file_size=60)
+    for i in range(3):
+        writer.add_game("g%d" % i, game(i))
+    writer.close()
+    tc.assertEqual(sorted(os.listdir(dirname)),
+                   ["games-0000.sgf", "games-0001.sgf", "games.index"])
+    writer = sgf_archives.Sgf_archive_writer(dirname, max_file_size=200)
+    writer.add_game("g3", game(3))
+    # replacing an earlier game
+    writer.add_game("g0", game(10))
+    writer.close()
+    writer = sgf_archives.Sgf_archive_writer(dirname, compress=True)
+    writer.add_game("g4", game(4))
+    writer.close()
+    archive = sgf_archives.Sgf_archive(dirname)
+    tc.assertEqual(archive.get_game_ids(), ["g0", "g1", "g2", "g3", "g4"])
+    tc.assertEqual(
+        [os.path.basename(archive.get_location(game_id)[0])
+         for game_id in archive.get_game_ids()],
+        ["games-0001.sgf", "games-0000.sgf", "games-0001.sgf",
+         "games-0001.sgf", "games-0002.sgf.gz"])
+    tc.assertEqual(archive.get_sgf_string("g0"), game(10) + "\n")
+    tc.assertEqual(archive.get_sgf_string("g3"), game(3) + "\n")
+    tc.assertEqual(archive.get_sgf_string("g4"), game(4) + "\n")
+
+def test_damaged_index(tc):
+    dirname = tc.sandbox()
+    writer = sgf_archives.Sgf_archive_writer(dirname)
+    writer.add_game("g0", game(0))
+    writer.close()
+    with open(os.path.join(dirname, "games.index"), "a") as f:
+        f.write("junk\ng1\tgames-0000.sgf\t3")
+    archive = sgf_archives.Sgf_archive(dirname)
+    tc.assertEqual(archive.get_game_ids(), ["g0"])
@@ -247,6 +247,46 @@ def test_parser_properties(tc):
     tc.assertEqual(props("(;XX[1]YY[2]XX[3]YY[4])"),
                    [{'XX': ['1', '3'], 'YY' : ['2', '4']}])
 
+def test_parser_lower_case_propidents(tc):
+    parse_sgf_game = sgf_grammar.parse_sgf_game
+
+    def props(s):
+        coarse_game = parse_sgf_game(s)
+        return coarse_game.sequence
+
+    tc.assertEqual(props("(;AddBlack[ag][ah]Comment[x];White[bc])"),
+                   [{'AB': ['ag', 'ah'], 'C': ['x']},
+                    {'W': ['bc']}])
+    tc.assertEqual(props("(;AB[ag]AddBlack[ah])"),
+                   [{'AB': ['ag', 'ah']}])
+
+def test_parser_matches_tokeniser(tc):
+    # The parser doesn't use tokenise(), but it should stop in the same place
+    s = "junk (;B[ag];W[ah](;B[ai])(;B[aj]))(;X[1]) junk"
+    tokens, tail_index = sgf_grammar.tokenise(s)
+    tc.assertEqual(sgf_grammar._parse_sgf_game(s, 0)[1], tail_index)
+    tc.assertEqual(sgf_grammar._parse_sgf_game(s, tail_index)[1], len(s) - 5)
+    tc.assertEqual(sgf_grammar._parse_sgf_game(s, len(s) - 5), (None, None))
+
+def test_parse_compact(tc):
+    coarse_game = sgf_grammar.parse_sgf_game(
+        "(;AB[aa][ab]XY[1]XY[2];B[cc](;W[dd]))", compact=True)
+    tc.assertEqual(coarse_game.sequence,
+                   [{'AB' : ("aa", "ab"), 'XY' : ("1", "2")},
+                    {'B' : ("cc",)}])
+    tc.assertEqual(coarse_game.children[0].sequence, [{'W' : ("dd",)}])
+    games = sgf_grammar.parse_sgf_collection("(;B[aa])(;W[bb])", compact=True)
+    tc.assertEqual([game.sequence for game in games],
+                   [[{'B' : ("aa",)}], [{'W' : ("bb",)}]])
+
+def test_parser_interns_propidents(tc):
+    g1 = sgf_grammar.parse_sgf_game("(;XyZZ[1])")
+    g2 = sgf_grammar.parse_sgf_game("(;XZZ[2])")
+    ident1, = g1.sequence[0].keys()
+    ident2, = g2.sequence[0].keys()
+    tc.assertEqual(ident1, "XZZ")
+    tc.assertIs(ident1, ident2)
+
 def test_parse_sgf_collection(tc):
     parse_sgf_collection = sgf_grammar.parse_sgf_collection
 
@@ -282,6 +322,25 @@ def test_parse_sgf_collection(tc):
     tc.assertEqual(str(ar.exception),
                    "error parsing game 1: unexpected end of SGF data")
 
+def test_iter_sgf_collection(tc):
+    def positions(s):
+        return [(start, end, len(game_tree.sequence))
+                for (start, end, game_tree)
+                in sgf_grammar.iter_sgf_collection(s)]
+
+    tc.assertEqual(positions(""), [])
+    tc.assertEqual(positions("junk"), [])
+    s = "dummy (;X[1];X[2](;B[bc])) junk\n(;Y[1];Y[2]) Nonsense"
+    tc.assertEqual(positions(s), [(6, 26, 2), (32, 44, 2)])
+    tc.assertEqual(s[32:44], "(;Y[1];Y[2])")
+
+    games = sgf_grammar.iter_sgf_collection("(;X[1]) (;Y[1];Y[2]")
+    tc.assertEqual(games.next()[:2], (0, 7))
+    with tc.assertRaises(ValueError) as ar:
+        games.next()
+    tc.assertEqual(str(ar.exception),
+                   "error parsing game 1: unexpected end of SGF data")
+
 
 def test_parse_compose(tc):
     pc = sgf_grammar.parse_compose
@@ -377,3 +436,40 @@ def test_serialise_game_tree(tc):
     tc.assertEqual(sgf_grammar.serialise_game_tree(coarse_game, wrap=None),
                    serialised.replace("\n", "")+"\n")
 
+
+def test_write_node_tree(tc):
+    from cStringIO import StringIO
+    class Node(object):
+        def __init__(self, properties):
+            self.properties = properties
+            self.children = []
+    def check(serialised, wrap=79):
+        coarse_game = sgf_grammar.parse_sgf_game(serialised)
+        root = Node(coarse_game.sequence[0])
+        sgf_grammar.make_tree(
+            coarse_game, root,
+            lambda parent, properties: Node(properties),
+            lambda parent, child: parent.children.append(child))
+        f = StringIO()
+        sgf_grammar.write_node_tree(
+            f, root, lambda node: node.children,
+            lambda node: node.properties, wrap)
+        tc.assertEqual(f.getvalue(),
+                       sgf_grammar.serialise_game_tree(coarse_game, wrap))
+    check("(;AB[aa][ab][ac]C[comment \xa3];W[ab];C[];C[]"
+          "(;B[bc])(;B[bd];W[ca](;B[da])(;B[db];W[ea])))")
+    check("(;FF[4]C[a];B[aa](;W[bb])(;W[cc];B[dd])(;W[ee]))", wrap=None)
+    check("(;FF[4]C[a];B[aa](;W[bb])(;W[cc];B[dd])(;W[ee]))", wrap=5)
+    check("(;C[%s];B[aa];W[bb])" % ("x" * 100))
+    check("(;)")
+
+def test_write_node_tree_transcode(tc):
+    from cStringIO import StringIO
+    coarse_game = sgf_grammar.parse_sgf_game("(;C[ab];B[cd])")
+    f = StringIO()
+    sgf_grammar.write_node_tree(
+        f, coarse_game.sequence[0],
+        lambda node: coarse_game.sequence[1:2] if node is
+                     coarse_game.sequence[0] else [],
+        lambda node: node, transcode=str.upper)
+    tc.assertEqual(f.getvalue(), "(;C[AB];B[CD])\n")
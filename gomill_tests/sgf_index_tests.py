@@ -0,0 +1,97 @@
+"""Tests for sgf_index.py."""
+
+import os
+
+from gomill_tests import gomill_test_support
+
+from gomill import sgf_grammar
+from gomill import sgf_index
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+GAME1 = "(;FF[4]SZ[9]PB[Alice]PW[Bob]RE[B+R]KM[7.5]DT[2017-04-14];B[ee])\n"
+GAME2 = "(;FF[4]SZ[19]PB[Bob]PW[Carol]RE[W+3.5]HA[2]GN[G2];W[dd];B[pp])\n"
+GAME3 = "(;FF[4]CA[ISO-8859-1]PB[Dave \xa3]PW[Alice]SZ[13]KM[junk])\n"
+
+def write_file(pathname, contents):
+    f = open(pathname, "wb")
+    f.write(contents)
+    f.close()
+
+def test_get_indexed_properties(tc):
+    props = sgf_index.get_indexed_properties(
+        sgf_grammar.parse_sgf_game(GAME3))
+    tc.assertEqual(props, {
+        'PB' : "Dave \xc2\xa3", 'PW' : "Alice", 'RE' : None, 'SZ' : 13,
+        'KM' : None, 'HA' : None, 'DT' : None, 'GN' : None, 'EV' : None})
+    props = sgf_index.get_indexed_properties(
+        sgf_grammar.parse_sgf_game("(;SZ[1000])"))
+    tc.assertEqual(set(props.values()), set([None]))
+
+def test_sgf_index(tc):
+    dirname = os.path.join(tc.sandbox(), "games")
+    os.mkdir(dirname)
+    os.mkdir(os.path.join(dirname, "sub"))
+    write_file(os.path.join(dirname, "one.sgf"), GAME1)
+    write_file(os.path.join(dirname, "sub", "two.SGF"),
+               "junk " + GAME2 + GAME3 + "more junk")
+    write_file(os.path.join(dirname, "notes.txt"), GAME1)
+    write_file(os.path.join(dirname, "bad.sgf"), GAME1 + "(;B[aa]")
+
+    index_pathname = os.path.join(tc.sandbox(), "index.db")
+    index = sgf_index.Sgf_index(index_pathname)
+    errors = index.update_directory(dirname)
+    tc.assertEqual(errors, [(os.path.join(dirname, "bad.sgf"),
+                             "error parsing game 1: "
+                             "unexpected end of SGF data")])
+    tc.assertEqual(index.get_errors(), errors)
+    tc.assertEqual(index.count_games(), 4)
+
+    games = index.find_games(player="Alice")
+    tc.assertEqual([(os.path.basename(g.pathname), g.game_number)
+                    for g in games],
+                   [("bad.sgf", 0), ("one.sgf", 0), ("two.SGF", 1)])
+    tc.assertEqual(games[1].properties['KM'], 7.5)
+    tc.assertEqual(games[1].properties['DT'], "2017-04-14")
+    tc.assertEqual(games[2].offset, 5 + len(GAME2))
+    tc.assertEqual(games[2].get_sgf_string(), GAME3.rstrip("\n"))
+    tc.assertEqual(games[2].get_sgf_game().get_player_name('b'),
+                   "Dave \xc2\xa3")
+
+    games = index.find_games(PB="Bob", SZ=19)
+    tc.assertEqual(len(games), 1)
+    tc.assertEqual(games[0].properties['HA'], 2)
+    tc.assertEqual(games[0].get_sgf_game().get_root()[0].get_move(),
+                   ('w', (15, 3)))
+    tc.assertEqual(index.find_games(PB="Bob", SZ=9), [])
+    tc.assertRaisesRegexp(ValueError, "property not indexed: C",
+                          index.find_games, C="x")
+    index.close()
+
+    # Reopen, change one file and remove another
+    index = sgf_index.Sgf_index(index_pathname)
+    tc.assertEqual(index.count_games(), 4)
+    write_file(os.path.join(dirname, "bad.sgf"), GAME2)
+    os.remove(os.path.join(dirname, "one.sgf"))
+    tc.assertEqual(index.update_directory(dirname), [])
+    tc.assertEqual(index.get_errors(), [])
+    tc.assertEqual(len(index.find_games(player="Bob")), 2)
+    tc.assertEqual(len(index.find_games(player="Alice")), 1)
+    index.close()
+
+def test_sgf_index_update_files(tc):
+    pathname = os.path.join(tc.sandbox(), "one.sgf")
+    write_file(pathname, GAME1)
+    index = sgf_index.Sgf_index(os.path.join(tc.sandbox(), "index.db"))
+    tc.assertEqual(index.update_files([pathname]), [])
+    tc.assertEqual(index.count_games(), 1)
+    # Unchanged files aren't reread
+    index.connection.execute("UPDATE games SET PB = 'Zed'")
+    tc.assertEqual(index.update_files([pathname]), [])
+    tc.assertEqual(index.find_games()[0].properties['PB'], "Zed")
+    os.remove(pathname)
+    tc.assertEqual(index.update_files([pathname]), [])
+    tc.assertEqual(index.count_games(), 0)
+    index.close()
@@ -3,6 +3,7 @@ from gomill_tests import gomill_test_support
 from gomill import ascii_boards
 from gomill import boards
 from gomill import sgf
+from gomill import sgf_grammar
 from gomill import sgf_moves
 
 def make_tests(suite):
@@ -112,6 +113,74 @@ def test_get_setup_and_moves_board_provided(tc):
                           sgf_moves.get_setup_and_moves, g1, b2)
 
 
+def test_get_compact_setup_and_moves(tc):
+    def compact(s):
+        size, (setup_colours, setup_points), (colours, points) = \
+            sgf_moves.get_compact_setup_and_moves(
+                sgf_grammar.parse_sgf_game(s))
+        tc.assertEqual(setup_points.typecode, 'h')
+        tc.assertEqual(points.typecode, 'h')
+        return (size,
+                [(chr(c), sgf_moves.decode_compact_point(p, size))
+                 for c, p in zip(setup_colours, setup_points)],
+                [(chr(c), sgf_moves.decode_compact_point(p, size))
+                 for c, p in zip(colours, points)])
+
+    tc.assertEqual(compact(SAMPLE_SGF),
+                   (9,
+                    [('b', (0, 0)), ('b', (1, 1)), ('b', (4, 4)),
+                     ('w', (6, 5)), ('w', (6, 6))],
+                    [('b', (2, 3)), ('w', (3, 4)), ('b', None), ('w', None)]))
+    tc.assertEqual(compact("(;SZ[26];B[ab];W[bc];B[tt])"),
+                   (26, [], [('b', (24, 0)), ('w', (23, 1)), ('b', (6, 19))]))
+    tc.assertEqual(compact("(;B[ab];C[x];W[])"),
+                   (19, [], [('b', (17, 0)), ('w', None)]))
+    tc.assertEqual(compact("(;SZ[5]AB[aa:bb]AW[ee];W[cc](;B[dd])(;B[ee]))"),
+                   (5,
+                    [('b', (3, 0)), ('b', (3, 1)), ('b', (4, 0)),
+                     ('b', (4, 1)), ('w', (0, 4))],
+                    [('w', (2, 2)), ('b', (1, 3))]))
+    # The setup position isn't built: root AE is ignored and repeated points
+    # are kept.
+    tc.assertEqual(compact("(;SZ[5]AB[aa][aa]AW[aa]AE[bb];B[cc])"),
+                   (5,
+                    [('b', (4, 0)), ('b', (4, 0)), ('w', (4, 0))],
+                    [('b', (2, 2))]))
+
+    g = sgf_grammar.parse_sgf_game(SAMPLE_SGF)
+    board, plays = sgf_moves.get_setup_and_moves(sgf.Sgf_game.from_string(
+        SAMPLE_SGF))
+    size, setup, moves = sgf_moves.get_compact_setup_and_moves(g)
+    tc.assertEqual(
+        [(chr(c), sgf_moves.decode_compact_point(p, size))
+         for c, p in zip(*moves)],
+        plays)
+
+    tc.assertRaisesRegexp(
+        ValueError, "setup properties after the root node",
+        sgf_moves.get_compact_setup_and_moves,
+        sgf_grammar.parse_sgf_game("(;SZ[9];B[ab];AW[bc])"))
+    tc.assertRaisesRegexp(
+        ValueError, "mixed setup and moves in root node",
+        sgf_moves.get_compact_setup_and_moves,
+        sgf_grammar.parse_sgf_game("(;SZ[9]AB[ab]W[bc])"))
+    tc.assertRaisesRegexp(
+        ValueError, "bad move: zz",
+        sgf_moves.get_compact_setup_and_moves,
+        sgf_grammar.parse_sgf_game("(;SZ[9];B[zz])"))
+    tc.assertRaisesRegexp(
+        ValueError, "bad setup point: tt",
+        sgf_moves.get_compact_setup_and_moves,
+        sgf_grammar.parse_sgf_game("(;SZ[19]AB[aa][tt])"))
+    tc.assertRaisesRegexp(
+        ValueError, "bad SZ property: nine",
+        sgf_moves.get_compact_setup_and_moves,
+        sgf_grammar.parse_sgf_game("(;SZ[nine];B[ab])"))
+    tc.assertRaisesRegexp(
+        ValueError, "size out of range: 30",
+        sgf_moves.get_compact_setup_and_moves,
+        sgf_grammar.parse_sgf_game("(;SZ[30];B[ab])"))
+
 def test_set_initial_position(tc):
     board = ascii_boards.interpret_diagram(DIAGRAM1, 9)
     sgf_game = sgf.Sgf_game(9)
@@ -3,6 +3,7 @@
 
 from __future__ import with_statement
 
+import sys
 from textwrap import dedent
 
 from gomill_tests import gomill_test_support
@@ -130,6 +131,47 @@ def test_node_get(tc):
     tc.assertEqual(root.get('AE'), set())
     tc.assertRaisesRegexp(ValueError, "multiple values", root.get, 'PW')
 
+def test_node_value_cache(tc):
+    sgf_game = sgf.Sgf_game.from_string(
+        "(;FF[4]GM[1]SZ[9]AB[ai][bh]C[comment];B[dg])")
+    root = sgf_game.get_root()
+    tc.assertIsNot(root.get('AB'), root.get('AB'))
+    sgf_game.enable_value_cache()
+    ab = root.get('AB')
+    tc.assertEqual(ab, set([(0, 0), (1, 1)]))
+    tc.assertIs(root.get('AB'), ab)
+    tc.assertEqual(root.get_setup_stones(), (ab, set(), set()))
+    tc.assertRaises(KeyError, root.get, 'XX')
+    root.set('AB', [(2, 2)])
+    tc.assertEqual(root.get('AB'), set([(2, 2)]))
+    root.set_raw('AB', "ai")
+    tc.assertEqual(root.get('AB'), set([(0, 0)]))
+    root.set_raw_list('AB', ["ai", "bh"])
+    tc.assertEqual(root.get('AB'), ab)
+    root.set_setup_stones(black=[], white=[(3, 3)])
+    tc.assertRaises(KeyError, root.get, 'AB')
+    tc.assertEqual(root.get('AW'), set([(3, 3)]))
+    root.unset('AW')
+    tc.assertRaises(KeyError, root.get, 'AW')
+    tc.assertEqual(root.get('C'), "comment")
+    root.add_comment_text("more")
+    tc.assertEqual(root.get('C'), "comment\n\nmore")
+
+    node = sgf_game.get_last_node()
+    tc.assertEqual(node.get('B'), (2, 3))
+    node.set_move('w', (4, 4))
+    tc.assertRaises(KeyError, node.get, 'B')
+    tc.assertEqual(node.get('W'), (4, 4))
+
+    # Changing property types discards cached values
+    presenter = sgf_game.get_property_presenter()
+    presenter.register_property('C', presenter.get_property_type('GN'))
+    tc.assertEqual(root.get('C'), "comment  more")
+
+    sgf_game.enable_value_cache(False)
+    root.set_raw('AB', "ai")
+    tc.assertIsNot(root.get('AB'), root.get('AB'))
+
 def test_text_values(tc):
     def check(s):
         sgf_game = sgf.Sgf_game.from_string(s)
@@ -296,6 +338,19 @@ def test_serialise_wrap(tc):
     tc.assertEqual(map(str, sgf_game.get_main_sequence()),
                    map(str, sgf_game2.get_main_sequence()))
 
+def test_serialise_to_file(tc):
+    from cStringIO import StringIO
+    sgf_game = sgf.Sgf_game.from_string(SAMPLE_SGF_VAR)
+    for wrap in (79, None, 10):
+        f = StringIO()
+        sgf_game.serialise_to_file(f, wrap)
+        tc.assertEqual(f.getvalue(), sgf_game.serialise(wrap))
+    sgf_game.get_root().set("CA", "latin-1")
+    sgf_game.get_root().set("C", "\xc2\xa3")
+    f = StringIO()
+    sgf_game.serialise_to_file(f)
+    tc.assertIn("C[\xa3]", f.getvalue())
+
 def test_encoding(tc):
     g1 = sgf.Sgf_game(19)
     tc.assertEqual(g1.get_charset(), "UTF-8")
@@ -484,6 +539,98 @@ def test_tree_mutation_from_coarse_game(tc):
                    "(;SZ[9](;N[n1])(;N[n2])(;N[n4]))\n")
     tc.assertRaises(ValueError, root.delete)
 
+def test_lazy_expansion(tc):
+    sgf_game = sgf.Sgf_game.from_string(
+        "(;C[root](;B[aa];W[ab](;B[ac])(;B[ad]))(;B[ba];W[bb]))")
+    root = sgf_game.get_root()
+    branch1, branch2 = root
+    tc.assertIs(root[0], branch1)
+    tc.assertEqual(branch2.get_raw('B'), "ba")
+    tc.assertEqual([node.get_raw('B') for node in branch1[0]], ["ac", "ad"])
+    tc.assertIs(branch1[0].parent, branch1)
+    # branch2's children haven't been created
+    tc.assertIs(type(branch2), sgf._Unexpanded_tree_node)
+    tc.assertEqual(len(branch2), 1)
+    tc.assertIs(type(branch2), sgf.Tree_node)
+    tc.assertIs(branch2[0], branch2[0])
+
+def test_compact_nodes(tc):
+    sgf_game = sgf.Sgf_game.from_string(
+        "(;C[root](;B[aa];W[ab])(;B[ba]))")
+    root = sgf_game.get_root()
+    leaf = root[1]
+    tc.assertEqual(leaf[0:], [])
+    for node in (root, root[0], root[0][0], leaf):
+        tc.assertRaises(AttributeError, getattr, node, '__dict__')
+    # Leaf nodes share an empty child list until a child is added
+    tc.assertIs(root[0][0]._children, leaf._children)
+    tc.assertEqual(len(leaf), 0)
+    tc.assertRaises(IndexError, leaf.__getitem__, 0)
+    tc.assertRaises(ValueError, leaf.index, root)
+    tc.assertEqual(list(leaf), [])
+    child = leaf.new_child()
+    tc.assertEqual(list(leaf), [child])
+    tc.assertEqual(len(root[0][0]), 0)
+    tc.assertEqual(leaf.index(child), 0)
+    grandchild = child.new_child()
+    grandchild.reparent(root[0][0])
+    tc.assertEqual(len(child), 0)
+    tc.assertEqual(list(root[0][0]), [grandchild])
+
+def test_compact_parse(tc):
+    sgf_game = sgf.Sgf_game.from_string(
+        "(;SZ[9]C[root]AB[aa][ab]DD[];B[ca];W[]XX[x]XX[y])", compact=True)
+    root = sgf_game.get_root()
+    tc.assertEqual(root.get_raw_property_map()['AB'], ("aa", "ab"))
+    tc.assertEqual(root.get_raw_list('AB'), ["aa", "ab"])
+    tc.assertIs(type(root.get_raw_list('AB')), list)
+    tc.assertEqual(root.get('AB'), set([(8, 0), (7, 0)]))
+    tc.assertEqual(root.get('DD'), set())
+    tc.assertEqual(root.get('C'), "root")
+    node1, node2 = sgf_game.get_main_sequence()[1:]
+    tc.assertEqual(node1.get_move(), ('b', (8, 2)))
+    tc.assertEqual(node2.get_move(), ('w', None))
+    tc.assertEqual(node2.get_raw_list('XX'), ["x", "y"])
+    node2.set('C', "comment")
+    node2.set_raw_list('XX', ["z"])
+    tc.assertEqual(sgf_game.serialise(),
+                   "(;AB[aa][ab]C[root]DD[]SZ[9];B[ca];C[comment]W[]"
+                   "XX[z])\n")
+
+def test_compact_parse_memory(tc):
+    moves = "".join(";B[%s]W[%s]C[comment]" % (chr(97+i%19)*2, chr(98+i%18)*2)
+                    for i in xrange(400))
+    s = "(;SZ[19]%s)" % moves
+    def get_size(sgf_game):
+        total = 0
+        for node in sgf_game.get_main_sequence():
+            d = node.get_raw_property_map()
+            total += sys.getsizeof(node) + sys.getsizeof(d)
+            for values in d.itervalues():
+                total += sys.getsizeof(values)
+        return total
+    normal_size = get_size(sgf.Sgf_game.from_string(s))
+    compact_size = get_size(sgf.Sgf_game.from_string(s, compact=True))
+    tc.assertLess(compact_size, normal_size)
+
+def test_lazy_expansion_mutation(tc):
+    sgf_game = sgf.Sgf_game.from_string(
+        "(;C[root](;B[aa];W[ab])(;B[ba];W[bb])(;B[ca];W[cb]))")
+    root = sgf_game.get_root()
+    branch1, branch2, branch3 = root
+    # Reparent into a node whose children haven't been created
+    branch1.reparent(branch2, 0)
+    tc.assertEqual([node.get_raw_move() for node in branch2],
+                   [('b', "aa"), ('w', "bb")])
+    tc.assertEqual(branch1[0].get_raw_move(), ('w', "ab"))
+    branch3.new_child().set_raw('C', "new")
+    tc.assertEqual(len(branch3), 2)
+    branch3[0].delete()
+    tc.assertEqual(branch3[0].get_raw('C'), "new")
+    tc.assertEqual(
+        sgf_game.serialise(wrap=None),
+        "(;C[root](;B[ba](;B[aa];W[ab])(;W[bb]))(;B[ca];C[new]))\n")
+
 def test_tree_new_child_with_unexpanded_root_and_index(tc):
     sgf_game = sgf.Sgf_game.from_string("(;SZ[9](;N[n1];N[n3])(;N[n2]))")
     root = sgf_game.get_root()
@@ -701,7 +848,7 @@ def test_node_aliasing(tc):
     # Check the main_sequence_iter() optimisation was used, otherwise this test
     # isn't checking what it's supposed to.
     tc.assertIsNot(tree_node, plain_node)
-    tc.assertIs(tree_node.__class__, sgf.Tree_node)
+    tc.assertIsInstance(tree_node, sgf.Tree_node)
     tc.assertIs(plain_node.__class__, sgf.Node)
 
     tc.assertEqual(tree_node.get_raw('C'), "node 1")
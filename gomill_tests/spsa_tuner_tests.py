@@ -0,0 +1,235 @@
+"""Tests for spsa_tuners.py"""
+
+from __future__ import with_statement, division
+
+import random
+import cPickle as pickle
+
+from gomill import spsa_tuners
+from gomill.game_jobs import Game_job
+from gomill.spsa_tuners import Parameter_config
+from gomill.competitions import (
+    Player_config, CompetitionError, ControlFileError)
+
+from gomill_tests import gomill_test_support
+from gomill_tests import competition_test_support
+
+def make_tests(suite):
+    suite.addTests(gomill_test_support.make_simple_tests(globals()))
+
+
+def simple_make_candidate(*args):
+    if -1 in args:
+        raise ValueError("oops")
+    return Player_config("cand " + " ".join(map(str, args)))
+
+def default_config():
+    return {
+        'board_size' : 13,
+        'komi' : 7.5,
+        'players' : {},
+        'number_of_iterations' : 10,
+        'step_size' : 0.02,
+        'perturbation_size' : 0.1,
+        'stability_constant' : 0.0,
+        'perturbation_exponent' : 0.0,
+        'step_size_exponent' : 0.0,
+        'parameters' : [
+            Parameter_config(
+                'resign_at',
+                scale = float,
+                format = "rsn@ %.2f"),
+
+            Parameter_config(
+                'initial_wins',
+                scale = spsa_tuners.LINEAR(0, 100),
+                initial_value = 0.2,
+                format = "iwins %d"),
+            ],
+        'make_candidate' : simple_make_candidate,
+        }
+
+
+def test_parameter_config(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    config = default_config()
+    comp.initialise_from_control_file(config)
+    tc.assertEqual(len(comp.parameter_specs), 2)
+    tc.assertEqual(comp.parameter_specs[0].initial_value, 0.5)
+    tc.assertEqual(comp.parameter_specs[1].initial_value, 0.2)
+    tc.assertEqual(comp.format_optimiser_parameters([0.5, 0.2]),
+                   "rsn@ 0.50; iwins 20")
+    tc.assertEqual(comp.stability_constant, 0.0)
+
+    comp2 = spsa_tuners.Spsa_tuner('spsatest')
+    config2 = default_config()
+    del config2['stability_constant']
+    comp2.initialise_from_control_file(config2)
+    tc.assertEqual(comp2.stability_constant, 1.0)
+
+def test_bad_parameter_config(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    config = default_config()
+    config['parameters'].append(
+        Parameter_config(
+            'bad',
+            scale = float,
+            initial_value = 1.5))
+    with tc.assertRaises(ControlFileError) as ar:
+        comp.initialise_from_control_file(config)
+    tc.assertEqual(str(ar.exception),
+                   "parameter bad: 'initial_value': out of range (0.0 to 1.0)")
+
+def test_bad_settings(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    config = default_config()
+    config['perturbation_size'] = 0.6
+    with tc.assertRaises(ControlFileError) as ar:
+        comp.initialise_from_control_file(config)
+    tc.assertEqual(str(ar.exception),
+                   "perturbation_size: out of range (0.0 to 0.5)")
+
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    config = default_config()
+    config['step_size'] = 0.0
+    with tc.assertRaises(ControlFileError) as ar:
+        comp.initialise_from_control_file(config)
+    tc.assertEqual(str(ar.exception), "step_size: must be positive")
+
+def test_gain_sequences(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    config = default_config()
+    config['stability_constant'] = 3.0
+    config['step_size_exponent'] = 1.0
+    config['perturbation_exponent'] = 0.5
+    comp.initialise_from_control_file(config)
+    tc.assertAlmostEqual(comp.get_step_size(0), 0.02 / 4)
+    tc.assertAlmostEqual(comp.get_step_size(6), 0.02 / 10)
+    tc.assertAlmostEqual(comp.get_perturbation_size(0), 0.1)
+    tc.assertAlmostEqual(comp.get_perturbation_size(3), 0.05)
+
+def test_get_player_checks(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    comp.initialise_from_control_file(default_config())
+    checks = comp.get_player_checks()
+    tc.assertEqual(len(checks), 1)
+    tc.assertEqual(checks[0].player.code, 'candidate')
+    tc.assertEqual(checks[0].player.cmd_args, ['cand', '0.5', '20.0'])
+
+def test_play(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    comp.initialise_from_control_file(default_config())
+    comp.set_clean_status()
+    tc.assertEqual(comp.theta, [0.5, 0.2])
+    random.seed(1234)
+
+    job1 = comp.get_game()
+    tc.assertIsInstance(job1, Game_job)
+    tc.assertEqual(job1.game_id, '0')
+    tc.assertEqual(job1.game_data, 0)
+    tc.assertEqual(job1.player_b.code, '#0+')
+    tc.assertEqual(job1.player_w.code, '#0-')
+    tc.assertEqual(job1.board_size, 13)
+    tc.assertEqual(job1.komi, 7.5)
+    tc.assertEqual(job1.sgf_event, 'spsatest')
+    tc.assertRegexpMatches(job1.sgf_note, '^Candidate parameters:\n\\+ rsn@ ')
+    p1 = comp.outstanding_perturbations[0]
+    tc.assertEqual(
+        [round(p - 0.1*d, 10) for (p, d) in zip(p1.plus_parameters, p1.delta)],
+        [0.5, 0.2])
+    tc.assertEqual(
+        [round(p + 0.1*d, 10) for (p, d) in zip(p1.minus_parameters, p1.delta)],
+        [0.5, 0.2])
+
+    job2 = comp.get_game()
+    tc.assertEqual(job2.game_id, '1')
+    tc.assertEqual(job2.player_b.code, '#1-')
+    tc.assertEqual(job2.player_w.code, '#1+')
+    tc.assertItemsEqual(comp.outstanding_perturbations.keys(), [0, 1])
+
+    # Plus candidate wins: theta moves by step_size / (2 * c) = 0.1 along delta
+    comp.process_game_result(
+        competition_test_support.fake_response(job1, 'b'))
+    tc.assertEqual([round(t, 10) for t in comp.theta],
+                   [round(0.5 + 0.1*p1.delta[0], 10),
+                    round(0.2 + 0.1*p1.delta[1], 10)])
+    tc.assertEqual(comp.iterations_completed, 1)
+    tc.assertEqual(comp.plus_score, 1)
+
+    comp2 = spsa_tuners.Spsa_tuner('spsatest')
+    comp2.initialise_from_control_file(default_config())
+    comp2.set_status(pickle.loads(pickle.dumps(comp.get_status())))
+    tc.assertEqual(comp2.theta, comp.theta)
+    tc.assertEqual(comp2.iterations_completed, 1)
+    # The outstanding game is reissued
+    tc.assertEqual(comp2.get_game().game_id, '1')
+
+    # No winner: theta doesn't move
+    theta = comp.theta
+    comp.process_game_result(
+        competition_test_support.fake_response(job2, None))
+    tc.assertEqual(comp.theta, theta)
+    tc.assertEqual(comp.plus_score, 1.5)
+    tc.assertEqual(comp.outstanding_perturbations, {})
+
+    competition_test_support.check_screen_report(tc, comp, """\
+2/10 games played
+plus candidates' score: 1.5/2
+
+Current parameters: %s
+
+""" % comp.format_optimiser_parameters(comp.theta))
+
+def test_minus_wins(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    comp.initialise_from_control_file(default_config())
+    comp.set_clean_status()
+    comp.theta = [0.95, 0.02]
+    random.seed(1234)
+    job = comp.get_game()
+    perturbation = comp.outstanding_perturbations[0]
+    comp.process_game_result(
+        competition_test_support.fake_response(job, 'w'))
+    expected = [max(0.0, min(1.0, t - 0.1*d))
+                for (t, d) in zip([0.95, 0.02], perturbation.delta)]
+    tc.assertEqual([round(t, 10) for t in comp.theta],
+                   [round(t, 10) for t in expected])
+    tc.assertEqual(comp.plus_score, 0)
+
+def test_number_of_iterations(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    config = default_config()
+    config['number_of_iterations'] = 2
+    comp.initialise_from_control_file(config)
+    comp.set_clean_status()
+    job1 = comp.get_game()
+    job2 = comp.get_game()
+    tc.assertIs(comp.get_game(), spsa_tuners.NoGameAvailable)
+
+def test_game_errors(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    comp.initialise_from_control_file(default_config())
+    comp.set_clean_status()
+    job1 = comp.get_game()
+    job2 = comp.get_game()
+    job3 = comp.get_game()
+    # First response is an error
+    tc.assertEqual(comp.process_game_error(job1, 0), (True, False))
+    comp.process_game_result(
+        competition_test_support.fake_response(job2, 'b'))
+    tc.assertEqual(comp.process_game_error(job3, 0), (False, False))
+    tc.assertEqual(comp.outstanding_perturbations, {})
+
+def test_status_mismatch(tc):
+    comp = spsa_tuners.Spsa_tuner('spsatest')
+    comp.initialise_from_control_file(default_config())
+    comp.set_clean_status()
+    config = default_config()
+    del config['parameters'][1]
+    comp2 = spsa_tuners.Spsa_tuner('spsatest')
+    comp2.initialise_from_control_file(config)
+    with tc.assertRaises(CompetitionError) as ar:
+        comp2.set_status(pickle.loads(pickle.dumps(comp.get_status())))
+    tc.assertEqual(str(ar.exception),
+                   "status file is inconsistent with control file")
+